@@ -3,9 +3,17 @@
 Script principal para orquestar todas las fases del análisis econométrico.
 
 Uso desde la terminal:
+- Para ejecutar toda la cadena (los pasos sin cambios en sus entradas se omiten y los
+  independientes se ejecutan en paralelo):
+  python main.py all --jobs 4
+
 - Para ejecutar el pre-procesamiento de datos:
   python main.py data
 
+- Para anexar sólo los años nuevos de una colección de MapBiomas (sin reconstruir el
+  dataset; los momentos del DiD y de la prueba de tendencias paralelas se actualizan):
+  python main.py data --append-data
+
 - Para ejecutar el Análisis Exploratorio de Datos (EDA):
   python main.py eda
 
@@ -23,6 +31,58 @@ Uso desde la terminal:
 
 - Para ejecutar el análisis de Control Sintético (SCM):
   python main.py scm
+
+- Para generar la tabla de estadísticas descriptivas:
+  python main.py descriptive
+
+- Para la descomposición de Goodman-Bacon del estimador de efectos fijos bidireccionales
+  (comparaciones 2x2 entre grupos de adopción y sus pesos):
+  python main.py bacon
+
+- Para la simulación de Monte Carlo de la potencia y el tamaño del modelo DiD (curvas de
+  potencia por efecto y ventana en reports/power_analysis):
+  python main.py power
+
+- Para las diferencias en diferencias sintéticas (pesos de unidades y de años previos,
+  con varianza placebo; reporte y gráfico en reports/synthetic_did):
+  python main.py sdid
+
+- Para estimar el DiD, la prueba de tendencias paralelas y el estudio de eventos sobre
+  todas las variables de resultado del panel en una sola corrida (tabla apilada en
+  reports/multi_outcome):
+  python main.py outcomes
+
+- Para el barrido de sensibilidad (años de intervención x ventanas de estimación),
+  con una sola tabla consolidada y un mapa de calor en reports/sensitivity_sweep:
+  python main.py sweep --years 1999-2015 --windows 3,4,5,full
+
+Los pasos 'parallel_trends', 'did', 'event_study', 'bacon', 'power', 'sdid' y 'outcomes' aceptan '--year' (por defecto, 2005).
+
+Con '--treatment' los pasos del DiD y del SCM usan otra asignación del tratamiento:
+varias unidades tratadas con su año de adopción, en línea o en un archivo CSV (columnas
+departamento, tratado y anio_adopcion). Los años de la asignación prevalecen sobre
+'--year', que sólo completa las unidades sin año:
+  python main.py did --treatment "San Martin=2005,Loreto=2005"
+  python main.py all --treatment data/tratamiento.csv
+Con adopción escalonada (p. ej. "San Martin=2005,Loreto=2010"), 'did' marca a cada
+unidad desde su propio año, el estudio de eventos y el SCM miden el efecto desde el año
+de cada unidad, y los estimadores de año común (placebos, permutación, potencia, SDID)
+fallan con un error explicativo ('sweep' aplica cada año de su grilla a todas las
+unidades tratadas); para esos casos, ver 'bacon'.
+
+Las figuras se guardan en resolución de borrador; '--final' las genera a 300 dpi
+para publicación (p. ej. python main.py all --final).
+
+Para medir el costo de arranque (importación) de los pasos frente al presupuesto:
+  python main.py all --profile-imports
+
+Cada corrida registra el tiempo de reloj, el tiempo de CPU y la memoria pico de sus
+etapas (carga, preparación, estimación, reporte, renderizado) en 'metrics.json'. Para
+guardar además un perfil de cProfile de algunos pasos ('profile.prof' en su corrida):
+  python main.py did --cprofile did,parallel_trends
+
+Cada paso ejecuta antes sus dependencias (p. ej. 'did' requiere 'data' y
+'parallel_trends'); '--force' re-ejecuta los pasos aunque no haya cambios.
 """
 import argparse
 import logging
@@ -35,41 +95,173 @@ logging.basicConfig(
     stream=sys.stdout
 )
 
+DEFAULT_YEAR = 2005
+DEFAULT_SWEEP_YEARS = '1999-2015'
+DEFAULT_SWEEP_WINDOWS = '3,4,5,full'
+
+def build_steps(year=DEFAULT_YEAR, years=DEFAULT_SWEEP_YEARS, windows=DEFAULT_SWEEP_WINDOWS, final=False,
+                append_data=False, treatment=None):
+    """
+    Define los pasos del análisis, sus dependencias, entradas y salidas.
+
+    Args:
+        year (int): Año de intervención de 'parallel_trends', 'did', 'event_study', 'bacon', 'power', 'sdid' y 'outcomes'.
+        years (str): Años de intervención del barrido de sensibilidad ('sweep').
+        windows (str): Ventanas del barrido de sensibilidad.
+        final (bool): Figuras en resolución de publicación (300 dpi) en lugar de borrador.
+        append_data (bool): El paso 'data' sólo anexa los períodos nuevos del archivo crudo.
+        treatment (str, optional): Asignación del tratamiento de los pasos del DiD y del SCM
+                                   ('UNIDAD=AÑO,...' o un archivo CSV); por defecto, San Martín.
+                                   Sus años de adopción prevalecen sobre `year`, que sólo se
+                                   aplica a las unidades sin año propio.
+
+    Raises:
+        ValueError: Si la asignación del tratamiento no es válida.
+    """
+    import os
+
+    from src.core.data_manager import PROCESSED_DATA_PATH
+    from src.core.pipeline import Step
+    from src.core.treatment import TreatmentAssignment
+
+    # Los pasos con año de intervención usan el de la asignación (el primero, si es escalonada).
+    if treatment:
+        year = TreatmentAssignment.parse(treatment, default_year=year).reference_year
+
+    # Salidas de cada paso (directorios de reportes con las corridas fechadas).
+    two_shocks_dir = f'reports/exploratory_two_shocks_analysis/{year}'
+
+    # La asignación del tratamiento sólo se pasa a los pasos del DiD; si es un archivo, su
+    # contenido forma parte de las entradas del paso.
+    treatment_inputs = [treatment] if treatment and os.path.isfile(treatment) else []
+
+    def analysis_step(name, module, output, depends_on=('data',), treated=False, **kwargs):
+        inputs = [PROCESSED_DATA_PATH, f'src/analysis/{module}.py', 'src/core', 'src/utils.py']
+        if treated and treatment:
+            kwargs[treated if isinstance(treated, str) else 'treatment'] = treatment
+            inputs += treatment_inputs
+        return Step(
+            name=name,
+            target=f'src.analysis.{module}:main',
+            depends_on=list(depends_on),
+            inputs=inputs,
+            outputs=[output],
+            kwargs=kwargs,
+        )
+
+    return [
+        Step(
+            name='data',
+            target='src.data.make_dataset:main',
+            # El modo de anexado también actualiza los momentos guardados de los modelos.
+            inputs=['data/01_raw/mapbiomas_cobertura_1996_2023.csv', 'src/data', 'src/core/data_manager.py',
+                    'src/core/incremental.py', 'src/core/sufficient_stats.py', 'src/core/treatment.py'],
+            outputs=[PROCESSED_DATA_PATH],
+            kwargs={'append': True} if append_data else {},
+        ),
+        analysis_step('eda', 'exploratory_data_analysis', 'reports/figures/eda', final=final),
+        analysis_step('descriptive', 'descriptive_table', 'reports/tables'),
+        analysis_step('parallel_trends', 'parallel_trends_validation', f'{two_shocks_dir}/validation', year=year,
+                      final=final, treated=True),
+        analysis_step('did', 'did_analysis', f'{two_shocks_dir}/did_analysis', depends_on=['parallel_trends'],
+                      year=year, final=final, treated=True),
+        analysis_step('robustness', 'robustness_checks', 'reports/robustness_checks', depends_on=['did'],
+                      final=final, treated=True),
+        analysis_step('event_study', 'event_study_analysis', f'{two_shocks_dir}/event_study', year=year,
+                      final=final, treated=True),
+        analysis_step('scm', 'scm_analysis', 'reports/scm_analysis', final=final, treated=True),
+        analysis_step('bacon', 'bacon_decomposition_analysis', 'reports/bacon_decomposition', year=year,
+                      final=final, treated='adoption'),
+        analysis_step('power', 'power_analysis', 'reports/power_analysis', year=year, final=final, treated=True),
+        analysis_step('sdid', 'synthetic_did_analysis', 'reports/synthetic_did', year=year, final=final,
+                      treated=True),
+        analysis_step('outcomes', 'multi_outcome_analysis', 'reports/multi_outcome', year=year, treated=True),
+        analysis_step('sweep', 'sensitivity_sweep', 'reports/sensitivity_sweep', years=years, windows=windows,
+                      final=final, treated=True),
+    ]
+
+STEP_NAMES = ["data", "eda", "descriptive", "parallel_trends", "did", "robustness", "event_study", "scm", "bacon",
+              "power", "sdid", "outcomes", "sweep"]
+
+def profile_step_imports(steps):
+    """
+    Informa el costo de importación del módulo de cada paso y lo compara con el presupuesto.
+
+    Returns:
+        int: Código de salida (1 si algún paso excede el presupuesto de arranque).
+    """
+    from src.core.import_profile import STARTUP_BUDGET_MS, profile_imports
+
+    over_budget = []
+    for step in steps:
+        profile = profile_imports(step.target.split(':')[0])
+        print(f"\n[{step.name}] {profile.report()}")
+        if profile.total_ms > STARTUP_BUDGET_MS:
+            over_budget.append(step.name)
+    if over_budget:
+        logging.error(f"--- Pasos que exceden el presupuesto de arranque ({STARTUP_BUDGET_MS} ms): "
+                      f"{', '.join(over_budget)} ---")
+        return 1
+    logging.info(f"--- Todos los pasos arrancan dentro del presupuesto ({STARTUP_BUDGET_MS} ms). ---")
+    return 0
+
 def main():
     """Punto de entrada principal del programa."""
     parser = argparse.ArgumentParser(description="Orquestador del proyecto de análisis de deforestación.")
     parser.add_argument(
         "step",
-        choices=["data", "eda", "parallel_trends", "did", "robustness", "event_study", "scm"],
-        help="El paso del análisis a ejecutar."
+        choices=["all"] + STEP_NAMES,
+        help="El paso del análisis a ejecutar (con sus dependencias), o 'all' para toda la cadena."
     )
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Pasos independientes ejecutados en paralelo (0 usa todos los núcleos).")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-ejecuta los pasos aunque sus entradas no hayan cambiado.")
+    parser.add_argument("--year", type=int, default=DEFAULT_YEAR,
+                        help="Año de intervención para 'parallel_trends', 'did', 'event_study', 'bacon', 'power', 'sdid' y 'outcomes'.")
+    parser.add_argument("--years", default=DEFAULT_SWEEP_YEARS,
+                        help="Años de intervención del barrido 'sweep', p. ej. '1999-2015' o '2005,2012'.")
+    parser.add_argument("--windows", default=DEFAULT_SWEEP_WINDOWS,
+                        help="Ventanas del barrido 'sweep': años desde la intervención o 'full', p. ej. '3,4,5,full'.")
+    parser.add_argument("--final", action="store_true",
+                        help="Genera las figuras a 300 dpi (por defecto, borradores de menor resolución).")
+    parser.add_argument("--append-data", action="store_true",
+                        help="El paso 'data' sólo anexa los períodos nuevos del archivo crudo al dataset existente.")
+    parser.add_argument("--treatment", default=None,
+                        help="Asignación del tratamiento de los pasos del DiD: 'UNIDAD=AÑO,...' o un archivo CSV "
+                             "(columnas departamento, tratado, anio_adopcion). Por defecto, San Martin.")
+    parser.add_argument("--profile-imports", action="store_true",
+                        help="No ejecuta los pasos: informa el costo de importación de cada uno frente al presupuesto.")
+    parser.add_argument("--cprofile", default=None, metavar="PASOS",
+                        help="Ejecuta bajo cProfile los pasos indicados (separados por comas, o 'all') y guarda el perfil en su corrida.")
     args = parser.parse_args()
 
-    logging.info(f"--- Ejecutando el paso: '{args.step}' ---")
+    from src.core.pipeline import Pipeline
+
+    targets = STEP_NAMES if args.step == "all" else [args.step]
+    try:
+        steps = build_steps(year=args.year, years=args.years, windows=args.windows, final=args.final,
+                            append_data=args.append_data, treatment=args.treatment)
+    except ValueError as e:
+        parser.error(f"--treatment: {e}")
+    if args.profile_imports:
+        sys.exit(profile_step_imports([step for step in steps if step.name in targets]))
+    if args.cprofile:
+        profiled = STEP_NAMES if args.cprofile == "all" else [name.strip() for name in args.cprofile.split(',')]
+        unknown = [name for name in profiled if name not in STEP_NAMES]
+        if unknown:
+            parser.error(f"--cprofile: pasos desconocidos {unknown}.")
+        for step in steps:
+            step.profile = step.name in profiled
 
-    if args.step == "data":
-        from src.data import make_dataset
-        make_dataset.main()
-    elif args.step == "eda":
-        from src.analysis import exploratory_data_analysis
-        exploratory_data_analysis.main()
-    elif args.step == "parallel_trends":
-        from src.analysis import parallel_trends_validation
-        parallel_trends_validation.main()
-    elif args.step == "did":
-        from src.analysis import did_analysis
-        did_analysis.main()
-    elif args.step == "robustness":
-        from src.analysis import robustness_checks
-        robustness_checks.main()
-    elif args.step == "event_study":
-        from src.analysis import event_study_analysis
-        event_study_analysis.main()
-    elif args.step == "scm":
-        from src.analysis import scm_analysis
-        scm_analysis.main()
+    logging.info(f"--- Ejecutando el paso: '{args.step}' ---")
+    status = Pipeline(steps).run(targets, n_jobs=args.jobs, force=args.force)
 
+    failed = [name for name, result in status.items() if result in ('failed', 'blocked')]
+    if failed:
+        logging.error(f"--- Paso '{args.step}' con errores en: {', '.join(failed)} ---")
+        sys.exit(1)
     logging.info(f"--- Paso '{args.step}' completado exitosamente. ---")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
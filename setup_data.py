@@ -1,6 +1,6 @@
 import logging
 import os
-from src.core.data_manager import get_truth_data, save_processed_data
+from src.core.data_manager import PROCESSED_DATA_PATH, get_truth_data, save_processed_data
 
 def setup_logging():
     """Configura un logging robusto a consola y archivo."""
@@ -37,7 +37,7 @@ def main():
     logger = setup_logging()
     logger.info("--- Inicio del script de configuración de datos ---")
     
-    output_path = "data/02_processed/deforestation_analysis_data.csv"
+    output_path = PROCESSED_DATA_PATH
     
     logger.info("Paso 1: Obteniendo los datos desde la 'fuente de la verdad'.")
     truth_df = get_truth_data()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Script de benchmark de los estimadores: mide el tiempo y la memoria pico del DiD, del
+estudio de eventos, de las pruebas de placebo y del control sintético sobre paneles
+sintéticos de distintos tamaños, y compara los resultados con la línea base local
+(reescalada con un caso de calibración medido en la misma ejecución). Si no hay línea
+base, la primera ejecución la registra.
+"""
+import os
+import logging
+import sys
+import argparse
+import tempfile
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.utils import setup_run_environment
+from src.core.benchmark import (BASELINE_PATH, benchmark_case, compare_to_baseline, load_baseline,
+                                measure_calibration, panel_size_label, parse_sizes, results_frame,
+                                save_baseline)
+from src.core.data_manager import save_processed_data
+from src.core.econometrics import DiDAnalysis
+from src.core.result_cache import ResultCache
+from src.core.synthetic_control import SyntheticControl
+from src.data.synthetic_panel import make_synthetic_panel
+
+DEFAULT_SIZES = '5x26,25x26,100x26,100x52'
+ESTIMATORS = ('did', 'event_study', 'placebo', 'scm')
+# Tamaño máximo (unidades) por estimador en la grilla: el barrido de placebos del SCM
+# ajusta un problema por unidad con tantos donantes como unidades y crece más que
+# linealmente (unos 15 s por ejecución con 25 unidades).
+MAX_UNITS = {'scm': 25}
+
+def _analyzer(data_path, panel):
+    """DiDAnalysis sobre el panel sintético, sin caché de resultados (cada medición estima de nuevo)."""
+    return DiDAnalysis(data_path, panel.treated_units[0], panel.treatment_year, cache=ResultCache(enabled=False))
+
+def estimator_cases(panel, data_path, n_jobs=1):
+    """
+    Describe cada estimador como una función `prepare` (ver `src.core.benchmark.measure`).
+
+    La carga del panel y la construcción del analizador quedan fuera del tiempo medido;
+    el control sintético sí incluye la construcción de la matriz unidades x años, que
+    forma parte del paso SCM.
+
+    Returns:
+        dict: Nombre del estimador -> `prepare`.
+    """
+    placebo_years = [year for year in panel.periods if year < panel.treatment_year][1:]
+
+    def did():
+        return _analyzer(data_path, panel).run_did_model
+
+    def event_study():
+        return _analyzer(data_path, panel).run_event_study_batch
+
+    def placebo():
+        analyzer = _analyzer(data_path, panel)
+        return lambda: analyzer.run_did_batch([(year, None, None) for year in placebo_years])
+
+    def scm():
+        return lambda: SyntheticControl(panel.data, panel.treated_units[0], panel.treatment_year).placebo_sweep(n_jobs=n_jobs)
+
+    return {'did': did, 'event_study': event_study, 'placebo': placebo, 'scm': scm}
+
+def run_benchmarks(sizes, estimators=ESTIMATORS, repeats=3, n_jobs=1):
+    """
+    Mide cada estimador sobre cada tamaño de la grilla.
+
+    Args:
+        sizes (list): Tuplas (n_units, n_years, n_treated).
+        estimators (tuple): Estimadores a medir (subconjunto de ESTIMATORS); cada uno sólo
+                            se mide en los tamaños que no superan su MAX_UNITS.
+        repeats (int): Repeticiones cronometradas por caso.
+        n_jobs (int): Procesos del barrido de placebos del SCM. Con 1 (por defecto) todo
+                      corre en el proceso actual y la memoria pico es completa; con más,
+                      la memoria de los procesos del pool no se contabiliza.
+
+    Returns:
+        list: Resultados (`BenchmarkResult`).
+    """
+    results = []
+    # Los mensajes por estimación (p. ej. cada placebo) no aportan al benchmark.
+    root_logger = logging.getLogger()
+    previous_level = root_logger.level
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_units, n_years, n_treated in sizes:
+            panel = make_synthetic_panel(n_units=n_units, n_years=n_years, n_treated=n_treated)
+            data_path = os.path.join(workdir, f"panel_{panel_size_label(n_units, n_years, n_treated)}")
+            save_processed_data(panel.data, data_path, root_logger)
+            cases = estimator_cases(panel, data_path, n_jobs=n_jobs)
+            for name in estimators:
+                if n_units > MAX_UNITS.get(name, n_units):
+                    logging.info(f"Se omite {name} con {n_units} unidades (máximo {MAX_UNITS[name]}).")
+                    continue
+                root_logger.setLevel(logging.WARNING)
+                try:
+                    result = benchmark_case(name, cases[name], n_units, n_years, n_treated, repeats=repeats)
+                finally:
+                    root_logger.setLevel(previous_level)
+                logging.info(f"{result.key}: {result.best_seconds * 1000:.1f} ms (mediana "
+                             f"{result.median_seconds * 1000:.1f} ms), memoria pico {result.peak_mib:.1f} MiB")
+                results.append(result)
+    return results
+
+def main(sizes=DEFAULT_SIZES, estimators=ESTIMATORS, repeats=3, n_jobs=1, baseline_path=BASELINE_PATH,
+         save=False):
+    """
+    Orquesta el benchmark y la comparación con la línea base.
+
+    Args:
+        sizes (str or list): Grilla de tamaños, p. ej. '5x26,100x26' o [(5, 26, 1)].
+        estimators (tuple): Estimadores a medir.
+        repeats (int): Repeticiones cronometradas por caso.
+        n_jobs (int): Procesos del barrido de placebos del SCM.
+        baseline_path (str): Archivo JSON de la línea base; si no existe, se registra con
+                             los resultados de esta ejecución.
+        save (bool): Guarda los resultados como nueva línea base.
+
+    Returns:
+        pd.DataFrame: Comparación con la línea base (columna 'regression').
+    """
+    sizes = parse_sizes(sizes) if isinstance(sizes, str) else [tuple(size) for size in sizes]
+    unknown = [name for name in estimators if name not in ESTIMATORS]
+    if unknown:
+        raise ValueError(f"Estimadores desconocidos: {unknown}. Disponibles: {list(ESTIMATORS)}.")
+
+    run_dir, _ = setup_run_environment('reports/benchmarks')
+    logging.info(f"Iniciando el benchmark: {len(estimators)} estimadores x {len(sizes)} tamaños, "
+                 f"{repeats} repeticiones por caso...")
+
+    results = run_benchmarks(sizes, estimators, repeats=repeats, n_jobs=n_jobs)
+    calibration = measure_calibration()
+    logging.info(f"Caso de calibración: {calibration * 1000:.1f} ms")
+    table = results_frame(results)
+    table.to_csv(os.path.join(run_dir, 'benchmark_results.csv'), index=False)
+
+    baseline = load_baseline(baseline_path)
+    comparison = compare_to_baseline(results, baseline, calibration)
+    comparison.to_csv(os.path.join(run_dir, 'benchmark_comparison.csv'), index=False)
+
+    report_path = os.path.join(run_dir, 'benchmark_report.txt')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write("Benchmark de Estimadores sobre Paneles Sintéticos\n")
+        f.write("=================================================\n")
+        f.write("Tamaño: UNIDADESxAÑOS[:TRATADAS]. Tiempos en segundos (mejor de las repeticiones);\n")
+        f.write("memoria pico en MiB (tracemalloc, sólo el proceso actual). Los tiempos de base se\n")
+        f.write(f"reescalan con el caso de calibración de esta ejecución ({calibration:.4f} s).\n\n")
+        f.write(comparison.to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+        f.write("\n\n")
+        if baseline is None:
+            f.write(f"No había línea base en '{baseline_path}'; se registra con esta ejecución.\n")
+        else:
+            f.write(f"Línea base: {baseline_path} (registrada el {baseline.get('created')} en "
+                    f"{baseline.get('machine', {}).get('platform')}).\n")
+            regressions = comparison.loc[comparison['regression'], 'key'].tolist()
+            f.write(f"Regresiones: {', '.join(regressions) if regressions else 'ninguna'}.\n")
+    logging.info(f"Reporte del benchmark guardado en: {report_path}")
+
+    regressions = comparison[comparison['regression']]
+    for row in regressions.itertuples(index=False):
+        logging.warning(f"Regresión en {row.key}: tiempo x{row.time_ratio:.2f}, memoria x{row.memory_ratio:.2f} "
+                        f"respecto de la línea base.")
+
+    if save or baseline is None:
+        logging.info(f"Línea base actualizada en: {save_baseline(results, calibration, baseline_path)}")
+    logging.info("Benchmark completado.")
+    return comparison
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="Grilla de tamaños UNIDADESxAÑOS[:TRATADAS], p. ej. '5x26,100x26,100x52:10'.")
+    parser.add_argument("--estimators", default=','.join(ESTIMATORS),
+                        help=f"Estimadores a medir, separados por comas ({', '.join(ESTIMATORS)}).")
+    parser.add_argument("--repeats", type=int, default=3, help="Repeticiones cronometradas por caso.")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Procesos del barrido de placebos del SCM (con más de 1, la memoria del pool no se mide).")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Archivo JSON de la línea base.")
+    parser.add_argument("--save-baseline", action="store_true", help="Guarda los resultados como línea base.")
+    parser.add_argument("--check", action="store_true", help="Termina con código 1 si hay regresiones.")
+    args = parser.parse_args()
+    comparison = main(sizes=args.sizes, estimators=tuple(e.strip() for e in args.estimators.split(',')),
+                      repeats=args.repeats, n_jobs=args.jobs, baseline_path=args.baseline, save=args.save_baseline)
+    if args.check and comparison['regression'].any():
+        sys.exit(1)
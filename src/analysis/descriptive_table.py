@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 
-import pandas as pd
 import logging
 import os
 import sys
@@ -12,32 +11,42 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 from src.utils import setup_run_environment
+from src.core.data_manager import load_processed_data
+from src.core.result_cache import ResultCache
+from src.core.lazy_imports import is_available, lazy_import
 
-try:
-    from tabulate import tabulate
-except ImportError:
+if not is_available('tabulate'):
     logging.error("La librería 'tabulate' no está instalada. Por favor, instálala manualmente con 'pip install tabulate'.")
     sys.exit(1)
 
+pd = lazy_import('pandas')
+tabulate = lazy_import('tabulate')
+
 def main():
     """
     Script principal para generar la tabla de estadísticas descriptivas.
     """
     # --- PASO 0: Configurar entorno de ejecución ---
-    run_dir = setup_run_environment('reports/tables')
+    run_dir, _ = setup_run_environment('reports/tables')
     logging.info("Iniciando la generación de la tabla de estadísticas descriptivas con datos procesados...")
 
     # --- PASO 1: Cargar datos procesados ---
     try:
-        df = pd.read_csv('data/02_processed/deforestation_analysis_data.csv')
+        df = load_processed_data(columns=['departamento', 'deforestacion_anual'])
         logging.info("Datos procesados cargados exitosamente.")
     except FileNotFoundError:
         logging.error("No se encontró el archivo de datos procesados. Ejecuta primero 'src/data/make_dataset.py'.")
+        return False
+
+    cache = ResultCache()
+    cache_key = cache.key({'script': 'descriptive_table'})
+    if cache.restore_artifacts(cache_key, run_dir):
+        logging.info(f"Sin cambios en datos, especificación ni código: productos recuperados de la caché en {run_dir}.")
         return
 
     # --- PASO 2: Calcular estadísticas descriptivas ---
     logging.info("Calculando estadísticas descriptivas...")
-    desc_stats = df.groupby('departamento')['deforestacion_anual'].describe()
+    desc_stats = df.groupby('departamento', observed=True)['deforestacion_anual'].describe()
 
     # --- PASO 3: Formatear y guardar la tabla (Estilo \"Investigación Anfibia\") ---
     logging.info("Formateando la tabla...")
@@ -58,7 +67,7 @@ def main():
     })
 
     # Convertir el DataFrame a una tabla formateada con un estilo limpio
-    table = tabulate(desc_stats, headers='keys', tablefmt='simple', stralign="center", numalign="center")
+    table = tabulate.tabulate(desc_stats, headers='keys', tablefmt='simple', stralign="center", numalign="center")
 
     # Añadir título y notas al pie claras y concisas
     title = "Tabla 1: Estadísticas Descriptivas de la Deforestación Anual por Departamento (1998-2023)\n"
@@ -82,7 +91,9 @@ def main():
         logging.info(f"Tabla de estadísticas descriptivas guardada en: {output_path}")
     except Exception as e:
         logging.error(f"Error al guardar la tabla: {e}")
+        return False
 
+    cache.store_artifacts(cache_key, run_dir)
     logging.info("Generación de tabla completada.")
 
 if __name__ == '__main__':
@@ -18,13 +18,49 @@ if project_root not in sys.path:
 # --- Módulos del Proyecto ---
 from src.utils import setup_run_environment
 from src.core.econometrics import DiDAnalysis
+from src.core.data_manager import PROCESSED_DATA_PATH
+from src.core.instrumentation import span
+from src.core.parallel import resolve_jobs
+from src.core.rendering import render_figures
+from src.core.treatment import TreatmentAssignment
+
+def format_bootstrap_section(label, result):
+    """Formatea los resultados del bootstrap salvaje por conglomerados para el reporte."""
+    mode = 'enumeración exacta' if result['enumerated'] else 'muestreo aleatorio'
+    return f"""
+Inferencia por Bootstrap Salvaje por Conglomerados - {label}
+----------------------------------------------
+- Pesos: {result['weight_type']} ({result['n_reps']} réplicas, {mode}), {result['n_clusters']} conglomerados (departamento).
+- Coeficiente 'did': {result['coef']:.4f}
+- Error Estándar Robusto por Conglomerados: {result['se_cluster']:.4f}
+- Error Estándar Bootstrap: {result['se_bootstrap']:.4f}
+- P-valor Bootstrap (WCR, t simétrico): {result['p_value_bootstrap']:.4f}
+"""
 
-def main(year=2005):
+def main(year=2005, bootstrap_reps=0, bootstrap_weights='webb', n_jobs=None, seed=None, compressed=False,
+         final=False, treatment=None):
     """
     Función principal para orquestar el análisis de Diferencias en Diferencias (DiD)
     para un año de intervención específico.
+
+    Args:
+        year (int): Año de intervención; con `treatment`, sólo el de las unidades sin año
+                    propio (el análisis usa el primer año de adopción de la asignación).
+        bootstrap_reps (int): Réplicas del bootstrap salvaje por conglomerados (0 lo desactiva).
+        bootstrap_weights (str): 'rademacher' o 'webb'.
+        n_jobs (int, optional): Procesos para el bootstrap; None usa todos los núcleos.
+        seed (int, optional): Semilla del bootstrap. Sin semilla (y con bootstrap) los
+                              productos no se guardan en la caché de resultados.
+        compressed (bool): Estima los modelos sobre celdas (grupo, período) comprimidas;
+                           coeficientes y errores estándar son idénticos.
+        final (bool): Guarda las figuras en resolución de publicación (300 dpi) en lugar de borrador.
+        treatment (str or dict, optional): Asignación del tratamiento (archivo CSV o
+                                           'UNIDAD=AÑO,...', ver `src.core.treatment`);
+                                           por defecto, San Martín.
     """
     # --- PASO 1: Configurar Entorno de Ejecución Dinámico ---
+    assignment = TreatmentAssignment.parse(treatment if treatment is not None else 'San Martin', default_year=year)
+    year = assignment.reference_year
     output_dir = os.path.join('reports', 'exploratory_two_shocks_analysis', str(year), 'did_analysis')
     run_dir, _ = setup_run_environment(output_dir)
     logging.info(f"Iniciando el análisis DiD para el año de intervención {year}...")
@@ -32,23 +68,35 @@ def main(year=2005):
     # --- PASO 2: Inicializar el Análisis con el Año Específico ---
     try:
         analyzer = DiDAnalysis(
-            data_path='data/02_processed/deforestation_analysis_data.csv',
-            treatment_unit='San Martin',
-            treatment_year=year
+            data_path=PROCESSED_DATA_PATH,
+            treatment=assignment
         )
         logging.info(f"Motor de análisis econométrico inicializado para el año {year}.")
     except FileNotFoundError:
         logging.error("No se encontró el dataset procesado. Abortando. Ejecuta 'python main.py data' primero.")
-        return
+        return False
     except Exception as e:
         logging.error(f"Error al inicializar el analizador: {e}")
+        return False
+
+    # Si ni los datos, ni la especificación, ni el código cambiaron, se reutilizan los productos.
+    cacheable = bootstrap_reps == 0 or seed is not None
+    cache_key = analyzer.cache.key({
+        'script': 'did_analysis', 'year': year, 'treatment': analyzer.treatment.key(),
+        'bootstrap_reps': bootstrap_reps, 'bootstrap_weights': bootstrap_weights, 'seed': seed,
+        'n_jobs': resolve_jobs(n_jobs) if bootstrap_reps > 0 else None, 'compressed': compressed,
+        'final': final,
+    }, data_path=PROCESSED_DATA_PATH)
+    if cacheable and analyzer.cache.restore_artifacts(cache_key, run_dir):
+        logging.info(f"Sin cambios en datos, especificación ni código: productos recuperados de la caché en {run_dir}.")
         return
 
     # --- PASO 3: Ejecutar Modelos Econométricos (Corto y Largo Plazo Dinámicos) ---
     logging.info("Ejecutando modelos DiD para corto y largo plazo...")
     short_term_end_year = year + 4
-    did_short_term_results = analyzer.run_did_model(start_year=year, end_year=short_term_end_year)
-    did_full_term_results = analyzer.run_did_model()
+    with span('fit'):
+        did_short_term_results = analyzer.run_did_model(start_year=year, end_year=short_term_end_year, compressed=compressed)
+        did_full_term_results = analyzer.run_did_model(compressed=compressed)
 
     # --- PASO 4: Generar Productos "Anfibios" ---
 
@@ -84,36 +132,60 @@ Interpretación:
 Conclusión: El efecto {'es' if did_full_term_results.pvalues['did'] < 0.05 else 'no es'} estadísticamente significativo al 95% de confianza.
 ==============================================================================
 """
+    if bootstrap_reps > 0:
+        logging.info(f"Ejecutando bootstrap salvaje por conglomerados ({bootstrap_reps} réplicas, pesos {bootstrap_weights})...")
+        with span('bootstrap'):
+            bootstrap_short = analyzer.run_wild_bootstrap(start_year=year, end_year=short_term_end_year, n_reps=bootstrap_reps,
+                                                          weight_type=bootstrap_weights, seed=seed, n_jobs=n_jobs)
+            bootstrap_full = analyzer.run_wild_bootstrap(n_reps=bootstrap_reps, weight_type=bootstrap_weights,
+                                                         seed=seed, n_jobs=n_jobs)
+        report_content += format_bootstrap_section(f"Corto Plazo ({year}-{short_term_end_year})", bootstrap_short)
+        report_content += format_bootstrap_section("Período Completo", bootstrap_full)
+        report_content += "==============================================================================\n"
+
     report_path = os.path.join(run_dir, 'did_analysis_report.txt')
-    with open(report_path, 'w', encoding='utf-8') as f:
+    with span('report'), open(report_path, 'w', encoding='utf-8') as f:
         f.write(report_content)
     logging.info(f"Reporte técnico del análisis DiD guardado en: {report_path}")
 
     # 4.2. Producto 2: Visualizaciones de Impacto
     logging.info("Generando visualizaciones de impacto...")
     
-    # Gráfico para el corto plazo
-    plot_path_short = analyzer.plot_did_results(
-        did_results=did_short_term_results,
-        title=f'Impacto de Corto Plazo ({year}-{short_term_end_year}) en la Deforestación',
-        run_dir=run_dir,
-        filename='did_summary_short_term.png'
-    )
+    # Ambos gráficos (corto plazo y período completo) se renderizan juntos en el pool.
+    plot_path_short, plot_path_full = render_figures([
+        analyzer.did_plot_job(
+            did_results=did_short_term_results,
+            title=f'Impacto de Corto Plazo ({year}-{short_term_end_year}) en la Deforestación',
+            run_dir=run_dir,
+            filename='did_summary_short_term.png'
+        ),
+        analyzer.did_plot_job(
+            did_results=did_full_term_results,
+            title=f'Impacto de Período Completo (1998-2023) en la Deforestación',
+            run_dir=run_dir,
+            filename='did_summary_full_term.png'
+        ),
+    ], final=final)
     logging.info(f"Visualización de corto plazo guardada en: {plot_path_short}")
-
-    # Gráfico para el período completo
-    plot_path_full = analyzer.plot_did_results(
-        did_results=did_full_term_results,
-        title=f'Impacto de Período Completo (1998-2023) en la Deforestación',
-        run_dir=run_dir,
-        filename='did_summary_full_term.png'
-    )
     logging.info(f"Visualización de período completo guardada en: {plot_path_full}")
-    
+
+    if cacheable:
+        analyzer.cache.store_artifacts(cache_key, run_dir)
     logging.info(f"Análisis de Diferencias en Diferencias para el año {year} completado exitosamente.")
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("--year", type=int, default=2005)
+    parser.add_argument("--bootstrap-reps", type=int, default=0,
+                        help="Réplicas del bootstrap salvaje por conglomerados (0 lo desactiva).")
+    parser.add_argument("--bootstrap-weights", choices=["rademacher", "webb"], default="webb")
+    parser.add_argument("--jobs", type=int, default=None, help="Procesos para el bootstrap (por defecto, todos los núcleos).")
+    parser.add_argument("--seed", type=int, default=None, help="Semilla del bootstrap (permite reutilizar la caché).")
+    parser.add_argument("--compressed", action="store_true",
+                        help="Estima sobre celdas (grupo, período) comprimidas en lugar de fila a fila.")
+    parser.add_argument("--final", action="store_true", help="Guarda las figuras a 300 dpi (por defecto, borrador).")
+    parser.add_argument("--treatment", default=None,
+                        help="Asignación del tratamiento: archivo CSV o 'UNIDAD=AÑO,...' (por defecto, San Martin).")
     args = parser.parse_args()
-    main(year=args.year)
+    main(year=args.year, bootstrap_reps=args.bootstrap_reps, bootstrap_weights=args.bootstrap_weights,
+         n_jobs=args.jobs, seed=args.seed, compressed=args.compressed, final=args.final, treatment=args.treatment)
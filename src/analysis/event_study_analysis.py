@@ -8,9 +8,6 @@ Admite un año de intervención dinámico.
 import os
 import logging
 import sys
-import pandas as pd
-import matplotlib.pyplot as plt
-import statsmodels.formula.api as smf
 import argparse
 
 # --- Configuración del Entorno ---
@@ -21,132 +18,188 @@ if project_root not in sys.path:
 # --- Módulos del Proyecto ---
 from src.utils import setup_run_environment
 from src.core.econometrics import DiDAnalysis
+from src.core.data_manager import PROCESSED_DATA_PATH
+from src.core.event_study import ENGINES
+from src.core.instrumentation import span
+from src.core.result_cache import ResultCache
+from src.core.treatment import TreatmentAssignment
+from src.core.rendering import FigureJob, render_figures
 from src.core.visualization_utils import style_event_study_plot
 
-def main(year=2005):
+TREATMENT_UNIT = 'San Martin'
+
+def main(year=2005, years=None, reference=-1, min_event=None, max_event=None, final=False, treatment=None,
+         engine='auto', cluster=None):
     """
-    Función principal para orquestar el análisis de Estudio de Eventos para un año dado.
+    Función principal para orquestar el análisis de Estudio de Eventos.
+
+    Args:
+        year (int): Año de intervención (se usa si no se indica `years`); con `treatment`,
+                    sólo el de las unidades sin año propio.
+        years (list, optional): Varios años candidatos (p. ej. [2005, 2012]) estimados
+                                en una sola llamada por lotes; por defecto, el año de la
+                                asignación. No se admiten con adopción escalonada.
+        reference (int): Tiempo relativo omitido (período base).
+        min_event, max_event (int, optional): Extremos agrupados del tiempo relativo.
+        final (bool): Guarda las figuras en resolución de publicación (300 dpi) en lugar de borrador.
+        treatment (str or dict, optional): Asignación del tratamiento (archivo CSV o
+                                           'UNIDAD=AÑO,...', ver `src.core.treatment`);
+                                           por defecto, San Martín. Con adopción escalonada,
+                                           el tiempo relativo se mide desde el año de cada unidad.
+        engine (str): Motor de efectos fijos: 'dummies', 'hdfe' (absorbidos por
+                      proyecciones alternadas) o 'auto' (HDFE con muchas unidades).
+        cluster (str, optional): 'unit' para errores estándar agrupados por departamento.
     """
-    # --- PASO 1: Configurar Entorno de Ejecución Dinámico ---
-    output_dir = os.path.join('reports', 'exploratory_two_shocks_analysis', str(year), 'event_study')
-    run_dir, _ = setup_run_environment(output_dir)
-    logging.info(f"Iniciando el análisis de Estudio de Eventos para el año de intervención {year}...")
-
-    # --- PASO 2: Cargar Datos a través del Analizador ---
+    years = list(years) if years else None
+    assignment = TreatmentAssignment.parse(treatment if treatment is not None else TREATMENT_UNIT,
+                                           default_year=years[0] if years else year)
+    years = years or [assignment.reference_year]
+    staggered = assignment.is_staggered
+    logging.info(f"Iniciando el análisis de Estudio de Eventos para los años de intervención {years}...")
+
+    # --- PASO 1: Recuperar de la Caché los Años sin Cambios ---
+    # Los años pendientes se estiman en un solo lote: sus corridas comparten las métricas.
+    cache = ResultCache()
+    pending = []
     try:
-        analyzer = DiDAnalysis(
-            data_path='data/02_processed/deforestation_analysis_data.csv',
-            treatment_unit='San Martin',
-            treatment_year=year
-        )
-        df = analyzer.df
-        logging.info(f"Datos cargados y preparados para el año de tratamiento {year}.")
+        for index, treatment_year in enumerate(years):
+            output_dir = os.path.join('reports', 'exploratory_two_shocks_analysis', str(treatment_year), 'event_study')
+            run_dir, _ = setup_run_environment(output_dir, join_run=index > 0)
+            cache_key = cache.key({
+                'script': 'event_study_analysis', 'year': treatment_year, 'treatment': assignment.key(),
+                'reference': reference, 'min_event': min_event, 'max_event': max_event, 'final': final,
+                'engine': engine, 'cluster': cluster,
+            }, data_path=PROCESSED_DATA_PATH)
+            if cache.restore_artifacts(cache_key, run_dir):
+                logging.info(f"Año {treatment_year} sin cambios: productos recuperados de la caché en {run_dir}.")
+            else:
+                pending.append((treatment_year, run_dir, cache_key))
     except FileNotFoundError:
         logging.error("No se encontró el dataset procesado. Abortando. Ejecuta 'python main.py data' primero.")
+        return False
+    if not pending:
         return
 
-    # --- PASO 3: Preparar Variables para el Estudio de Eventos ---
-    logging.info("Creando variables relativas al tiempo para el modelo...")
-    treatment_year = analyzer.treatment_year
-    df['tiempo_relativo'] = df['Periodo'] - treatment_year
-
-    # Crear dummies para cada período de tiempo relativo, y limpiar sus nombres.
-    event_dummies = pd.get_dummies(df['tiempo_relativo'], prefix='evento', drop_first=False)
-    clean_colnames = {col: col.replace('-', 'm') for col in event_dummies.columns}
-    event_dummies = event_dummies.rename(columns=clean_colnames)
-    df = pd.concat([df, event_dummies], axis=1)
-    
-    # Definir el año base para la regresión ('evento_m1' es el nuevo nombre para t-1)
-    base_period_dummy = 'evento_m1'
-    if base_period_dummy not in df.columns:
-        # Si el año base no existe (porque está fuera del rango de datos), buscar uno alternativo.
-        available_dummies = sorted([c for c in df.columns if c.startswith('evento_m')])
-        if not available_dummies:
-            logging.error("No se encontraron dummies de eventos pre-tratamiento para usar como base. No se puede continuar.")
-            return
-        base_period_dummy = available_dummies[0]
-        logging.warning(f"El período base 'evento_m1' no se encontró. Usando '{base_period_dummy}' como período base alternativo.")
-
-    # Crear los términos de interacción: tratado * dummy_de_evento
-    interaction_terms = []
-    for col in event_dummies.columns:
-        if col != base_period_dummy: # Excluir el año base de los términos de interacción
-            interaction_term = f"I({col} * tratado)"
-            interaction_terms.append(interaction_term)
-
-    # --- PASO 4: Construir y Ejecutar el Modelo de Regresión ---
-    logging.info("Construyendo y ejecutando el modelo de Estudio de Eventos...")
-    # Se incluyen efectos fijos por departamento (C(unit)) y por año (C(Periodo)) para controlar por características invariantes
-    # en el tiempo de las unidades y por shocks comunes a todos los departamentos en un año determinado.
-    formula = f"""
-        deforestacion_anual ~ tratado + C(Periodo) + C(departamento) + {' + '.join(interaction_terms)}
+    # --- PASO 2: Cargar Datos a través del Analizador (sólo si hay años pendientes) ---
+    analyzer = DiDAnalysis(
+        data_path=PROCESSED_DATA_PATH,
+        treatment_year=years[0],
+        cache=cache,
+        treatment=assignment
+    )
+    logging.info("Datos cargados y preparados.")
+
+    # --- PASO 3: Estimar el Modelo para los Años Pendientes en un Solo Lote ---
+    # El motor construye un diseño disperso a partir de códigos enteros: efectos fijos por
+    # departamento y por año, más dummies de tiempo relativo interactuadas con el tratamiento.
+    logging.info("Construyendo y ejecutando el modelo de Estudio de Eventos (diseño disperso por lotes)...")
+    with span('fit'):
+        try:
+            coefficients, model_stats = analyzer.run_event_study_batch(
+                [treatment_year for treatment_year, _, _ in pending],
+                reference=reference, min_event=min_event, max_event=max_event, engine=engine, cluster=cluster
+            )
+        except ValueError as e:
+            logging.error(f"No se pudo estimar el Estudio de Eventos: {e}")
+            return False
+
+    # Los gráficos de todos los años pendientes se renderizan juntos en el pool.
+    with span('report'):
+        jobs = [write_event_study_outputs(treatment_year, coefficients, model_stats, run_dir, reference, staggered)
+                for treatment_year, run_dir, _ in pending]
+    for plot_path in render_figures(jobs, final=final):
+        logging.info(f"Gráfico del Estudio de Eventos guardado en: {plot_path}")
+    for _, run_dir, cache_key in pending:
+        analyzer.cache.store_artifacts(cache_key, run_dir)
+
+    logging.info(f"Análisis de Estudio de Eventos para los años {years} completado.")
+
+def write_event_study_outputs(year, coefficients, model_stats, run_dir, reference=-1, staggered=False):
+    """
+    Genera el reporte técnico del Estudio de Eventos para un año de intervención.
+    Con `staggered`, el Año 0 es el de adopción de cada unidad y `year` el primero.
+
+    Returns:
+        FigureJob: Trabajo de renderizado del gráfico del año.
     """
-    
-    model = smf.ols(formula, data=df).fit()
-    
-    # --- PASO 5: Extraer y Guardar Resultados ---
+    # --- PASO 4: Extraer y Guardar Resultados ---
     logging.info("Extrayendo coeficientes y generando reporte técnico...")
-    results_summary = model.summary()
-
-    # Extraer coeficientes de interacción
-    all_coef_names = model.params.index.tolist()
-    interaction_names = [name for name in all_coef_names if name.startswith('I(evento_')]
-
-    coefficients_table = model.params.loc[interaction_names].reset_index()
-    coefficients_table.columns = ['Termino', 'Coeficiente']
-    
-    # Extraer el año relativo del término de interacción
-    coefficients_table['Tiempo Relativo'] = coefficients_table['Termino'].str.extract(r'evento_m?(-?\d+)').astype(int)
-
-    conf_int = model.conf_int().loc[interaction_names].reset_index()
-    conf_int.columns = ['Termino', 'CI_lower', 'CI_upper']
-
-    results_df = pd.merge(coefficients_table, conf_int, on='Termino')
-
-    # Añadir el punto base (t-1) con coeficiente 0
-    base_year_relative = -1 # Asumimos que el año base es t-1
-    base_point = pd.DataFrame({
-        'Termino': [f'evento_m{abs(base_year_relative)}' if base_year_relative < 0 else f'evento_{base_year_relative}'], 
-        'Coeficiente': [0],
-        'Tiempo Relativo': [base_year_relative], 
-        'CI_lower': [0], 
-        'CI_upper': [0]
-    })
-    results_df = pd.concat([results_df, base_point], ignore_index=True).sort_values('Tiempo Relativo').reset_index(drop=True)
-    
+    results_df = coefficients[coefficients['treatment_year'] == year].rename(columns={
+        'relative_time': 'Tiempo Relativo',
+        'coef': 'Coeficiente',
+        'std_err': 'Error Estándar',
+        'p_value': 'P-valor',
+        'ci_lower': 'CI_lower',
+        'ci_upper': 'CI_upper',
+    }).reset_index(drop=True)
+    stats_row = model_stats[model_stats['treatment_year'] == year].iloc[0]
+
     report_path = os.path.join(run_dir, 'event_study_coefficients.txt')
     with open(report_path, 'w', encoding='utf-8') as f:
-        f.write(f"Resultados del Estudio de Eventos (Año de Intervención: {year})\n")
+        if staggered:
+            f.write(f"Resultados del Estudio de Eventos (Adopción Escalonada desde {year}; Año 0 = Adopción de Cada Unidad)\n")
+        else:
+            f.write(f"Resultados del Estudio de Eventos (Año de Intervención: {year})\n")
         f.write("=================================================================\n\n")
-        f.write("Coeficientes para los términos de interacción (Efecto por año):\n")
-        f.write(results_df[['Tiempo Relativo', 'Coeficiente', 'CI_lower', 'CI_upper']].to_string(index=False))
-        f.write("\n\nResumen Completo del Modelo de Regresión:\n")
-        f.write(str(results_summary))
+        f.write(f"Coeficientes para los términos de interacción (Efecto por año, base t{reference:+d}):\n")
+        f.write(results_df[['Tiempo Relativo', 'Coeficiente', 'Error Estándar', 'P-valor', 'CI_lower', 'CI_upper']].to_string(index=False))
+        f.write("\n\nEstadísticos del Modelo (efectos fijos por departamento y año):\n")
+        f.write(f"- Observaciones: {int(stats_row['nobs'])}\n")
+        f.write(f"- Grados de libertad residuales: {stats_row['df_resid']:.0f}\n")
+        f.write(f"- R-cuadrado: {stats_row['r_squared']:.4f}\n")
+        if stats_row['n_clusters'] > 0:
+            f.write(f"- Errores estándar agrupados por departamento ({int(stats_row['n_clusters'])} conglomerados).\n")
+        if results_df['binned'].any():
+            f.write("- Los extremos marcados como agrupados acumulan todos los tiempos relativos más allá del límite.\n")
     logging.info(f"Reporte técnico guardado en: {report_path}")
 
-    # 5.2. Visualización
-    logging.info("Generando gráfico del Estudio de Eventos...")
-    fig, ax = plt.subplots(figsize=(14, 8))
-    
-    ax.errorbar(results_df['Tiempo Relativo'], results_df['Coeficiente'], 
-                yerr=[results_df['Coeficiente'] - results_df['CI_lower'], results_df['CI_upper'] - results_df['Coeficiente']],
+    # 4.2. Visualización (descrita como datos; se renderiza en el pool)
+    return FigureJob(
+        renderer='src.analysis.event_study_analysis:draw_event_study',
+        output_path=os.path.join(run_dir, 'event_study_plot.png'),
+        data={
+            'year': year,
+            'staggered': staggered,
+            'relative_time': results_df['Tiempo Relativo'].tolist(),
+            'coef': results_df['Coeficiente'].tolist(),
+            'ci_lower': results_df['CI_lower'].tolist(),
+            'ci_upper': results_df['CI_upper'].tolist(),
+        },
+        template='event_study',
+        figsize=(14, 8),
+    )
+
+def draw_event_study(fig, ax, year, relative_time, coef, ci_lower, ci_upper, staggered=False):
+    """Dibuja los coeficientes del Estudio de Eventos (trabajo de renderizado)."""
+    ax.errorbar(relative_time, coef,
+                yerr=[[c - low for c, low in zip(coef, ci_lower)], [high - c for c, high in zip(coef, ci_upper)]],
                 fmt='o', color='#005f73', ecolor='#48cae4', elinewidth=1, capsize=5, markersize=8, label='Coeficiente Estimado (β)')
 
     style_event_study_plot(ax, fig,
         title="Estudio de Eventos: Efecto Dinámico de la Política Fiscal",
-        subtitle=f"Evolución del impacto en la deforestación antes y después de la intervención de {year} (Año 0)",
-        source_note="Elaboración propia. Las barras de error representan el intervalo de confianza del 95%."
+        subtitle=("Evolución del impacto en la deforestación antes y después de la adopción de cada unidad (Año 0)"
+                  if staggered else
+                  f"Evolución del impacto en la deforestación antes y después de la intervención de {year} (Año 0)"),
+        source_note="Elaboración propia. Las barras de error representan el intervalo de confianza del 95%.",
+        treatment_year=year
     )
-    
-    plot_path = os.path.join(run_dir, 'event_study_plot.png')
-    plt.savefig(plot_path, dpi=300, bbox_inches='tight')
-    plt.close(fig)
-    logging.info(f"Gráfico del Estudio de Eventos guardado en: {plot_path}")
-    
-    logging.info(f"Análisis de Estudio de Eventos para el año {year} completado.")
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("--year", type=int, default=2005)
+    parser.add_argument("--years", type=int, nargs='+', default=None,
+                        help="Varios años de intervención estimados en un solo lote (p. ej. 2005 2012).")
+    parser.add_argument("--reference", type=int, default=-1, help="Tiempo relativo omitido (período base).")
+    parser.add_argument("--min-event", type=int, default=None, help="Extremo inferior agrupado del tiempo relativo.")
+    parser.add_argument("--max-event", type=int, default=None, help="Extremo superior agrupado del tiempo relativo.")
+    parser.add_argument("--final", action="store_true", help="Guarda las figuras a 300 dpi (por defecto, borrador).")
+    parser.add_argument("--treatment", default=None,
+                        help="Asignación del tratamiento: archivo CSV o 'UNIDAD=AÑO,...' (por defecto, San Martin).")
+    parser.add_argument("--engine", choices=list(ENGINES), default='auto',
+                        help="Efectos fijos como dummies o absorbidos (HDFE); 'auto' usa HDFE con muchas unidades.")
+    parser.add_argument("--cluster", choices=['unit'], default=None,
+                        help="Errores estándar agrupados por departamento (usa el motor HDFE).")
     args = parser.parse_args()
-    main(year=args.year)
+    main(year=args.year, years=args.years, reference=args.reference,
+         min_event=args.min_event, max_event=args.max_event, final=args.final, treatment=args.treatment,
+         engine=args.engine, cluster=args.cluster)
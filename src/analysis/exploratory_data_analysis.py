@@ -1,89 +1,104 @@
 # -*- coding: utf-8 -*-
-import pandas as pd
-import matplotlib.pyplot as plt
 import os
-import numpy as np
 import logging
 import sys
+import argparse
 
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 from src.utils import setup_run_environment
+from src.core.data_manager import load_processed_data
+from src.core.result_cache import ResultCache
+from src.core.rendering import FigureJob, render_figures
+from src.core.visualization_utils import annotate_plot
+from src.core.lazy_imports import lazy_import
+
+plt = lazy_import('matplotlib.pyplot')
+np = lazy_import('numpy')
+
+SOURCE_NOTE = 'Fuente: Datos de MapBiomas Perú (Procesado). Elaboración propia.'
+INTERVENTION_YEAR = 2005
 
 def style_chart(ax, fig, title, subtitle, xlabel, source_note):
-    """Aplica un estilo consistente y profesional a un gráfico."""
-    fig.suptitle(title, fontsize=18, fontweight='bold', ha='center')
-    ax.set_title(subtitle, fontsize=12, fontstyle='italic', pad=20, loc='center')
-    ax.spines['top'].set_visible(False)
-    ax.spines['right'].set_visible(False)
-    ax.spines['bottom'].set_color('gray')
-    ax.spines['left'].set_visible(False)
+    """Completa la plantilla 'base' con títulos, etiquetas de ejes y nota de fuente."""
     ax.set_xlabel(xlabel, fontsize=12, labelpad=15, color='gray')
-    ax.yaxis.grid(True, color='#EEEEEE', linestyle='--', linewidth=0.8)
-    ax.set_axisbelow(True)
-    ax.tick_params(axis='x', colors='gray', rotation=45)
-    ax.tick_params(axis='y', length=0, colors='gray')
     ax.set_ylabel('Deforestación Anual (miles de hectáreas)', fontsize=12, color='gray')
-    fig.tight_layout(rect=[0, 0.05, 1, 0.9])
-    fig.text(0.05, 0.01, source_note, ha='left', fontsize=9, color='gray')
+    annotate_plot(ax, fig, title, subtitle, source_note)
 
-def main():
-    """Genera los gráficos del Análisis Exploratorio de Datos (EDA)."""
+def draw_department(fig, ax, department, periods, values):
+    """Dibuja la evolución de la deforestación de un departamento (trabajo de renderizado)."""
+    style_chart(ax, fig,
+                title=f'Evolución de la Deforestación en {department}',
+                subtitle=f'Período {min(periods)}-{max(periods)}',
+                xlabel='Año',
+                source_note=SOURCE_NOTE)
+    ax.plot(periods, values, marker='o', linestyle='-', color='#005f73')
+    ax.axvline(x=INTERVENTION_YEAR, color='#E63946', linestyle=':', linewidth=2, label='Intervención Ley 2005')
+    ax.legend(loc='upper left', frameon=False)
+
+def draw_comparison(fig, ax, series, first_year, last_year):
+    """Dibuja el comparativo de todos los departamentos (trabajo de renderizado)."""
+    style_chart(ax, fig,
+                title='Comparativo de Deforestación Anual por Departamento',
+                subtitle=f'Período {first_year}-{last_year}',
+                xlabel='Año',
+                source_note=SOURCE_NOTE)
+    colors = plt.get_cmap('viridis')(np.linspace(0, 1, len(series)))
+    for i, (dep, (periods, values)) in enumerate(series.items()):
+        ax.plot(periods, values, marker='o', markersize=4, linestyle='-', label=dep, color=colors[i], alpha=0.8)
+    ax.axvline(x=INTERVENTION_YEAR, color='#E63946', linestyle=':', linewidth=2, label='Intervención Ley 2005')
+    ax.legend(loc='upper left', frameon=False, title='Departamentos')
+
+def main(final=False, n_jobs=None):
+    """
+    Genera los gráficos del Análisis Exploratorio de Datos (EDA).
+
+    Args:
+        final (bool): Guarda las figuras en resolución de publicación (300 dpi) en lugar de borrador.
+        n_jobs (int, optional): Procesos del pool de renderizado; None usa todos los núcleos.
+    """
     run_dir, _ = setup_run_environment('reports/figures/eda')
     logging.info("Iniciando la generación de gráficos del EDA...")
 
     try:
-        df = pd.read_csv('data/02_processed/deforestation_analysis_data.csv')
+        df = load_processed_data(columns=['departamento', 'Periodo', 'deforestacion_anual'])
         logging.info("Datos procesados cargados para el EDA.")
     except FileNotFoundError:
         logging.error("No se encontró el archivo procesado. Ejecuta 'python main.py data' primero.")
-        return
+        return False
 
-    departamentos = df['departamento'].unique()
-    for dep in departamentos:
-        fig, ax = plt.subplots(figsize=(12, 7))
-        dep_data = df[df['departamento'] == dep]
-        
-        style_chart(ax, fig, 
-                    title=f'Evolución de la Deforestación en {dep}',
-                    subtitle=f'Período {dep_data["Periodo"].min()}-{dep_data["Periodo"].max()}',
-                    xlabel='Año',
-                    source_note='Fuente: Datos de MapBiomas Perú (Procesado). Elaboración propia.')
-        
-        ax.plot(dep_data['Periodo'], dep_data['deforestacion_anual'], marker='o', linestyle='-', color='#005f73')
-        ax.axvline(x=2005, color='#E63946', linestyle=':', linewidth=2, label='Intervención Ley 2005')
-        ax.legend(loc='upper left', frameon=False)
-
-        output_path = os.path.join(run_dir, f'deforestacion_{dep.replace(" ", "_")}.png')
-        plt.savefig(output_path, dpi=300, bbox_inches='tight')
-        plt.close(fig)
-
-    logging.info("Gráficos individuales generados.")
-
-    # Gráfico comparativo
-    fig_comp, ax_comp = plt.subplots(figsize=(14, 8))
-    style_chart(ax_comp, fig_comp, 
-                title='Comparativo de Deforestación Anual por Departamento',
-                subtitle=f'Período {df["Periodo"].min()}-{df["Periodo"].max()}',
-                xlabel='Año',
-                source_note='Fuente: Datos de MapBiomas Perú (Procesado). Elaboración propia.')
-
-    colors = plt.get_cmap('viridis')(np.linspace(0, 1, len(departamentos)))
-
-    for i, dep in enumerate(departamentos):
-        dep_data = df[df['departamento'] == dep]
-        ax_comp.plot(dep_data['Periodo'], dep_data['deforestacion_anual'], marker='o', markersize=4, linestyle='-', label=dep, color=colors[i], alpha=0.8)
-
-    ax_comp.axvline(x=2005, color='#E63946', linestyle=':', linewidth=2, label='Intervención Ley 2005')
-    ax_comp.legend(loc='upper left', frameon=False, title='Departamentos')
+    cache = ResultCache()
+    cache_key = cache.key({'script': 'exploratory_data_analysis', 'final': final})
+    if cache.restore_artifacts(cache_key, run_dir):
+        logging.info(f"Sin cambios en datos, especificación ni código: productos recuperados de la caché en {run_dir}.")
+        return
 
-    comp_path = os.path.join(run_dir, 'deforestacion_comparativo_total.png')
-    plt.savefig(comp_path, dpi=300, bbox_inches='tight')
-    plt.close(fig_comp)
-    logging.info("Gráfico comparativo generado.")
+    # Cada gráfico se describe como datos y se renderiza en el pool (un departamento por trabajo).
+    series = {
+        dep: (dep_data['Periodo'].tolist(), dep_data['deforestacion_anual'].tolist())
+        for dep, dep_data in df.groupby('departamento', sort=False)
+    }
+    jobs = [
+        FigureJob(renderer='src.analysis.exploratory_data_analysis:draw_department',
+                  output_path=os.path.join(run_dir, f'deforestacion_{dep.replace(" ", "_")}.png'),
+                  data={'department': dep, 'periods': periods, 'values': values})
+        for dep, (periods, values) in series.items()
+    ]
+    jobs.append(FigureJob(renderer='src.analysis.exploratory_data_analysis:draw_comparison',
+                          output_path=os.path.join(run_dir, 'deforestacion_comparativo_total.png'),
+                          data={'series': series, 'first_year': int(df['Periodo'].min()),
+                                'last_year': int(df['Periodo'].max())},
+                          figsize=(14, 8)))
+    render_figures(jobs, n_jobs=n_jobs, final=final)
+    logging.info(f"{len(series)} gráficos individuales y el comparativo generados.")
+    cache.store_artifacts(cache_key, run_dir)
     logging.info("Generación de gráficos del EDA completada.")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--final", action="store_true", help="Guarda las figuras a 300 dpi (por defecto, borrador).")
+    parser.add_argument("--jobs", type=int, default=None, help="Procesos de renderizado (por defecto, todos los núcleos).")
+    args = parser.parse_args()
+    main(final=args.final, n_jobs=args.jobs)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Script para estimar los modelos DiD, de tendencias paralelas y de estudio de eventos
+sobre varias variables de resultado del panel en una sola corrida (p. ej.
+`cobertura_boscosa` además de `deforestacion_anual`, o las clases de cobertura de
+MapBiomas), con una tabla de resultados apilada.
+"""
+
+import os
+import logging
+import sys
+import argparse
+
+# --- Configuración del Entorno ---
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# --- Módulos del Proyecto ---
+from src.utils import setup_run_environment
+from src.core.econometrics import DiDAnalysis
+from src.core.data_manager import PROCESSED_DATA_PATH
+from src.core.instrumentation import span
+from src.core.multi_outcome import MODELS, outcome_columns
+
+TREATMENT_UNIT = 'San Martin'
+
+def parse_list(text):
+    """Interpreta una lista separada por comas, p. ej. 'deforestacion_anual,cobertura_boscosa'."""
+    return [part.strip() for part in str(text).split(',') if part.strip()]
+
+def main(year=2005, outcomes=None, models=','.join(MODELS), start_year=None, end_year=None, treatment=None):
+    """
+    Función principal para orquestar el análisis con varias variables de resultado.
+
+    Args:
+        year (int): Año de intervención; con `treatment`, sólo el de las unidades sin año
+                    propio (se usa el primer año de adopción de la asignación).
+        outcomes (str or list, optional): Variables de resultado; por defecto, todas las
+                                          columnas numéricas del panel procesado.
+        models (str or list): Modelos a estimar: 'did', 'parallel_trends', 'event_study'.
+        start_year, end_year (int, optional): Ventana del modelo DiD.
+        treatment (str or dict, optional): Asignación del tratamiento (archivo CSV o
+                                           'UNIDAD=AÑO,...', ver `src.core.treatment`);
+                                           por defecto, San Martín.
+    """
+    if isinstance(models, str):
+        models = parse_list(models)
+    if isinstance(outcomes, str):
+        outcomes = parse_list(outcomes)
+
+    run_dir, _ = setup_run_environment(os.path.join('reports', 'multi_outcome'))
+    logging.info("Iniciando el análisis con varias variables de resultado...")
+
+    try:
+        analyzer = DiDAnalysis(data_path=PROCESSED_DATA_PATH, treatment_unit=TREATMENT_UNIT, treatment_year=year,
+                               treatment=treatment)
+    except FileNotFoundError:
+        logging.error("No se encontró el dataset procesado. Abortando. Ejecuta 'python main.py data' primero.")
+        return False
+    year = analyzer.treatment_year
+    outcomes = outcomes or outcome_columns(analyzer.df)
+
+    cache_key = analyzer.cache.key({
+        'script': 'multi_outcome_analysis', 'year': year, 'treatment': analyzer.treatment.key(),
+        'outcomes': outcomes, 'models': models,
+        'start_year': start_year, 'end_year': end_year,
+    }, data_path=PROCESSED_DATA_PATH)
+    if analyzer.cache.restore_artifacts(cache_key, run_dir):
+        logging.info(f"Sin cambios en datos, especificación ni código: productos recuperados de la caché en {run_dir}.")
+        return
+
+    with span('fit'):
+        try:
+            table = analyzer.run_multi_outcome(outcomes, models=models, start_year=start_year, end_year=end_year)
+        except ValueError as e:
+            logging.error(f"No se pudo estimar el análisis: {e}")
+            return False
+    logging.info(f"{len(outcomes)} variables de resultado x {len(models)} modelos estimados.")
+
+    with span('report'):
+        table.to_csv(os.path.join(run_dir, 'multi_outcome_results.csv'), index=False)
+        report_path = os.path.join(run_dir, 'multi_outcome_report.txt')
+        columns = ['outcome', 'coef', 'std_err', 'p_value', 'ci_lower', 'ci_upper', 'nobs', 'r_squared']
+        titles = {
+            'did': "Modelo DiD: coeficiente 'did'",
+            'parallel_trends': "Tendencias paralelas: coeficiente 'tratado:año_norm' (pre-intervención)",
+            'event_study': "Estudio de eventos: coeficientes por año relativo (base: -1)",
+        }
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write("Resultados con Varias Variables de Resultado\n")
+            f.write("==============================================================================\n")
+            f.write(f"Unidad tratada: {analyzer.treatment_unit} | Año de intervención: {year}\n")
+            f.write(f"Variables de resultado: {', '.join(outcomes)}\n")
+            for model in models:
+                rows = table[table['model'] == model]
+                f.write(f"\n{titles[model]}\n")
+                if model == 'event_study':
+                    coefficients = rows.pivot(index='relative_time', columns='outcome', values='coef')[outcomes]
+                    f.write(coefficients.to_string(float_format=lambda x: f"{x:.4f}"))
+                else:
+                    f.write(rows[columns].to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+                f.write("\n")
+            f.write("\nLa tabla completa (con errores estándar e intervalos del estudio de eventos) está en\n")
+            f.write("multi_outcome_results.csv.\n")
+        logging.info(f"Reporte guardado en: {report_path}")
+
+    analyzer.cache.store_artifacts(cache_key, run_dir)
+    logging.info("Análisis con varias variables de resultado completado.")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--year", type=int, default=2005)
+    parser.add_argument("--outcomes", default=None,
+                        help="Variables de resultado, p. ej. 'deforestacion_anual,cobertura_boscosa' "
+                             "(por defecto, todas las columnas numéricas del panel).")
+    parser.add_argument("--models", default=','.join(MODELS), help="Modelos, p. ej. 'did,event_study'.")
+    parser.add_argument("--start-year", type=int, default=None, help="Inicio de la ventana del modelo DiD.")
+    parser.add_argument("--end-year", type=int, default=None, help="Fin de la ventana del modelo DiD.")
+    parser.add_argument("--treatment", default=None,
+                        help="Asignación del tratamiento: archivo CSV o 'UNIDAD=AÑO,...' (por defecto, San Martin).")
+    args = parser.parse_args()
+    main(year=args.year, outcomes=args.outcomes, models=args.models, start_year=args.start_year,
+         end_year=args.end_year, treatment=args.treatment)
@@ -3,26 +3,94 @@
 Script refactorizado para validar el supuesto de tendencias paralelas.
 Admite un año de intervención dinámico para análisis de sensibilidad.
 """
-import pandas as pd
-import matplotlib.pyplot as plt
 import os
 import logging
 import sys
+import argparse
 
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 from src.utils import setup_run_environment
+from src.core.batched_ols import PanelCells
+from src.core.control_search import ControlSubsetSearch
+from src.core.data_manager import PROCESSED_DATA_PATH, load_processed_data
+from src.core.incremental import MomentStore
+from src.core.result_cache import ResultCache
+from src.core.treatment import TreatmentAssignment
+from src.core.rendering import FigureJob, render_figures
+from src.core.lazy_imports import is_available, lazy_import
 
-try:
-    import statsmodels.formula.api as smf
-except ImportError:
+if not is_available('statsmodels'):
     logging.error("La librería 'statsmodels' no está instalada. Por favor, instálala manualmente con 'pip install statsmodels'.")
     sys.exit(1)
 
-def main(year=2005):
-    """Orquesta la validación de tendencias paralelas para un año de intervención dado."""
+smf = lazy_import('statsmodels.formula.api')
+
+TREATMENT_UNIT = 'San Martin'
+
+def draw_parallel_trends(fig, ax, year, periods, control, treated, treated_label='San Martín'):
+    """Trayectorias promedio pre-intervención de ambos grupos (trabajo de renderizado)."""
+    ax = fig.subplots()
+    fig.suptitle(f'Validación de Tendencias Paralelas (Intervención: {year})', fontsize=18, fontweight='bold')
+    ax.set_title(f'Evolución de la Deforestación Promedio ({min(periods)}-{max(periods)})', fontsize=12, fontstyle='italic', pad=20)
+    ax.set_xlabel('Año')
+    ax.set_ylabel('Deforestación Anual Promedio (miles de ha)')
+    ax.grid(True, which='both', linestyle='--', linewidth=0.5)
+    ax.plot(periods, control, marker='o', linestyle='-', label='Grupo de Control (Promedio)')
+    ax.plot(periods, treated, marker='o', linestyle='-', label=f'Grupo de Tratamiento ({treated_label})')
+    ax.legend(title='Grupos')
+    fig.tight_layout(rect=[0, 0.05, 1, 0.9])
+
+def control_search_report(ranking, summary):
+    """Sección del reporte con el ranking de grupos de control."""
+    baseline = summary['all_donors']
+    mode = 'todos enumerados' if summary['mode'] == 'enumerated' else 'muestra aleatoria'
+    lines = [
+        "",
+        "Búsqueda de Grupos de Control",
+        "==============================================================================",
+        f"Donantes candidatos: {summary['n_donors']}; subconjuntos admisibles: {summary['n_admissible']:,}",
+        f"Subconjuntos evaluados: {summary['n_evaluated']:,} ({mode})",
+        f"No se rechazan tendencias paralelas (p > {summary['alpha']}): {summary['share_not_rejected']:.1%}",
+        f"Con todos los donantes: coeficiente {baseline['coef']:.4f}, p-valor {baseline['p_value']:.4f}",
+        "",
+        f"Los {len(ranking)} subconjuntos con mayor p-valor de 'tratado:año_norm':",
+        ranking.to_string(index=False, float_format=lambda x: f"{x:.4f}"),
+        "",
+        "Un p-valor alto también puede deberse a un grupo pequeño y ruidoso: conviene",
+        "preferir grupos con más donantes entre los que no rechazan la hipótesis nula.",
+        "==============================================================================",
+    ]
+    return "\n".join(lines) + "\n"
+
+def main(year=2005, compressed=False, final=False, control_search=False, max_subsets=1_000_000, top=20, seed=0,
+         treatment=None):
+    """
+    Orquesta la validación de tendencias paralelas para un año de intervención dado.
+
+    Args:
+        year (int): Año de intervención; con `treatment`, sólo el de las unidades sin año
+                    propio (la prueba usa el primer año de adopción de la asignación).
+        compressed (bool): Estima la prueba sobre celdas (grupo, período) comprimidas.
+        final (bool): Guarda el gráfico en resolución de publicación (300 dpi) en lugar de borrador.
+        control_search (bool): Además, ordena los subconjuntos de departamentos de control
+                               según la prueba (ver `src.core.control_search`).
+        max_subsets (int): Límite de subconjuntos evaluados; si hay más, se muestrean.
+        top (int): Subconjuntos a reportar en el ranking.
+        seed (int): Semilla del muestreo de subconjuntos.
+        treatment (str or dict, optional): Asignación del tratamiento (archivo CSV o
+                                           'UNIDAD=AÑO,...', ver `src.core.treatment`);
+                                           por defecto, San Martín. Con adopción escalonada,
+                                           el período previo termina en el primer año de
+                                           adopción, antes del cual ninguna unidad está tratada.
+    """
+    assignment = TreatmentAssignment.parse(treatment if treatment is not None else TREATMENT_UNIT,
+                                           default_year=year)
+    year = assignment.reference_year
+    treated_label = 'San Martín' if assignment.treated_units == [TREATMENT_UNIT] else assignment.label
+
     # Directorio de salida dinámico para el análisis de sensibilidad
     output_dir = os.path.join('reports', 'exploratory_two_shocks_analysis', str(year), 'validation')
     run_dir, _ = setup_run_environment(output_dir)
@@ -30,12 +98,22 @@ def main(year=2005):
     logging.info(f"Iniciando la validación de tendencias paralelas para el año de intervención {year}...")
 
     try:
-        df = pd.read_csv('data/02_processed/deforestation_analysis_data.csv')
+        df = load_processed_data(columns=['departamento', 'Periodo', 'deforestacion_anual'])
     except FileNotFoundError:
         logging.error("Abortando. Ejecuta 'python main.py data' primero.")
+        return False
+
+    cache = ResultCache()
+    spec = {'script': 'parallel_trends_validation', 'year': year, 'treatment': assignment.key(),
+            'compressed': compressed, 'final': final}
+    if control_search:
+        spec.update(control_search=True, max_subsets=max_subsets, top=top, seed=seed)
+    cache_key = cache.key(spec)
+    if cache.restore_artifacts(cache_key, run_dir):
+        logging.info(f"Sin cambios en datos, especificación ni código: productos recuperados de la caché en {run_dir}.")
         return
 
-    df['tratado'] = (df['departamento'] == 'San Martin').astype(int)
+    df['tratado'] = assignment.codes(df['departamento'])[0].astype(int)
     # Usar el año de intervención pasado como parámetro
     pre_intervention_df = df[df['Periodo'] < year].copy()
 
@@ -45,26 +123,23 @@ def main(year=2005):
 
     logging.info("Generando gráfico de validación visual...")
     avg_trends = pre_intervention_df.groupby(['Periodo', 'tratado'])['deforestacion_anual'].mean().unstack()
-    
-    fig, ax = plt.subplots(figsize=(12, 8))
-    fig.suptitle(f'Validación de Tendencias Paralelas (Intervención: {year})', fontsize=18, fontweight='bold')
-    ax.set_title(f'Evolución de la Deforestación Promedio ({pre_intervention_df.Periodo.min()}-{pre_intervention_df.Periodo.max()})', fontsize=12, fontstyle='italic', pad=20)
-    ax.set_xlabel('Año')
-    ax.set_ylabel('Deforestación Anual Promedio (miles de ha)')
-    ax.grid(True, which='both', linestyle='--', linewidth=0.5)
-    ax.plot(avg_trends.index, avg_trends[0], marker='o', linestyle='-', label='Grupo de Control (Promedio)')
-    ax.plot(avg_trends.index, avg_trends[1], marker='o', linestyle='-', label='Grupo de Tratamiento (San Martín)')
-    ax.legend(title='Grupos')
-    fig.tight_layout(rect=[0, 0.05, 1, 0.9])
-    
-    plot_path = os.path.join(run_dir, 'parallel_trends_visual_validation.png')
-    plt.savefig(plot_path, dpi=300)
+    job = FigureJob(renderer='src.analysis.parallel_trends_validation:draw_parallel_trends',
+                    output_path=os.path.join(run_dir, 'parallel_trends_visual_validation.png'),
+                    data={'year': year, 'periods': avg_trends.index.tolist(),
+                          'control': avg_trends[0].tolist(), 'treated': avg_trends[1].tolist(),
+                          'treated_label': treated_label},
+                    template=None, figsize=(12, 8), tight=False)
+    plot_path, = render_figures([job], n_jobs=1, final=final)
     logging.info(f"Gráfico de validación guardado en: {plot_path}")
-    plt.close(fig)
 
     logging.info("Realizando prueba estadística...")
-    pre_intervention_df['año_norm'] = pre_intervention_df['Periodo'] - pre_intervention_df['Periodo'].min()
-    model = smf.ols('deforestacion_anual ~ tratado + año_norm + tratado:año_norm', data=pre_intervention_df).fit()
+    formula = 'deforestacion_anual ~ tratado + año_norm + tratado:año_norm'
+    if compressed:
+        # Momentos guardados junto al dataset: se actualizan al anexar años (make_dataset --append).
+        model = MomentStore(PROCESSED_DATA_PATH).results('parallel_trends', assignment.treated_units, year, df)
+    else:
+        pre_intervention_df['año_norm'] = pre_intervention_df['Periodo'] - pre_intervention_df['Periodo'].min()
+        model = smf.ols(formula, data=pre_intervention_df).fit()
     
     report_table = f"""
 ==============================================================================
@@ -72,6 +147,7 @@ def main(year=2005):
          Período de Prueba: {pre_intervention_df.Periodo.min()}-{pre_intervention_df.Periodo.max()}
 ==============================================================================
 Variable Dependiente: deforestacion_anual
+Unidades tratadas: {', '.join(assignment.treated_units)}
 
 {model.summary()}
 ==============================================================================
@@ -88,16 +164,38 @@ tendencias son paralelas, lo cual valida nuestro supuesto para el análisis DiD.
 ==============================================================================
 """
     
+    if control_search:
+        logging.info("Buscando subconjuntos de departamentos de control...")
+        ranking, summary = ControlSubsetSearch(PanelCells(df), assignment.treated_units, year, max_subsets=max_subsets,
+                                               seed=seed).run(top=top)
+        ranking_path = os.path.join(run_dir, 'control_subset_ranking.csv')
+        ranking.to_csv(ranking_path, index=False)
+        report_table += control_search_report(ranking, summary)
+        logging.info(f"Ranking de grupos de control guardado en: {ranking_path}")
+
     table_path = os.path.join(run_dir, 'parallel_trends_statistical_validation.txt')
     with open(table_path, 'w', encoding='utf-8') as f:
         f.write(report_table)
     logging.info(f"Resultados de la validación estadística guardados en: {table_path}")
     
+    cache.store_artifacts(cache_key, run_dir)
     logging.info(f"Validación de tendencias paralelas para el año {year} completada.")
 
 if __name__ == '__main__':
     # Permite la ejecución directa del script con un año por defecto
     parser = argparse.ArgumentParser()
     parser.add_argument("--year", type=int, default=2005)
+    parser.add_argument("--compressed", action="store_true",
+                        help="Estima la prueba sobre celdas (grupo, período) comprimidas.")
+    parser.add_argument("--final", action="store_true", help="Guarda el gráfico a 300 dpi (por defecto, borrador).")
+    parser.add_argument("--control-search", action="store_true",
+                        help="Ordena los subconjuntos de departamentos de control según la prueba.")
+    parser.add_argument("--max-subsets", type=int, default=1_000_000,
+                        help="Límite de subconjuntos evaluados; si hay más, se muestrean.")
+    parser.add_argument("--top", type=int, default=20, help="Subconjuntos a reportar en el ranking.")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla del muestreo de subconjuntos.")
+    parser.add_argument("--treatment", default=None,
+                        help="Asignación del tratamiento: archivo CSV o 'UNIDAD=AÑO,...' (por defecto, San Martin).")
     args = parser.parse_args()
-    main(year=args.year)
+    main(year=args.year, compressed=args.compressed, final=args.final, control_search=args.control_search,
+         max_subsets=args.max_subsets, top=args.top, seed=args.seed, treatment=args.treatment)
@@ -6,8 +6,7 @@ para validar la solidez de los resultados del análisis DiD.
 import os
 import logging
 import sys
-import pandas as pd
-import matplotlib.pyplot as plt
+import argparse
 
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 if project_root not in sys.path:
@@ -15,64 +14,130 @@ if project_root not in sys.path:
 
 from src.utils import setup_run_environment
 from src.core.econometrics import DiDAnalysis
+from src.core.data_manager import PROCESSED_DATA_PATH
+from src.core.rendering import FigureJob, render_figures
 
-def run_placebo_test(analyzer, placebo_year, run_dir):
+def run_permutation_tests(analyzer, run_dir, n_jobs=None):
     """
-    Ejecuta una prueba de placebo para un año específico.
+    Ejecuta la inferencia por aleatorización (placebos en el espacio y en el tiempo)
+    y guarda el resumen de p-valores y la distribución nula.
 
     Args:
         analyzer (DiDAnalysis): Una instancia de la clase de análisis.
-        placebo_year (int): El año falso para simular la intervención.
         run_dir (str): El directorio para guardar los resultados.
+        n_jobs (int, optional): Procesos del pool; None usa todos los núcleos.
+
+    Returns:
+        tuple: (resumen de p-valores, trabajo de renderizado del histograma de la distribución nula).
     """
-    logging.info(f"--- Ejecutando Prueba de Placebo para el año {placebo_year} ---")
-    
-    # Modificar temporalmente el año de tratamiento en una copia del dataframe
-    placebo_df = analyzer.df.copy()
-    placebo_df['post_treatment'] = (placebo_df['Periodo'] >= placebo_year).astype(int)
-    placebo_df['did'] = placebo_df['post_treatment'] * placebo_df['tratado']
+    logging.info("Ejecutando inferencia por permutación en el espacio y en el tiempo...")
+    # Semilla fija: si hay que muestrear asignaciones, la distribución nula es reproducible.
+    summary, draws = analyzer.run_permutation_inference(n_jobs=n_jobs, seed=0)
 
-    try:
-        import statsmodels.formula.api as smf
-        model = smf.ols('deforestacion_anual ~ tratado + post_treatment + did', data=placebo_df).fit()
-        
-        coef_did = model.params['did']
-        p_value_did = model.pvalues['did']
-        
-        logging.info(f"Placebo {placebo_year}: Coeficiente DiD = {coef_did:.4f}, P-valor = {p_value_did:.4f}")
-        return {'year': placebo_year, 'coef': coef_did, 'p_value': p_value_did}
+    draws_path = os.path.join(run_dir, 'permutation_null_distribution.csv')
+    draws.to_csv(draws_path, index=False)
+
+    report_path = os.path.join(run_dir, 'permutation_inference_summary.txt')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write("Inferencia por Permutación (Aleatorización) del Efecto DiD\n")
+        f.write("==========================================================\n")
+        f.write("'space': el tratamiento se reasigna a cada departamento en el año real.\n")
+        f.write("'time': el tratamiento se reasigna a cada año pre-intervención; el efecto observado y cada\n"
+                "placebo se estiman con la misma ventana de años alrededor del año asignado (la de los\n"
+                "placebos termina antes de la intervención).\n")
+        f.write("El p-valor es la proporción de asignaciones con un efecto al menos tan extremo como el observado.\n\n")
+        f.write(summary.to_string(index=False))
+        f.write("\n\nDistribución nula empírica:\n")
+        f.write(draws.to_string(index=False))
+    logging.info(f"Reporte de permutación guardado en {report_path}")
 
-    except Exception as e:
-        logging.error(f"Fallo la prueba de placebo para el año {placebo_year}: {e}")
-        return None
+    families = [
+        {'family': row.family, 'observed_coef': row.observed_coef, 'p_value': row.p_value_coef,
+         'null': draws[(draws['family'] == row.family) & ~draws['is_observed']]['coef'].tolist()}
+        for row in summary.itertuples(index=False)
+    ]
+    job = FigureJob(renderer='src.analysis.robustness_checks:draw_permutation_null',
+                    output_path=os.path.join(run_dir, 'permutation_null_distribution.png'),
+                    data={'families': families}, template=None, figsize=(7 * len(families), 6), tight=False)
+    return summary, job
+
+def draw_placebo_coefficients(fig, ax, years, coefs, p_values):
+    """Coeficientes DiD de los años placebo (trabajo de renderizado)."""
+    ax = fig.subplots()
+    fig.suptitle('Resultados de las Pruebas de Placebo', fontsize=16, fontweight='bold')
+    ax.set_title('Coeficientes DiD para Años de Intervención Falsos', fontsize=12, fontstyle='italic')
+    ax.axhline(0, color='black', linestyle='--', linewidth=0.8)
+
+    # Colorear por significancia
+    colors = ['red' if p < 0.05 else 'gray' for p in p_values]
+
+    ax.bar(years, coefs, color=colors, alpha=0.7)
+    ax.set_xlabel('Año de Placebo')
+    ax.set_ylabel('Coeficiente DiD Estimado')
+    ax.grid(axis='y', linestyle=':', alpha=0.5)
+
+def draw_permutation_null(fig, ax, families):
+    """Histogramas de la distribución nula por familia de permutación (trabajo de renderizado)."""
+    axes = fig.subplots(1, len(families), squeeze=False)
+    fig.suptitle('Distribución Nula por Permutación', fontsize=16, fontweight='bold')
+    for ax, family in zip(axes[0], families):
+        null = family['null']
+        ax.hist(null, bins=max(5, min(50, len(null))), color='gray', alpha=0.7, label='Asignaciones placebo')
+        ax.axvline(family['observed_coef'], color='red', linestyle='--', linewidth=2, label='Efecto observado')
+        ax.set_title(f"Familia '{family['family']}' (p-valor: {family['p_value']:.3f})", fontsize=12, fontstyle='italic')
+        ax.set_xlabel('Coeficiente DiD Estimado')
+        ax.legend(frameon=False)
+        ax.grid(axis='y', linestyle=':', alpha=0.5)
 
-def main():
-    """Función principal para orquestar las pruebas de robustez."""
+def main(n_jobs=None, final=False, treatment=None):
+    """
+    Función principal para orquestar las pruebas de robustez.
+
+    Args:
+        n_jobs (int, optional): Procesos para la inferencia por permutación y el renderizado.
+        final (bool): Guarda las figuras en resolución de publicación (300 dpi) en lugar de borrador.
+        treatment (str or dict, optional): Asignación del tratamiento (archivo CSV o
+                                           'UNIDAD=AÑO,...', ver `src.core.treatment`);
+                                           por defecto, San Martín.
+    """
     run_dir, _ = setup_run_environment('reports/robustness_checks')
     logging.info("Iniciando pruebas de robustez...")
 
     try:
         analyzer = DiDAnalysis(
-            data_path='data/02_processed/deforestation_analysis_data.csv',
+            data_path=PROCESSED_DATA_PATH,
             treatment_unit='San Martin',
-            treatment_year=2005 # El año real de la intervención
+            treatment_year=2005, # El año real de la intervención
+            treatment=treatment
         )
     except FileNotFoundError:
         logging.error("Abortando. Ejecuta 'python main.py data' primero.")
+        return False
+
+    cache_key = analyzer.cache.key({'script': 'robustness_checks', 'treatment': analyzer.treatment.key(),
+                                    'treatment_year': analyzer.treatment_year, 'final': final},
+                                   data_path=PROCESSED_DATA_PATH)
+    if analyzer.cache.restore_artifacts(cache_key, run_dir):
+        logging.info(f"Sin cambios en datos, especificación ni código: productos recuperados de la caché en {run_dir}.")
         return
 
-    # Años pre-intervención para las pruebas de placebo
-    placebo_years = [year for year in range(1999, 2005)]
-    placebo_results = []
+    # Años pre-intervención para las pruebas de placebo (hasta el año de la asignación)
+    placebo_years = [year for year in range(1999, analyzer.treatment_year)]
 
-    for year in placebo_years:
-        result = run_placebo_test(analyzer, year, run_dir)
-        if result:
-            placebo_results.append(result)
+    # Todas las pruebas de placebo se estiman en una sola llamada al motor por lotes.
+    logging.info(f"Estimando {len(placebo_years)} pruebas de placebo en un solo lote...")
+    try:
+        batch = analyzer.run_did_batch([(year, None, None) for year in placebo_years])
+    except ValueError as e:
+        logging.error(f"No se pudieron estimar los placebos: {e}")
+        return False
+    df_placebo = batch.rename(columns={'treatment_year': 'year'})[['year', 'coef', 'p_value']]
+    for row in df_placebo.itertuples(index=False):
+        logging.info(f"Placebo {row.year}: Coeficiente DiD = {row.coef:.4f}, P-valor = {row.p_value:.4f}")
 
     # --- Generar reporte y gráfico de las pruebas de placebo ---
-    if placebo_results:
-        df_placebo = pd.DataFrame(placebo_results)
+    jobs = []
+    if not df_placebo.empty:
         
         # Guardar resultados en un archivo de texto
         report_path = os.path.join(run_dir, 'placebo_tests_summary.txt')
@@ -83,26 +148,26 @@ def main():
             f.write(df_placebo.to_string(index=False))
         logging.info(f"Reporte de placebo guardado en {report_path}")
 
-        # Generar gráfico
-        fig, ax = plt.subplots(figsize=(12, 7))
-        fig.suptitle('Resultados de las Pruebas de Placebo', fontsize=16, fontweight='bold')
-        ax.set_title('Coeficientes DiD para Años de Intervención Falsos', fontsize=12, fontstyle='italic')
-        ax.axhline(0, color='black', linestyle='--', linewidth=0.8)
-        
-        # Colorear por significancia
-        colors = ['red' if p < 0.05 else 'gray' for p in df_placebo['p_value']]
-        
-        ax.bar(df_placebo['year'], df_placebo['coef'], color=colors, alpha=0.7)
-        ax.set_xlabel('Año de Placebo')
-        ax.set_ylabel('Coeficiente DiD Estimado')
-        ax.grid(axis='y', linestyle=':', alpha=0.5)
+        # Gráfico descrito como datos; se renderiza junto con el de permutación
+        jobs.append(FigureJob(renderer='src.analysis.robustness_checks:draw_placebo_coefficients',
+                              output_path=os.path.join(run_dir, 'placebo_coefficients_plot.png'),
+                              data={'years': df_placebo['year'].tolist(), 'coefs': df_placebo['coef'].tolist(),
+                                    'p_values': df_placebo['p_value'].tolist()},
+                              template=None, figsize=(12, 7), tight=False))
 
-        plot_path = os.path.join(run_dir, 'placebo_coefficients_plot.png')
-        plt.savefig(plot_path, dpi=300)
-        plt.close(fig)
-        logging.info(f"Gráfico de placebo guardado en {plot_path}")
+    _, permutation_job = run_permutation_tests(analyzer, run_dir, n_jobs=n_jobs)
+    jobs.append(permutation_job)
+    for plot_path in render_figures(jobs, n_jobs=n_jobs, final=final):
+        logging.info(f"Gráfico guardado en {plot_path}")
+    analyzer.cache.store_artifacts(cache_key, run_dir)
 
     logging.info("Pruebas de robustez completadas.")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=None, help="Procesos del pool (por defecto, todos los núcleos).")
+    parser.add_argument("--final", action="store_true", help="Guarda las figuras a 300 dpi (por defecto, borrador).")
+    parser.add_argument("--treatment", default=None,
+                        help="Asignación del tratamiento: archivo CSV o 'UNIDAD=AÑO,...' (por defecto, San Martin).")
+    args = parser.parse_args()
+    main(n_jobs=args.jobs, final=args.final, treatment=args.treatment)
\ No newline at end of file
@@ -6,40 +6,266 @@ la validación econométrica final del impacto de la política fiscal.
 import os
 import logging
 import sys
-import pandas as pd
-import matplotlib.pyplot as plt
+import argparse
 
 # --- Configuración del Entorno ---
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-# --- Módulos del Proyecto y Dependencias Externas ---
+# --- Módulos del Proyecto ---
 from src.utils import setup_run_environment
+from src.core.data_manager import load_processed_data
+from src.core.result_cache import ResultCache
+from src.core.rendering import FigureJob, figure_dpi, render_figures
 from src.core.visualization_utils import style_scm_plot
+from src.core.synthetic_control import SyntheticControl
+from src.core.covariate_scm import DEFAULT_PREDICTORS, CovariateSyntheticControl
+from src.core.instrumentation import span
+from src.core.lazy_imports import lazy_import
+from src.core.treatment import TreatmentAssignment
 
-try:
-    from pysyncon import Dataprep, Synth
-except ImportError:
-    logging.error("La librería 'pysyncon' no está instalada. Por favor, instálala con 'pip install pysyncon'.")
-    sys.exit(1)
+pd = lazy_import('pandas')
+plt = lazy_import('matplotlib.pyplot')
 
-def main():
+TREATED_UNIT = 'San Martin'
+TREATMENT_YEAR = 2005
+
+def display_name(unit):
+    """Nombre de la unidad para reportes y gráficos (con tilde para San Martín)."""
+    return 'San Martín' if unit == TREATED_UNIT else unit
+
+def main(engine='native', n_jobs=None, final=False, predictors=None, n_starts=8, seed=0, treatment=None):
     """
     Función principal para orquestar el análisis de Control Sintético.
+
+    Args:
+        engine (str): 'native' usa el solucionador del proyecto con placebos en el espacio;
+                      'covariates' empareja con varios predictores y elige su importancia (V)
+                      por optimización anidada; 'pysyncon' mantiene el ajuste único con la
+                      librería externa.
+        n_jobs (int, optional): Procesos para los placebos o los puntos de partida; None usa todos los núcleos.
+        final (bool): Guarda las figuras en resolución de publicación (300 dpi) en lugar de borrador.
+        predictors (str, optional): Predictores del motor 'covariates' (ver
+                                    `src.core.covariate_scm.parse_predictors`).
+        n_starts (int): Puntos de partida de la optimización de V.
+        seed (int): Semilla de los puntos de partida.
+        treatment (str or dict, optional): Asignación del tratamiento (archivo CSV o
+                                           'UNIDAD=AÑO,...', ver `src.core.treatment`); por
+                                           defecto, San Martín desde 2005. Cada unidad tratada
+                                           se ajusta con su propio año de adopción y sin las
+                                           demás tratadas en el grupo donante; con varias, los
+                                           productos llevan el nombre de la unidad.
     """
+    predictors = predictors or ','.join(DEFAULT_PREDICTORS)
+    assignment = TreatmentAssignment.parse(treatment if treatment is not None else TREATED_UNIT,
+                                           default_year=TREATMENT_YEAR)
     # --- PASO 1: Configurar Entorno de Ejecución ---
     run_dir, logger = setup_run_environment('reports/scm_analysis')
-    logger.info("Iniciando el análisis de Método de Control Sintético (SCM)...")
+    logger.info(f"Iniciando el análisis de Método de Control Sintético (SCM) con el motor '{engine}'...")
 
     # --- PASO 2: Cargar y Preparar Datos ---
     try:
-        df = pd.read_csv('data/02_processed/deforestation_analysis_data.csv')
+        columns = None if engine == 'covariates' else ['departamento', 'Periodo', 'deforestacion_anual']
+        df = load_processed_data(columns=columns)
         logger.info("Datos procesados cargados.")
     except FileNotFoundError:
         logger.error("No se encontró el dataset procesado. Abortando. Ejecuta 'python main.py data' primero.")
+        return False
+
+    cache = ResultCache()
+    spec = {'script': 'scm_analysis', 'engine': engine, 'treatment': assignment.key(), 'final': final}
+    if engine == 'covariates':
+        spec.update(predictors=predictors, n_starts=n_starts, seed=seed)
+    cache_key = cache.key(spec)
+    if cache.restore_artifacts(cache_key, run_dir):
+        logger.info(f"Sin cambios en datos, especificación ni código: productos recuperados de la caché en {run_dir}.")
         return
 
+    if engine == 'pysyncon':
+        if len(assignment.adoption) > 1:
+            logger.error("El motor 'pysyncon' ajusta una sola unidad tratada; usa 'native' o 'covariates' "
+                         f"para la asignación {assignment.adoption}.")
+            return False
+        (unit, year), = assignment.adoption.items()
+        if run_pysyncon(df, run_dir, logger, unit, year, final=final) is False:
+            return False
+    else:
+        for unit, year in assignment.adoption.items():
+            # Las demás unidades tratadas no pueden servir de contrafactual: salen del panel.
+            others = [other for other in assignment.treated_units if other != unit]
+            panel = df[~df['departamento'].isin(others)]
+            suffix = '' if len(assignment.adoption) == 1 else '_' + unit.lower().replace(' ', '_')
+            if engine == 'covariates':
+                run_covariates(panel, run_dir, logger, unit, year, predictors, n_starts=n_starts, seed=seed,
+                               n_jobs=n_jobs, final=final, suffix=suffix)
+            else:
+                run_native(panel, run_dir, logger, unit, year, n_jobs=n_jobs, final=final, suffix=suffix)
+
+    cache.store_artifacts(cache_key, run_dir)
+    logging.info("Análisis de Control Sintético completado.")
+
+def run_native(df, run_dir, logger, treated_unit=TREATED_UNIT, treatment_year=TREATMENT_YEAR, n_jobs=None,
+               final=False, suffix=''):
+    """
+    Ajusta el control sintético con el solucionador nativo y ejecuta los placebos en el
+    espacio (cada departamento como pseudo-tratado) para obtener un p-valor por permutación.
+    `suffix` se agrega al nombre de los productos.
+    """
+    # --- PASO 3: Ajustar el Control Sintético y los Placebos ---
+    logger.info(f"Buscando los pesos óptimos de {treated_unit} (emparejamiento con la trayectoria previa a "
+                f"{treatment_year}) y ejecutando placebos...")
+    with span('prepare'):
+        scm = SyntheticControl(df, treated_unit=treated_unit, treatment_year=treatment_year)
+    with span('fit'):
+        sweep = scm.placebo_sweep(n_jobs=n_jobs)
+
+    # --- PASO 4: Generar Productos "Anfibios" ---
+    logger.info("Generando reporte y visualizaciones...")
+
+    # 4.1. Reporte Técnico
+    weights = sweep['weights'].loc[treated_unit].drop(treated_unit).rename('Peso').to_frame()
+    gaps = sweep['gaps']
+    comparison = pd.DataFrame({
+        'Real': scm.Y.loc[treated_unit],
+        'Sintético': sweep['synthetic'].loc[treated_unit],
+        'Diferencia': gaps.loc[treated_unit],
+    })
+    report_content = f"""Resultados del Análisis SCM (Motor Nativo)
+==============================================================================
+Unidad tratada: {treated_unit} | Año de intervención: {treatment_year}
+Emparejamiento: deforestación anual de cada año pre-intervención (V = identidad).
+
+Pesos del Control Sintético:
+{weights.round(4).to_string()}
+
+Trayectoria Real vs. Sintética:
+{comparison.round(4).to_string()}
+
+Placebos en el Espacio (cada departamento como pseudo-tratado):
+{sweep['rmspe'].round(4).to_string()}
+
+P-valor por permutación (razón RMSPE post/pre): {sweep['p_value']:.4f}
+Un p-valor bajo indica que el efecto de {treated_unit} es inusual frente a los placebos.
+==============================================================================
+"""
+    report_path = os.path.join(run_dir, f'scm_report{suffix}.txt')
+    with span('report'), open(report_path, 'w', encoding='utf-8') as f:
+        f.write(report_content)
+    logger.info(f"Reporte técnico del SCM guardado en: {report_path}")
+
+    # 4.2. Visualización de Impacto (ambos gráficos se renderizan juntos en el pool)
+    periods = list(scm.periods)
+    plot_path, plot_path_gaps = render_figures([
+        FigureJob(renderer='src.analysis.scm_analysis:draw_scm_path',
+                  output_path=os.path.join(run_dir, f'scm_path_plot{suffix}.png'),
+                  data={'periods': periods, 'actual': scm.Y.loc[treated_unit].tolist(),
+                        'synthetic': sweep['synthetic'].loc[treated_unit].tolist(),
+                        'treated_unit': treated_unit, 'treatment_year': treatment_year},
+                  template='scm', figsize=(14, 8)),
+        FigureJob(renderer='src.analysis.scm_analysis:draw_scm_gaps',
+                  output_path=os.path.join(run_dir, f'scm_gaps_plot{suffix}.png'),
+                  data={'periods': periods, 'treated_gap': gaps.loc[treated_unit].tolist(),
+                        'placebo_gaps': [gaps.loc[unit].tolist() for unit in gaps.index.drop(treated_unit)],
+                        'p_value': sweep['p_value'], 'treated_unit': treated_unit, 'treatment_year': treatment_year},
+                  template='scm', figsize=(14, 8)),
+    ], final=final)
+    logger.info(f"Gráfico de trayectoria guardado en: {plot_path}")
+    logger.info(f"Gráfico de diferencias (gaps) guardado en: {plot_path_gaps}")
+
+def run_covariates(df, run_dir, logger, treated_unit, treatment_year, predictors, n_starts=8, seed=0, n_jobs=None,
+                   final=False, suffix=''):
+    """
+    Ajusta el control sintético con varios predictores (rezagos de la deforestación,
+    niveles de cobertura, otras columnas del panel) y elige su importancia V minimizando
+    el error de predicción pre-intervención. `suffix` se agrega al nombre de los productos.
+    """
+    logger.info(f"Buscando V y los pesos óptimos de {treated_unit} con los predictores '{predictors}' "
+                f"({n_starts} puntos de partida)...")
+    with span('prepare'):
+        scm = CovariateSyntheticControl(df, treated_unit=treated_unit, treatment_year=treatment_year,
+                                        predictors=predictors)
+    if scm.dropped_predictors:
+        logger.warning(f"Predictores descartados por datos faltantes: {scm.dropped_predictors}")
+    with span('fit'):
+        result = scm.fit(n_starts=n_starts, seed=seed, n_jobs=n_jobs)
+
+    logger.info("Generando reporte y visualizaciones...")
+    comparison = pd.DataFrame({
+        'Real': scm.Y.loc[treated_unit],
+        'Sintético': result['synthetic'],
+        'Diferencia': result['gaps'],
+    })
+    report_content = f"""Resultados del Análisis SCM (Motor con Predictores)
+==============================================================================
+Unidad tratada: {treated_unit} | Año de intervención: {treatment_year}
+Predictores: {predictors}
+V elegida minimizando el error cuadrático pre-intervención de la deforestación anual.
+
+Pesos del Control Sintético:
+{result['weights'].rename('Peso').to_frame().round(4).to_string()}
+
+Balance de Predictores e Importancia (V):
+{result['balance'].round(4).to_string()}
+
+Trayectoria Real vs. Sintética:
+{comparison.round(4).to_string()}
+
+RMSPE pre-intervención: {result['pre_rmspe']:.4f} | RMSPE post-intervención: {result['post_rmspe']:.4f}
+
+Puntos de partida de la optimización de V (pérdida final e iteraciones):
+{result['starts'].round(6).to_string()}
+==============================================================================
+"""
+    report_path = os.path.join(run_dir, f'scm_report{suffix}.txt')
+    with span('report'), open(report_path, 'w', encoding='utf-8') as f:
+        f.write(report_content)
+    logger.info(f"Reporte técnico del SCM guardado en: {report_path}")
+
+    plot_path, = render_figures([
+        FigureJob(renderer='src.analysis.scm_analysis:draw_scm_path',
+                  output_path=os.path.join(run_dir, f'scm_path_plot{suffix}.png'),
+                  data={'periods': list(scm.periods), 'actual': scm.Y.loc[treated_unit].tolist(),
+                        'synthetic': result['synthetic'].tolist(), 'treated_unit': treated_unit,
+                        'treatment_year': treatment_year},
+                  template='scm', figsize=(14, 8)),
+    ], final=final)
+    logger.info(f"Gráfico de trayectoria guardado en: {plot_path}")
+
+def draw_scm_path(fig, ax, periods, actual, synthetic, treated_unit=TREATED_UNIT, treatment_year=TREATMENT_YEAR):
+    """Trayectoria real frente a la sintética (trabajo de renderizado sobre la plantilla 'scm')."""
+    ax.plot(periods, actual, color='black', linewidth=2, label=treated_unit)
+    ax.plot(periods, synthetic, color='#457B9D', linestyle='--', linewidth=2, label='synthetic')
+    style_scm_plot(ax, fig,
+        title="Validación con Control Sintético: Real vs. Contrafactual",
+        subtitle=f"Comparación de la deforestación observada en {display_name(treated_unit)} con su 'gemelo' sintético",
+        source_note="Elaboración propia.",
+        treatment_year=treatment_year
+    )
+
+def draw_scm_gaps(fig, ax, periods, treated_gap, placebo_gaps, p_value, treated_unit=TREATED_UNIT,
+                  treatment_year=TREATMENT_YEAR):
+    """Diferencias de la unidad tratada frente a los placebos (trabajo de renderizado sobre la plantilla 'scm')."""
+    for gap in placebo_gaps:
+        ax.plot(periods, gap, color='#BBBBBB', linewidth=1)
+    ax.plot(periods, treated_gap, color='black', linewidth=2, label=treated_unit)
+    ax.set_ylabel('Diferencia en Deforestación (Real - Sintético)')
+    style_scm_plot(ax, fig,
+        title="Efecto Causal Estimado a lo Largo del Tiempo (SCM)",
+        subtitle=f"{display_name(treated_unit)} frente a los placebos en el espacio "
+                 f"(p-valor por permutación: {p_value:.3f})",
+        source_note="Elaboración propia. Las líneas grises corresponden a los placebos en el espacio.",
+        treatment_year=treatment_year
+    )
+
+def run_pysyncon(df, run_dir, logger, treated_unit=TREATED_UNIT, treatment_year=TREATMENT_YEAR, final=False):
+    """Ajuste único con la librería externa `pysyncon` (configuración documentada en el postmortem)."""
+    try:
+        from pysyncon import Dataprep, Synth
+    except ImportError:
+        logger.error("La librería 'pysyncon' no está instalada. Por favor, instálala con 'pip install pysyncon'.")
+        return False
+
     # --- PASO 3: Preparar Datos para PySyncon ---
     logger.info("Preparando datos para el formato SCM...")
     
@@ -52,22 +278,24 @@ def main():
     # --- PASO 4: Configurar y Ejecutar el Optimizador de Control Sintético ---
     logger.info("Configurando el Dataprep para el control sintético...")
     
-    dataprep = Dataprep(
-        foo=df_for_scm,
-        predictors=['deforestacion_anual'], # CORREGIDO
-        dependent='deforestacion_anual',   # CORREGIDO
-        unit_variable='unit',
-        time_variable='time',
-        treatment_identifier='San Martin',
-        controls_identifier=['Amazonas', 'Loreto', 'Ucayali', 'Madre de Dios'],
-        time_predictors_prior=[1998, 2004],
-        time_optimize_ssr=[1998, 2004],
-        predictors_op="mean"
-    )
+    with span('prepare'):
+        dataprep = Dataprep(
+            foo=df_for_scm,
+            predictors=['deforestacion_anual'], # CORREGIDO
+            dependent='deforestacion_anual',   # CORREGIDO
+            unit_variable='unit',
+            time_variable='time',
+            treatment_identifier=treated_unit,
+            controls_identifier=[unit for unit in df_for_scm['unit'].unique() if unit != treated_unit],
+            time_predictors_prior=[1998, treatment_year - 1],
+            time_optimize_ssr=[1998, treatment_year - 1],
+            predictors_op="mean"
+        )
 
     logger.info("Buscando los pesos óptimos para el control sintético...")
     synth = Synth()
-    synth.fit(dataprep=dataprep)
+    with span('fit'):
+        synth.fit(dataprep=dataprep)
     
     # --- PASO 5: Generar Productos "Anfibios" ---
     logger.info("Generando reporte y visualizaciones...")
@@ -77,7 +305,7 @@ def main():
     summary_table = synth.summary(round=4).to_string()
     report_content = f"""Resultados del Análisis SCM...\n{weights_table}\n{summary_table}"""
     report_path = os.path.join(run_dir, 'scm_report.txt')
-    with open(report_path, 'w', encoding='utf-8') as f:
+    with span('report'), open(report_path, 'w', encoding='utf-8') as f:
         f.write(report_content)
     logger.info(f"Reporte técnico del SCM guardado en: {report_path}")
 
@@ -87,11 +315,11 @@ def main():
     fig, ax = plt.gcf(), plt.gca()
     style_scm_plot(ax, fig,
         title="Validación con Control Sintético: Real vs. Contrafactual",
-        subtitle="Comparación de la deforestación observada en San Martín con su 'gemelo' sintético",
+        subtitle=f"Comparación de la deforestación observada en {display_name(treated_unit)} con su 'gemelo' sintético",
         source_note="Elaboración propia."
     )
     plot_path = os.path.join(run_dir, 'scm_path_plot.png')
-    plt.savefig(plot_path, dpi=300, bbox_inches='tight')
+    plt.savefig(plot_path, dpi=figure_dpi(final), bbox_inches='tight')
     plt.close(fig)
     logger.info(f"Gráfico de trayectoria guardado en: {plot_path}")
 
@@ -101,15 +329,27 @@ def main():
     ax_gaps.set_ylabel('Diferencia en Deforestación (Real - Sintético)')
     style_scm_plot(ax_gaps, fig_gaps,
         title="Efecto Causal Estimado a lo Largo del Tiempo (SCM)",
-        subtitle="Diferencia en la deforestación anual entre San Martín y su control sintético",
+        subtitle=f"Diferencia en la deforestación anual entre {display_name(treated_unit)} y su control sintético",
         source_note="Elaboración propia."
     )
     plot_path_gaps = os.path.join(run_dir, 'scm_gaps_plot.png')
-    plt.savefig(plot_path_gaps, dpi=300, bbox_inches='tight')
+    plt.savefig(plot_path_gaps, dpi=figure_dpi(final), bbox_inches='tight')
     plt.close(fig_gaps)
     logger.info(f"Gráfico de diferencias (gaps) guardado en: {plot_path_gaps}")
 
-    logging.info("Análisis de Control Sintético completado.")
-
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engine", choices=["native", "covariates", "pysyncon"], default="native")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Procesos para los placebos o los puntos de partida (por defecto, todos los núcleos).")
+    parser.add_argument("--final", action="store_true", help="Guarda las figuras a 300 dpi (por defecto, borrador).")
+    parser.add_argument("--predictors", default=None,
+                        help="Predictores del motor 'covariates', p. ej. "
+                             "'deforestacion_anual@1998-2004,cobertura_boscosa:mean@1998-2004'.")
+    parser.add_argument("--starts", type=int, default=8, help="Puntos de partida de la optimización de V.")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de los puntos de partida.")
+    parser.add_argument("--treatment", default=None,
+                        help="Asignación del tratamiento: archivo CSV o 'UNIDAD=AÑO,...' (por defecto, San Martin=2005).")
+    args = parser.parse_args()
+    main(engine=args.engine, n_jobs=args.jobs, final=args.final, predictors=args.predictors,
+         n_starts=args.starts, seed=args.seed, treatment=args.treatment)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Script para el barrido de sensibilidad del análisis DiD: estima el efecto y la
+prueba de tendencias paralelas para una grilla de años de intervención y ventanas
+de estimación, y consolida todo en una sola tabla y un mapa de calor.
+"""
+import os
+import logging
+import sys
+import argparse
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.utils import setup_run_environment
+from src.core.data_manager import load_processed_data
+from src.core.result_cache import ResultCache
+from src.core.rendering import FigureJob, render_figures
+from src.core.sensitivity import SensitivitySweep, parse_windows, parse_years
+from src.core.treatment import TreatmentAssignment
+from src.core.lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+
+DEFAULT_YEARS = '1999-2015'
+DEFAULT_WINDOWS = '3,4,5,full'
+TREATMENT_UNIT = 'San Martin'
+
+def significance_stars(p_value):
+    """Marca de significancia convencional para un p-valor."""
+    if not np.isfinite(p_value):
+        return ''
+    return '***' if p_value < 0.01 else '**' if p_value < 0.05 else '*' if p_value < 0.1 else ''
+
+def sweep_heatmap_job(results, run_dir):
+    """Describe el mapa de calor del barrido como un trabajo de renderizado."""
+    n_years = results['year'].nunique()
+    return FigureJob(renderer='src.analysis.sensitivity_sweep:draw_sweep_heatmap',
+                     output_path=os.path.join(run_dir, 'sensitivity_sweep_heatmap.png'),
+                     data={'results': results[['year', 'window', 'coef', 'p_value', 'pre_trend_p_value']]},
+                     template=None, figsize=(14, max(6, 0.45 * n_years + 2)))
+
+def draw_sweep_heatmap(fig, ax, results):
+    """Mapa de calor del efecto DiD por (año, ventana) y p-valores de la prueba de tendencias paralelas."""
+    coefs = results.pivot(index='year', columns='window', values='coef')
+    p_values = results.pivot(index='year', columns='window', values='p_value')
+    column_order = list(dict.fromkeys(results['window']))
+    coefs, p_values = coefs[column_order], p_values[column_order]
+    pre_trends = results.drop_duplicates('year').set_index('year')['pre_trend_p_value']
+
+    ax, ax_trend = fig.subplots(1, 2, gridspec_kw={'width_ratios': [3, 1]}, sharey=True)
+    fig.suptitle('Sensibilidad del Efecto DiD al Año de Intervención y a la Ventana', fontsize=16, fontweight='bold')
+
+    limit = np.nanmax(np.abs(coefs.to_numpy())) if np.isfinite(coefs.to_numpy()).any() else 1.0
+    image = ax.imshow(coefs.to_numpy(), cmap='RdBu_r', vmin=-limit, vmax=limit, aspect='auto')
+    for i in range(coefs.shape[0]):
+        for j in range(coefs.shape[1]):
+            value = coefs.iat[i, j]
+            if np.isfinite(value):
+                ax.text(j, i, f"{value:.2f}{significance_stars(p_values.iat[i, j])}", ha='center', va='center', fontsize=9)
+    ax.set_xticks(range(len(column_order)))
+    ax.set_xticklabels([f"{w} años" if w != 'full' else 'Completo' for w in column_order])
+    ax.set_yticks(range(len(coefs.index)))
+    ax.set_yticklabels(coefs.index)
+    ax.set_xlabel('Ventana de estimación')
+    ax.set_ylabel('Año de intervención')
+    ax.set_title('Coeficiente DiD (* p<0.1, ** p<0.05, *** p<0.01)', fontsize=12, fontstyle='italic')
+    fig.colorbar(image, ax=ax, label='Efecto estimado (miles de ha)', shrink=0.8)
+
+    positions = np.arange(len(coefs.index))
+    colors = ['#E63946' if p < 0.05 else 'gray' for p in pre_trends.reindex(coefs.index).fillna(1.0)]
+    ax_trend.barh(positions, pre_trends.reindex(coefs.index), color=colors, alpha=0.7)
+    ax_trend.axvline(0.05, color='black', linestyle='--', linewidth=0.8)
+    ax_trend.set_xlim(0, 1)
+    ax_trend.set_xlabel('P-valor')
+    ax_trend.set_title('Tendencias paralelas\n(interacción pre-intervención)', fontsize=12, fontstyle='italic')
+    ax_trend.spines['top'].set_visible(False)
+    ax_trend.spines['right'].set_visible(False)
+
+    fig.text(0.05, 0.01, 'Fuente: Elaboración propia con datos de MapBiomas Perú.', ha='left', fontsize=9, color='gray')
+    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+
+def main(years=DEFAULT_YEARS, windows=DEFAULT_WINDOWS, n_jobs=None, final=False, treatment=None):
+    """
+    Orquesta el barrido de sensibilidad sobre la grilla (año de intervención, ventana).
+
+    Args:
+        years (str or list): Años de intervención, p. ej. '1999-2015' o [2005, 2012].
+        windows (str or list): Ventanas, p. ej. '3,4,5,full' o [3, 'full'].
+        n_jobs (int, optional): Procesos del pool; None usa todos los núcleos.
+        final (bool): Guarda el mapa de calor en resolución de publicación (300 dpi) en lugar de borrador.
+        treatment (str or dict, optional): Unidades tratadas (archivo CSV o 'UNIDAD=AÑO,...',
+                                           ver `src.core.treatment`); por defecto, San Martín.
+                                           Los años de adopción se reemplazan por los de la grilla.
+    """
+    years = parse_years(years) if isinstance(years, str) else sorted({int(y) for y in years})
+    assignment = TreatmentAssignment.parse(treatment if treatment is not None else TREATMENT_UNIT,
+                                           default_year=years[0])
+    treated_units = assignment.treated_units
+    if assignment.is_staggered:
+        logging.warning(f"El barrido supone un año común: cada año de la grilla se aplica a todas las unidades "
+                        f"tratadas y se ignoran los años de adopción escalonados {assignment.adoption}.")
+    windows = parse_windows(windows) if isinstance(windows, str) else parse_windows(','.join(map(str, windows)))
+
+    run_dir, _ = setup_run_environment('reports/sensitivity_sweep')
+    logging.info(f"Iniciando el barrido de sensibilidad: {len(years)} años x {len(windows)} ventanas...")
+
+    try:
+        df = load_processed_data(columns=['departamento', 'Periodo', 'deforestacion_anual'])
+    except FileNotFoundError:
+        logging.error("No se encontró el dataset procesado. Abortando. Ejecuta 'python main.py data' primero.")
+        return False
+
+    cache = ResultCache()
+    cache_key = cache.key({'script': 'sensitivity_sweep', 'years': years, 'windows': windows,
+                           'treated_units': treated_units, 'final': final})
+    if cache.restore_artifacts(cache_key, run_dir):
+        logging.info(f"Sin cambios en datos, especificación ni código: productos recuperados de la caché en {run_dir}.")
+        return
+
+    results = SensitivitySweep(df, treated_units, years, windows, n_jobs=n_jobs).run()
+
+    table_path = os.path.join(run_dir, 'sensitivity_sweep_results.csv')
+    results.to_csv(table_path, index=False)
+
+    report_path = os.path.join(run_dir, 'sensitivity_sweep_results.txt')
+    columns = ['year', 'window', 'start_year', 'end_year', 'nobs', 'coef', 'std_err', 'p_value',
+               'pre_trend_coef', 'pre_trend_p_value']
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write("Barrido de Sensibilidad del Análisis DiD\n")
+        f.write("========================================\n")
+        f.write("Cada fila estima 'deforestacion_anual ~ tratado + post_treatment + did' para un año de\n")
+        f.write("intervención y una ventana (w años desde la intervención, o el período completo).\n")
+        f.write("'pre_trend_*' corresponde a la interacción tratado:año_norm antes de la intervención.\n")
+        if results['truncated'].any():
+            f.write("Las ventanas que exceden el último año del panel se estiman hasta ese año.\n")
+        f.write("\n")
+        f.write(results[columns].to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+    logging.info(f"Tabla consolidada guardada en: {table_path} y {report_path}")
+
+    plot_path, = render_figures([sweep_heatmap_job(results, run_dir)], n_jobs=1, final=final)
+    logging.info(f"Mapa de calor guardado en: {plot_path}")
+
+    cache.store_artifacts(cache_key, run_dir)
+    logging.info("Barrido de sensibilidad completado.")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", default=DEFAULT_YEARS, help="Años de intervención, p. ej. '1999-2015' o '2005,2012'.")
+    parser.add_argument("--windows", default=DEFAULT_WINDOWS, help="Ventanas, p. ej. '3,4,5,full'.")
+    parser.add_argument("--jobs", type=int, default=None, help="Procesos del pool (por defecto, todos los núcleos).")
+    parser.add_argument("--final", action="store_true", help="Guarda el mapa de calor a 300 dpi (por defecto, borrador).")
+    parser.add_argument("--treatment", default=None,
+                        help="Asignación del tratamiento: archivo CSV o 'UNIDAD=AÑO,...' (por defecto, San Martin).")
+    args = parser.parse_args()
+    main(years=args.years, windows=args.windows, n_jobs=args.jobs, final=args.final, treatment=args.treatment)
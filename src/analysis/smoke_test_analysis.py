@@ -5,11 +5,10 @@ existe una "señal" en los datos que justifique un análisis más profundo.
 Este script ahora lee desde los datos procesados para mantener la consistencia.
 """
 
-import pandas as pd
-import matplotlib.pyplot as plt
 import os
 import logging
 import sys
+import argparse
 
 # Añadir el directorio raíz del proyecto al sys.path
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -17,6 +16,15 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 from src.utils import setup_run_environment
+from src.core.data_manager import load_processed_data
+from src.core.result_cache import ResultCache
+from src.core.treatment import TreatmentAssignment
+from src.core.lazy_imports import lazy_import
+
+pd = lazy_import('pandas')
+plt = lazy_import('matplotlib.pyplot')
+
+DEFAULT_CONTROLS = ['Amazonas', 'Loreto', 'Ucayali']
 
 def style_chart(ax, fig, title, subtitle, xlabel, source_note):
     """Aplica un estilo consistente y profesional a un gráfico de Matplotlib."""
@@ -35,28 +43,50 @@ def style_chart(ax, fig, title, subtitle, xlabel, source_note):
     fig.text(0.05, 0.01, source_note, ha='left', fontsize=9, color='gray')
     fig.tight_layout(rect=[0, 0.05, 1, 0.9])
 
-def main():
-    """Función principal para orquestar la prueba de humo."""
-    run_dir = setup_run_environment('reports/figures/smoke_test')
+def main(treatment=None):
+    """
+    Función principal para orquestar la prueba de humo.
+
+    Args:
+        treatment (str, optional): Asignación del tratamiento (archivo CSV o
+                                   'UNIDAD=AÑO,...', ver `src.core.treatment`); por
+                                   defecto, San Martín desde 2005 frente a Amazonas,
+                                   Loreto y Ucayali.
+    """
+    run_dir, _ = setup_run_environment('reports/figures/smoke_test')
     logging.info("Iniciando la prueba de humo con datos procesados...")
 
     # --- PASO 1: Cargar los datos desde la carpeta de datos PROCESADOS ---
     try:
-        df = pd.read_csv('data/02_processed/deforestation_analysis_data.csv')
+        df = load_processed_data(columns=['departamento', 'Periodo', 'deforestacion_anual'])
         logging.info("Datos procesados cargados para la prueba de humo.")
     except FileNotFoundError:
         logging.error("Error: No se encontró el archivo de datos procesados. Ejecuta 'src/data/make_dataset.py' primero.")
+        return False
+
+    if treatment is None:
+        assignment = TreatmentAssignment({'San Martin': 2005}, controls=DEFAULT_CONTROLS)
+    else:
+        assignment = TreatmentAssignment.parse(treatment, default_year=2005)
+
+    cache = ResultCache()
+    cache_key = cache.key({'script': 'smoke_test_analysis', 'treatment': assignment.key(),
+                           'controls': sorted(assignment.controls)})
+    if cache.restore_artifacts(cache_key, run_dir):
+        logging.info(f"Sin cambios en datos, especificación ni código: productos recuperados de la caché en {run_dir}.")
         return
 
     # --- PASO 2: Preparar los grupos de Tratamiento y Control ---
     logging.info("Preparando grupos de tratamiento y control...")
-    tratamiento_dep = 'San Martin'
-    control_deps = ['Amazonas', 'Loreto', 'Ucayali']
-
-    df_tratamiento = df[df['departamento'] == tratamiento_dep].copy()
-    df_control_group = df[df['departamento'].isin(control_deps)]
+    treated, _ = assignment.codes(df['departamento'])
+    # Controles: los declarados en la asignación o, si no hay, todas las unidades no tratadas.
+    control = df['departamento'].isin(assignment.controls).to_numpy() if assignment.controls else ~treated
+    control_deps = sorted(df.loc[control, 'departamento'].unique())
 
-    control_avg = df_control_group.groupby('Periodo')['deforestacion_anual'].mean().reset_index()
+    treated_avg = df[treated].groupby('Periodo')['deforestacion_anual'].mean().reset_index()
+    control_avg = df[control].groupby('Periodo')['deforestacion_anual'].mean().reset_index()
+    treated_label = 'San Martín' if assignment.treated_units == ['San Martin'] else assignment.label
+    control_label = ', '.join(control_deps) if len(control_deps) <= 3 else f'{len(control_deps)} unidades'
 
     # --- PASO 3: Generar el Gráfico de Divergencia ---
     logging.info("Generando gráfico de divergencia...")
@@ -64,13 +94,17 @@ def main():
 
     style_chart(ax, fig, 
                 title='Prueba de Humo: ¿Divergen las Tendencias de Deforestación?',
-                subtitle='Comparación de la deforestación anual en San Martín vs. el promedio de otros departamentos amazónicos (1998-2023)',
+                subtitle=f'Comparación de la deforestación anual en {treated_label} vs. el promedio de otros departamentos amazónicos (1998-2023)',
                 xlabel='Año',
                 source_note='Fuente: Datos de MapBiomas Perú (Procesado). Elaboración propia.')
 
-    ax.plot(df_tratamiento['Periodo'], df_tratamiento['deforestacion_anual'], marker='o', linestyle='-', label='San Martín (Tratamiento)', color='#E63946', zorder=10)
-    ax.plot(control_avg['Periodo'], control_avg['deforestacion_anual'], marker='s', linestyle='--', label='Promedio Control (Amazonas, Loreto, Ucayali)', color='#457B9D')
-    ax.axvline(x=2005, color='#333333', linestyle=':', linewidth=2, label='Ley N° 28575 (Exclusión de San Martín)')
+    ax.plot(treated_avg['Periodo'], treated_avg['deforestacion_anual'], marker='o', linestyle='-', label=f'{treated_label} (Tratamiento)', color='#E63946', zorder=10)
+    ax.plot(control_avg['Periodo'], control_avg['deforestacion_anual'], marker='s', linestyle='--', label=f'Promedio Control ({control_label})', color='#457B9D')
+    if treatment is None:
+        ax.axvline(x=2005, color='#333333', linestyle=':', linewidth=2, label='Ley N° 28575 (Exclusión de San Martín)')
+    else:
+        for year in sorted(set(assignment.adoption.values())):
+            ax.axvline(x=year, color='#333333', linestyle=':', linewidth=2, label=f'Adopción ({year})')
 
     ax.legend(loc='upper left', frameon=False)
 
@@ -79,7 +113,12 @@ def main():
     logging.info(f"Gráfico de la prueba de humo guardado en: {output_path}")
     plt.close(fig)
 
+    cache.store_artifacts(cache_key, run_dir)
     logging.info("Prueba de humo completada.")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--treatment", default=None,
+                        help="Asignación del tratamiento: archivo CSV o 'UNIDAD=AÑO,...' (por defecto, San Martin=2005).")
+    args = parser.parse_args()
+    main(treatment=args.treatment)
\ No newline at end of file
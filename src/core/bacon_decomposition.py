@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Descomposición de Goodman-Bacon (2021) del estimador de efectos fijos bidireccionales
+(TWFE) con adopción escalonada.
+
+En un panel balanceado, el coeficiente de `y ~ D + efectos fijos de unidad y de año`
+es un promedio ponderado de todas las comparaciones 2x2 entre grupos de adopción:
+cada grupo tratado frente a los nunca tratados, los tempranos frente a los tardíos
+(antes de que éstos se traten) y los tardíos frente a los tempranos (ya tratados). Las
+estimaciones 2x2 son diferencias de medias por ventana de períodos y los pesos sólo
+dependen del tamaño de cada grupo y de la varianza de su tratamiento, de modo que todo
+se obtiene de la tabla de medias por (grupo, período) sin estimar una regresión por
+par: con sumas acumuladas, la media de cualquier ventana cuesta una resta.
+"""
+from .lazy_imports import lazy_import
+from .staggered_did import CohortPanel
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Tipos de comparación 2x2.
+TREATED_VS_NEVER = 'treated_vs_never'
+EARLIER_VS_LATER = 'earlier_vs_later'
+LATER_VS_EARLIER = 'later_vs_earlier'
+TREATED_VS_ALWAYS = 'treated_vs_always'
+COMPARISON_TYPES = (TREATED_VS_NEVER, EARLIER_VS_LATER, LATER_VS_EARLIER, TREATED_VS_ALWAYS)
+COMPARISON_LABELS = {
+    TREATED_VS_NEVER: 'Tratado vs. nunca tratado',
+    EARLIER_VS_LATER: 'Temprano vs. tardío (aún no tratado)',
+    LATER_VS_EARLIER: 'Tardío vs. temprano (ya tratado)',
+    TREATED_VS_ALWAYS: 'Tratado vs. siempre tratado',
+}
+
+
+class BaconDecomposition:
+    """
+    Comparaciones 2x2 y pesos de la descomposición de Goodman-Bacon.
+
+    Attributes:
+        periods (np.ndarray): Períodos del panel.
+        starts (np.ndarray): Índice del primer período tratado de cada grupo de adopción
+                             (0: siempre tratado; número de períodos: nunca tratado).
+        shares (np.ndarray): Proporción de unidades de cada grupo.
+        treated_share (np.ndarray): Proporción de períodos tratados de cada grupo (D̄).
+        dropped_periods (list): Períodos descartados para balancear el panel.
+    """
+    def __init__(self, df, first_treatment, outcome='deforestacion_anual', unit_col='departamento',
+                 period_col='Periodo'):
+        """
+        Args:
+            df (pd.DataFrame): Panel balanceado en formato largo.
+            first_treatment (dict): Año de adopción por unidad; las ausentes son nunca tratadas.
+            outcome, unit_col, period_col (str): Columnas del panel.
+        """
+        panel = CohortPanel(df, first_treatment, outcome=outcome, unit_col=unit_col, period_col=period_col,
+                            keep_always_treated=True)
+        self.periods = panel.periods
+        self.dropped_periods = panel.dropped_periods
+        n_periods = len(self.periods)
+
+        # Las cohortes que adoptan entre dos períodos observados, o después del último, se
+        # agrupan según el primer período en que están tratadas.
+        cohort_starts = np.searchsorted(self.periods, panel.cohorts, side='left')
+        self.starts, group = np.unique(cohort_starts, return_inverse=True)
+        sizes = np.bincount(group, weights=panel.sizes)
+        sums = np.zeros((len(self.starts), n_periods))
+        np.add.at(sums, group, panel.means * panel.sizes[:, None])
+        means = sums / sizes[:, None]
+
+        self.shares = sizes / sizes.sum()
+        self.treated_share = (n_periods - self.starts) / n_periods
+        # Sumas acumuladas por grupo: la media de la ventana [a, b) es (C[b] - C[a]) / (b - a).
+        self._cumulative = np.concatenate([np.zeros((len(self.starts), 1)), np.cumsum(means, axis=1)], axis=1)
+
+    def _window_mean(self, groups, start, end):
+        """Media de cada grupo en la ventana de períodos [start, end)."""
+        return (self._cumulative[groups, end] - self._cumulative[groups, start]) / (end - start)
+
+    def _cohort_year(self, starts):
+        """Año de adopción de cada grupo (np.inf: nunca tratado)."""
+        padded = np.append(self.periods.astype(float), np.inf)
+        return padded[starts]
+
+    def comparisons(self):
+        """
+        Calcula todas las comparaciones 2x2 con sus pesos.
+
+        Para cada par de grupos con distinto momento de adopción (k antes que l) hay dos
+        comparaciones: k tratado frente a l como control en los períodos previos a la
+        adopción de l, y l tratado frente a k como control en los períodos posteriores a
+        la adopción de k. La segunda no existe si l nunca se trata y la primera no existe
+        si k está tratado desde el primer período.
+
+        Returns:
+            pd.DataFrame: Una fila por comparación con 'comparison_type', 'treated_cohort'
+                          y 'control_cohort' (año de adopción; np.inf para nunca tratados),
+                          'estimate' y 'weight' (los pesos suman 1).
+        """
+        n_periods = len(self.periods)
+        early, late = np.triu_indices(len(self.starts), k=1)
+        s_k, s_l = self.starts[early], self.starts[late]
+        n_k, n_l = self.shares[early], self.shares[late]
+        d_k, d_l = self.treated_share[early], self.treated_share[late]
+        n_kl = n_k / (n_k + n_l)
+        pair_variance = n_kl * (1 - n_kl)
+
+        # k tratado, l de control: ventana [0, s_l), con k tratado desde s_k.
+        first = s_k > 0
+        e, l, a, b = early[first], late[first], s_k[first], s_l[first]
+        first_estimate = ((self._window_mean(e, a, b) - self._window_mean(e, 0, a))
+                          - (self._window_mean(l, a, b) - self._window_mean(l, 0, a)))
+        dk, dl = d_k[first], d_l[first]
+        first_weight = (((n_k[first] + n_l[first]) * (1 - dl)) ** 2 * pair_variance[first]
+                        * (dk - dl) / (1 - dl) * (1 - dk) / (1 - dl))
+        first_type = np.where(b == n_periods, TREATED_VS_NEVER, EARLIER_VS_LATER)
+
+        # l tratado, k de control: ventana [s_k, T), con l tratado desde s_l.
+        second = s_l < n_periods
+        e, l, a, b = early[second], late[second], s_k[second], s_l[second]
+        second_estimate = ((self._window_mean(l, b, n_periods) - self._window_mean(l, a, b))
+                           - (self._window_mean(e, b, n_periods) - self._window_mean(e, a, b)))
+        dk, dl = d_k[second], d_l[second]
+        second_weight = (((n_k[second] + n_l[second]) * dk) ** 2 * pair_variance[second]
+                         * dl / dk * (dk - dl) / dk)
+        second_type = np.where(a == 0, TREATED_VS_ALWAYS, LATER_VS_EARLIER)
+
+        weights = np.concatenate([first_weight, second_weight])
+        if weights.sum() <= 0:
+            raise ValueError("No hay variación en el momento de adopción: la descomposición no tiene comparaciones.")
+        return pd.DataFrame({
+            'comparison_type': np.concatenate([first_type, second_type]),
+            'treated_cohort': self._cohort_year(np.concatenate([s_k[first], s_l[second]])),
+            'control_cohort': self._cohort_year(np.concatenate([s_l[first], s_k[second]])),
+            'estimate': np.concatenate([first_estimate, second_estimate]),
+            'weight': weights / weights.sum(),
+        })
+
+
+def summarize_by_type(comparisons):
+    """
+    Peso total y estimación promedio ponderada por tipo de comparación.
+
+    Returns:
+        pd.DataFrame: 'comparison_type', 'weight', 'estimate' y 'n_comparisons'.
+    """
+    weighted = comparisons.assign(weighted=comparisons['estimate'] * comparisons['weight'])
+    summary = weighted.groupby('comparison_type', sort=False).agg(
+        weight=('weight', 'sum'), weighted=('weighted', 'sum'), n_comparisons=('estimate', 'size'))
+    summary['estimate'] = summary['weighted'] / summary['weight']
+    order = [name for name in COMPARISON_TYPES if name in summary.index]
+    return summary.loc[order, ['weight', 'estimate', 'n_comparisons']].reset_index()
+
+
+def bacon_decomposition(df, first_treatment, **columns):
+    """
+    Descompone el estimador TWFE en sus comparaciones 2x2.
+
+    Args:
+        df (pd.DataFrame): Panel balanceado en formato largo.
+        first_treatment (dict): Año de adopción por unidad.
+        **columns: 'outcome', 'unit_col' y 'period_col', como en `BaconDecomposition`.
+
+    Returns:
+        dict: 'comparisons' (ver `BaconDecomposition.comparisons`), 'summary' (ver
+              `summarize_by_type`), 'twfe_estimate' (suma ponderada de las estimaciones
+              2x2, igual al coeficiente TWFE en el panel balanceado) y 'dropped_periods'.
+    """
+    decomposition = BaconDecomposition(df, first_treatment, **columns)
+    comparisons = decomposition.comparisons()
+    return {
+        'comparisons': comparisons,
+        'summary': summarize_by_type(comparisons),
+        'twfe_estimate': float((comparisons['estimate'] * comparisons['weight']).sum()),
+        'dropped_periods': decomposition.dropped_periods,
+    }
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de mínimos cuadrados ordinarios por lotes.
+
+Los modelos DiD del proyecto sólo dependen de agregados por (departamento, período),
+por lo que sus productos cruzados (X'X, X'y, y'y) se pueden armar a partir de sumas
+precalculadas una sola vez. Este módulo construye esas sumas y resuelve en NumPy,
+de forma vectorizada, todos los sistemas de ecuaciones normales de un barrido.
+"""
+from .lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+stats = lazy_import('scipy.stats')
+
+DID_TERMS = ['Intercept', 'tratado', 'post_treatment', 'did']
+
+# Regresores de cada una de las cuatro celdas DiD, en el orden
+# (control, pre), (tratado, pre), (control, post), (tratado, post).
+_DID_CELL_DESIGN = (
+    (1.0, 0.0, 0.0, 0.0),
+    (1.0, 1.0, 0.0, 0.0),
+    (1.0, 0.0, 1.0, 0.0),
+    (1.0, 1.0, 1.0, 1.0),
+)
+
+
+class PanelCells:
+    """
+    Sumas suficientes de la variable de resultado por celda (unidad, período).
+
+    Attributes:
+        units (np.ndarray): Unidades ordenadas alfabéticamente.
+        periods (np.ndarray): Períodos ordenados.
+        n (np.ndarray): Observaciones por celda, de forma (unidades, períodos).
+        s (np.ndarray): Suma de la variable de resultado por celda.
+        q (np.ndarray): Suma de cuadrados de la variable de resultado por celda.
+    """
+    def __init__(self, df, outcome='deforestacion_anual', unit_col='departamento', period_col='Periodo'):
+        # statsmodels descarta las filas con valores faltantes; replicamos ese criterio.
+        df = df.loc[df[outcome].notna(), [unit_col, period_col, outcome]]
+        unit_codes, self.units = pd.factorize(df[unit_col], sort=True)
+        period_codes, self.periods = pd.factorize(df[period_col], sort=True)
+        self.units = np.asarray(self.units)
+        self.periods = np.asarray(self.periods)
+
+        shape = (len(self.units), len(self.periods))
+        cell_index = unit_codes * shape[1] + period_codes
+        y = df[outcome].to_numpy(dtype=float)
+        size = shape[0] * shape[1]
+        self.n = np.bincount(cell_index, minlength=size).reshape(shape).astype(float)
+        self.s = np.bincount(cell_index, weights=y, minlength=size).reshape(shape)
+        self.q = np.bincount(cell_index, weights=y * y, minlength=size).reshape(shape)
+
+    def unit_mask(self, treated_units):
+        """Devuelve un vector booleano que marca las unidades tratadas."""
+        return np.isin(self.units, list(treated_units))
+
+
+def ols_from_moments(xtx, xty, yty, nobs, rcond=1e-10):
+    """
+    Resuelve por lotes sistemas de ecuaciones normales de MCO.
+
+    Usa la pseudo-inversa de X'X (vía descomposición espectral), que coincide con
+    la solución de norma mínima que calcula statsmodels cuando el diseño es singular.
+
+    Args:
+        xtx (np.ndarray): Matrices X'X de forma (K, p, p).
+        xty (np.ndarray): Vectores X'y de forma (K, p).
+        yty (np.ndarray): Escalares y'y de forma (K,).
+        nobs (np.ndarray): Número de observaciones de cada sistema, forma (K,).
+        rcond (float): Umbral relativo bajo el cual un valor propio se considera nulo.
+
+    Returns:
+        dict: Arreglos 'params', 'bse', 'tvalues', 'pvalues' (K, p) y 'df_resid',
+              'rank', 'ssr' (K,), además de 'normalized_cov' (K, p, p).
+    """
+    fit = ols_multi_outcome(xtx, np.asarray(xty, dtype=float)[:, :, None], np.asarray(yty, dtype=float)[:, None],
+                            nobs, rcond=rcond)
+    for name in ('params', 'bse', 'tvalues', 'pvalues', 'ssr'):
+        fit[name] = fit[name][:, 0]
+    return fit
+
+
+def ols_multi_outcome(xtx, xty, yty, nobs, rcond=1e-10):
+    """
+    Resuelve por lotes sistemas de MCO con varias variables de resultado por diseño.
+
+    La descomposición espectral de cada X'X se calcula una sola vez y se reutiliza para
+    todas las columnas de X'Y, como un sistema con varios lados derechos.
+
+    Args:
+        xtx (np.ndarray): Matrices X'X de forma (K, p, p).
+        xty (np.ndarray): Productos X'Y de forma (K, p, M), una columna por resultado.
+        yty (np.ndarray): Sumas de cuadrados de cada resultado, forma (K, M).
+        nobs (np.ndarray): Número de observaciones de cada sistema, forma (K,).
+        rcond (float): Umbral relativo bajo el cual un valor propio se considera nulo.
+
+    Returns:
+        dict: Arreglos 'params', 'bse', 'tvalues', 'pvalues' (K, M, p), 'ssr' (K, M),
+              'df_resid', 'rank' (K,) y 'normalized_cov' (K, p, p).
+    """
+    xtx = np.asarray(xtx, dtype=float)
+    xty = np.asarray(xty, dtype=float)
+    eigvals, eigvecs = np.linalg.eigh(xtx)
+    keep = eigvals > rcond * eigvals.max(axis=-1, keepdims=True)
+    inv_eigvals = np.where(keep, 1.0 / np.where(keep, eigvals, 1.0), 0.0)
+    normalized_cov = (eigvecs * inv_eigvals[:, None, :]) @ eigvecs.transpose(0, 2, 1)
+
+    params = (normalized_cov @ xty).transpose(0, 2, 1)
+    rank = keep.sum(axis=-1)
+    ssr = np.maximum(np.asarray(yty, dtype=float) - np.einsum('kmi,kim->km', params, xty), 0.0)
+    df_resid = np.asarray(nobs, dtype=float) - rank
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = ssr / df_resid[:, None]
+        bse = np.sqrt(scale[:, :, None] * np.diagonal(normalized_cov, axis1=1, axis2=2)[:, None, :])
+        tvalues = params / bse
+    pvalues = 2 * stats.t.sf(np.abs(tvalues), df_resid[:, None, None])
+
+    return {
+        'params': params,
+        'bse': bse,
+        'tvalues': tvalues,
+        'pvalues': pvalues,
+        'df_resid': df_resid,
+        'rank': rank,
+        'ssr': ssr,
+        'normalized_cov': normalized_cov,
+    }
+
+
+def did_moments(cells, treated, treatment_years, start_years, end_years):
+    """
+    Arma los productos cruzados del modelo DiD clásico para varias especificaciones.
+
+    Args:
+        cells (PanelCells): Sumas suficientes del panel.
+        treated (np.ndarray): Vector booleano de unidades tratadas (compartido por todas
+                              las especificaciones) o matriz (K, unidades) con una
+                              asignación de tratamiento por especificación.
+        treatment_years, start_years, end_years (array-like): Un valor por especificación.
+
+    Returns:
+        tuple: (xtx, xty, yty, nobs) listos para `ols_from_moments`.
+    """
+    periods = cells.periods[None, :]
+    window = (periods >= np.asarray(start_years)[:, None]) & (periods <= np.asarray(end_years)[:, None])
+    post = periods >= np.asarray(treatment_years)[:, None]
+    pre_mask = (window & ~post).astype(float)
+    post_mask = (window & post).astype(float)
+
+    treated = np.asarray(treated, dtype=float)
+    by_group = []
+    for table in (cells.n, cells.s, cells.q):
+        # Con un vector compartido las sumas del grupo tratado son (P,); con una matriz, (K, P).
+        treated_sum = treated @ table
+        control_sum = table.sum(axis=0) - treated_sum
+        # Celdas en el orden de _DID_CELL_DESIGN.
+        by_group.append(np.stack([
+            (pre_mask * control_sum).sum(axis=1),
+            (pre_mask * treated_sum).sum(axis=1),
+            (post_mask * control_sum).sum(axis=1),
+            (post_mask * treated_sum).sum(axis=1),
+        ], axis=1))
+    n_cell, s_cell, q_cell = by_group
+
+    design = np.asarray(_DID_CELL_DESIGN)
+    xtx = np.einsum('kc,ci,cj->kij', n_cell, design, design)
+    xty = s_cell @ design
+    return xtx, xty, q_cell.sum(axis=1), n_cell.sum(axis=1)
+
+
+def batched_did(cells, treated, specs, alpha=0.05):
+    """
+    Estima el modelo `deforestacion_anual ~ tratado + post_treatment + did` para
+    una lista de especificaciones en una sola llamada.
+
+    Args:
+        cells (PanelCells): Sumas suficientes del panel.
+        treated (np.ndarray): Vector booleano de unidades tratadas, o matriz (K, unidades)
+                              con una asignación por especificación.
+        specs (list): Tuplas (treatment_year, start_year, end_year). Si start_year o
+                      end_year es None se usa el período completo, como en `run_did_model`.
+        alpha (float): Nivel de significancia para los intervalos de confianza.
+
+    Returns:
+        pd.DataFrame: Una fila por especificación con el coeficiente 'did', su error
+                      estándar, estadístico t, p-valor e intervalo de confianza.
+    """
+    first, last = cells.periods.min(), cells.periods.max()
+    table = pd.DataFrame(list(specs), columns=['treatment_year', 'start_year', 'end_year'])
+    full_period = table['start_year'].isna() | table['end_year'].isna()
+    starts = np.where(full_period, first, table['start_year'].fillna(first)).astype(float)
+    ends = np.where(full_period, last, table['end_year'].fillna(last)).astype(float)
+
+    moments = did_moments(cells, treated, table['treatment_year'].to_numpy(dtype=float), starts, ends)
+    fit = ols_from_moments(*moments)
+
+    did_index = DID_TERMS.index('did')
+    critical = stats.t.ppf(1 - alpha / 2, fit['df_resid'])
+    table[['start_year', 'end_year']] = table[['start_year', 'end_year']].astype('Int64')
+    table['nobs'] = moments[3].astype(int)
+    table['coef'] = fit['params'][:, did_index]
+    table['std_err'] = fit['bse'][:, did_index]
+    table['t_value'] = fit['tvalues'][:, did_index]
+    table['p_value'] = fit['pvalues'][:, did_index]
+    table['ci_lower'] = table['coef'] - critical * table['std_err']
+    table['ci_upper'] = table['coef'] + critical * table['std_err']
+    return table
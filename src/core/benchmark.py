@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Medición de tiempo y memoria de los estimadores, y comparación con una línea base.
+
+Cada caso del benchmark se describe con una función `prepare` que deja listo el
+estimador (datos cargados, objetos construidos) y devuelve la llamada a medir; así la
+preparación no cuenta en el tiempo. El tiempo se toma en varias repeticiones (tras una
+ejecución de calentamiento que absorbe importaciones y compilación) y la memoria pico
+en una ejecución aparte con `tracemalloc`, para que su costo no afecte al tiempo.
+
+Los tiempos dependen de la máquina, así que cada ejecución mide también un caso de
+calibración fijo (álgebra lineal y una agregación de pandas) y la línea base guarda
+los tiempos en unidades de ese caso: al comparar, la base se reescala con la
+calibración medida en la misma ejecución. La línea base se guarda en JSON local (no
+se versiona); una regresión es un caso cuyo tiempo o memoria pico supera la línea
+base más la tolerancia.
+"""
+import json
+import os
+import platform
+import re
+import statistics
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from datetime import datetime
+
+from .lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+BASELINE_PATH = os.path.join('reports', 'benchmarks', 'baseline.json')
+# Tolerancias relativas sobre la línea base antes de marcar una regresión.
+TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.10
+# Diferencias absolutas por debajo de estos umbrales se consideran ruido.
+MIN_TIME_DELTA = 0.005
+MIN_MEMORY_DELTA_MIB = 1.0
+# Tamaño del caso de calibración (filas del sistema de mínimos cuadrados y de la agregación).
+CALIBRATION_ROWS = 20_000
+
+
+@dataclass
+class BenchmarkResult:
+    """Tiempo y memoria de un estimador para un tamaño de panel."""
+    estimator: str
+    n_units: int
+    n_years: int
+    n_treated: int
+    repeats: int
+    best_seconds: float
+    median_seconds: float
+    peak_mib: float
+
+    @property
+    def key(self):
+        """Identificador del caso en la línea base (estimador y tamaño del panel)."""
+        return f"{self.estimator}/{panel_size_label(self.n_units, self.n_years, self.n_treated)}"
+
+
+def panel_size_label(n_units, n_years, n_treated=1):
+    """Etiqueta de un tamaño de panel: 'UNIDADESxAÑOS', con ':TRATADAS' si hay más de una."""
+    label = f"{n_units}x{n_years}"
+    return label if n_treated == 1 else f"{label}:{n_treated}"
+
+
+def parse_sizes(text):
+    """
+    Interpreta una grilla de tamaños como '5x26,100x26,100x52:10'.
+
+    Cada elemento es UNIDADESxAÑOS, opcionalmente seguido de ':TRATADAS' (por defecto 1).
+
+    Returns:
+        list: Tuplas (n_units, n_years, n_treated) en el orden indicado.
+
+    Raises:
+        ValueError: Si algún elemento no tiene el formato esperado.
+    """
+    sizes = []
+    for part in str(text).split(','):
+        part = part.strip().lower()
+        match = re.fullmatch(r'(\d+)\s*x\s*(\d+)(?:\s*:\s*(\d+))?', part)
+        if not match:
+            raise ValueError(f"Tamaño inválido: '{part}'. Usa UNIDADESxAÑOS[:TRATADAS], p. ej. '100x26'.")
+        sizes.append((int(match.group(1)), int(match.group(2)), int(match.group(3) or 1)))
+    return list(dict.fromkeys(sizes))
+
+
+def measure(prepare, repeats=3, warmup=True):
+    """
+    Mide el tiempo y la memoria pico de una llamada.
+
+    Args:
+        prepare (callable): Función sin argumentos que prepara el caso y devuelve la
+                            llamada a medir; se invoca antes de cada ejecución, de modo
+                            que ninguna reutiliza resultados memorizados de otra.
+        repeats (int): Ejecuciones cronometradas.
+        warmup (bool): Ejecuta una vez sin medir antes de las mediciones.
+
+    Returns:
+        tuple: (tiempos en segundos de cada repetición, memoria pico en bytes).
+    """
+    if warmup:
+        prepare()()
+
+    run = prepare()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    times = []
+    for _ in range(max(1, int(repeats))):
+        run = prepare()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return times, peak
+
+
+def benchmark_case(estimator, prepare, n_units, n_years, n_treated=1, repeats=3):
+    """
+    Mide un caso del benchmark.
+
+    Returns:
+        BenchmarkResult: Mejor tiempo y mediana de las repeticiones, y memoria pico (MiB).
+    """
+    times, peak = measure(prepare, repeats=repeats)
+    return BenchmarkResult(estimator=estimator, n_units=n_units, n_years=n_years, n_treated=n_treated,
+                           repeats=len(times), best_seconds=min(times),
+                           median_seconds=statistics.median(times), peak_mib=peak / 1024 ** 2)
+
+
+def _calibration_case():
+    """Caso fijo de calibración: mínimos cuadrados y una agregación por grupos (ver `measure`)."""
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((CALIBRATION_ROWS, 20))
+    y = X @ rng.standard_normal(20) + rng.standard_normal(CALIBRATION_ROWS)
+    frame = pd.DataFrame({'unit': rng.integers(0, 100, CALIBRATION_ROWS), 'y': y})
+
+    def run():
+        np.linalg.lstsq(X, y, rcond=None)
+        frame.groupby('unit')['y'].mean()
+    return run
+
+
+def measure_calibration(repeats=5):
+    """
+    Mide el caso de calibración en la máquina actual.
+
+    Returns:
+        float: Mejor tiempo en segundos; los tiempos de la línea base se expresan en esta unidad.
+    """
+    times, _ = measure(_calibration_case, repeats=repeats)
+    return min(times)
+
+
+def results_frame(results):
+    """Convierte una lista de `BenchmarkResult` en una tabla."""
+    return pd.DataFrame([dict(asdict(result), key=result.key) for result in results])
+
+
+def machine_info():
+    """Descripción de la máquina: las líneas base sólo son comparables en el mismo entorno."""
+    return {'platform': platform.platform(), 'processor': platform.processor() or platform.machine(),
+            'python': platform.python_version(), 'cpu_count': os.cpu_count()}
+
+
+def save_baseline(results, calibration_seconds, path=BASELINE_PATH):
+    """
+    Guarda los resultados como línea base (JSON), conservando los casos previos que
+    no se volvieron a medir.
+
+    Args:
+        results (list): Resultados (`BenchmarkResult`).
+        calibration_seconds (float): Tiempo del caso de calibración medido en la misma ejecución.
+        path (str): Archivo de la línea base.
+
+    Returns:
+        str: Ruta del archivo escrito.
+    """
+    baseline = load_baseline(path) or {}
+    cases = dict(baseline.get('cases', {}))
+    for result in results:
+        cases[result.key] = {'best_seconds': round(result.best_seconds, 6),
+                             'median_seconds': round(result.median_seconds, 6),
+                             'relative_time': round(result.best_seconds / calibration_seconds, 6),
+                             'peak_mib': round(result.peak_mib, 3)}
+    payload = {'created': datetime.now().isoformat(timespec='seconds'), 'machine': machine_info(),
+               'calibration_seconds': round(calibration_seconds, 6), 'cases': dict(sorted(cases.items()))}
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    return path
+
+
+def load_baseline(path=BASELINE_PATH):
+    """Lee una línea base; devuelve None si no existe."""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_to_baseline(results, baseline, calibration_seconds, time_tolerance=TIME_TOLERANCE,
+                        memory_tolerance=MEMORY_TOLERANCE):
+    """
+    Compara los resultados con una línea base.
+
+    Se compara el mejor tiempo (el menos sensible a la carga de la máquina) y la
+    memoria pico. El tiempo de base se reescala a la máquina actual con el caso de
+    calibración: 'baseline_seconds' es el tiempo relativo guardado multiplicado por la
+    calibración de esta ejecución. Un caso es una regresión si alguna razón actual/base supera
+    1 + tolerancia y la diferencia absoluta supera el umbral de ruido.
+
+    Args:
+        results (list): Resultados actuales (`BenchmarkResult`).
+        baseline (dict): Línea base leída con `load_baseline`.
+        calibration_seconds (float): Tiempo del caso de calibración en esta ejecución.
+        time_tolerance, memory_tolerance (float): Tolerancias relativas.
+
+    Returns:
+        pd.DataFrame: Una fila por caso con los valores actuales y de base, las razones y
+                      la columna 'regression'; los casos sin base quedan con NaN y sin marcar.
+    """
+    cases = (baseline or {}).get('cases', {})
+    rows = []
+    for result in results:
+        base = cases.get(result.key, {})
+        base_relative, base_peak = base.get('relative_time'), base.get('peak_mib')
+        base_seconds = base_relative * calibration_seconds if base_relative else None
+        time_ratio = result.best_seconds / base_seconds if base_seconds else float('nan')
+        memory_ratio = result.peak_mib / base_peak if base_peak else float('nan')
+        slower = (time_ratio > 1 + time_tolerance and
+                  result.best_seconds - base_seconds > MIN_TIME_DELTA)
+        heavier = (memory_ratio > 1 + memory_tolerance and
+                   result.peak_mib - base_peak > MIN_MEMORY_DELTA_MIB)
+        rows.append({'key': result.key, 'best_seconds': result.best_seconds, 'baseline_seconds': base_seconds,
+                     'time_ratio': time_ratio, 'peak_mib': result.peak_mib, 'baseline_peak_mib': base_peak,
+                     'memory_ratio': memory_ratio, 'regression': bool(slower or heavier)})
+    return pd.DataFrame(rows)
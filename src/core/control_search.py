@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+Búsqueda de subconjuntos de donantes para la prueba de tendencias paralelas.
+
+La prueba pre-intervención `y ~ tratado + año_norm + tratado:año_norm` es un modelo
+completamente interactuado: equivale a dos regresiones simples (tratado y control)
+con varianza residual común, de modo que el coeficiente de 'tratado:año_norm', su
+error estándar y su estadístico t se obtienen en forma cerrada a partir de seis sumas
+por grupo (n, Σt, Σt², Σy, Σty, Σy²). Las sumas de cada donante se calculan una sola
+vez; las de un grupo de control son el producto de su máscara de donantes por esa
+matriz, así que millones de subconjuntos se evalúan con un producto matricial por
+bloque en lugar de una regresión por subconjunto.
+"""
+import itertools
+import math
+
+from .lazy_imports import lazy_import
+from .parallel import map_in_pool, resolve_jobs, split_chunks, worker_state
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+stats = lazy_import('scipy.stats')
+
+# Máximo de donantes para representar un subconjunto como entero de 64 bits.
+MAX_ENUMERATION_DONORS = 62
+# Subconjuntos evaluados por bloque dentro de cada tarea.
+_BLOCK_SIZE = 65536
+
+
+def unit_trend_stats(cells, end_year, start_year=None):
+    """
+    Sumas de la regresión de tendencia de cada unidad en el período pre-intervención.
+
+    Args:
+        cells (PanelCells): Sumas suficientes del panel.
+        end_year (int): Año de intervención; se usan los períodos anteriores.
+        start_year (int, optional): Primer período de la prueba; None usa el primero del panel.
+
+    Returns:
+        np.ndarray: Matriz (unidades, 6) con n, Σt, Σt², Σy, Σty y Σy² por unidad, con
+                    t medido desde el primer período de la prueba.
+    """
+    start_year = cells.periods.min() if start_year is None else start_year
+    window = (cells.periods >= start_year) & (cells.periods < end_year)
+    if window.sum() < 2:
+        raise ValueError(f"La prueba de tendencias requiere al menos dos períodos antes de {end_year}.")
+    t = (cells.periods[window] - cells.periods[window].min()).astype(float)
+    n, s, q = cells.n[:, window], cells.s[:, window], cells.q[:, window]
+    return np.column_stack([n.sum(axis=1), n @ t, n @ (t * t), s.sum(axis=1), s @ t, q.sum(axis=1)])
+
+
+def trend_difference(treated_stats, control_stats):
+    """
+    Diferencia de tendencias (coeficiente de 'tratado:año_norm') para muchos grupos de control.
+
+    Args:
+        treated_stats (np.ndarray): Sumas del grupo tratado, forma (6,).
+        control_stats (np.ndarray): Sumas de cada grupo de control, forma (K, 6).
+
+    Returns:
+        dict: Arreglos (K,) 'coef', 'std_err', 't_value', 'p_value' y 'df_resid',
+              idénticos a los de MCO sobre las observaciones del tratado y del control.
+    """
+    def slope_terms(g):
+        n, st, stt, sy, sty, syy = (g[..., i] for i in range(6))
+        sxx = stt - st * st / n
+        sxy = sty - st * sy / n
+        slope = sxy / sxx
+        ssr = syy - sy * sy / n - slope * sxy
+        return n, sxx, slope, ssr
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n_t, sxx_t, slope_t, ssr_t = slope_terms(np.asarray(treated_stats, dtype=float))
+        n_c, sxx_c, slope_c, ssr_c = slope_terms(np.asarray(control_stats, dtype=float))
+        df_resid = n_t + n_c - 4
+        scale = np.maximum(ssr_t + ssr_c, 0.0) / df_resid
+        coef = slope_t - slope_c
+        std_err = np.sqrt(scale * (1.0 / sxx_t + 1.0 / sxx_c))
+        t_value = coef / std_err
+    p_value = 2 * stats.t.sf(np.abs(t_value), df_resid)
+    return {'coef': coef, 'std_err': std_err, 't_value': t_value, 'p_value': p_value, 'df_resid': df_resid}
+
+
+def count_subsets(n_donors, min_size, max_size):
+    """Número de subconjuntos de donantes con tamaño entre `min_size` y `max_size`."""
+    return sum(math.comb(n_donors, k) for k in range(min_size, max_size + 1))
+
+
+def _masks_from_codes(lo, hi, n_donors, min_size, max_size):
+    """Máscaras (0/1) de los subconjuntos codificados como enteros en [lo, hi), filtradas por tamaño."""
+    codes = np.arange(lo, hi, dtype=np.int64)
+    masks = ((codes[:, None] >> np.arange(n_donors, dtype=np.int64)) & 1).astype(np.uint8)
+    sizes = masks.sum(axis=1)
+    return masks[(sizes >= min_size) & (sizes <= max_size)]
+
+
+def _task_blocks(task):
+    """Recorre en bloques las máscaras de una tarea: un rango de códigos o máscaras empaquetadas."""
+    state = worker_state()
+    kind, payload = task
+    if kind == 'codes':
+        lo, hi = payload
+        for start in range(lo, hi, _BLOCK_SIZE):
+            yield _masks_from_codes(start, min(start + _BLOCK_SIZE, hi), state['n_donors'],
+                                    state['min_size'], state['max_size'])
+    else:
+        for start in range(0, len(payload), _BLOCK_SIZE):
+            yield np.unpackbits(payload[start:start + _BLOCK_SIZE], axis=1, count=state['n_donors'])
+
+
+def _best(p_value, n_donors, top):
+    """Índices de los `top` mejores subconjuntos: mayor p-valor y, a igualdad, más donantes."""
+    p_value = np.nan_to_num(p_value, nan=-1.0)
+    if len(p_value) > top:
+        candidates = np.argpartition(-p_value, top - 1)[:top]
+    else:
+        candidates = np.arange(len(p_value))
+    order = np.lexsort((-n_donors[candidates], -p_value[candidates]))
+    return candidates[order]
+
+
+def _search_task(task):
+    """Evalúa los subconjuntos de una tarea y devuelve sus mejores candidatos y los conteos."""
+    state = worker_state()
+    top, alpha = state['top'], state['alpha']
+    kept_masks, kept_stats = [], []
+    n_evaluated = n_not_rejected = 0
+    for masks in _task_blocks(task):
+        if not len(masks):
+            continue
+        fit = trend_difference(state['treated_stats'], masks.astype(float) @ state['donor_stats'])
+        n_evaluated += len(masks)
+        n_not_rejected += int((fit['p_value'] > alpha).sum())
+        best = _best(fit['p_value'], masks.sum(axis=1), top)
+        kept_masks.append(masks[best])
+        kept_stats.append(np.column_stack([fit['coef'][best], fit['std_err'][best],
+                                           fit['t_value'][best], fit['p_value'][best]]))
+        # Conserva sólo los mejores acumulados para acotar la memoria de la tarea.
+        if len(kept_masks) > 1:
+            masks_so_far, stats_so_far = np.vstack(kept_masks), np.vstack(kept_stats)
+            best = _best(stats_so_far[:, 3], masks_so_far.sum(axis=1), top)
+            kept_masks, kept_stats = [masks_so_far[best]], [stats_so_far[best]]
+    if not kept_masks:
+        return np.empty((0, state['n_donors']), dtype=np.uint8), np.empty((0, 4)), 0, 0
+    return kept_masks[0], kept_stats[0], n_evaluated, n_not_rejected
+
+
+class ControlSubsetSearch:
+    """
+    Ordena subconjuntos de donantes según la prueba de tendencias paralelas pre-intervención.
+
+    Si el número de subconjuntos admisibles no supera `max_subsets` se enumeran todos;
+    si no, se evalúa una muestra aleatoria uniforme de subconjuntos distintos.
+
+    Attributes:
+        donors (np.ndarray): Unidades candidatas a formar el grupo de control.
+        n_admissible (int): Subconjuntos de donantes con el tamaño permitido.
+        mode (str): 'enumerated' o 'sampled', tras llamar a `run`.
+    """
+    def __init__(self, cells, treated_units, treatment_year, donors=None, start_year=None, min_size=2,
+                 max_size=None, max_subsets=1_000_000, alpha=0.05, seed=None, n_jobs=None):
+        """
+        Args:
+            cells (PanelCells): Sumas suficientes del panel.
+            treated_units (list): Unidades tratadas.
+            treatment_year (int): Año de intervención; la prueba usa los períodos anteriores.
+            donors (list, optional): Unidades candidatas; None usa todas las no tratadas.
+            start_year (int, optional): Primer período de la prueba.
+            min_size, max_size (int): Tamaño mínimo y máximo de los grupos de control
+                                      (None: todos los donantes).
+            max_subsets (int): Límite de subconjuntos evaluados; por encima se muestrea.
+            alpha (float): Nivel para contar los subconjuntos en que no se rechaza la hipótesis nula.
+            seed (int, optional): Semilla del muestreo de subconjuntos.
+            n_jobs (int, optional): Procesos del pool; None usa todos los núcleos.
+        """
+        treated = cells.unit_mask(treated_units)
+        if not treated.any():
+            raise ValueError(f"Ninguna de las unidades tratadas {list(treated_units)} está en el panel.")
+        candidates = ~treated if donors is None else cells.unit_mask(donors) & ~treated
+        self.donors = cells.units[candidates]
+        if len(self.donors) == 0:
+            raise ValueError("No hay donantes disponibles para formar el grupo de control.")
+        self.max_size = len(self.donors) if max_size is None else min(int(max_size), len(self.donors))
+        self.min_size = min(max(1, int(min_size)), self.max_size)
+        self.n_admissible = count_subsets(len(self.donors), self.min_size, self.max_size)
+
+        unit_stats = unit_trend_stats(cells, treatment_year, start_year)
+        self.treated_stats = unit_stats[treated].sum(axis=0)
+        self.donor_stats = unit_stats[candidates]
+        self.max_subsets = int(max_subsets)
+        self.alpha = alpha
+        self.rng = np.random.default_rng(seed)
+        self.n_jobs = n_jobs
+        self.mode = None
+
+    def _enumeration_tasks(self, n_tasks):
+        """Tareas que enumeran todos los subconjuntos admisibles."""
+        n_donors = len(self.donors)
+        n_codes = 2 ** n_donors
+        if n_donors <= MAX_ENUMERATION_DONORS and n_codes <= 4 * self.max_subsets:
+            bounds = np.linspace(1, n_codes, n_tasks + 1).astype(np.int64)
+            return [('codes', (int(lo), int(hi))) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+        # Pocos subconjuntos frente a 2^D (grupos pequeños): se generan por combinaciones.
+        masks = []
+        for size in range(self.min_size, self.max_size + 1):
+            members = np.fromiter(itertools.chain.from_iterable(itertools.combinations(range(n_donors), size)),
+                                  dtype=np.int64).reshape(-1, size)
+            block = np.zeros((len(members), n_donors), dtype=np.uint8)
+            np.put_along_axis(block, members, 1, axis=1)
+            masks.append(block)
+        return self._packed_tasks(np.vstack(masks), n_tasks)
+
+    def _sampled_tasks(self, n_tasks):
+        """Tareas con una muestra uniforme de subconjuntos admisibles distintos."""
+        n_donors = len(self.donors)
+        sizes = np.arange(self.min_size, self.max_size + 1)
+        weights = np.array([math.comb(n_donors, int(k)) for k in sizes], dtype=float)
+        packed = []
+        for start in range(0, self.max_subsets, _BLOCK_SIZE):
+            n_draws = min(_BLOCK_SIZE, self.max_subsets - start)
+            size = self.rng.choice(sizes, size=n_draws, p=weights / weights.sum())
+            # Los `size` menores de D claves uniformes forman un subconjunto uniforme de ese tamaño.
+            keys = self.rng.random((n_draws, n_donors))
+            cutoff = np.sort(keys, axis=1)[np.arange(n_draws), size - 1]
+            packed.append(np.packbits((keys <= cutoff[:, None]).astype(np.uint8), axis=1))
+        # Descarta repetidos comparando cada fila empaquetada como un solo valor binario.
+        packed = np.ascontiguousarray(np.vstack(packed))
+        rows = np.unique(packed.view(np.dtype((np.void, packed.shape[1]))).ravel())
+        return self._packed_tasks(rows.view(np.uint8).reshape(-1, packed.shape[1]), n_tasks, packed=True)
+
+    @staticmethod
+    def _packed_tasks(masks, n_tasks, packed=False):
+        if not packed:
+            masks = np.packbits(masks, axis=1)
+        return [('packed', masks[chunk]) for chunk in split_chunks(len(masks), n_tasks)]
+
+    def run(self, top=50):
+        """
+        Evalúa los subconjuntos y ordena los mejores.
+
+        Args:
+            top (int): Número de subconjuntos a conservar en el ranking.
+
+        Returns:
+            tuple: (ranking, resumen). El ranking tiene 'rank', 'donors', 'n_donors',
+                   'coef', 'std_err', 't_value' y 'p_value', ordenado por p-valor
+                   decreciente (a igualdad, más donantes); el resumen incluye el modo,
+                   los subconjuntos evaluados, la proporción en que no se rechaza la
+                   hipótesis nula y la prueba con todos los donantes.
+        """
+        n_donors = len(self.donors)
+        n_tasks = max(resolve_jobs(self.n_jobs), int(np.ceil(min(self.n_admissible, self.max_subsets) / 500_000)))
+        if self.n_admissible <= self.max_subsets:
+            self.mode = 'enumerated'
+            tasks = self._enumeration_tasks(n_tasks)
+        else:
+            self.mode = 'sampled'
+            tasks = self._sampled_tasks(n_tasks)
+
+        state = {'treated_stats': self.treated_stats, 'donor_stats': self.donor_stats, 'n_donors': n_donors,
+                 'min_size': self.min_size, 'max_size': self.max_size, 'top': top, 'alpha': self.alpha}
+        results = map_in_pool(_search_task, tasks, n_jobs=self.n_jobs, state=state)
+        masks = np.vstack([result[0] for result in results])
+        fits = np.vstack([result[1] for result in results])
+        n_evaluated = sum(result[2] for result in results)
+        n_not_rejected = sum(result[3] for result in results)
+
+        best = _best(fits[:, 3], masks.sum(axis=1), top)
+        masks, fits = masks[best], fits[best]
+        ranking = pd.DataFrame(fits, columns=['coef', 'std_err', 't_value', 'p_value'])
+        ranking.insert(0, 'rank', np.arange(1, len(ranking) + 1))
+        ranking.insert(1, 'donors', [', '.join(self.donors[mask.astype(bool)]) for mask in masks])
+        ranking.insert(2, 'n_donors', masks.sum(axis=1).astype(int))
+
+        baseline = trend_difference(self.treated_stats, self.donor_stats.sum(axis=0)[None, :])
+        summary = {
+            'mode': self.mode,
+            'n_donors': n_donors,
+            'n_admissible': self.n_admissible,
+            'n_evaluated': n_evaluated,
+            'n_not_rejected': n_not_rejected,
+            'share_not_rejected': n_not_rejected / n_evaluated if n_evaluated else np.nan,
+            'alpha': self.alpha,
+            'all_donors': {name: float(values[0]) for name, values in baseline.items() if name != 'df_resid'},
+        }
+        return ranking, summary
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+Control sintético con predictores y optimización anidada de la matriz de importancia V.
+
+Cada predictor es una fila de la matriz X (predictores x unidades): rezagos de la
+variable de resultado, niveles de cobertura o cualquier otra columna del panel,
+resumidos por año o por promedio de una ventana. Para una V diagonal, los pesos de
+los donantes resuelven el problema interno
+
+    w(V) = argmin_w (x1 - X0 w)' V (x1 - X0 w)   sujeto a w en el simplex,
+
+y V se elige minimizando el error cuadrático de la variable de resultado en el
+período pre-intervención con esos pesos (problema externo, Abadie y Gardeazabal 2003).
+
+El gradiente del problema externo se obtiene de forma analítica: en el soporte S de
+w(V), las condiciones KKT del problema interno son un sistema lineal cuya derivada
+respecto de cada v_k sólo depende de X0[k, S] y del residuo del predictor k, así que
+un único sistema adjunto por evaluación da el gradiente completo. El problema externo
+se resuelve con L-BFGS desde varios puntos de partida en paralelo; los puntos se eligen
+evaluando de una sola vez, con el solucionador cuadrático por lotes, muchas V al azar.
+"""
+import re
+
+from .lazy_imports import lazy_import
+from .parallel import map_in_pool, resolve_jobs, split_chunks, worker_state
+from .synthetic_control import solve_simplex_qp
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+optimize = lazy_import('scipy.optimize')
+
+DEFAULT_PREDICTORS = (
+    'deforestacion_anual@1998-2004',
+    'cobertura_boscosa:mean@1998-2004',
+    'cobertura_boscosa@1998',
+)
+PREDICTOR_OPS = ('each', 'mean')
+
+
+def parse_predictors(text):
+    """
+    Interpreta una lista de predictores como 'deforestacion_anual@1998-2004,cobertura_boscosa:mean@1998-2004'.
+
+    Cada elemento tiene la forma COLUMNA[:OPERACIÓN]@AÑOS. Con 'each' (por defecto) se
+    genera un predictor por año; con 'mean', uno con el promedio de los años indicados.
+
+    Returns:
+        list: Tuplas (columna, operación, años).
+
+    Raises:
+        ValueError: Si algún elemento no tiene la forma esperada.
+    """
+    predictors = []
+    for part in re.split(r',(?=[^,@]*@)', str(text)):
+        match = re.fullmatch(r'\s*(\w+)(?::(\w+))?\s*@\s*(\d{4})(?:\s*-\s*(\d{4}))?\s*', part)
+        if not match or (match.group(2) or 'each') not in PREDICTOR_OPS:
+            raise ValueError(f"Predictor inválido: '{part}'. Usa COLUMNA[:each|mean]@AÑO o @AÑO-AÑO, "
+                             f"p. ej. 'cobertura_boscosa:mean@1998-2004'.")
+        first = int(match.group(3))
+        last = int(match.group(4) or first)
+        if first > last:
+            raise ValueError(f"Rango de años inválido en el predictor '{part}'.")
+        predictors.append((match.group(1), match.group(2) or 'each', list(range(first, last + 1))))
+    return predictors
+
+
+def build_predictors(df, predictors, unit_col='departamento', period_col='Periodo'):
+    """
+    Arma la matriz de predictores (predictores x unidades) a partir del panel.
+
+    Args:
+        df (pd.DataFrame): Panel en formato largo.
+        predictors (list or str): Tuplas de `parse_predictors` o su forma de texto.
+        unit_col, period_col (str): Columnas del panel.
+
+    Returns:
+        pd.DataFrame: Una fila por predictor (p. ej. 'deforestacion_anual@1999' o
+                      'cobertura_boscosa:mean@1998-2004') y una columna por unidad.
+
+    Raises:
+        ValueError: Si una columna no existe en el panel.
+    """
+    if isinstance(predictors, str):
+        predictors = parse_predictors(predictors)
+    rows = {}
+    for column, op, years in predictors:
+        if column not in df.columns:
+            raise ValueError(f"La columna '{column}' no está en el panel.")
+        table = df.pivot_table(index=period_col, columns=unit_col, values=column, observed=True)
+        table = table.reindex(years)
+        if op == 'each':
+            for year in years:
+                rows[f"{column}@{year}"] = table.loc[year]
+        else:
+            rows[f"{column}:mean@{years[0]}-{years[-1]}"] = table.mean(axis=0)
+    return pd.DataFrame(rows).T
+
+
+def _softmax(theta):
+    z = np.exp(theta - theta.max(axis=-1, keepdims=True))
+    return z / z.sum(axis=-1, keepdims=True)
+
+
+def active_set_qp(H, g, w0=None, max_iter=1000):
+    """
+    Resuelve min_w  w'Hw - 2g'w  sujeto a w en el simplex con un método de conjunto activo.
+
+    A diferencia del gradiente proyectado, llega a la solución exacta (salvo redondeo)
+    en pocas iteraciones cuando hay decenas de donantes, y su soporte es el que usa el
+    gradiente analítico del problema externo.
+
+    Args:
+        H (np.ndarray): Matriz (J, J) semidefinida positiva.
+        g (np.ndarray): Vector (J,).
+        w0 (np.ndarray, optional): Punto factible de partida; por defecto, pesos uniformes.
+        max_iter (int): Máximo de iteraciones.
+
+    Returns:
+        np.ndarray: Pesos óptimos (J,).
+    """
+    n = len(g)
+    w = np.full(n, 1.0 / n) if w0 is None else np.asarray(w0, dtype=float).copy()
+    free = w > 0
+    tolerance = 1e-12 * max(np.abs(H).max(), np.abs(g).max(), 1.0)
+    for _ in range(max_iter):
+        index = np.flatnonzero(free)
+        kkt = np.zeros((len(index) + 1, len(index) + 1))
+        kkt[:-1, :-1] = H[np.ix_(index, index)]
+        kkt[:-1, -1] = kkt[-1, :-1] = 1.0
+        solution = np.linalg.lstsq(kkt, np.append(g[index], 1.0), rcond=None)[0]
+        target, nu = solution[:-1], solution[-1]
+        if np.all(target > 0):
+            w = np.zeros(n)
+            w[index] = target
+            # Multiplicadores de las cotas w_j >= 0 de los donantes fuera del soporte.
+            multipliers = np.where(free, np.inf, H @ w - g + nu)
+            entering = int(np.argmin(multipliers))
+            if multipliers[entering] >= -tolerance:
+                return w
+            free[entering] = True
+        else:
+            # Avanza hacia la solución del subproblema hasta que un peso llega a cero; ese
+            # donante sale del soporte.
+            current = w[index]
+            blocking = np.flatnonzero(target <= 0)
+            ratios = current[blocking] / (current[blocking] - target[blocking])
+            step = ratios.min()
+            w[index] = np.maximum(current + step * (target - current), 0.0)
+            w[index[blocking[np.argmin(ratios)]]] = 0.0
+            w /= w.sum()
+            free = w > 0
+    return w
+
+
+def outer_loss(v, X0, x1, Z0, z1, w0=None):
+    """
+    Pérdida del problema externo y su gradiente respecto de la diagonal de V.
+
+    Args:
+        v (np.ndarray): Diagonal de V, forma (K,).
+        X0, x1 (np.ndarray): Predictores de los donantes (K, J) y de la unidad tratada (K,).
+        Z0, z1 (np.ndarray): Resultados pre-intervención de los donantes (T, J) y de la tratada (T,).
+        w0 (np.ndarray, optional): Punto de partida del problema interno.
+
+    Returns:
+        tuple: (pérdida, gradiente (K,), pesos w(V) (J,)).
+    """
+    H = (X0.T * v) @ X0
+    g = X0.T @ (v * x1)
+    w = active_set_qp(H, g, w0=w0)
+    outcome_residual = z1 - Z0 @ w
+    loss = outcome_residual @ outcome_residual / len(z1)
+
+    # Sistema KKT en el soporte: [H_SS 1; 1' 0] [dw_S; dmu] = [X0[k, S] r_k; 0] por cada v_k.
+    support = np.flatnonzero(w > 0)
+    kkt = np.zeros((len(support) + 1, len(support) + 1))
+    kkt[:-1, :-1] = H[np.ix_(support, support)]
+    kkt[:-1, -1] = kkt[-1, :-1] = 1.0
+    loss_grad_w = np.append(-2.0 * Z0[:, support].T @ outcome_residual / len(z1), 0.0)
+    adjoint = np.linalg.lstsq(kkt.T, loss_grad_w, rcond=None)[0][:-1]
+    predictor_residual = x1 - X0 @ w
+    gradient = predictor_residual * (X0[:, support] @ adjoint)
+    return loss, gradient, w
+
+
+def _fit_starts(thetas):
+    """Resuelve el problema externo con L-BFGS desde cada punto de partida del bloque."""
+    state = worker_state()
+    X0, x1, Z0, z1 = state['X0'], state['x1'], state['Z0'], state['z1']
+    results = []
+    for theta0 in thetas:
+        last = {'w': None}
+
+        def objective(theta):
+            v = _softmax(theta)
+            loss, grad_v, last['w'] = outer_loss(v, X0, x1, Z0, z1, w0=last['w'])
+            # Regla de la cadena de la parametrización softmax: dv/dtheta = diag(v) - v v'.
+            return loss, v * (grad_v - v @ grad_v)
+
+        solution = optimize.minimize(objective, theta0, jac=True, method='L-BFGS-B',
+                                     options={'maxiter': state['max_iter']})
+        v = _softmax(solution.x)
+        loss, _, w = outer_loss(v, X0, x1, Z0, z1, w0=last['w'])
+        results.append((loss, v, w, int(solution.nit)))
+    return results
+
+
+def _screen_starts(X0, x1, Z0, z1, n_candidates, n_starts, rng, tol):
+    """
+    Elige los puntos de partida: V uniforme y las mejores de `n_candidates` V al azar,
+    evaluadas en un único lote del solucionador cuadrático.
+    """
+    n_predictors = X0.shape[0]
+    candidates = np.vstack([np.full(n_predictors, 1.0 / n_predictors),
+                            rng.dirichlet(np.ones(n_predictors), size=max(n_candidates - 1, 0))])
+    H = np.einsum('kj,ck,kl->cjl', X0, candidates, X0)
+    g = np.einsum('kj,ck->cj', X0, candidates * x1)
+    weights, _ = solve_simplex_qp(H, g, tol=tol, max_iter=2000)
+    residuals = z1[None, :] - weights @ Z0.T
+    losses = np.mean(residuals ** 2, axis=1)
+    # La V uniforme siempre es un punto de partida; el resto, las de menor pérdida.
+    order = np.concatenate([[0], 1 + np.argsort(losses[1:])])[:n_starts]
+    return np.log(np.maximum(candidates[order], 1e-12))
+
+
+class CovariateSyntheticControl:
+    """
+    Control sintético con varios predictores y V elegida por optimización anidada.
+
+    Attributes:
+        predictors (pd.DataFrame): Matriz de predictores sin estandarizar (predictores x unidades).
+        dropped_predictors (list): Predictores descartados por tener valores faltantes.
+        Y (pd.DataFrame): Variable de resultado (unidades x períodos).
+    """
+    def __init__(self, df, treated_unit, treatment_year, predictors=DEFAULT_PREDICTORS,
+                 outcome='deforestacion_anual', unit_col='departamento', period_col='Periodo',
+                 pre_start=None, donors=None, tol=1e-7):
+        """
+        Args:
+            df (pd.DataFrame): Panel en formato largo.
+            treated_unit (str): Unidad tratada.
+            treatment_year (int): Año de la intervención.
+            predictors (list or str): Predictores: texto o lista de elementos en el formato de
+                                      `parse_predictors`, o sus tuplas ya interpretadas.
+            outcome, unit_col, period_col (str): Columnas del panel.
+            pre_start (int, optional): Primer año del período de ajuste de V.
+            donors (list, optional): Unidades donantes; None usa todas las demás.
+            tol (float): Tolerancia del solucionador por lotes con que se eligen los puntos
+                         de partida (el problema interno se resuelve de forma exacta).
+        """
+        if isinstance(predictors, str):
+            predictors = parse_predictors(predictors)
+        elif all(isinstance(item, str) for item in predictors):
+            # Lista de elementos COLUMNA[:OPERACIÓN]@AÑOS, como DEFAULT_PREDICTORS.
+            predictors = parse_predictors(','.join(predictors))
+        self.Y = df.pivot_table(index=unit_col, columns=period_col, values=outcome, observed=True)
+        self.units = np.asarray(self.Y.index, dtype=object)
+        self.periods = self.Y.columns.to_numpy()
+        if treated_unit not in self.units:
+            raise ValueError(f"La unidad tratada '{treated_unit}' no está en el panel.")
+        self.treated_unit = treated_unit
+        self.treatment_year = treatment_year
+        self.donors = np.asarray([u for u in self.units if u != treated_unit and (donors is None or u in donors)],
+                                 dtype=object)
+        if len(self.donors) < 2:
+            raise ValueError("El control sintético requiere al menos dos donantes.")
+        self.tol = tol
+
+        matrix = build_predictors(df, predictors, unit_col=unit_col, period_col=period_col)
+        matrix = matrix.reindex(columns=[treated_unit, *self.donors])
+        complete = matrix.notna().all(axis=1)
+        self.dropped_predictors = matrix.index[~complete].tolist()
+        self.predictors = matrix[complete]
+        if self.predictors.empty:
+            raise ValueError("Ningún predictor está completo para la unidad tratada y los donantes.")
+
+        first = pre_start if pre_start is not None else self.periods.min()
+        outcomes = self.Y.loc[[treated_unit, *self.donors]]
+        self.pre_mask = ((self.periods >= first) & (self.periods < treatment_year)
+                         & outcomes.notna().all(axis=0).to_numpy())
+        if not self.pre_mask.any():
+            raise ValueError(f"No hay años pre-intervención completos antes de {treatment_year}.")
+
+        # Como en `synth`, cada predictor se divide por su desviación estándar entre unidades.
+        values = self.predictors.to_numpy(dtype=float)
+        scale = values.std(axis=1, ddof=1)
+        values = values / np.where(scale > 0, scale, 1.0)[:, None]
+        pre = outcomes.to_numpy()[:, self.pre_mask]
+        self._problem = {'x1': values[:, 0], 'X0': values[:, 1:], 'z1': pre[0], 'Z0': pre[1:].T}
+
+    def fit(self, n_starts=8, n_candidates=256, max_iter=200, seed=None, n_jobs=None):
+        """
+        Elige V y los pesos de los donantes.
+
+        Args:
+            n_starts (int): Puntos de partida de L-BFGS, resueltos en paralelo.
+            n_candidates (int): V al azar evaluadas en lote para elegir los puntos de partida.
+            max_iter (int): Máximo de iteraciones de L-BFGS por punto de partida.
+            seed (int, optional): Semilla de las V al azar.
+            n_jobs (int, optional): Procesos del pool; None usa todos los núcleos.
+
+        Returns:
+            dict: 'weights' (pesos de los donantes), 'v' (importancia de cada predictor,
+                  suma 1), 'balance' (predictores de la tratada, del sintético y promedio
+                  de los donantes), 'synthetic' y 'gaps' (por período), 'pre_rmspe',
+                  'post_rmspe' y 'starts' (pérdida e iteraciones de cada punto de partida).
+        """
+        problem = self._problem
+        rng = np.random.default_rng(seed)
+        thetas = _screen_starts(problem['X0'], problem['x1'], problem['Z0'], problem['z1'],
+                                n_candidates, n_starts, rng, self.tol)
+        state = dict(problem, max_iter=max_iter)
+        chunks = split_chunks(len(thetas), resolve_jobs(n_jobs))
+        results = map_in_pool(_fit_starts, [thetas[chunk] for chunk in chunks], n_jobs=n_jobs, state=state)
+        results = [result for chunk in results for result in chunk]
+        losses = np.array([result[0] for result in results])
+        best_loss, v, w, _ = results[int(np.argmin(losses))]
+
+        weights = pd.Series(w, index=self.donors, name='peso')
+        Y = self.Y.loc[[self.treated_unit, *self.donors]].to_numpy()
+        donor_y = Y[1:]
+        synthetic = w @ np.nan_to_num(donor_y)
+        # Un año sin dato en algún donante con peso positivo deja el sintético sin definir.
+        synthetic[(w > 0).astype(float) @ np.isnan(donor_y).astype(float) > 0] = np.nan
+        gaps = Y[0] - synthetic
+        post_mask = self.periods >= self.treatment_year
+
+        raw = self.predictors.to_numpy(dtype=float)
+        balance = pd.DataFrame({
+            'tratada': raw[:, 0],
+            'sintético': raw[:, 1:] @ w,
+            'promedio_donantes': raw[:, 1:].mean(axis=1),
+            'v': v,
+        }, index=self.predictors.index)
+        return {
+            'weights': weights,
+            'v': pd.Series(v, index=self.predictors.index, name='v'),
+            'balance': balance,
+            'synthetic': pd.Series(synthetic, index=self.periods),
+            'gaps': pd.Series(gaps, index=self.periods),
+            'pre_rmspe': float(np.sqrt(best_loss)),
+            'post_rmspe': float(np.sqrt(np.nanmean(gaps[post_mask] ** 2))) if post_mask.any() else np.nan,
+            'starts': pd.DataFrame({'loss': losses, 'iterations': [result[3] for result in results]}),
+        }
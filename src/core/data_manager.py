@@ -1,6 +1,21 @@
-import pandas as pd
 import io
+import json
+import os
 import re
+import shutil
+
+from .instrumentation import span
+from .lazy_imports import is_available, lazy_import
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+# 'pyarrow' es opcional: sin él se usa el formato '.npcols'.
+pa = lazy_import('pyarrow') if is_available('pyarrow') else None
+pq = lazy_import('pyarrow.parquet') if is_available('pyarrow') else None
+
+# Ruta base del dataset procesado; la extensión depende del formato columnar usado.
+PROCESSED_DATA_PATH = 'data/02_processed/deforestation_analysis_data'
+_KNOWN_EXTENSIONS = ('.parquet', '.npcols', '.csv')
 
 def get_truth_data():
     """
@@ -172,17 +187,340 @@ def get_truth_data():
     
     return df
 
-def save_processed_data(df, path, logger):
+def _processed_base_path(path):
+    """Quita la extensión de formato conocida para obtener la ruta base del dataset."""
+    for extension in _KNOWN_EXTENSIONS:
+        if path.endswith(extension):
+            return path[:-len(extension)]
+    return path
+
+def _remove_existing(target):
+    """Elimina una versión previa del dataset (archivo o directorio particionado)."""
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    elif os.path.exists(target):
+        os.remove(target)
+
+def _typed_frame(df):
+    """Aplica los tipos del dataset procesado: departamento categórico y Periodo entero."""
+    df = df.copy()
+    df['departamento'] = df['departamento'].astype('category')
+    df['Periodo'] = df['Periodo'].astype('int32')
+    for column in df.columns.drop(['departamento', 'Periodo']):
+        df[column] = df[column].astype('float64')
+    return df
+
+def _write_numpy_columns(df, directory):
+    """Escribe cada columna como un archivo .npy (memory-mappable) más un esquema JSON."""
+    os.makedirs(directory, exist_ok=True)
+    schema = {'columns': [], 'categories': {}}
+    for column in df.columns:
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            schema['categories'][column] = [str(c) for c in values.cat.categories]
+            values = values.cat.codes.astype('int32')
+        np.save(os.path.join(directory, f"{column}.npy"), values.to_numpy())
+        schema['columns'].append(column)
+    with open(os.path.join(directory, 'schema.json'), 'w', encoding='utf-8') as f:
+        json.dump(schema, f, ensure_ascii=False, indent=2)
+
+def _read_numpy_columns(directory, columns=None):
+    """Lee (mapeando en memoria) sólo las columnas solicitadas de un directorio .npcols."""
+    with open(os.path.join(directory, 'schema.json'), encoding='utf-8') as f:
+        schema = json.load(f)
+    data = {}
+    for column in columns or schema['columns']:
+        values = np.load(os.path.join(directory, f"{column}.npy"), mmap_mode='r')
+        if column in schema['categories']:
+            values = pd.Categorical.from_codes(values, categories=schema['categories'][column])
+        data[column] = values
+    return pd.DataFrame(data, copy=False)
+
+def save_processed_data(df, path, logger, partition_by=None, fmt=None):
     """
-    Guarda el DataFrame en la ruta especificada y registra el resultado.
+    Guarda el DataFrame en un formato columnar tipado y registra el resultado.
+
+    Se conserva la precisión completa de los flotantes, 'departamento' se guarda como
+    categórico y 'Periodo' como entero. Si 'pyarrow' está disponible se usa Parquet;
+    en caso contrario, un directorio '.npcols' con un archivo .npy por columna.
+
+    Args:
+        df (pd.DataFrame): Datos a guardar.
+        path (str): Ruta base del dataset (con o sin extensión).
+        logger (logging.Logger): Logger para registrar el resultado.
+        partition_by (str, optional): Columna por la que particionar (p. ej. 'departamento').
+        fmt (str, optional): 'parquet' o 'numpy'; por defecto, Parquet si está disponible.
     """
     try:
-        # Asegurarse de que el directorio de salida exista
-        import os
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        df.to_csv(path, index=False, float_format='%.2f')
-        logger.info(f"Datos guardados exitosamente en '{path}'")
+        base = _processed_base_path(path)
+        os.makedirs(os.path.dirname(base) or '.', exist_ok=True)
+        typed = _typed_frame(df)
+        fmt = fmt or ('parquet' if pq is not None else 'numpy')
+
+        if fmt == 'parquet':
+            target = f"{base}.parquet"
+            _remove_existing(target)
+            if partition_by:
+                pq.write_to_dataset(pa.Table.from_pandas(typed, preserve_index=False), target,
+                                    partition_cols=[partition_by])
+            else:
+                typed.to_parquet(target, index=False)
+        else:
+            target = f"{base}.npcols"
+            _remove_existing(target)
+            if partition_by:
+                for value, part in typed.groupby(partition_by, observed=True):
+                    _write_numpy_columns(part.drop(columns=partition_by).reset_index(drop=True),
+                                         os.path.join(target, f"{partition_by}={value}"))
+            else:
+                _write_numpy_columns(typed, target)
+
+        logger.info(f"Datos guardados exitosamente en '{target}'")
         return True
     except Exception as e:
         logger.error(f"FALLO al guardar los datos en '{path}'. Error: {e}")
-        return False
\ No newline at end of file
+        return False
+
+class ProcessedDataWriter:
+    """
+    Escritor por bloques del dataset procesado, para datos que no caben en memoria.
+
+    Cada bloque se escribe en cuanto llega: como un grupo de filas del archivo Parquet
+    o, sin 'pyarrow', anexado a un archivo binario por columna que al cerrar se
+    convierte en el '.npy' correspondiente. La memoria usada depende del tamaño del
+    bloque, no del total de filas. Los tipos son los de `save_processed_data`.
+
+    Los bloques se escriben en un destino temporal junto al definitivo, que sólo lo
+    reemplaza al cerrar sin errores: si la ingesta falla, el dataset previo se conserva.
+    """
+    def __init__(self, path, fmt=None):
+        """
+        Args:
+            path (str): Ruta base del dataset (con o sin extensión).
+            fmt (str, optional): 'parquet' o 'numpy'; por defecto, Parquet si está disponible.
+        """
+        base = _processed_base_path(path)
+        os.makedirs(os.path.dirname(base) or '.', exist_ok=True)
+        self.fmt = fmt or ('parquet' if pq is not None else 'numpy')
+        self.target = f"{base}.parquet" if self.fmt == 'parquet' else f"{base}.npcols"
+        self._temporary = f"{self.target}.{os.getpid()}.tmp"
+        _remove_existing(self._temporary)
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+        self._categories = {}
+
+    def write(self, df):
+        """Añade un bloque de filas al dataset."""
+        if df.empty:
+            return
+        typed = _typed_frame(df)
+        if self.fmt == 'parquet':
+            # Las categorías cambian entre bloques: se escriben como texto y el cargador
+            # vuelve a convertirlas en categóricas.
+            typed['departamento'] = typed['departamento'].astype(str)
+            table = pa.Table.from_pandas(typed, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self._temporary, table.schema)
+            self._writer.write_table(table.cast(self._writer.schema))
+        else:
+            os.makedirs(self._temporary, exist_ok=True)
+            if self._schema is None:
+                self._schema = {column: None for column in typed.columns}
+            for column in self._schema:
+                values = typed[column]
+                if isinstance(values.dtype, pd.CategoricalDtype):
+                    # Códigos estables entre bloques: las categorías se numeran al aparecer.
+                    codes = self._categories.setdefault(column, {})
+                    for category in values.cat.categories:
+                        codes.setdefault(str(category), len(codes))
+                    lookup = np.array([codes[str(c)] for c in values.cat.categories], dtype='int32')
+                    values = lookup[values.cat.codes.to_numpy()]
+                else:
+                    values = values.to_numpy()
+                self._schema[column] = values.dtype.str
+                with open(os.path.join(self._temporary, f"{column}.bin"), 'ab') as f:
+                    values.tofile(f)
+        self.rows += len(typed)
+
+    def close(self):
+        """
+        Termina la escritura del dataset y reemplaza con él la versión previa.
+
+        Returns:
+            str: Ruta del dataset escrito.
+        """
+        if self.fmt == 'parquet':
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        elif self._schema is not None:
+            for column, dtype in self._schema.items():
+                raw_path = os.path.join(self._temporary, f"{column}.bin")
+                raw = np.memmap(raw_path, dtype=dtype, mode='r')
+                output = np.lib.format.open_memmap(os.path.join(self._temporary, f"{column}.npy"), mode='w+',
+                                                   dtype=dtype, shape=raw.shape)
+                for start in range(0, len(raw), 1 << 22):
+                    output[start:start + (1 << 22)] = raw[start:start + (1 << 22)]
+                output.flush()
+                del raw, output
+                os.remove(raw_path)
+            schema = {
+                'columns': list(self._schema),
+                'categories': {column: list(codes) for column, codes in self._categories.items()},
+            }
+            with open(os.path.join(self._temporary, 'schema.json'), 'w', encoding='utf-8') as f:
+                json.dump(schema, f, ensure_ascii=False, indent=2)
+        if os.path.exists(self._temporary):
+            _remove_existing(self.target)
+            os.replace(self._temporary, self.target)
+        return self.target
+
+    def abort(self):
+        """Descarta lo escrito; el dataset previo queda intacto."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        _remove_existing(self._temporary)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+def _partition_column(target):
+    """Columna de partición de un dataset columnar particionado; None si no lo está."""
+    if not os.path.isdir(target):
+        return None
+    keys = {name.split('=', 1)[0] for name in os.listdir(target) if '=' in name}
+    return keys.pop() if len(keys) == 1 else None
+
+def append_processed_data(df, path, logger):
+    """
+    Anexa filas nuevas (p. ej. un año más) al dataset procesado existente.
+
+    En CSV y en Parquet particionado las filas se agregan sin tocar los archivos
+    previos; en los demás formatos el dataset se reescribe con las filas anexadas,
+    conservando su formato y su partición.
+
+    Args:
+        df (pd.DataFrame): Filas a anexar, con las columnas del dataset.
+        path (str): Ruta base del dataset (con o sin extensión).
+        logger (logging.Logger): Logger para registrar el resultado.
+
+    Returns:
+        str: Ruta del dataset actualizado.
+
+    Raises:
+        FileNotFoundError: Si el dataset no existe en ningún formato.
+    """
+    target = resolve_processed_path(path)
+    if df.empty:
+        return target
+    partition_by = _partition_column(target)
+    if target.endswith('.csv'):
+        columns = pd.read_csv(target, nrows=0).columns
+        df[list(columns)].to_csv(target, mode='a', header=False, index=False)
+    elif target.endswith('.parquet') and partition_by:
+        typed = _typed_frame(df)
+        typed['departamento'] = typed['departamento'].astype(str)
+        pq.write_to_dataset(pa.Table.from_pandas(typed, preserve_index=False), target,
+                            partition_cols=[partition_by],
+                            basename_template=f"append-{os.urandom(4).hex()}-{{i}}.parquet")
+    else:
+        existing = load_processed_data(path)
+        combined = pd.concat([existing.astype({'departamento': str}), df.astype({'departamento': str})],
+                             ignore_index=True)
+        if not save_processed_data(combined, path, logger, partition_by=partition_by,
+                                   fmt='parquet' if target.endswith('.parquet') else 'numpy'):
+            raise OSError(f"No se pudo reescribir el dataset '{target}' con las filas anexadas.")
+        return target
+    logger.info(f"{len(df)} filas anexadas a '{target}'")
+    return target
+
+def resolve_processed_path(path=PROCESSED_DATA_PATH):
+    """
+    Devuelve la ruta del dataset procesado que usará `load_processed_data`.
+
+    Args:
+        path (str): Ruta base del dataset (con o sin extensión).
+
+    Returns:
+        str: Ruta al archivo o directorio existente (Parquet, '.npcols' o CSV).
+
+    Raises:
+        FileNotFoundError: Si el dataset no existe en ningún formato.
+    """
+    base = _processed_base_path(path)
+    parquet_path, numpy_path, csv_path = (f"{base}{ext}" for ext in _KNOWN_EXTENSIONS)
+    if os.path.exists(parquet_path) and pq is not None:
+        return parquet_path
+    if os.path.isdir(numpy_path):
+        return numpy_path
+    if os.path.exists(csv_path):
+        return csv_path
+    raise FileNotFoundError(f"No se encontró el dataset procesado en '{base}' (.parquet, .npcols o .csv).")
+
+@span('load')
+def load_processed_data(path=PROCESSED_DATA_PATH, columns=None, units=None):
+    """
+    Cargador compartido del dataset procesado.
+
+    Busca, en este orden, el dataset en Parquet, en columnas NumPy ('.npcols') y, por
+    compatibilidad, en CSV. Los formatos columnares se leen mapeando los archivos en
+    memoria y sólo se cargan las columnas (y particiones) solicitadas.
+
+    Args:
+        path (str): Ruta base del dataset (con o sin extensión).
+        columns (list, optional): Columnas a cargar; por defecto, todas.
+        units (list, optional): Departamentos a cargar; en datasets particionados sólo
+                                se leen sus particiones.
+
+    Returns:
+        pd.DataFrame: Panel con 'departamento' categórico y 'Periodo' entero.
+
+    Raises:
+        FileNotFoundError: Si el dataset no existe en ningún formato.
+    """
+    source = resolve_processed_path(path)
+    requested = columns
+    if columns is not None and units is not None and 'departamento' not in columns:
+        columns = list(columns) + ['departamento']
+
+    if source.endswith('.parquet'):
+        filters = [('departamento', 'in', list(units))] if units is not None else None
+        table = pq.read_table(source, columns=columns, filters=filters, memory_map=True)
+        df = table.to_pandas()
+    elif source.endswith('.npcols'):
+        partitions = sorted(d for d in os.listdir(source) if '=' in d)
+        if partitions:
+            frames = []
+            for partition in partitions:
+                key, value = partition.split('=', 1)
+                if units is not None and value not in units:
+                    continue
+                part_columns = [c for c in columns if c != key] if columns else None
+                part = _read_numpy_columns(os.path.join(source, partition), part_columns)
+                if columns is None or key in columns:
+                    part[key] = value
+                frames.append(part)
+            df = pd.concat(frames, ignore_index=True)
+        else:
+            df = _read_numpy_columns(source, columns)
+    else:
+        df = pd.read_csv(source, usecols=columns)
+
+    if units is not None and 'departamento' in df.columns:
+        df = df[df['departamento'].isin(units)].reset_index(drop=True)
+    if requested is not None:
+        df = df[list(requested)]
+    if 'departamento' in df.columns:
+        df['departamento'] = df['departamento'].astype('category')
+    if 'Periodo' in df.columns:
+        df['Periodo'] = df['Periodo'].astype('int32')
+    return df
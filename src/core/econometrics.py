@@ -2,137 +2,517 @@
 """
 Módulo de econometría con la clase principal para análisis DiD.
 """
-import pandas as pd
-import statsmodels.formula.api as smf
-import matplotlib.pyplot as plt
-import numpy as np
-from .visualization_utils import style_plot
+import logging
+
+from .lazy_imports import lazy_import
+from .data_manager import load_processed_data
+from .bacon_decomposition import bacon_decomposition
+from .batched_ols import PanelCells, batched_did
+from .control_search import ControlSubsetSearch
+from .event_study import EventStudyPanel, event_study_batch
+from .incremental import MomentStore
+from .multi_outcome import MODELS, multi_outcome_analysis
+from .instrumentation import span
+from .permutation_inference import PermutationInference
+from .power_simulation import PowerSimulation
+from .parallel import resolve_jobs
+from .rendering import FigureJob, render_figures
+from .result_cache import ResultCache
+from .staggered_did import CohortPanel, StaggeredDiD
+from .sufficient_stats import cell_ols, compress_panel
+from .treatment import TreatmentAssignment
+from .synthetic_did import synthetic_did
+from .wild_bootstrap import wild_cluster_bootstrap
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+smf = lazy_import('statsmodels.formula.api')
 
 class DiDAnalysis:
     """
     Clase para encapsular la lógica del análisis de Diferencias en Diferencias.
     """
-    def __init__(self, data_path, treatment_unit, treatment_year):
-        self.df = pd.read_csv(data_path)
-        self.treatment_unit = treatment_unit
-        self.treatment_year = treatment_year
+    def __init__(self, data_path, treatment_unit=None, treatment_year=None, cache=None, treatment=None):
+        """
+        Args:
+            data_path (str): Ruta base del dataset procesado.
+            treatment_unit (str or list): Departamento(s) tratado(s) desde `treatment_year`.
+            treatment_year (int, optional): Año de la intervención de `treatment_unit`, o de
+                                            las unidades de `treatment` sin año propio; los
+                                            años de adopción de la asignación prevalecen.
+            cache (ResultCache, optional): Caché de resultados; por defecto, la caché
+                                           persistente del proyecto.
+            treatment (TreatmentAssignment, dict or str, optional): Asignación unidad -> año
+                                            de adopción, o la ruta de su archivo CSV (ver
+                                            `src.core.treatment`); reemplaza a `treatment_unit`.
+
+        Raises:
+            ValueError: Si no se indica ninguna unidad tratada.
+        """
+        if treatment is None and treatment_unit is None:
+            raise ValueError("Indica la unidad tratada ('treatment_unit') o la asignación ('treatment').")
+        self.treatment = TreatmentAssignment.parse(treatment if treatment is not None else treatment_unit,
+                                                   default_year=treatment_year)
+        self.df = load_processed_data(data_path)
+        self.data_path = data_path
+        self.treated_units = self.treatment.treated_units
+        self.treatment_unit = self.treatment.label
+        # Año de referencia (calendario) de los estimadores de momento común: el primer
+        # año de adopción, que coincide con el de todas las unidades sin escalonamiento.
+        self.treatment_year = self.treatment.reference_year
+        self.cache = cache if cache is not None else ResultCache()
+        self._cells = None
         self._prepare_data()
 
+    def _cached(self, method, compute, **spec):
+        """
+        Consulta la caché de resultados antes de estimar un modelo.
+
+        La clave combina el dataset, el código, la asignación y el año de tratamiento, el
+        método y sus opciones (ventana, fórmula, opciones del estimador).
+        """
+        spec = dict(spec, method=method, treatment=self.treatment.key(), treatment_year=self.treatment_year)
+        return self.cache.get_or_compute(spec, compute, data_path=self.data_path)
+
+    def _require_common_timing(self, estimator):
+        """
+        Rechaza las asignaciones escalonadas en los estimadores con un único año de intervención.
+
+        Raises:
+            ValueError: Si las unidades tratadas adoptan en años distintos.
+        """
+        if self.treatment.is_staggered:
+            raise ValueError(f"{estimator} supone un año de intervención común y la asignación es escalonada "
+                             f"({self.treatment.adoption}). Usa run_staggered_did o run_bacon_decomposition, "
+                             f"o una asignación con un solo año.")
+
+    def _warn_staggered(self, estimator):
+        """Advierte que un modelo de efectos agrupados se estima con adopción escalonada."""
+        if self.treatment.is_staggered:
+            logging.warning(f"{estimator} con adopción escalonada ({self.treatment.adoption}): 'did' usa el año "
+                            f"de cada unidad, pero el estimador agrupado compara también cohortes ya tratadas; "
+                            f"contrasta con run_staggered_did y run_bacon_decomposition.")
+
+    @span('prepare')
     def _prepare_data(self):
         """Prepara el DataFrame para el análisis DiD."""
-        self.df['tratado'] = (self.df['departamento'] == self.treatment_unit).astype(int)
-        self.df['post_treatment'] = (self.df['Periodo'] >= self.treatment_year).astype(int)
-        self.df['did'] = self.df['tratado'] * self.df['post_treatment']
+        self.treatment.apply(self.df, self.treatment_year)
 
-    def run_did_model(self, start_year=None, end_year=None):
+    def run_did_model(self, start_year=None, end_year=None, compressed=False):
         """
         Ejecuta el modelo DiD clásico.
         Permite filtrar por un rango de años para análisis específicos.
+
+        Con `compressed=True` el modelo se estima sobre las celdas (grupo, período) del
+        panel; los coeficientes y errores estándar clásicos son idénticos. En el período
+        completo, los productos cruzados se guardan junto al dataset y se actualizan al
+        anexar años nuevos (ver `src.core.incremental`).
+
+        Con adopción escalonada 'did' marca cada unidad desde su propio año; las celdas
+        comprimidas agrupan a las tratadas y requieren un año común.
         """
+        if compressed:
+            self._require_common_timing("El DiD comprimido")
+        self._warn_staggered("El DiD clásico")
+        formula = 'deforestacion_anual ~ tratado + post_treatment + did'
+
+        def fit():
+            if start_year and end_year:
+                subset_df = self.df[(self.df['Periodo'] >= start_year) & (self.df['Periodo'] <= end_year)]
+            else:
+                subset_df = self.df
+            if compressed and not (start_year and end_year):
+                return MomentStore(self.data_path).results('did_model', self.treated_units, self.treatment_year,
+                                                           self.df)
+            if compressed:
+                cells = self._compress(subset_df)
+                cells['post_treatment'] = (cells['Periodo'] >= self.treatment_year).astype(int)
+                cells['did'] = cells['tratado'] * cells['post_treatment']
+                return cell_ols(formula, cells)
+            return smf.ols(formula, data=subset_df).fit()
+
+        return self._cached('did_model', fit, formula=formula, start_year=start_year, end_year=end_year,
+                            compressed=compressed)
+
+    def _compress(self, df):
+        """Comprime el panel en celdas (grupo de tratamiento, período)."""
+        return compress_panel(df, ['tratado', 'Periodo'])
+
+    def run_wild_bootstrap(self, start_year=None, end_year=None, n_reps=9999, weight_type='webb',
+                           seed=None, n_jobs=None):
+        """
+        Calcula la inferencia del coeficiente 'did' con un bootstrap salvaje por
+        conglomerados (departamento), en lugar de los errores estándar MCO por defecto.
+
+        Args:
+            start_year, end_year (int, optional): Ventana de estimación, como en `run_did_model`.
+            n_reps (int): Número de réplicas bootstrap.
+            weight_type (str): 'rademacher' o 'webb'.
+            seed (int, optional): Semilla del generador de pesos.
+            n_jobs (int, optional): Procesos del pool para corridas grandes; None usa todos los núcleos.
+
+        Returns:
+            dict: Coeficiente, error estándar por conglomerados, p-valor bootstrap y metadatos.
+        """
+        self._warn_staggered("El bootstrap salvaje del DiD")
+
+        def fit():
+            return self._fit_wild_bootstrap(start_year, end_year, n_reps, weight_type, seed, n_jobs)
+
+        if seed is None:
+            return fit()
+        # Con semilla fija el resultado es reproducible y puede recuperarse de la caché
+        # (el reparto de réplicas entre procesos también determina los pesos generados).
+        return self._cached('wild_bootstrap', fit, start_year=start_year, end_year=end_year, n_reps=n_reps,
+                            weight_type=weight_type, seed=seed, n_jobs=resolve_jobs(n_jobs))
+
+    def _fit_wild_bootstrap(self, start_year, end_year, n_reps, weight_type, seed, n_jobs):
+        """Construye el diseño DiD de la ventana y ejecuta el bootstrap salvaje."""
         if start_year and end_year:
             subset_df = self.df[(self.df['Periodo'] >= start_year) & (self.df['Periodo'] <= end_year)]
         else:
             subset_df = self.df
-        
-        model = smf.ols('deforestacion_anual ~ tratado + post_treatment + did', data=subset_df)
-        results = model.fit()
-        return results
+        subset_df = subset_df.dropna(subset=['deforestacion_anual'])
+
+        X = np.column_stack([
+            np.ones(len(subset_df)),
+            subset_df['tratado'].to_numpy(dtype=float),
+            subset_df['post_treatment'].to_numpy(dtype=float),
+            subset_df['did'].to_numpy(dtype=float),
+        ])
+        return wild_cluster_bootstrap(
+            X, subset_df['deforestacion_anual'].to_numpy(dtype=float), subset_df['departamento'].to_numpy(),
+            term_index=3, n_reps=n_reps, weight_type=weight_type, seed=seed, n_jobs=n_jobs
+        )
+
+    def run_did_batch(self, specs):
+        """
+        Estima varios modelos DiD en una sola llamada, sin reconstruir el diseño con patsy.
+
+        Las sumas por (departamento, período) se calculan una vez y se reutilizan en
+        todas las especificaciones; los resultados coinciden con `run_did_model`.
+
+        Args:
+            specs (list): Tuplas (treatment_year, start_year, end_year). Si start_year o
+                          end_year es None se usa el período completo.
+
+        Returns:
+            pd.DataFrame: Tabla con coeficiente 'did', error estándar y p-valor por especificación.
+        """
+        self._require_common_timing("El DiD por lotes")
+        specs = [tuple(spec) for spec in specs]
+
+        def fit():
+            cells = self._get_cells()
+            return batched_did(cells, self.treatment.unit_mask(cells.units), specs)
+
+        return self._cached('did_batch', fit, specs=specs)
+
+    def run_permutation_inference(self, families=('space', 'time'), start_year=None, end_year=None,
+                                  n_jobs=None, seed=None):
+        """
+        Ejecuta la inferencia por aleatorización (placebos en el espacio y en el tiempo).
+
+        Args:
+            families (tuple): 'space' reasigna el tratamiento a cada departamento;
+                              'time' a cada año pre-intervención, con la misma ventana
+                              alrededor del año asignado para el efecto observado y los placebos.
+            start_year, end_year (int, optional): Ventana del efecto observado en la familia 'space'.
+            n_jobs (int, optional): Procesos del pool; None usa todos los núcleos.
+            seed (int, optional): Semilla para el muestreo de asignaciones.
+
+        Returns:
+            tuple: (resumen con p-valores por familia, distribución nula empírica).
+        """
+        self._require_common_timing("La inferencia por permutación")
+
+        def fit():
+            inference = PermutationInference(self._get_cells(), self.treated_units, self.treatment_year,
+                                             start_year=start_year, end_year=end_year, n_jobs=n_jobs, seed=seed)
+            summary = inference.run(families)
+            return summary, inference.draws
+
+        if seed is None:
+            return fit()
+        return self._cached('permutation_inference', fit, families=list(families),
+                            start_year=start_year, end_year=end_year, seed=seed)
+
+    def run_power_simulation(self, effects=None, windows=(3, 5, 10, 'full'), n_reps=2000, baseline='did',
+                             resampling='unit', alpha=0.05, seed=None, n_jobs=None):
+        """
+        Simula paneles con la forma del real para medir la potencia y el tamaño del DiD.
+
+        Args:
+            effects (list, optional): Efectos inyectados; por defecto, múltiplos de la
+                                      desviación estándar de los residuos.
+            windows (list): Años desde la intervención incluidos en la estimación, o 'full'.
+            n_reps (int): Réplicas de Monte Carlo.
+            baseline (str): Residuos remuestreados: 'did' (modelo DiD) o 'event_study'.
+            resampling (str): 'unit' (series completas por unidad) o 'iid'.
+            alpha (float): Nivel de la prueba.
+            seed (int, optional): Semilla de la simulación.
+            n_jobs (int, optional): Procesos del pool; None usa todos los núcleos.
+
+        Returns:
+            tuple: (tabla de `PowerSimulation.run`, desviación estándar de los residuos).
+        """
+        self._require_common_timing("La simulación de potencia")
+
+        def fit():
+            simulation = PowerSimulation(self._get_cells(), self.treated_units, self.treatment_year,
+                                         baseline=baseline, resampling=resampling)
+            table = simulation.run(effects=effects, windows=windows, n_reps=n_reps, alpha=alpha, seed=seed,
+                                   n_jobs=n_jobs)
+            return table, simulation.residual_sd
+
+        if seed is None:
+            return fit()
+        return self._cached('power_simulation', fit, effects=list(effects) if effects is not None else None,
+                            windows=[str(window) for window in windows], n_reps=n_reps, baseline=baseline,
+                            resampling=resampling, alpha=alpha, seed=seed)
+
+    def run_synthetic_did(self, variance='placebo', n_reps=200, alpha=0.05, seed=None, n_jobs=None):
+        """
+        Estima el efecto con diferencias en diferencias sintéticas (pesos de unidades y de
+        años pre-intervención) y lo compara con el DiD de pesos iguales.
 
-    def plot_did_results(self, did_results, title, run_dir, filename="did_visual_summary.png"):
+        Args:
+            variance (str): 'placebo' o 'jackknife' (éste requiere varias unidades tratadas).
+            n_reps (int): Réplicas placebo.
+            alpha (float): Nivel del intervalo de confianza.
+            seed (int, optional): Semilla de las réplicas placebo.
+            n_jobs (int, optional): Procesos del pool; None usa todos los núcleos.
+
+        Returns:
+            dict: Resultados de `synthetic_did`.
+        """
+        self._require_common_timing("El DiD sintético")
+
+        def fit():
+            return synthetic_did(self.df, self.treated_units, self.treatment_year, variance=variance,
+                                 n_reps=n_reps, alpha=alpha, seed=seed, n_jobs=n_jobs)
+
+        if seed is None and variance == 'placebo':
+            return fit()
+        return self._cached('synthetic_did', fit, variance=variance, n_reps=n_reps, alpha=alpha, seed=seed)
+
+    def run_staggered_did(self, first_treatment=None, control_group='not_yet_treated', base_period='varying',
+                          anticipation=0, n_reps=999, seed=None, n_jobs=None):
+        """
+        Estima los efectos por cohorte y período (ATT(g,t)) con adopción escalonada y
+        sus agregaciones por tiempo de evento, año calendario, cohorte y global.
+
+        Args:
+            first_treatment (dict, optional): Año de adopción por departamento; por defecto,
+                                              el de la asignación de la instancia.
+            control_group (str): 'never_treated' o 'not_yet_treated'.
+            base_period (str): 'varying' o 'universal'.
+            anticipation (int): Períodos de anticipación del tratamiento.
+            n_reps (int): Réplicas del bootstrap multiplicador; 0 usa errores analíticos.
+            seed (int, optional): Semilla del bootstrap.
+            n_jobs (int, optional): Procesos del pool; None usa todos los núcleos.
+
+        Returns:
+            dict: Tablas 'att_gt', 'event_time', 'calendar', 'group' y 'overall' (ver
+                  `StaggeredDiD.fit`).
+        """
+        if first_treatment is None:
+            first_treatment = self.treatment.adoption
+        first_treatment = {str(unit): int(year) for unit, year in first_treatment.items() if year}
+
+        def fit():
+            panel = CohortPanel(self.df, first_treatment)
+            estimator = StaggeredDiD(panel, control_group=control_group, base_period=base_period,
+                                     anticipation=anticipation)
+            return estimator.fit(n_reps=n_reps, seed=seed, n_jobs=n_jobs)
+
+        if seed is None and n_reps > 0:
+            return fit()
+        return self._cached('staggered_did', fit, first_treatment=dict(sorted(first_treatment.items())),
+                            control_group=control_group, base_period=base_period, anticipation=anticipation,
+                            n_reps=n_reps, seed=seed, n_jobs=resolve_jobs(n_jobs) if n_reps > 0 else None)
+
+    def run_bacon_decomposition(self, first_treatment=None):
+        """
+        Descompone el estimador de efectos fijos bidireccionales (TWFE) en las
+        comparaciones 2x2 entre grupos de adopción (Goodman-Bacon).
+
+        Args:
+            first_treatment (dict, optional): Año de adopción por departamento; por defecto,
+                                              el de la asignación de la instancia.
+
+        Returns:
+            dict: 'comparisons', 'summary' y 'twfe_estimate' (ver
+                  `src.core.bacon_decomposition.bacon_decomposition`).
+        """
+        if first_treatment is None:
+            first_treatment = self.treatment.adoption
+        first_treatment = {str(unit): int(year) for unit, year in first_treatment.items() if year}
+        return self._cached('bacon_decomposition', lambda: bacon_decomposition(self.df, first_treatment),
+                            first_treatment=dict(sorted(first_treatment.items())))
+
+    def _get_cells(self):
+        """Calcula (una sola vez) las sumas por departamento y período del panel."""
+        if self._cells is None:
+            self._cells = PanelCells(self.df)
+        return self._cells
+
+    def did_plot_job(self, did_results, title, run_dir, filename="did_visual_summary.png"):
+        """
+        Describe el gráfico de barras de los resultados del DiD como un trabajo de renderizado.
+
+        Returns:
+            FigureJob: Trabajo para `render_figures`, con las medias por grupo y período ya calculadas.
+        """
+        means = self.df.groupby(['tratado', 'post_treatment'])['deforestacion_anual'].mean()
+        return FigureJob(
+            renderer='src.core.visualization_utils:draw_did_summary',
+            output_path=f"{run_dir}/{filename}",
+            data={
+                'pre_means': [means.get((0, 0), np.nan), means.get((1, 0), np.nan)],
+                'post_means': [means.get((0, 1), np.nan), means.get((1, 1), np.nan)],
+                'treatment_year': self.treatment_year,
+                'treated_label': self.treatment_unit,
+                'title': title,
+                'subtitle': f"Efecto DiD estimado: {did_results.params['did']:.2f} (p-valor: {did_results.pvalues['did']:.3f})",
+            },
+            figsize=(10, 7),
+        )
+
+    def plot_did_results(self, did_results, title, run_dir, filename="did_visual_summary.png", final=False):
         """Genera un gráfico de barras para visualizar los resultados del DiD."""
-        # Extraer datos para el gráfico
-        pre_treatment_control = self.df[(self.df['tratado'] == 0) & (self.df['post_treatment'] == 0)]['deforestacion_anual'].mean()
-        post_treatment_control = self.df[(self.df['tratado'] == 0) & (self.df['post_treatment'] == 1)]['deforestacion_anual'].mean()
-        pre_treatment_treated = self.df[(self.df['tratado'] == 1) & (self.df['post_treatment'] == 0)]['deforestacion_anual'].mean()
-        post_treatment_treated = self.df[(self.df['tratado'] == 1) & (self.df['post_treatment'] == 1)]['deforestacion_anual'].mean()
-
-        labels = ['Grupo de Control', 'Grupo de Tratamiento (San Martín)']
-        pre_means = [pre_treatment_control, pre_treatment_treated]
-        post_means = [post_treatment_control, post_treatment_treated]
-        
-        x = np.arange(len(labels))
-        width = 0.35
-
-        fig, ax = plt.subplots(figsize=(10, 7))
-        rects1 = ax.bar(x - width/2, pre_means, width, label=f'Pre-{self.treatment_year}', color='#457B9D', alpha=0.7)
-        rects2 = ax.bar(x + width/2, post_means, width, label=f'Post-{self.treatment_year}', color='#A8DADC')
-
-        # Estilo
-        ax.set_ylabel('Deforestación Anual Promedio (miles de ha)')
-        ax.set_xticks(x)
-        ax.set_xticklabels(labels)
-        ax.legend(frameon=False, loc='upper left')
-
-        style_plot(ax, fig, title, 
-                   f"Efecto DiD estimado: {did_results.params['did']:.2f} (p-valor: {did_results.pvalues['did']:.3f})",
-                   'Fuente: Elaboración propia con datos de MapBiomas Perú.')
-        
-        # Guardar la figura
-        plot_path = f"{run_dir}/{filename}"
-        fig.savefig(plot_path, dpi=300, bbox_inches='tight')
-        plt.close(fig)
-        return plot_path
-
-    def run_parallel_trends_test(self):
-        """Ejecuta la prueba de tendencias paralelas."""
-        pre_intervention_df = self.df[self.df['Periodo'] < self.treatment_year].copy()
-        pre_intervention_df['año_norm'] = pre_intervention_df['Periodo'] - pre_intervention_df['Periodo'].min()
-        model = smf.ols('deforestacion_anual ~ tratado + año_norm + tratado:año_norm', data=pre_intervention_df)
-        results = model.fit()
-        return results
+        job = self.did_plot_job(did_results, title, run_dir, filename)
+        return render_figures([job], n_jobs=1, final=final)[0]
+
+    def run_parallel_trends_test(self, compressed=False):
+        """
+        Ejecuta la prueba de tendencias paralelas.
+
+        Con `compressed=True` el modelo se estima sobre las celdas (grupo, período), con
+        productos cruzados que se actualizan al anexar años nuevos (ver `src.core.incremental`).
+        Con adopción escalonada, el período previo termina en el primer año de adopción.
+        """
+        formula = 'deforestacion_anual ~ tratado + año_norm + tratado:año_norm'
+
+        def fit():
+            if compressed:
+                return MomentStore(self.data_path).results('parallel_trends', self.treated_units,
+                                                           self.treatment_year, self.df)
+            pre_intervention_df = self.df[self.df['Periodo'] < self.treatment_year]
+            data = pre_intervention_df.copy()
+            data['año_norm'] = data['Periodo'] - data['Periodo'].min()
+            return smf.ols(formula, data=data).fit()
+
+        return self._cached('parallel_trends', fit, formula=formula, compressed=compressed)
+
+    def run_control_search(self, donors=None, min_size=2, max_size=None, max_subsets=1_000_000, top=50,
+                           alpha=0.05, seed=None, n_jobs=None):
+        """
+        Busca los grupos de control con los que mejor se sostiene la prueba de tendencias
+        paralelas, evaluando subconjuntos de donantes con regresiones por lotes.
+
+        Args:
+            donors (list, optional): Departamentos candidatos; None usa todos los no tratados.
+            min_size, max_size (int): Tamaño mínimo y máximo del grupo de control.
+            max_subsets (int): Límite de subconjuntos; si hay más, se muestrean al azar.
+            top (int): Subconjuntos a conservar en el ranking.
+            alpha (float): Nivel de la prueba.
+            seed (int, optional): Semilla del muestreo.
+            n_jobs (int, optional): Procesos del pool; None usa todos los núcleos.
+
+        Returns:
+            tuple: (ranking, resumen) de `ControlSubsetSearch.run`.
+        """
+        search = ControlSubsetSearch(self._get_cells(), self.treated_units, self.treatment_year, donors=donors,
+                                     min_size=min_size, max_size=max_size, max_subsets=max_subsets, alpha=alpha,
+                                     seed=seed, n_jobs=n_jobs)
+        # Con muestreo, el resultado sólo es reproducible si se fija la semilla.
+        if seed is None and search.n_admissible > max_subsets:
+            return search.run(top=top)
+        return self._cached('control_search', lambda: search.run(top=top),
+                            donors=sorted(donors) if donors is not None else None,
+                            min_size=min_size, max_size=max_size, max_subsets=max_subsets, top=top,
+                            alpha=alpha, seed=seed)
+
+    def run_multi_outcome(self, outcomes, models=MODELS, start_year=None, end_year=None, reference=-1):
+        """
+        Estima los modelos DiD, de tendencias paralelas y de estudio de eventos para
+        varias variables de resultado, con una factorización del diseño por modelo.
+
+        Args:
+            outcomes (list): Columnas del panel usadas como variable de resultado.
+            models (tuple): Subconjunto de 'did', 'parallel_trends' y 'event_study'.
+            start_year, end_year (int, optional): Ventana del modelo DiD, como en `run_did_model`.
+            reference (int): Tiempo relativo omitido en el estudio de eventos.
+
+        Returns:
+            pd.DataFrame: Tabla apilada de `multi_outcome_analysis`.
+        """
+        if 'did' in models:
+            self._warn_staggered("El DiD de varias variables de resultado")
+
+        def fit():
+            return multi_outcome_analysis(self.df, outcomes, self.treated_units, self.treatment_year,
+                                          models=models, start_year=start_year, end_year=end_year,
+                                          reference=reference, adoption=self.treatment.adoption)
+
+        return self._cached('multi_outcome', fit, outcomes=list(outcomes), models=list(models),
+                            start_year=start_year, end_year=end_year, reference=reference)
 
     def run_event_study_model(self):
         """Ejecuta un modelo de estudio de eventos."""
-        df_event = self.df.copy()
-        df_event['relative_year'] = df_event['Periodo'] - self.treatment_year
-        
-        # Omitir el año base (-1) para evitar multicolinealidad perfecta
-        df_event = df_event[df_event['relative_year'] != -1]
-        
+        self._require_common_timing("El estudio de eventos por fórmula")
         # Crear dummies para cada año relativo y tratarlas como categóricas
         formula = f'deforestacion_anual ~ tratado * C(relative_year, Treatment(reference=0)) + C(departamento) + C(Periodo)'
-        
-        model = smf.ols(formula, data=df_event)
-        results = model.fit()
-        return results
-
-    def plot_event_study_results(self, event_study_results, run_dir):
-        """Genera un gráfico para visualizar los resultados del estudio de eventos."""
-        params = event_study_results.params.filter(like='tratado:C(relative_year').reset_index()
-        conf_int = event_study_results.conf_int().filter(like='tratado:C(relative_year', axis=0)
-        
-        params.columns = ['term', 'coef']
-        params['relative_year'] = params['term'].apply(lambda x: int(x.split('T.')[1][:-1]))
-        
-        conf_int.reset_index(inplace=True)
-        conf_int.columns = ['term', 'conf_low', 'conf_high']
-        
-        plot_data = pd.merge(params, conf_int, on='term')
-        
-        # Añadir el punto base (año -1, efecto 0)
-        base_year = pd.DataFrame({'relative_year': [-1], 'coef': [0], 'conf_low': [0], 'conf_high': [0]})
-        plot_data = pd.concat([base_year, plot_data]).sort_values('relative_year')
-
-        fig, ax = plt.subplots(figsize=(12, 8))
-        
-        yerr = [plot_data['coef'] - plot_data['conf_low'], plot_data['conf_high'] - plot_data['coef']]
-        ax.errorbar(plot_data['relative_year'], plot_data['coef'], yerr=yerr,
-                    fmt='-o', color='#005f73', capsize=5, label='Coeficiente de Impacto Anual')
-        
-        ax.axhline(0, color='black', linestyle='--', linewidth=0.8)
-        ax.axvline(x=-0.5, color='#E63946', linestyle=':', linewidth=2, label=f'Intervención ({self.treatment_year})')
-        
-        ax.set_xticks(plot_data['relative_year'])
-        ax.legend(frameon=False, loc='lower left')
-        
-        ax.set_xlabel(f"Años relativos a la intervención (Año 0 = {self.treatment_year})")
-        ax.set_ylabel("Coeficiente de Impacto (miles de ha)")
-
-        style_plot(ax, fig, "Análisis de Estudio de Eventos",
-                   "Evolución del Impacto de la Política Año a Año",
-                   'Fuente: Elaboración propia con datos de MapBiomas Perú.')
-        
-        plot_path = f"{run_dir}/event_study_plot.png"
-        fig.savefig(plot_path, dpi=300, bbox_inches='tight')
-        plt.close(fig)
-        return plot_path
+
+        def fit():
+            df_event = self.df.copy()
+            df_event['relative_year'] = df_event['Periodo'] - self.treatment_year
+
+            # Omitir el año base (-1) para evitar multicolinealidad perfecta
+            df_event = df_event[df_event['relative_year'] != -1]
+            return smf.ols(formula, data=df_event).fit()
+
+        return self._cached('event_study_model', fit, formula=formula)
+
+    def run_event_study_batch(self, treatment_years=None, reference=-1, min_event=None, max_event=None,
+                              engine='auto', cluster=None):
+        """
+        Estima el estudio de eventos con el motor disperso, para uno o varios años de
+        intervención candidatos en una sola llamada (p. ej. el análisis de "dos shocks").
+
+        Con adopción escalonada, el tiempo relativo de cada unidad tratada se mide desde
+        su propio año de adopción y se estima un solo modelo (etiquetado con el primer año).
+
+        Args:
+            treatment_years (list, optional): Años a estimar; por defecto, el año de la
+                                              instancia (el único admitido con adopción
+                                              escalonada).
+            reference (int): Tiempo relativo omitido (período base).
+            min_event, max_event (int, optional): Extremos agrupados del tiempo relativo.
+            engine (str): 'dummies', 'hdfe' (efectos fijos absorbidos, ver `src.core.hdfe`) o 'auto'.
+            cluster (str, optional): 'unit' para errores estándar agrupados por departamento.
+
+        Returns:
+            tuple: (tabla de coeficientes por año y tiempo relativo, estadísticos de cada modelo).
+
+        Raises:
+            ValueError: Si se piden años candidatos con una asignación escalonada.
+        """
+        if treatment_years is None:
+            treatment_years = [self.treatment_year]
+        treatment_years = [int(year) for year in treatment_years]
+        staggered = self.treatment.is_staggered
+        if staggered and treatment_years != [self.treatment_year]:
+            raise ValueError(f"Con adopción escalonada ({self.treatment.adoption}) el tiempo relativo se mide desde "
+                             f"el año de cada unidad; no se admiten años candidatos {treatment_years}.")
+
+        def fit():
+            panel = EventStudyPanel(self.df)
+            treated, adoption = self.treatment.lookup(panel.units)
+            return event_study_batch(panel, treated, treatment_years, reference=reference,
+                                     min_event=min_event, max_event=max_event, engine=engine, cluster=cluster,
+                                     adoption=adoption if staggered else None)
+
+        return self._cached('event_study_batch', fit, treatment_years=treatment_years, reference=reference,
+                            min_event=min_event, max_event=max_event, engine=engine, cluster=cluster)
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de Estudio de Eventos con diseño disperso y estimación por lotes.
+
+El diseño se construye directamente a partir de códigos enteros de unidad y período
+(sin `pd.get_dummies` ni fórmulas de patsy). El bloque de efectos fijos (constante,
+departamento y período) es común a todos los años de intervención candidatos, por lo
+que sus productos cruzados se calculan una sola vez; sólo el bloque de dummies de
+evento cambia con cada año. Todos los sistemas se resuelven en una única llamada a
+`ols_from_moments`.
+
+Con muchas unidades (distritos, píxeles) el bloque de efectos fijos ya no cabe como
+X'X densa: el motor HDFE (`src.core.hdfe`) los absorbe por proyecciones alternadas y
+sólo resuelve el sistema de las dummies de evento, que además admite errores
+estándar agrupados.
+"""
+from .batched_ols import ols_from_moments
+from .hdfe import FixedEffects, ols_demeaned
+from .lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+sparse = lazy_import('scipy.sparse')
+stats = lazy_import('scipy.stats')
+
+ENGINES = ('auto', 'dummies', 'hdfe')
+# Con 'auto', niveles de efectos fijos (unidades + períodos) a partir de los cuales se
+# absorben en lugar de construir sus dummies.
+HDFE_MIN_LEVELS = 500
+
+
+class EventStudyPanel:
+    """
+    Panel codificado en enteros, listo para construir diseños dispersos.
+
+    Attributes:
+        units (np.ndarray): Unidades ordenadas.
+        periods (np.ndarray): Períodos ordenados.
+        unit_codes, period_codes (np.ndarray): Código de cada fila.
+        y (np.ndarray): Variable de resultado.
+    """
+    def __init__(self, df, outcome='deforestacion_anual', unit_col='departamento', period_col='Periodo'):
+        df = df.loc[df[outcome].notna(), [unit_col, period_col, outcome]]
+        self.unit_codes, units = pd.factorize(df[unit_col], sort=True)
+        self.period_codes, periods = pd.factorize(df[period_col], sort=True)
+        self.units = np.asarray(units)
+        self.periods = np.asarray(periods)
+        self.y = df[outcome].to_numpy(dtype=float)
+
+    @classmethod
+    def from_chunks(cls, chunks, outcome='deforestacion_anual', unit_col='departamento', period_col='Periodo'):
+        """
+        Construye el panel a partir de bloques de filas (p. ej. `pd.read_csv(..., chunksize=...)`
+        o los lotes de un archivo Parquet), sin materializar la tabla completa: de cada
+        bloque sólo se conservan los códigos enteros y la variable de resultado.
+
+        Args:
+            chunks (iterable): DataFrames con las columnas de unidad, período y resultado.
+
+        Returns:
+            EventStudyPanel: Panel equivalente al construido con la tabla concatenada.
+        """
+        indexes = {unit_col: pd.Index([]), period_col: pd.Index([])}
+        parts = {unit_col: [], period_col: [], outcome: []}
+        for chunk in chunks:
+            chunk = chunk.loc[chunk[outcome].notna(), [unit_col, period_col, outcome]]
+            for column, index in indexes.items():
+                codes, uniques = pd.factorize(chunk[column])
+                index = indexes[column] = index.append(uniques[~uniques.isin(index)])
+                parts[column].append(index.get_indexer(uniques)[codes])
+            parts[outcome].append(chunk[outcome].to_numpy(dtype=float))
+
+        panel = cls.__new__(cls)
+        for column, (codes_name, labels_name) in ((unit_col, ('unit_codes', 'units')),
+                                                  (period_col, ('period_codes', 'periods'))):
+            # Se reordenan las categorías como `pd.factorize(sort=True)`.
+            order = indexes[column].argsort()
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            codes = np.concatenate(parts[column]) if parts[column] else np.array([], dtype=np.int64)
+            setattr(panel, codes_name, rank[codes])
+            setattr(panel, labels_name, np.asarray(indexes[column][order]))
+        panel.y = np.concatenate(parts[outcome]) if parts[outcome] else np.array([])
+        return panel
+
+    def fixed_effects(self):
+        """Efectos fijos de unidad y período para el motor HDFE."""
+        return FixedEffects(self.unit_codes, self.period_codes)
+
+    def fixed_effects_design(self):
+        """Constante + dummies de unidad y de período (se omite la primera categoría de cada una)."""
+        n_obs, n_units, n_periods = len(self.y), len(self.units), len(self.periods)
+        rows = np.arange(n_obs)
+        unit_rows, period_rows = self.unit_codes > 0, self.period_codes > 0
+        row_index = np.concatenate([rows, rows[unit_rows], rows[period_rows]])
+        col_index = np.concatenate([
+            np.zeros(n_obs, dtype=int),
+            self.unit_codes[unit_rows],
+            n_units - 1 + self.period_codes[period_rows],
+        ])
+        return sparse.csr_matrix((np.ones(len(row_index)), (row_index, col_index)),
+                                 shape=(n_obs, n_units + n_periods - 1))
+
+    def event_design(self, treated, treatment_year, reference=-1, min_event=None, max_event=None):
+        """
+        Dummies de tiempo relativo interactuadas con el tratamiento, en formato disperso.
+
+        Args:
+            treated (np.ndarray): Vector booleano de unidades tratadas.
+            treatment_year (int or np.ndarray): Año de intervención común, o el año de
+                                                adopción de cada unidad de `units`
+                                                (adopción escalonada).
+            reference (int): Tiempo relativo omitido (período base).
+            min_event, max_event (int, optional): Extremos agrupados: los tiempos relativos
+                                                  fuera de [min_event, max_event] se acumulan en
+                                                  el extremo correspondiente.
+
+        Returns:
+            tuple: (matriz dispersa N x E, arreglo con los E tiempos relativos estimados).
+        """
+        treated_rows = np.flatnonzero(np.asarray(treated)[self.unit_codes])
+        years = np.broadcast_to(np.asarray(treatment_year), (len(self.units),))
+        relative = (self.periods[self.period_codes[treated_rows]]
+                    - years[self.unit_codes[treated_rows]]).astype(np.int64)
+        if min_event is not None:
+            relative = np.maximum(relative, min_event)
+        if max_event is not None:
+            relative = np.minimum(relative, max_event)
+
+        event_times = np.unique(relative)
+        event_times = event_times[event_times != reference]
+        keep = relative != reference
+        columns = np.searchsorted(event_times, relative[keep])
+        design = sparse.csr_matrix((np.ones(keep.sum()), (treated_rows[keep], columns)),
+                                   shape=(len(self.y), len(event_times)))
+        return design, event_times
+
+
+def _fit_dummies(panel, blocks):
+    """Ajusta los modelos con las dummies de efectos fijos explícitas (un solo lote de `ols_from_moments`)."""
+    fe_design = panel.fixed_effects_design()
+    fe_cross = (fe_design.T @ fe_design).toarray()
+    fe_y = fe_design.T @ panel.y
+    yty = panel.y @ panel.y
+    n_fe = fe_design.shape[1]
+    n_events = max(len(event_times) for _, event_times in blocks)
+
+    # Los bloques de evento se rellenan con columnas nulas hasta el mismo tamaño; la
+    # pseudo-inversa las descarta y el rango (y los grados de libertad) no cambian.
+    size = n_fe + n_events
+    xtx = np.zeros((len(blocks), size, size))
+    xty = np.zeros((len(blocks), size))
+    for k, (event_design, event_times) in enumerate(blocks):
+        n_k = len(event_times)
+        cross = (event_design.T @ fe_design).toarray()
+        xtx[k, :n_fe, :n_fe] = fe_cross
+        xtx[k, n_fe:n_fe + n_k, :n_fe] = cross
+        xtx[k, :n_fe, n_fe:n_fe + n_k] = cross.T
+        xtx[k, n_fe:n_fe + n_k, n_fe:n_fe + n_k] = (event_design.T @ event_design).toarray()
+        xty[k, :n_fe] = fe_y
+        xty[k, n_fe:n_fe + n_k] = event_design.T @ panel.y
+
+    nobs = np.full(len(blocks), len(panel.y), dtype=float)
+    fit = ols_from_moments(xtx, xty, np.full(len(blocks), yty), nobs)
+    return [{
+        'params': fit['params'][k, n_fe:], 'bse': fit['bse'][k, n_fe:], 'tvalues': fit['tvalues'][k, n_fe:],
+        'pvalues': fit['pvalues'][k, n_fe:], 'df_resid': fit['df_resid'][k], 'df_inference': fit['df_resid'][k],
+        'rank': fit['rank'][k], 'ssr': fit['ssr'][k],
+    } for k in range(len(blocks))]
+
+
+def _fit_hdfe(panel, blocks, cluster=None):
+    """
+    Ajusta los modelos absorbiendo los efectos fijos: la variable de resultado se
+    desmedia una sola vez y las dummies de evento, una vez por año candidato.
+    """
+    fixed_effects = panel.fixed_effects()
+    absorbed = fixed_effects.degrees_of_freedom()
+    y_tilde = fixed_effects.demean(panel.y)
+    return [ols_demeaned(y_tilde, fixed_effects.demean(event_design), absorbed, cluster)
+            for event_design, _ in blocks]
+
+
+def event_study_batch(panel, treated, treatment_years, reference=-1, min_event=None, max_event=None, alpha=0.05,
+                      engine='auto', cluster=None, adoption=None):
+    """
+    Estima el Estudio de Eventos con efectos fijos de unidad y período para varios
+    años de intervención candidatos en una sola llamada.
+
+    Args:
+        panel (EventStudyPanel): Panel codificado.
+        treated (np.ndarray): Vector booleano de unidades tratadas.
+        treatment_years (list): Años de intervención a estimar.
+        reference (int): Tiempo relativo omitido (período base).
+        min_event, max_event (int, optional): Extremos agrupados del tiempo relativo.
+        alpha (float): Nivel de significancia para los intervalos de confianza.
+        engine (str): 'dummies' (efectos fijos como columnas del diseño), 'hdfe'
+                      (absorbidos por proyecciones alternadas) o 'auto' (HDFE desde
+                      `HDFE_MIN_LEVELS` unidades + períodos, o si hay conglomerados).
+        cluster (str or np.ndarray, optional): Errores estándar agrupados: 'unit' por
+                                               unidad, o un código entero por fila.
+        adoption (np.ndarray, optional): Año de adopción de cada unidad (adopción
+                                         escalonada). Se estima un solo modelo, con el
+                                         tiempo relativo de cada unidad tratada medido desde
+                                         su propio año; `treatment_years` debe tener un solo
+                                         elemento, con el que se etiqueta.
+
+    Returns:
+        tuple: (tabla de coeficientes por año y tiempo relativo, incluida la fila del
+                período base con efecto cero; tabla con estadísticos de cada modelo).
+
+    Raises:
+        ValueError: Si el motor no es válido, se piden conglomerados sin HDFE o se
+                    combinan varios años candidatos con `adoption`.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Motor desconocido: '{engine}'. Usa {list(ENGINES)}.")
+    if isinstance(cluster, str):
+        if cluster != 'unit':
+            raise ValueError(f"Conglomerado desconocido: '{cluster}'. Usa 'unit' o un código por fila.")
+        cluster = panel.unit_codes
+    if engine == 'auto':
+        many_levels = len(panel.units) + len(panel.periods) >= HDFE_MIN_LEVELS
+        engine = 'hdfe' if many_levels or cluster is not None else 'dummies'
+    if engine == 'dummies' and cluster is not None:
+        raise ValueError("Los errores agrupados requieren el motor 'hdfe'.")
+
+    if adoption is not None and len(treatment_years) != 1:
+        raise ValueError("Con años de adopción por unidad se estima un solo modelo: indica un solo año.")
+    timings = [adoption] if adoption is not None else treatment_years
+    blocks = [panel.event_design(treated, timing, reference, min_event, max_event) for timing in timings]
+    fits = _fit_hdfe(panel, blocks, cluster) if engine == 'hdfe' else _fit_dummies(panel, blocks)
+
+    yty = panel.y @ panel.y
+    rows, model_rows = [], []
+    lower_bin = min_event if min_event is not None else -np.inf
+    upper_bin = max_event if max_event is not None else np.inf
+    for year, (_, event_times), fit in zip(treatment_years, blocks, fits):
+        critical = stats.t.ppf(1 - alpha / 2, fit['df_inference'])
+        for j, event_time in enumerate(event_times):
+            coef, se = fit['params'][j], fit['bse'][j]
+            rows.append({
+                'treatment_year': year, 'relative_time': int(event_time), 'coef': coef, 'std_err': se,
+                't_value': fit['tvalues'][j], 'p_value': fit['pvalues'][j],
+                'ci_lower': coef - critical * se, 'ci_upper': coef + critical * se,
+                'binned': event_time <= lower_bin or event_time >= upper_bin, 'is_reference': False,
+            })
+        rows.append({
+            'treatment_year': year, 'relative_time': reference, 'coef': 0.0, 'std_err': np.nan,
+            't_value': np.nan, 'p_value': np.nan, 'ci_lower': 0.0, 'ci_upper': 0.0,
+            'binned': False, 'is_reference': True,
+        })
+        centered_tss = yty - panel.y.sum() ** 2 / len(panel.y)
+        model_rows.append({
+            'treatment_year': year, 'nobs': len(panel.y), 'df_resid': fit['df_resid'],
+            'rank': int(fit['rank']), 'ssr': fit['ssr'], 'r_squared': 1 - fit['ssr'] / centered_tss,
+            'engine': engine, 'n_clusters': fit.get('n_clusters', np.nan),
+        })
+
+    coefficients = pd.DataFrame(rows).sort_values(['treatment_year', 'relative_time']).reset_index(drop=True)
+    return coefficients, pd.DataFrame(model_rows)
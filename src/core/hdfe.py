@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Regresión con efectos fijos de alta dimensión (HDFE) por proyecciones alternadas.
+
+En lugar de agregar una columna dummy por unidad y por período (inviable con decenas
+de miles de distritos o millones de píxeles), los efectos fijos se eliminan de la
+variable de resultado y de los regresores restando, por turnos, las medias de cada
+factor hasta converger (teorema de Frisch-Waugh-Lovell). Cada barrido cuesta O(N) por
+columna: las medias por grupo se calculan con una matriz dispersa de pertenencia armada
+sobre los códigos enteros de cada factor, así que la memoria crece linealmente con el
+número de filas. La iteración se acelera con el esquema de Irons-Tuck; con dos
+factores y un panel balanceado un solo barrido es exacto y no se itera.
+
+El caso típico (unidad x período, con pocos períodos) no itera aunque el panel esté
+desbalanceado: se desmedia por unidad y los efectos de período se resuelven de forma
+exacta con su sistema de ecuaciones normales, de tamaño períodos x períodos.
+
+Los coeficientes, la suma de cuadrados residual y los errores estándar coinciden con
+los de la regresión con dummies (`C(departamento) + C(Periodo)` en statsmodels): los
+grados de libertad absorbidos por los efectos fijos se descuentan según los
+componentes conexos del grafo unidad-período.
+"""
+from .batched_ols import ols_from_moments
+from .lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+sparse = lazy_import('scipy.sparse')
+csgraph = lazy_import('scipy.sparse.csgraph')
+stats = lazy_import('scipy.stats')
+
+# Tolerancia del cambio máximo entre iteraciones, relativa a la escala de cada columna.
+DEFAULT_TOL = 1e-10
+DEFAULT_MAX_ITER = 10_000
+# Con dos factores, si el menor tiene a lo sumo estos niveles sus efectos se resuelven
+# de forma exacta en lugar de iterar.
+DIRECT_MAX_LEVELS = 200
+# Elementos (filas x columnas) que se desmedian a la vez; acota la memoria temporal.
+_BLOCK_ELEMENTS = 1 << 22
+
+
+def _compact_codes(codes):
+    """Renumera códigos enteros no negativos a 0..G-1 sin huecos (en tiempo lineal)."""
+    codes = np.asarray(codes)
+    if codes.ndim != 1 or not np.issubdtype(codes.dtype, np.integer):
+        raise ValueError("Los efectos fijos deben ser arreglos unidimensionales de códigos enteros.")
+    if len(codes) and codes.min() < 0:
+        raise ValueError("Los códigos de los efectos fijos no pueden ser negativos (¿hay valores faltantes?).")
+    present = np.bincount(codes) > 0
+    if present.all():
+        return codes.astype(np.int64, copy=False), len(present)
+    remap = np.cumsum(present) - 1
+    return remap[codes], int(present.sum())
+
+
+def group_sums_matrix(codes, n_groups):
+    """Matriz dispersa (G, N) de pertenencia: `S @ X` suma las filas de X por grupo."""
+    n_obs = len(codes)
+    return sparse.csr_matrix((np.ones(n_obs), (codes, np.arange(n_obs))), shape=(n_groups, n_obs))
+
+
+class FixedEffects:
+    """
+    Uno o varios factores de efectos fijos codificados en enteros.
+
+    Attributes:
+        codes (list): Código de grupo de cada fila, un arreglo por factor.
+        n_groups (list): Número de grupos de cada factor.
+        nobs (int): Número de filas.
+    """
+    def __init__(self, *codes):
+        """
+        Args:
+            *codes (np.ndarray): Códigos enteros no negativos de cada factor (p. ej. los
+                                 códigos de unidad y de período de `EventStudyPanel`).
+
+        Raises:
+            ValueError: Si no hay factores, tienen largos distintos o hay códigos negativos.
+        """
+        if not codes:
+            raise ValueError("Indica al menos un factor de efectos fijos.")
+        compacted = [_compact_codes(c) for c in codes]
+        self.codes = [c for c, _ in compacted]
+        self.n_groups = [g for _, g in compacted]
+        self.nobs = len(self.codes[0])
+        if any(len(c) != self.nobs for c in self.codes):
+            raise ValueError("Todos los factores de efectos fijos deben tener el mismo número de filas.")
+        self._sums = [group_sums_matrix(c, g) for c, g in zip(self.codes, self.n_groups)]
+        self._counts = [np.bincount(c, minlength=g).astype(float) for c, g in zip(self.codes, self.n_groups)]
+        # Dos factores con exactamente una fila por celda: un barrido ya es la proyección exacta.
+        self._balanced = (len(self.codes) == 2 and self.nobs == self.n_groups[0] * self.n_groups[1]
+                          and np.bincount(self.codes[0] * self.n_groups[1] + self.codes[1]).max(initial=0) <= 1)
+        self._direct = None
+        if len(self.codes) == 2 and not self._balanced and min(self.n_groups) <= DIRECT_MAX_LEVELS:
+            self._direct = self._direct_solver()
+
+    @classmethod
+    def from_frame(cls, df, columns):
+        """Efectos fijos de las columnas de un DataFrame (usa los códigos si son categóricas)."""
+        codes = []
+        for column in columns:
+            values = df[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                codes.append(values.cat.codes.to_numpy().astype(np.int64))
+            else:
+                codes.append(pd.factorize(values)[0])
+        return cls(*codes)
+
+    def degrees_of_freedom(self):
+        """
+        Parámetros absorbidos por los efectos fijos (incluida la constante).
+
+        Con dos factores es exacto: G1 + G2 menos el número de componentes conexos del
+        grafo bipartito entre ambos (p. ej. unidades y períodos). Cada factor adicional
+        descuenta sólo su redundancia con la constante, como cota conservadora.
+        """
+        total = sum(self.n_groups)
+        if len(self.codes) == 1:
+            return total
+        first, second = self.codes[:2]
+        graph = sparse.csr_matrix((np.ones(self.nobs), (first, second)), shape=(self.n_groups[0], self.n_groups[1]))
+        graph = sparse.bmat([[None, graph], [graph.T, None]], format='csr')
+        n_components, _ = csgraph.connected_components(graph, directed=False)
+        return total - n_components - (len(self.codes) - 2)
+
+    def _subtract_means(self, factor, X):
+        """Resta a X (en el lugar) las medias de sus filas por grupo del factor indicado."""
+        X -= (self._sums[factor] @ X / self._counts[factor][:, None])[self.codes[factor]]
+        return X
+
+    def _sweep(self, X):
+        """Un barrido de proyecciones alternadas: resta, en orden, las medias de cada factor (en el lugar)."""
+        for factor in range(len(self.codes)):
+            self._subtract_means(factor, X)
+        return X
+
+    def _direct_solver(self):
+        """
+        Pseudo-inversa de B'M_A B, con A el factor grande y B el pequeño (dummies de B
+        desmediadas por A). Se arma con los conteos por celda: diag(n_B) - C' diag(1/n_A) C.
+        """
+        small = int(np.argmin(self.n_groups))
+        large = 1 - small
+        cells = sparse.csr_matrix((np.ones(self.nobs), (self.codes[large], self.codes[small])),
+                                  shape=(self.n_groups[large], self.n_groups[small]))
+        cross = np.diag(self._counts[small]) - (cells.T @ sparse.diags(1.0 / self._counts[large]) @ cells).toarray()
+        eigvals, eigvecs = np.linalg.eigh(cross)
+        keep = eigvals > 1e-10 * eigvals.max()
+        pinv = (eigvecs[:, keep] / eigvals[keep]) @ eigvecs[:, keep].T
+        return large, small, pinv
+
+    def _demean_direct(self, X):
+        """M_[A,B] X = M_A X - M_A B (B'M_A B)^+ B'M_A X, sin iterar (ver `_direct_solver`)."""
+        large, small, pinv = self._direct
+        X = self._subtract_means(large, X)
+        effects = pinv @ (self._sums[small] @ X)
+        X -= self._subtract_means(large, effects[self.codes[small]])
+        return X
+
+    def demean(self, X, tol=DEFAULT_TOL, max_iter=DEFAULT_MAX_ITER):
+        """
+        Elimina los efectos fijos de las columnas de X.
+
+        Args:
+            X (np.ndarray or scipy.sparse matrix): Arreglo (N,) o (N, K); las matrices
+                                                  dispersas se densifican por bloques de
+                                                  columnas.
+            tol (float): Cambio máximo entre iteraciones, relativo a la escala de la columna.
+            max_iter (int): Máximo de iteraciones aceleradas por bloque.
+
+        Returns:
+            np.ndarray: Residuos de X sobre los efectos fijos, con la forma de la entrada.
+
+        Raises:
+            ValueError: Si X no tiene N filas o alguna columna no converge.
+        """
+        vector = not sparse.issparse(X) and np.ndim(X) == 1
+        if X.shape[0] != self.nobs:
+            raise ValueError(f"X tiene {X.shape[0]} filas; los efectos fijos, {self.nobs}.")
+        n_columns = 1 if vector else X.shape[1]
+        out = np.empty((self.nobs, n_columns))
+        block = max(1, _BLOCK_ELEMENTS // max(self.nobs, 1))
+        for start in range(0, n_columns, block):
+            columns = slice(start, min(start + block, n_columns))
+            if vector:
+                values = np.array(X, dtype=float)[:, None]
+            elif sparse.issparse(X):
+                values = X[:, columns].toarray().astype(float)
+            else:
+                values = np.array(X[:, columns], dtype=float)
+            out[:, columns] = self._demean_block(values, tol, max_iter)
+        return out[:, 0] if vector else out
+
+    def _demean_block(self, X, tol, max_iter):
+        """Proyecciones alternadas con aceleración de Irons-Tuck sobre un bloque denso de columnas."""
+        X = np.ascontiguousarray(X)
+        if len(self.codes) == 1 or self._balanced:
+            return self._sweep(X)
+        if self._direct is not None:
+            return self._demean_direct(X)
+
+        scale = np.maximum(np.abs(X).max(axis=0), 1e-300)
+        active = np.arange(X.shape[1])
+        for _ in range(max_iter):
+            x = X[:, active]
+            gx = self._sweep(x.copy())
+            ggx = self._sweep(gx.copy())
+            delta = ggx - gx
+            delta2 = delta - gx + x
+            denominator = (delta2 ** 2).sum(axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                step = np.where(denominator > 0, (delta * delta2).sum(axis=0) / denominator, 0.0)
+            accelerated = ggx - step * delta
+            change = np.abs(accelerated - x).max(axis=0)
+            X[:, active] = accelerated
+
+            done = change <= tol * scale[active]
+            active = active[~done]
+            if not len(active):
+                return X
+        raise ValueError(f"La eliminación de efectos fijos no convergió en {max_iter} iteraciones.")
+
+
+def cluster_covariance(X, resid, normalized_cov, clusters, n_params):
+    """
+    Matriz de covarianza robusta por conglomerados (CR1), con la corrección de
+    statsmodels: G/(G-1) * (N-1)/(N-p).
+
+    Args:
+        X (np.ndarray): Regresores sin efectos fijos, (N, K).
+        resid (np.ndarray): Residuos, (N,).
+        normalized_cov (np.ndarray): (X'X)^-1 de los regresores, (K, K).
+        clusters (np.ndarray): Código entero del conglomerado de cada fila.
+        n_params (int): Parámetros del modelo completo, incluidos los efectos fijos absorbidos.
+
+    Returns:
+        tuple: (matriz de covarianza (K, K), número de conglomerados).
+    """
+    codes, n_clusters = _compact_codes(clusters)
+    if n_clusters < 2:
+        raise ValueError("Se necesitan al menos dos conglomerados para los errores agrupados.")
+    scores = group_sums_matrix(codes, n_clusters) @ (X * resid[:, None])
+    bread = normalized_cov
+    cov = bread @ (scores.T @ scores) @ bread
+    nobs = len(resid)
+    cov *= n_clusters / (n_clusters - 1) * (nobs - 1) / (nobs - n_params)
+    return cov, n_clusters
+
+
+def hdfe_ols(y, X, fixed_effects, cluster=None, names=None, tol=DEFAULT_TOL, max_iter=DEFAULT_MAX_ITER):
+    """
+    MCO de y sobre X absorbiendo efectos fijos de alta dimensión.
+
+    Args:
+        y (np.ndarray): Variable de resultado, (N,).
+        X (np.ndarray or scipy.sparse matrix): Regresores de interés, (N, K).
+        fixed_effects (FixedEffects): Factores absorbidos (incluyen la constante).
+        cluster (np.ndarray, optional): Códigos enteros de conglomerado para errores
+                                        estándar robustos agrupados; None usa los
+                                        errores clásicos.
+        names (list, optional): Nombres de los regresores.
+        tol, max_iter: Criterio de convergencia de `FixedEffects.demean`.
+
+    Returns:
+        dict: 'params', 'bse', 'tvalues', 'pvalues' (K,) (Series si se indican nombres),
+              'normalized_cov', 'ssr', 'nobs', 'df_resid', 'df_inference' (grados de
+              libertad de la distribución t: G-1 con conglomerados), 'rank' del modelo
+              completo, 'r_squared' (total) y 'r_squared_within'.
+    """
+    y = np.asarray(y, dtype=float)
+    y_tilde = fixed_effects.demean(y, tol=tol, max_iter=max_iter)
+    X_tilde = fixed_effects.demean(X, tol=tol, max_iter=max_iter)
+    if X_tilde.ndim == 1:
+        X_tilde = X_tilde[:, None]
+    fit = ols_demeaned(y_tilde, X_tilde, fixed_effects.degrees_of_freedom(), cluster)
+
+    centered_tss = ((y - y.mean()) ** 2).sum()
+    fit['r_squared'] = 1 - fit['ssr'] / centered_tss
+    fit['r_squared_within'] = 1 - fit['ssr'] / (y_tilde @ y_tilde)
+    if names is not None:
+        for key in ('params', 'bse', 'tvalues', 'pvalues'):
+            fit[key] = pd.Series(fit[key], index=list(names))
+    return fit
+
+
+def ols_demeaned(y_tilde, X_tilde, absorbed, cluster=None):
+    """
+    Resuelve el MCO sobre variables ya desmediadas con `FixedEffects.demean`.
+
+    Args:
+        y_tilde (np.ndarray): Variable de resultado desmediada, (N,).
+        X_tilde (np.ndarray): Regresores desmediados, (N, K).
+        absorbed (int): Grados de libertad absorbidos (`FixedEffects.degrees_of_freedom`),
+                        que se descuentan de las observaciones.
+        cluster (np.ndarray, optional): Códigos de conglomerado de cada fila.
+
+    Returns:
+        dict: Ver `hdfe_ols` (sin los R²).
+    """
+    nobs = len(y_tilde)
+    fit = ols_from_moments((X_tilde.T @ X_tilde)[None], (X_tilde.T @ y_tilde)[None],
+                           np.array([y_tilde @ y_tilde]), np.array([nobs - absorbed], dtype=float))
+    fit = {key: value[0] for key, value in fit.items()}
+    fit['nobs'] = nobs
+    fit['rank'] = int(fit['rank']) + absorbed
+    fit['df_inference'] = fit['df_resid']
+    if cluster is not None:
+        resid = y_tilde - X_tilde @ fit['params']
+        cov, n_clusters = cluster_covariance(X_tilde, resid, fit['normalized_cov'], cluster, fit['rank'])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fit['bse'] = np.sqrt(np.diagonal(cov))
+            fit['tvalues'] = fit['params'] / fit['bse']
+        fit['df_inference'] = n_clusters - 1
+        fit['pvalues'] = 2 * stats.t.sf(np.abs(fit['tvalues']), fit['df_inference'])
+        fit['n_clusters'] = n_clusters
+    return fit
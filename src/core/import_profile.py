@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Perfil del costo de importación de los módulos del proyecto.
+
+Ejecuta `python -X importtime -c "import <módulo>"` en un proceso nuevo (sin módulos
+ya cargados), interpreta su salida y resume el tiempo por módulo y por paquete. Se usa
+para vigilar el presupuesto de arranque: importar el módulo de un paso no debería
+cargar dependencias pesadas ni superar STARTUP_BUDGET_MS.
+"""
+import os
+import re
+import subprocess
+import sys
+from dataclasses import dataclass, field
+
+# Presupuesto de arranque: tiempo acumulado de importar el módulo de un paso.
+STARTUP_BUDGET_MS = 200
+# Dependencias cuya carga en el arranque indica una importación no diferida.
+HEAVY_PACKAGES = ('numpy', 'pandas', 'scipy', 'statsmodels', 'matplotlib', 'pyarrow', 'patsy',
+                  'tabulate', 'pysyncon')
+
+_PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+@dataclass
+class ImportRecord:
+    """Una línea de `-X importtime`: tiempos en microsegundos y profundidad de anidación."""
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+@dataclass
+class ImportProfile:
+    """Perfil de importación de un módulo."""
+    module: str
+    records: list = field(default_factory=list)
+
+    @property
+    def total_ms(self):
+        """Tiempo acumulado de importar el módulo (incluye todo lo que importa)."""
+        for record in reversed(self.records):
+            if record.name == self.module:
+                return record.cumulative_us / 1000
+        return sum(record.self_us for record in self.records) / 1000
+
+    @property
+    def heavy_packages(self):
+        """Dependencias pesadas cargadas durante la importación."""
+        loaded = {record.name.split('.')[0] for record in self.records}
+        return [package for package in HEAVY_PACKAGES if package in loaded]
+
+    def by_package(self):
+        """Tiempo propio (ms) agregado por paquete de primer nivel, de mayor a menor."""
+        totals = {}
+        for record in self.records:
+            package = record.name.split('.')[0]
+            totals[package] = totals.get(package, 0) + record.self_us / 1000
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+    def report(self, top=15, budget_ms=STARTUP_BUDGET_MS):
+        """Reporte en texto: módulos más costosos, costo por paquete y estado del presupuesto."""
+        status = 'dentro del presupuesto' if self.total_ms <= budget_ms else 'EXCEDE el presupuesto'
+        lines = [
+            f"Importación de '{self.module}': {self.total_ms:.1f} ms ({status} de {budget_ms} ms)",
+            f"  {'acumulado (ms)':>15} {'propio (ms)':>12}  módulo",
+        ]
+        slowest = sorted(self.records, key=lambda record: record.cumulative_us, reverse=True)[:top]
+        for record in slowest:
+            lines.append(f"  {record.cumulative_us / 1000:15.1f} {record.self_us / 1000:12.1f}  "
+                         f"{'  ' * record.depth}{record.name}")
+        lines.append("  Por paquete (tiempo propio, ms): " +
+                     ', '.join(f"{package} {ms:.1f}" for package, ms in self.by_package()[:8]))
+        if self.heavy_packages:
+            lines.append(f"  Dependencias pesadas cargadas al importar: {', '.join(self.heavy_packages)}")
+        return '\n'.join(lines)
+
+
+def parse_importtime(output):
+    """Convierte la salida de `-X importtime` (stderr) en una lista de `ImportRecord`."""
+    records = []
+    for line in output.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            records.append(ImportRecord(name=match.group(4), self_us=int(match.group(1)),
+                                        cumulative_us=int(match.group(2)), depth=len(match.group(3)) // 2))
+    return records
+
+
+def profile_imports(module, python=None):
+    """
+    Mide el costo de importar `module` en un intérprete nuevo.
+
+    Args:
+        module (str): Módulo a importar (p. ej. 'src.analysis.did_analysis').
+        python (str, optional): Intérprete a usar; por defecto, el actual.
+
+    Returns:
+        ImportProfile: Registros de importación del módulo y de sus dependencias.
+
+    Raises:
+        RuntimeError: Si el módulo no se puede importar.
+    """
+    completed = subprocess.run(
+        [python or sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=_PROJECT_ROOT, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'error desconocido'
+        raise RuntimeError(f"No se pudo importar '{module}': {error}")
+    return ImportProfile(module=module, records=parse_importtime(completed.stderr))
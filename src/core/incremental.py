@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Actualización incremental de los modelos cuando se anexan períodos al dataset.
+
+Los productos cruzados (X'X, X'y, y'y) del DiD de período completo y de la prueba de
+tendencias paralelas se guardan junto al dataset procesado, asociados a su huella.
+Cuando `make_dataset --append` anexa un año nuevo, esos productos se actualizan sólo
+con las celdas nuevas (actualización de rango k, ver `RegressionMoments`), de modo que
+los resultados del dataset ampliado se obtienen sin volver a comprimir ni estimar
+sobre todo el panel. Si el dataset cambió por otra vía (p. ej. una reconstrucción
+completa), los momentos guardados se descartan y se recalculan al pedirlos.
+"""
+import json
+import os
+
+from .data_manager import PROCESSED_DATA_PATH, _processed_base_path
+from .result_cache import dataset_fingerprint
+from .sufficient_stats import RegressionMoments, compress_panel
+from .treatment import TreatmentAssignment
+
+MOMENTS_SUFFIX = '.moments.json'
+MODEL_FORMULAS = {
+    'did_model': 'deforestacion_anual ~ tratado + post_treatment + did',
+    'parallel_trends': 'deforestacion_anual ~ tratado + año_norm + tratado:año_norm',
+}
+
+
+def model_cells(model, df, treated_units, treatment_year, origin):
+    """
+    Celdas (grupo de tratamiento, período) de un modelo a partir de filas del panel.
+
+    Args:
+        model (str): 'did_model' (todo el panel) o 'parallel_trends' (sólo los períodos
+                     previos a la intervención).
+        df (pd.DataFrame): Filas del panel (todas o sólo las nuevas).
+        treated_units (list): Departamentos tratados.
+        treatment_year (int): Año de la intervención.
+        origin (int): Primer período del panel, origen de 'año_norm'.
+
+    Returns:
+        pd.DataFrame: Celdas de `compress_panel` con los regresores del modelo.
+    """
+    if model not in MODEL_FORMULAS:
+        raise ValueError(f"Modelo sin actualización incremental: '{model}'. Usa {list(MODEL_FORMULAS)}.")
+    df = df.assign(tratado=TreatmentAssignment.from_units(treated_units, treatment_year).codes(
+        df['departamento'])[0].astype(int))
+    if model == 'parallel_trends':
+        df = df[df['Periodo'] < treatment_year]
+    cells = compress_panel(df, ['tratado', 'Periodo'])
+    if model == 'did_model':
+        cells['post_treatment'] = (cells['Periodo'] >= treatment_year).astype(int)
+        cells['did'] = cells['tratado'] * cells['post_treatment']
+    else:
+        cells['año_norm'] = cells['Periodo'] - origin
+    return cells
+
+
+class MomentStore:
+    """Momentos de los modelos del panel completo, guardados junto al dataset procesado."""
+    def __init__(self, data_path=PROCESSED_DATA_PATH):
+        """
+        Args:
+            data_path (str): Ruta base del dataset procesado.
+        """
+        self.data_path = data_path
+        self.path = f"{_processed_base_path(data_path)}{MOMENTS_SUFFIX}"
+
+    def _read(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'dataset': None, 'models': {}}
+
+    def _write(self, payload):
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(temporary, self.path)
+
+    def results(self, model, treated_units, treatment_year, df):
+        """
+        Resultados de un modelo sobre el panel completo.
+
+        Si hay momentos guardados para el dataset actual se resuelven directamente; si
+        no, se calculan a partir de `df` y se guardan para las próximas actualizaciones.
+
+        Args:
+            model (str): 'did_model' o 'parallel_trends'.
+            treated_units (str or list): Departamento(s) tratado(s).
+            treatment_year (int): Año de la intervención.
+            df (pd.DataFrame): Panel completo cargado del dataset.
+
+        Returns:
+            CellOLSResults: Resultados idénticos a los de `cell_ols` sobre el panel.
+        """
+        fingerprint = dataset_fingerprint(self.data_path)
+        payload = self._read()
+        if payload.get('dataset') != fingerprint:
+            payload = {'dataset': fingerprint, 'models': {}}
+        treated_units = sorted([treated_units] if isinstance(treated_units, str) else treated_units)
+        key = f"{model}|{','.join(treated_units)}|{int(treatment_year)}"
+        entry = payload['models'].get(key)
+        if entry is not None:
+            return RegressionMoments.from_dict(entry['moments']).results()
+
+        origin = int(df['Periodo'].min())
+        moments = RegressionMoments.from_cells(MODEL_FORMULAS[model],
+                                               model_cells(model, df, treated_units, treatment_year, origin))
+        payload['models'][key] = {'model': model, 'treated_units': treated_units,
+                                  'treatment_year': int(treatment_year), 'origin': origin,
+                                  'moments': moments.to_dict()}
+        self._write(payload)
+        return moments.results()
+
+    def refresh(self, new_rows, previous_fingerprint):
+        """
+        Actualiza los momentos guardados con las filas anexadas al dataset.
+
+        Args:
+            new_rows (pd.DataFrame): Filas anexadas.
+            previous_fingerprint (str): Huella del dataset antes de anexarlas; si los
+                                        momentos corresponden a otra versión, se descartan.
+
+        Returns:
+            int: Modelos actualizados.
+        """
+        payload = self._read()
+        if payload.get('dataset') != previous_fingerprint:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return 0
+        for entry in payload['models'].values():
+            moments = RegressionMoments.from_dict(entry['moments'])
+            moments.update(model_cells(entry['model'], new_rows, entry['treated_units'], entry['treatment_year'],
+                                       entry['origin']))
+            entry['moments'] = moments.to_dict()
+        payload['dataset'] = dataset_fingerprint(self.data_path)
+        self._write(payload)
+        return len(payload['models'])
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentación de las corridas: tiempo y memoria por etapa.
+
+`setup_run_environment` abre una corrida (`start_run`). Dentro de ella, `span('fit')`
+(administrador de contexto o decorador) registra para cada etapa el tiempo de reloj,
+el tiempo de CPU del proceso y de sus procesos hijos ya terminados (p. ej. un pool) y
+la memoria residente pico. Las etapas pueden anidarse ('fit/bootstrap'). Al cerrar
+cada etapa de primer nivel se reescribe `metrics.json` junto a `run.log`, de modo que
+una corrida interrumpida conserva las etapas completadas. Fuera de una corrida, o en
+un proceso distinto del que la abrió, `span` no registra nada.
+
+En Linux el pico de memoria de cada etapa se obtiene reiniciando el máximo de memoria
+residente del proceso (VmHWM) al abrirla; en otros sistemas se informa el pico del
+proceso hasta el cierre de la etapa ('peak_rss_scope': 'process').
+
+`profile_call` ejecuta una función bajo cProfile y guarda el perfil en la corrida que
+esa función haya abierto.
+"""
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_FILENAME = 'metrics.json'
+PROFILE_FILENAME = 'profile.prof'
+PROFILE_SUMMARY_FILENAME = 'profile.txt'
+# Destino de los perfiles de pasos que no abren una corrida (p. ej. 'data').
+PROFILE_FALLBACK_DIR = os.path.join('reports', 'profiles')
+PROFILE_SUMMARY_LINES = 40
+
+_STATUS_PATH = '/proc/self/status'
+_CLEAR_REFS_PATH = '/proc/self/clear_refs'
+
+
+def _status_kib(field):
+    """Lee un campo en KiB de /proc/self/status (Linux); None si no está disponible."""
+    try:
+        with open(_STATUS_PATH, encoding='ascii') as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def current_rss_mib():
+    """Memoria residente actual del proceso (MiB); None si no se puede medir."""
+    kib = _status_kib('VmRSS')
+    return kib / 1024 if kib is not None else None
+
+
+def peak_rss_mib():
+    """Memoria residente máxima del proceso desde el inicio o desde el último reinicio (MiB)."""
+    kib = _status_kib('VmHWM')
+    if kib is not None:
+        return kib / 1024
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss está en bytes en macOS y en KiB en Linux.
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _reset_peak_rss():
+    """Reinicia el máximo de memoria residente del proceso (Linux); False si no es posible."""
+    try:
+        with open(_CLEAR_REFS_PATH, 'w', encoding='ascii') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _children_cpu_seconds():
+    """Tiempo de CPU acumulado de los procesos hijos ya terminados."""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _rounded(value, digits=4):
+    return round(value, digits) if value is not None else None
+
+
+class RunMetrics:
+    """Etapas medidas de una corrida y su escritura en `metrics.json`."""
+    def __init__(self, run_dir):
+        """
+        Args:
+            run_dir (str): Directorio de la corrida.
+        """
+        self.run_dirs = [run_dir]
+        self.pid = os.getpid()
+        self.started = datetime.now().isoformat(timespec='seconds')
+        self.spans = []
+        self.profile = None
+        self._stack = []
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._children_cpu_start = _children_cpu_seconds()
+        self._span_scoped_peak = _reset_peak_rss()
+        self._peak = peak_rss_mib() or 0.0
+
+    @property
+    def run_dir(self):
+        return self.run_dirs[0]
+
+    def _observe_peak(self):
+        """Lee el pico de memoria y lo propaga a la corrida y a las etapas abiertas."""
+        peak = peak_rss_mib() or 0.0
+        self._peak = max(self._peak, peak)
+        for frame in self._stack:
+            frame['peak'] = max(frame['peak'], peak)
+        return peak
+
+    def open_span(self, name):
+        # Antes de reiniciar el pico, las etapas abiertas absorben el valor acumulado.
+        self._observe_peak()
+        if self._span_scoped_peak:
+            _reset_peak_rss()
+        self._stack.append({
+            'name': name,
+            'path': '/'.join([frame['name'] for frame in self._stack] + [name]),
+            'wall': time.perf_counter(),
+            'cpu': time.process_time(),
+            'children_cpu': _children_cpu_seconds(),
+            'rss_start': current_rss_mib(),
+            'peak': peak_rss_mib() or 0.0,
+        })
+
+    def close_span(self, status='ok'):
+        self._observe_peak()
+        frame = self._stack.pop()
+        self.spans.append({
+            'name': frame['name'],
+            'path': frame['path'],
+            'depth': len(self._stack),
+            'status': status,
+            'start_seconds': _rounded(frame['wall'] - self._wall_start),
+            'wall_seconds': _rounded(time.perf_counter() - frame['wall']),
+            'cpu_seconds': _rounded(time.process_time() - frame['cpu']),
+            'children_cpu_seconds': _rounded(_children_cpu_seconds() - frame['children_cpu']),
+            'rss_start_mib': _rounded(frame['rss_start'], 2),
+            'rss_end_mib': _rounded(current_rss_mib(), 2),
+            'peak_rss_mib': _rounded(frame['peak'], 2),
+        })
+        if not self._stack:
+            self.write()
+
+    def summary(self):
+        """Resumen de la corrida: totales y etapas en orden de inicio."""
+        return {
+            'run_dir': self.run_dir,
+            'started': self.started,
+            'pid': self.pid,
+            'peak_rss_scope': 'span' if self._span_scoped_peak else 'process',
+            'total': {
+                'wall_seconds': _rounded(time.perf_counter() - self._wall_start),
+                'cpu_seconds': _rounded(time.process_time() - self._cpu_start),
+                'children_cpu_seconds': _rounded(_children_cpu_seconds() - self._children_cpu_start),
+                'peak_rss_mib': _rounded(max(self._peak, peak_rss_mib() or 0.0), 2),
+            },
+            'spans': sorted(self.spans, key=lambda record: (record['start_seconds'], record['depth'])),
+            'profile': self.profile,
+        }
+
+    def write(self):
+        """Escribe `metrics.json` en cada directorio de la corrida (reemplazo atómico)."""
+        payload = self.summary()
+        for run_dir in self.run_dirs:
+            path = os.path.join(run_dir, METRICS_FILENAME)
+            temporary = f"{path}.tmp"
+            with open(temporary, 'w', encoding='utf-8') as f:
+                json.dump(dict(payload, run_dir=run_dir), f, indent=2, ensure_ascii=False)
+            os.replace(temporary, path)
+
+
+# Corrida activa del proceso (ver `start_run`).
+_CURRENT_RUN = None
+
+
+def start_run(run_dir, join=False):
+    """
+    Abre la corrida activa del proceso.
+
+    Args:
+        run_dir (str): Directorio de la corrida (debe existir).
+        join (bool): Si ya hay una corrida activa en este proceso, `run_dir` se suma a
+                     ella en lugar de abrir una nueva (una ejecución que produce varias
+                     corridas con el mismo cálculo, p. ej. varios años en un lote).
+
+    Returns:
+        RunMetrics: Corrida activa.
+    """
+    global _CURRENT_RUN
+    if join and current_run() is not None:
+        _CURRENT_RUN.run_dirs.append(run_dir)
+    else:
+        _CURRENT_RUN = RunMetrics(run_dir)
+    _CURRENT_RUN.write()
+    return _CURRENT_RUN
+
+
+def current_run():
+    """Corrida activa del proceso actual; None si no hay (o si se heredó de otro proceso)."""
+    if _CURRENT_RUN is not None and _CURRENT_RUN.pid == os.getpid():
+        return _CURRENT_RUN
+    return None
+
+
+class span:
+    """
+    Etapa medida de la corrida activa, como administrador de contexto o decorador.
+
+    Ejemplos:
+        with span('fit'):
+            results = analyzer.run_did_model()
+
+        @span('load')
+        def load_processed_data(...): ...
+    """
+    def __init__(self, name):
+        self.name = name
+        self._runs = []
+
+    def __enter__(self):
+        run = current_run()
+        if run is not None:
+            run.open_span(self.name)
+        self._runs.append(run)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        run = self._runs.pop()
+        if run is not None:
+            run.close_span('ok' if exc_type is None else 'error')
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(self.name):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def profile_call(func, *args, label='profile', **kwargs):
+    """
+    Ejecuta `func(*args, **kwargs)` bajo cProfile y guarda el perfil.
+
+    El perfil ('profile.prof', legible con `pstats` o snakeviz) y un resumen en texto
+    de las funciones con mayor tiempo acumulado se guardan en la corrida que `func`
+    haya abierto; si no abrió ninguna, en PROFILE_FALLBACK_DIR con el nombre `label`.
+
+    Returns:
+        object: Resultado de `func`.
+    """
+    previous_run = current_run()
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        run = current_run()
+        if run is not None and run is not previous_run:
+            directory, stem = run.run_dir, ''
+        else:
+            run = None
+            directory = PROFILE_FALLBACK_DIR
+            stem = f"{label}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_"
+        os.makedirs(directory, exist_ok=True)
+        profile_path = os.path.join(directory, stem + PROFILE_FILENAME)
+        profiler.dump_stats(profile_path)
+        with open(os.path.join(directory, stem + PROFILE_SUMMARY_FILENAME), 'w', encoding='utf-8') as f:
+            stats = pstats.Stats(profiler, stream=f)
+            stats.sort_stats('cumulative').print_stats(PROFILE_SUMMARY_LINES)
+        if run is not None:
+            run.profile = profile_path
+            run.write()
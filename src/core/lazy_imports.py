@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Importación diferida de dependencias pesadas.
+
+pandas, numpy, scipy, statsmodels, matplotlib y pyarrow tardan en conjunto varios
+segundos en importarse. Los módulos del proyecto los declaran con `lazy_import`, que
+devuelve un módulo sustituto: la importación real ocurre en el primer acceso a un
+atributo (p. ej. `pd.DataFrame`). Así, `--help`, los errores tempranos (p. ej. un
+archivo faltante) y los procesos que sólo necesitan parte del código arrancan en
+milisegundos.
+"""
+import importlib
+import importlib.util
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Módulo sustituto que importa el módulo real en el primer acceso a un atributo."""
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_lazy_target'] = name
+
+    def _load(self):
+        module = importlib.import_module(self.__dict__['_lazy_target'])
+        # Copiar los atributos evita pasar por __getattr__ en los accesos siguientes.
+        self.__dict__.update(module.__dict__)
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        target = self.__dict__['_lazy_target']
+        state = 'cargado' if target in sys.modules else 'diferido'
+        return f"<módulo {target!r} ({state})>"
+
+
+def lazy_import(name):
+    """
+    Declara un módulo cuya importación se difiere hasta su primer uso.
+
+    Args:
+        name (str): Nombre completo del módulo (p. ej. 'statsmodels.formula.api').
+
+    Returns:
+        module: El módulo real si ya estaba importado; si no, un `LazyModule`.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
+
+
+def is_available(name):
+    """Indica si un paquete está instalado, sin importarlo."""
+    try:
+        return importlib.util.find_spec(name.split('.')[0]) is not None
+    except (ImportError, ValueError):
+        return False
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Estimación de los modelos DiD, de tendencias paralelas y de estudio de eventos para
+varias variables de resultado a la vez.
+
+Las tres especificaciones tienen un diseño que no depende de la variable de resultado,
+así que X'X se arma y se factoriza una sola vez y todas las variables se resuelven como
+lados derechos de un mismo sistema (`ols_multi_outcome`). Como statsmodels descarta las
+filas con valores faltantes de cada variable, las variables se agrupan por patrón de
+faltantes: cada patrón comparte un diseño y una factorización (con un panel completo,
+todas las variables caen en el mismo grupo). Los resultados coinciden con los de
+`DiDAnalysis.run_did_model`, `run_parallel_trends_test` y `run_event_study_batch`.
+"""
+from .batched_ols import DID_TERMS, ols_multi_outcome
+from .event_study import EventStudyPanel
+from .lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+sparse = lazy_import('scipy.sparse')
+stats = lazy_import('scipy.stats')
+
+MODELS = ('did', 'parallel_trends', 'event_study')
+TREND_TERMS = ['Intercept', 'tratado', 'año_norm', 'tratado:año_norm']
+
+# Términos reportados de cada modelo (el estudio de eventos reporta cada tiempo relativo).
+_KEY_TERMS = {'did': 'did', 'parallel_trends': 'tratado:año_norm'}
+
+
+def outcome_columns(df, exclude=('Periodo', 'departamento', 'tratado', 'post_treatment', 'did')):
+    """Columnas numéricas del panel que pueden usarse como variable de resultado."""
+    return [column for column in df.columns
+            if column not in exclude and pd.api.types.is_numeric_dtype(df[column])]
+
+
+def _check_outcomes(df, outcomes):
+    """Valida que las variables de resultado existan y sean numéricas."""
+    outcomes = list(dict.fromkeys(outcomes))
+    if not outcomes:
+        raise ValueError("Indica al menos una variable de resultado.")
+    missing = [column for column in outcomes if column not in df.columns]
+    if missing:
+        raise ValueError(f"Variables de resultado inexistentes: {missing}. Disponibles: {outcome_columns(df)}.")
+    non_numeric = [column for column in outcomes if not pd.api.types.is_numeric_dtype(df[column])]
+    if non_numeric:
+        raise ValueError(f"Variables de resultado no numéricas: {non_numeric}.")
+    return outcomes
+
+
+def _missing_patterns(frame, outcomes):
+    """Agrupa las variables de resultado por patrón de filas observadas: [(máscara de filas, variables)]."""
+    observed = frame[outcomes].notna().to_numpy()
+    patterns, groups = np.unique(observed.T, axis=0, return_inverse=True)
+    groups = np.ravel(groups)
+    return [(pattern, [outcome for outcome, group in zip(outcomes, groups) if group == g])
+            for g, pattern in enumerate(patterns)]
+
+
+def _fit_outcomes(frame, outcomes, design):
+    """
+    Ajusta un mismo diseño para todas las variables de resultado, con una factorización
+    por patrón de faltantes.
+
+    Args:
+        frame (pd.DataFrame): Filas de la especificación.
+        outcomes (list): Variables de resultado.
+        design (callable): Recibe las filas observadas y las variables del grupo, y
+                           devuelve (X, nombres, extra); X puede ser densa o dispersa.
+
+    Yields:
+        tuple: (variables del grupo, nombres, extra, ajuste de `ols_multi_outcome`,
+                observaciones, suma de cuadrados centrada de cada variable).
+    """
+    for rows, group in _missing_patterns(frame, outcomes):
+        subset = frame.loc[rows]
+        X, names, extra = design(subset, group)
+        Y = subset[group].to_numpy(dtype=float)
+        xtx = X.T @ X
+        xtx = xtx.toarray() if hasattr(xtx, 'toarray') else np.asarray(xtx)
+        xty = np.asarray(X.T @ Y)
+        fit = ols_multi_outcome(xtx[None], xty[None], (Y ** 2).sum(axis=0)[None], np.array([len(Y)], dtype=float))
+        centered_tss = (Y ** 2).sum(axis=0) - Y.sum(axis=0) ** 2 / len(Y)
+        yield group, names, extra, fit, len(Y), centered_tss
+
+
+def _rows(model, group, fit, nobs, centered_tss, columns, alpha, relative_times=None):
+    """Filas de la tabla apilada para las columnas `columns` del diseño."""
+    critical = stats.t.ppf(1 - alpha / 2, fit['df_resid'][0])
+    rows = []
+    for m, outcome in enumerate(group):
+        for j, (term, column) in enumerate(columns):
+            coef, se = fit['params'][0, m, column], fit['bse'][0, m, column]
+            rows.append({
+                'model': model, 'outcome': outcome, 'term': term,
+                'relative_time': relative_times[j] if relative_times is not None else pd.NA,
+                'coef': coef, 'std_err': se, 't_value': fit['tvalues'][0, m, column],
+                'p_value': fit['pvalues'][0, m, column],
+                'ci_lower': coef - critical * se, 'ci_upper': coef + critical * se,
+                'nobs': nobs, 'r_squared': 1 - fit['ssr'][0, m] / centered_tss[m],
+            })
+    return rows
+
+
+def _unit_years(units, adoption):
+    """Año de adopción de cada elemento de `units` (NaN en los controles)."""
+    return pd.Series(adoption, dtype=float).reindex(pd.Index(np.asarray(units, dtype=object))).to_numpy()
+
+
+def multi_outcome_did(df, outcomes, treated_units, treatment_year, start_year=None, end_year=None, alpha=0.05,
+                      adoption=None):
+    """
+    Modelo `y ~ tratado + post_treatment + did` para cada variable de resultado.
+
+    Con `adoption`, 'did' marca cada unidad tratada desde su propio año (como
+    `TreatmentAssignment.apply`); 'post_treatment' sigue cortando en `treatment_year`.
+
+    Returns:
+        list: Filas de la tabla apilada (ver `multi_outcome_analysis`).
+    """
+    frame = df if not (start_year and end_year) else \
+        df[(df['Periodo'] >= start_year) & (df['Periodo'] <= end_year)]
+
+    def design(rows, group):
+        treated = rows['departamento'].isin(list(treated_units)).to_numpy(dtype=float)
+        periods = rows['Periodo'].to_numpy()
+        post = (periods >= treatment_year).astype(float)
+        if adoption is None:
+            did = treated * post
+        else:
+            with np.errstate(invalid='ignore'):
+                did = (periods >= _unit_years(rows['departamento'], adoption)).astype(float)
+        return np.column_stack([np.ones(len(rows)), treated, post, did]), DID_TERMS, None
+
+    rows = []
+    for group, names, _, fit, nobs, tss in _fit_outcomes(frame, outcomes, design):
+        term = _KEY_TERMS['did']
+        rows += _rows('did', group, fit, nobs, tss, [(term, names.index(term))], alpha)
+    return rows
+
+
+def multi_outcome_parallel_trends(df, outcomes, treated_units, treatment_year, alpha=0.05):
+    """
+    Prueba de tendencias paralelas (`y ~ tratado + año_norm + tratado:año_norm` antes de
+    la intervención) para cada variable de resultado.
+
+    Returns:
+        list: Filas de la tabla apilada (ver `multi_outcome_analysis`).
+    """
+    frame = df[df['Periodo'] < treatment_year]
+    first_year = frame['Periodo'].min()
+
+    def design(rows, group):
+        treated = rows['departamento'].isin(list(treated_units)).to_numpy(dtype=float)
+        year = (rows['Periodo'] - first_year).to_numpy(dtype=float)
+        return np.column_stack([np.ones(len(rows)), treated, year, treated * year]), TREND_TERMS, None
+
+    rows = []
+    for group, names, _, fit, nobs, tss in _fit_outcomes(frame, outcomes, design):
+        term = _KEY_TERMS['parallel_trends']
+        rows += _rows('parallel_trends', group, fit, nobs, tss, [(term, names.index(term))], alpha)
+    return rows
+
+
+def multi_outcome_event_study(df, outcomes, treated_units, treatment_year, reference=-1, min_event=None,
+                              max_event=None, alpha=0.05, adoption=None):
+    """
+    Estudio de eventos con efectos fijos de unidad y período para cada variable de
+    resultado, con el diseño disperso de `EventStudyPanel`. Con `adoption`, el tiempo
+    relativo de cada unidad tratada se mide desde su propio año.
+
+    Returns:
+        list: Filas de la tabla apilada, una por variable y tiempo relativo estimado.
+    """
+    def design(rows, group):
+        # Las filas ya están restringidas a las observadas del grupo, en su orden original.
+        panel = EventStudyPanel(rows, outcome=group[0])
+        fe_design = panel.fixed_effects_design()
+        treated = np.isin(panel.units, list(treated_units))
+        timing = treatment_year if adoption is None else _unit_years(panel.units, adoption)
+        event_design, event_times = panel.event_design(treated, timing, reference, min_event, max_event)
+        names = [None] * fe_design.shape[1] + [f'evento_{int(t):+d}' for t in event_times]
+        return sparse.hstack([fe_design, event_design], format='csr'), names, (fe_design.shape[1], event_times)
+
+    rows = []
+    for group, names, (n_fe, event_times), fit, nobs, tss in _fit_outcomes(df, outcomes, design):
+        columns = [(names[n_fe + j], n_fe + j) for j in range(len(event_times))]
+        rows += _rows('event_study', group, fit, nobs, tss, columns, alpha,
+                      relative_times=[int(t) for t in event_times])
+    return rows
+
+
+def multi_outcome_analysis(df, outcomes, treated_units, treatment_year, models=MODELS, start_year=None,
+                           end_year=None, reference=-1, alpha=0.05, adoption=None):
+    """
+    Estima los modelos indicados para todas las variables de resultado y apila los resultados.
+
+    Args:
+        df (pd.DataFrame): Panel en formato largo (con 'departamento' y 'Periodo').
+        outcomes (list): Variables de resultado.
+        treated_units (list): Unidades tratadas.
+        treatment_year (int): Año de la intervención (con `adoption`, el primer año de
+                              adopción: corte de 'post_treatment' y fin del período previo).
+        models (tuple): Subconjunto de 'did', 'parallel_trends' y 'event_study'.
+        start_year, end_year (int, optional): Ventana del modelo DiD, como en `run_did_model`.
+        reference (int): Tiempo relativo omitido en el estudio de eventos.
+        alpha (float): Nivel de significancia para los intervalos de confianza.
+        adoption (dict, optional): Año de adopción de cada unidad tratada (adopción
+                                   escalonada); por defecto, `treatment_year` para todas.
+
+    Returns:
+        pd.DataFrame: Una fila por modelo, variable y término reportado ('did',
+                      'tratado:año_norm' o cada tiempo relativo), con coeficiente, error
+                      estándar, estadístico t, p-valor, intervalo de confianza, número de
+                      observaciones y R².
+
+    Raises:
+        ValueError: Si un modelo o una variable de resultado no es válido.
+    """
+    unknown = [model for model in models if model not in MODELS]
+    if unknown:
+        raise ValueError(f"Modelos desconocidos: {unknown}. Usa {list(MODELS)}.")
+    outcomes = _check_outcomes(df, outcomes)
+
+    rows = []
+    if 'did' in models:
+        rows += multi_outcome_did(df, outcomes, treated_units, treatment_year, start_year, end_year, alpha,
+                                  adoption=adoption)
+    if 'parallel_trends' in models:
+        rows += multi_outcome_parallel_trends(df, outcomes, treated_units, treatment_year, alpha)
+    if 'event_study' in models:
+        rows += multi_outcome_event_study(df, outcomes, treated_units, treatment_year, reference, alpha=alpha,
+                                          adoption=adoption)
+
+    table = pd.DataFrame(rows)
+    table['relative_time'] = table['relative_time'].astype('Int64')
+    order = {outcome: i for i, outcome in enumerate(outcomes)}
+    table['_model'] = table['model'].map({model: i for i, model in enumerate(MODELS)})
+    table['_outcome'] = table['outcome'].map(order)
+    return table.sort_values(['_model', '_outcome', 'relative_time'], kind='stable') \
+        .drop(columns=['_model', '_outcome']).reset_index(drop=True)
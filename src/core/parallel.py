@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Utilidades compartidas para repartir trabajo numérico en un pool de procesos.
+
+El estado pesado (tablas del panel, matrices de diseño) se envía una sola vez a cada
+proceso mediante el `initializer` del pool; las tareas sólo transportan índices y la
+función de cada tarea lo recupera con `worker_state()`.
+"""
+import os
+
+from .lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+futures = lazy_import('concurrent.futures')
+
+# Estado compartido del proceso actual, cargado por `map_in_pool` (ver `worker_state`).
+_WORKER_STATE = None
+
+
+def resolve_jobs(n_jobs=None):
+    """Convierte `n_jobs` en un número de procesos (None o <= 0 usa todos los núcleos)."""
+    if n_jobs is None or n_jobs <= 0:
+        return os.cpu_count() or 1
+    return int(n_jobs)
+
+
+def split_chunks(n_items, n_chunks):
+    """Divide el rango [0, n_items) en a lo sumo `n_chunks` bloques contiguos de índices."""
+    n_chunks = max(1, min(int(n_chunks), int(n_items)))
+    return [chunk for chunk in np.array_split(np.arange(n_items), n_chunks) if len(chunk)]
+
+
+def worker_state():
+    """
+    Devuelve el estado compartido que `map_in_pool` cargó en el proceso actual.
+
+    Raises:
+        RuntimeError: Si se llama fuera de una tarea de `map_in_pool`.
+    """
+    if _WORKER_STATE is None:
+        raise RuntimeError("No hay estado de trabajo cargado: la función debe ejecutarse con map_in_pool(state=...).")
+    return _WORKER_STATE
+
+
+def _init_process(state, initializer, initargs):
+    """Carga el estado compartido y ejecuta el `initializer` adicional en el proceso del pool."""
+    global _WORKER_STATE
+    _WORKER_STATE = state
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def map_in_pool(func, tasks, n_jobs=None, state=None, initializer=None, initargs=()):
+    """
+    Aplica `func` a cada tarea, en serie o en un pool de procesos.
+
+    `state` se envía una sola vez a cada proceso y `func` lo lee con `worker_state()`.
+    Con un solo proceso (o una sola tarea) se carga en el proceso actual, de modo que
+    `func` encuentra el mismo estado en ambos modos, y se descarta al terminar.
+
+    Args:
+        func (callable): Función a nivel de módulo (debe poder serializarse).
+        tasks (list): Argumentos de cada tarea.
+        n_jobs (int, optional): Número de procesos; None usa todos los núcleos.
+        state (optional): Estado compartido de las tareas (debe poder serializarse).
+        initializer (callable, optional): Preparación adicional de cada proceso (p. ej.
+                                          el backend de matplotlib).
+        initargs (tuple): Argumentos del `initializer`.
+
+    Returns:
+        list: Resultados en el mismo orden que `tasks`.
+    """
+    global _WORKER_STATE
+    tasks = list(tasks)
+    n_workers = min(resolve_jobs(n_jobs), len(tasks))
+    if n_workers <= 1:
+        previous = _WORKER_STATE
+        try:
+            _init_process(state, initializer, initargs)
+            return [func(task) for task in tasks]
+        finally:
+            _WORKER_STATE = previous
+
+    with futures.ProcessPoolExecutor(max_workers=n_workers, initializer=_init_process,
+                                     initargs=(state, initializer, initargs)) as executor:
+        return list(executor.map(func, tasks))
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Inferencia por permutación (aleatorización) para el modelo DiD.
+
+El tratamiento se reasigna en el espacio (a cada departamento donante) y en el tiempo
+(a cada año pre-intervención). Cada asignación placebo se estima con el motor DiD por
+lotes y el conjunto de estimaciones forma la distribución nula empírica. En el tiempo,
+el efecto observado y cada placebo se estiman con la misma regla de ventana (los
+mismos años antes y después del año asignado), de modo que se comparan estimaciones
+de igual longitud y tamaño de muestra. Los procesos del pool reciben una sola vez las
+sumas por (unidad, período); las tareas sólo transportan índices de unidades y años.
+"""
+import itertools
+import math
+
+from .batched_ols import batched_did
+from .lazy_imports import lazy_import
+from .parallel import map_in_pool, resolve_jobs, split_chunks, worker_state
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+
+def _fit_draws(task):
+    """Estima un bloque de asignaciones placebo y devuelve sus coeficientes y estadísticos t."""
+    treated_idx, specs = task
+    cells = worker_state()
+    treated = np.zeros((len(specs), len(cells.units)))
+    np.put_along_axis(treated, treated_idx, 1.0, axis=1)
+    table = batched_did(cells, treated, specs)
+    return table[['coef', 't_value']].to_numpy()
+
+
+class PermutationInference:
+    """
+    Calcula p-valores exactos de aleatorización para el efecto DiD.
+
+    Attributes:
+        draws (pd.DataFrame): Distribución nula empírica; una fila por asignación
+                              (incluida la observada) tras llamar a `run`.
+    """
+    def __init__(self, cells, treated_units, treatment_year, start_year=None, end_year=None,
+                 max_space_draws=10000, seed=None, n_jobs=None, chunk_size=2000, time_window=2):
+        """
+        Args:
+            cells (PanelCells): Sumas suficientes del panel.
+            treated_units (list): Unidades realmente tratadas.
+            treatment_year (int): Año real de la intervención.
+            start_year, end_year (int, optional): Ventana de estimación de la familia 'space';
+                                                  None usa el período completo.
+            max_space_draws (int): Límite de asignaciones en el espacio. Si el número de
+                                   combinaciones lo supera, se muestrean al azar.
+            seed (int, optional): Semilla para el muestreo de asignaciones.
+            n_jobs (int, optional): Procesos del pool; None usa todos los núcleos.
+            chunk_size (int): Asignaciones por tarea enviada al pool.
+            time_window (int): Años antes y después del año asignado con que se estiman el
+                               efecto observado y los placebos de la familia 'time': el año g
+                               usa [g - time_window, g + time_window - 1], y los placebos sólo
+                               usan años previos a la intervención.
+        """
+        self.cells = cells
+        self.treated_idx = np.flatnonzero(cells.unit_mask(treated_units))
+        if len(self.treated_idx) == 0:
+            raise ValueError(f"Ninguna de las unidades tratadas {list(treated_units)} está en el panel.")
+        self.treatment_year = treatment_year
+        self.start_year = start_year if start_year is not None else cells.periods.min()
+        self.end_year = end_year if end_year is not None else cells.periods.max()
+        self.max_space_draws = max_space_draws
+        self.rng = np.random.default_rng(seed)
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+        self.time_window = time_window
+        self.draws = None
+
+    def _space_assignments(self):
+        """Asignaciones en el espacio: todos los subconjuntos de unidades del mismo tamaño."""
+        n_units, n_treated = len(self.cells.units), len(self.treated_idx)
+        observed = tuple(self.treated_idx)
+        if math.comb(n_units, n_treated) <= self.max_space_draws:
+            others = [c for c in itertools.combinations(range(n_units), n_treated) if c != observed]
+            exact = True
+        else:
+            # Como en la enumeración exacta: asignaciones distintas y sin la observada.
+            seen, others = {observed}, []
+            while len(others) < self.max_space_draws - 1:
+                draw = tuple(np.sort(self.rng.choice(n_units, n_treated, replace=False)).tolist())
+                if draw not in seen:
+                    seen.add(draw)
+                    others.append(draw)
+            exact = False
+        assignments = np.array([observed] + others, dtype=int).reshape(-1, n_treated)
+        specs = [(self.treatment_year, self.start_year, self.end_year)] * len(assignments)
+        return assignments, specs, exact
+
+    def _time_assignments(self):
+        """
+        Asignaciones en el tiempo: cada año pre-intervención cuya ventana cabe en el
+        período previo, con la misma ventana alrededor del año asignado que el efecto observado.
+        """
+        first, width = self.cells.periods.min(), self.time_window
+        placebo_years = [int(y) for y in self.cells.periods
+                         if y - width >= first and y + width - 1 < self.treatment_year]
+        specs = [(int(year), int(year) - width, int(year) + width - 1)
+                 for year in [self.treatment_year] + placebo_years]
+        assignments = np.tile(self.treated_idx, (len(specs), 1))
+        return assignments, specs, True
+
+    def run(self, families=('space', 'time')):
+        """
+        Estima todas las asignaciones placebo y calcula los p-valores de aleatorización.
+
+        Args:
+            families (tuple): Familias de permutación a evaluar: 'space' y/o 'time'.
+
+        Returns:
+            pd.DataFrame: Resumen por familia con el efecto observado, el número de
+                          asignaciones y los p-valores basados en |coef| y en |t|.
+        """
+        builders = {'space': self._space_assignments, 'time': self._time_assignments}
+        frames, assignments, specs, exact = [], [], [], {}
+        for family in families:
+            fam_assignments, fam_specs, exact[family] = builders[family]()
+            frame = pd.DataFrame(fam_specs, columns=['treatment_year', 'start_year', 'end_year'])
+            frame.insert(0, 'family', family)
+            frame.insert(1, 'treated_units', [', '.join(self.cells.units[row]) for row in fam_assignments])
+            frame['is_observed'] = np.arange(len(frame)) == 0
+            frames.append(frame)
+            assignments.append(fam_assignments)
+            specs.extend(fam_specs)
+        draws = pd.concat(frames, ignore_index=True)
+        assignments = np.vstack(assignments)
+
+        n_chunks = max(resolve_jobs(self.n_jobs), int(np.ceil(len(specs) / self.chunk_size)))
+        tasks = [(assignments[chunk], [specs[i] for i in chunk]) for chunk in split_chunks(len(specs), n_chunks)]
+        results = map_in_pool(_fit_draws, tasks, n_jobs=self.n_jobs, state=self.cells)
+        draws[['coef', 't_value']] = np.vstack(results)
+        self.draws = draws
+
+        summary = []
+        for family, group in draws.groupby('family', sort=False):
+            observed = group[group['is_observed']].iloc[0]
+            summary.append({
+                'family': family,
+                'n_draws': len(group),
+                'exact': exact[family],
+                'observed_coef': observed['coef'],
+                'p_value_coef': (group['coef'].abs() >= abs(observed['coef']) - 1e-12).mean(),
+                'p_value_t': (group['t_value'].abs() >= abs(observed['t_value']) - 1e-12).mean(),
+            })
+        return pd.DataFrame(summary)
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Ejecutor de la cadena de análisis como un grafo de dependencias (DAG).
+
+Cada paso declara los pasos de los que depende, sus entradas (archivos o
+directorios: datos y código) y sus salidas. Un paso se omite si la huella de sus
+entradas no cambió desde su última ejecución exitosa y sus salidas existen; los pasos
+cuyas dependencias ya terminaron se ejecutan en paralelo en un pool de procesos, de
+modo que una actualización completa tarda lo que su ruta crítica.
+"""
+import hashlib
+import importlib
+import json
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from .data_manager import PROCESSED_DATA_PATH, resolve_processed_path
+from .instrumentation import profile_call
+from .parallel import resolve_jobs
+from .result_cache import path_fingerprint
+
+STATE_PATH = os.path.join('.cache', 'pipeline_state.json')
+
+
+@dataclass
+class Step:
+    """
+    Paso de la cadena de análisis.
+
+    Attributes:
+        name (str): Nombre del paso.
+        target (str): Función a ejecutar, como 'paquete.modulo:funcion' (se importa al ejecutarse).
+                      El paso falla si la función lanza una excepción o devuelve False
+                      (las funciones que registran un error y abortan).
+        depends_on (list): Pasos que deben terminar antes.
+        inputs (list): Archivos o directorios cuya huella decide si el paso se repite.
+                       PROCESSED_DATA_PATH se resuelve al formato del dataset procesado.
+        outputs (list): Archivos o directorios que el paso produce.
+        kwargs (dict): Argumentos de la función.
+        profile (bool): Ejecuta el paso bajo cProfile y guarda el perfil en su corrida. No
+                        forma parte de la huella; un paso perfilado se ejecuta aunque no
+                        haya cambios en sus entradas.
+    """
+    name: str
+    target: str
+    depends_on: list = field(default_factory=list)
+    inputs: list = field(default_factory=list)
+    outputs: list = field(default_factory=list)
+    kwargs: dict = field(default_factory=dict)
+    profile: bool = False
+
+
+def _resolve_path(path):
+    """Traduce la ruta base del dataset procesado a su archivo o directorio real."""
+    if path == PROCESSED_DATA_PATH:
+        try:
+            return resolve_processed_path(path)
+        except FileNotFoundError:
+            return None
+    return path if os.path.exists(path) else None
+
+
+class StepFailed(RuntimeError):
+    """La función de un paso abortó sin lanzar una excepción (devolvió False)."""
+
+
+def _run_step(target, kwargs, profile_label=None):
+    """
+    Importa y ejecuta la función de un paso (en el proceso del pool), bajo cProfile si se indica `profile_label`.
+
+    Raises:
+        StepFailed: Si la función devuelve False.
+    """
+    module_name, function_name = target.split(':')
+    function = getattr(importlib.import_module(module_name), function_name)
+    if profile_label is not None:
+        result = profile_call(function, label=profile_label, **kwargs)
+    else:
+        result = function(**kwargs)
+    if result is False:
+        raise StepFailed(f"'{target}' abortó; ver los errores registrados.")
+
+
+class Pipeline:
+    """Grafo de pasos con ejecución incremental y paralela."""
+    def __init__(self, steps, state_path=STATE_PATH):
+        """
+        Args:
+            steps (list): Pasos (`Step`) del grafo.
+            state_path (str): Archivo JSON con la huella de la última ejecución de cada paso.
+        """
+        self.steps = {step.name: step for step in steps}
+        self.state_path = state_path
+        for step in steps:
+            unknown = [d for d in step.depends_on if d not in self.steps]
+            if unknown:
+                raise ValueError(f"El paso '{step.name}' depende de pasos inexistentes: {unknown}")
+
+    def plan(self, targets):
+        """
+        Devuelve los pasos necesarios para `targets` (con sus dependencias) en orden topológico.
+
+        Raises:
+            ValueError: Si un paso no existe o el grafo tiene ciclos.
+        """
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name not in self.steps:
+                raise ValueError(f"Paso desconocido: '{name}'.")
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"El grafo de pasos tiene un ciclo en '{name}'.")
+            visiting.add(name)
+            for dependency in self.steps[name].depends_on:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for target in targets:
+            visit(target)
+        return order
+
+    def fingerprint(self, name):
+        """Huella de un paso: su especificación y el contenido de todas sus entradas."""
+        step = self.steps[name]
+        digest = hashlib.sha256(json.dumps([step.target, step.kwargs], sort_keys=True, default=str).encode('utf-8'))
+        for path in step.inputs:
+            resolved = _resolve_path(path)
+            digest.update(f"{path}={path_fingerprint(resolved) if resolved else 'missing'};".encode('utf-8'))
+        return digest.hexdigest()
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_state(self, state):
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        temporary = f"{self.state_path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(temporary, self.state_path)
+
+    def _is_fresh(self, name, fingerprint, state):
+        outputs_exist = all(_resolve_path(path) is not None for path in self.steps[name].outputs)
+        return state.get(name) == fingerprint and outputs_exist
+
+    def run(self, targets, n_jobs=1, force=False):
+        """
+        Ejecuta los pasos necesarios para `targets`.
+
+        Un paso se lanza en cuanto todas sus dependencias terminaron; su huella se calcula
+        en ese momento, cuando las salidas de las dependencias ya están escritas.
+
+        Args:
+            targets (list): Pasos objetivo.
+            n_jobs (int): Pasos simultáneos; None o <= 0 usa todos los núcleos.
+            force (bool): Ejecuta todos los pasos aunque sus entradas no hayan cambiado.
+
+        Returns:
+            dict: Estado final de cada paso: 'ok', 'skipped', 'failed' o 'blocked'.
+        """
+        order = self.plan(targets)
+        state = self._load_state()
+        status = {}
+        running = {}
+        n_workers = min(resolve_jobs(n_jobs), len(order))
+
+        def ready(name):
+            return name not in status and name not in running.values() and \
+                all(status.get(d) in ('ok', 'skipped') for d in self.steps[name].depends_on)
+
+        with ProcessPoolExecutor(max_workers=max(1, n_workers)) as executor:
+            while len(status) < len(order):
+                for name in order:
+                    if name in status or name in running.values():
+                        continue
+                    if any(status.get(d) in ('failed', 'blocked') for d in self.steps[name].depends_on):
+                        status[name] = 'blocked'
+                        logging.error(f"[pipeline] '{name}' no se ejecuta: falló una de sus dependencias.")
+                    elif ready(name):
+                        fingerprint = self.fingerprint(name)
+                        step = self.steps[name]
+                        if not force and not step.profile and self._is_fresh(name, fingerprint, state):
+                            status[name] = 'skipped'
+                            logging.info(f"[pipeline] '{name}' sin cambios en sus entradas; se omite.")
+                        elif len(running) < n_workers:
+                            logging.info(f"[pipeline] Iniciando '{name}'{' (con cProfile)' if step.profile else ''}...")
+                            future = executor.submit(_run_step, step.target, step.kwargs,
+                                                     name if step.profile else None)
+                            future.fingerprint = fingerprint
+                            running[future] = name
+                if not running:
+                    continue
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                    except (Exception, SystemExit) as e:
+                        # Un paso fallido no guarda su huella: se reintenta en la próxima corrida.
+                        status[name] = 'failed'
+                        if state.pop(name, None) is not None:
+                            self._save_state(state)
+                        logging.error(f"[pipeline] '{name}' falló: {e}")
+                        continue
+                    status[name] = 'ok'
+                    state[name] = future.fingerprint
+                    self._save_state(state)
+                    logging.info(f"[pipeline] '{name}' completado.")
+        return status
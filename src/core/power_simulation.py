@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Simulación de Monte Carlo de la potencia y el tamaño del diseño DiD.
+
+Los paneles simulados tienen la forma del panel real (unidades, años y celdas
+observadas): a la media del modelo nulo se le suman residuos remuestreados del modelo
+DiD o del estudio de eventos y, en las celdas tratadas posteriores a la intervención,
+un efecto conocido. Cada réplica sólo aporta al DiD sus sumas por (grupo, período), y
+el efecto inyectado desplaza esas sumas de forma exacta, así que todas las réplicas,
+efectos y ventanas se resuelven con el motor de MCO por lotes (`ols_from_moments`)
+en lugar de una regresión por panel simulado. Las réplicas se reparten en bloques
+entre los procesos del pool, cada uno con su propia semilla derivada.
+"""
+from .batched_ols import DID_TERMS, _DID_CELL_DESIGN, ols_from_moments
+from .lazy_imports import lazy_import
+from .parallel import map_in_pool, worker_state
+from .sensitivity import FULL_WINDOW
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+BASELINES = ('did', 'event_study')
+RESAMPLING = ('unit', 'iid')
+DEFAULT_EFFECT_MULTIPLES = (0.0, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0)
+
+
+def null_model(cells, treated, treatment_year, baseline='did'):
+    """
+    Media sin efecto y residuos del modelo base sobre el panel real.
+
+    Con 'did' se usan los residuos de `deforestacion_anual ~ tratado + post_treatment + did`
+    (desvíos respecto de la media de cada grupo y período) y la media nula de las celdas
+    tratadas posteriores descuenta el coeficiente 'did'. Con 'event_study' se usan los
+    residuos de efectos fijos de unidad y año de las unidades de control: en el estudio
+    de eventos la unidad tratada tiene un coeficiente por año relativo, de modo que sus
+    residuos son nulos y no aportan al remuestreo.
+
+    Args:
+        cells (PanelCells): Sumas suficientes del panel (una observación por celda).
+        treated (np.ndarray): Vector booleano de unidades tratadas.
+        treatment_year (int): Año de la intervención.
+        baseline (str): 'did' o 'event_study'.
+
+    Returns:
+        tuple: (media nula (unidades, períodos), residuos (mismas dimensiones; NaN en
+               las celdas sin dato), vector booleano de unidades cuyos residuos se remuestrean).
+    """
+    if baseline not in BASELINES:
+        raise ValueError(f"Modelo base desconocido: '{baseline}'. Usa {list(BASELINES)}.")
+    observed = cells.n > 0
+    y = np.where(observed, cells.s / np.where(observed, cells.n, 1.0), np.nan)
+    treated = np.asarray(treated, dtype=bool)
+    post = cells.periods >= treatment_year
+
+    if baseline == 'did':
+        groups = treated[:, None].astype(int) * 2 + post[None, :].astype(int)
+        means = np.array([np.nanmean(y[groups == g]) for g in range(4)])
+        fitted = means[groups]
+        mean = fitted.copy()
+        # Sin efecto, la celda (tratado, post) sigue la tendencia del control: m10 + m01 - m00.
+        mean[groups == 3] = means[2] + means[1] - means[0]
+        return mean, y - fitted, np.ones(len(cells.units), dtype=bool)
+
+    control = ~treated
+    rows, cols = np.nonzero(observed & control[:, None])
+    n_units, n_periods = y.shape
+    design = np.zeros((len(rows), n_units + n_periods))
+    design[np.arange(len(rows)), rows] = 1.0
+    design[np.arange(len(rows)), n_units + cols] = 1.0
+    coef = np.linalg.lstsq(design, y[rows, cols], rcond=None)[0]
+    unit_effects, period_effects = coef[:n_units], coef[n_units:]
+    # El nivel de cada unidad tratada se fija con sus años pre-intervención.
+    for unit in np.flatnonzero(treated):
+        pre = observed[unit] & ~post
+        unit_effects[unit] = np.mean(y[unit, pre] - period_effects[pre])
+    mean = unit_effects[:, None] + period_effects[None, :]
+    residuals = np.where(control[:, None], y - mean, 0.0)
+    return mean, np.where(observed, residuals, np.nan), control
+
+
+def window_bounds(treatment_year, window, first, last):
+    """
+    Ventana de estimación de la simulación: todo el período previo y `window` años desde
+    la intervención ('full': el panel completo).
+    """
+    if window == FULL_WINDOW:
+        return first, last
+    return first, min(last, treatment_year + int(window) - 1)
+
+
+def _simulate(task):
+    """Simula un bloque de réplicas y acumula rechazos y momentos de la estimación por (efecto, ventana)."""
+    n_reps, seed = task
+    state = worker_state()
+    rng = np.random.default_rng(seed)
+    mean, pool, observed = state['mean'], state['pool'], state['observed']
+    n_units, n_periods = mean.shape
+
+    if state['resampling'] == 'unit':
+        # Cada unidad recibe la serie completa de residuos de una unidad al azar del conjunto
+        # remuestreado: se conserva la autocorrelación en el tiempo.
+        noise = pool[rng.integers(len(pool), size=(n_reps, n_units))]
+    else:
+        values = pool[np.isfinite(pool)]
+        noise = rng.choice(values, size=(n_reps, n_units, n_periods))
+    y = np.where(observed, mean + np.nan_to_num(noise), 0.0)
+
+    effects = state['effects']
+    design = np.asarray(_DID_CELL_DESIGN)
+    did_index = DID_TERMS.index('did')
+    shape = (len(effects), len(state['groups']))
+    rejections, coef_sum, coef_sq_sum = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+    for column, groups in enumerate(state['groups']):
+        # groups: celda DiD (0-3) de cada (unidad, período) en la ventana; -1 fuera de ella.
+        one_hot = (groups[..., None] == np.arange(4)).astype(float) * observed[..., None]
+        n_cell = one_hot.sum(axis=(0, 1))
+        s_cell = np.einsum('rut,utc->rc', y, one_hot)
+        q_cell = np.einsum('rut,utc->rc', y * y, one_hot)
+        # El efecto sólo desplaza la celda (tratado, post): S + d n, Q + 2 d S + d^2 n.
+        s = np.repeat(s_cell[:, None, :], len(effects), axis=1)
+        q = np.repeat(q_cell[:, None, :], len(effects), axis=1)
+        q[:, :, 3] += 2 * effects[None, :] * s_cell[:, None, 3] + effects[None, :] ** 2 * n_cell[3]
+        s[:, :, 3] += effects[None, :] * n_cell[3]
+
+        n_systems = n_reps * len(effects)
+        xtx = np.broadcast_to(np.einsum('c,ci,cj->ij', n_cell, design, design), (n_systems, 4, 4))
+        fit = ols_from_moments(xtx, s.reshape(n_systems, 4) @ design, q.reshape(n_systems, 4).sum(axis=1),
+                               np.full(n_systems, n_cell.sum()))
+        coef = fit['params'][:, did_index].reshape(n_reps, len(effects))
+        p_value = fit['pvalues'][:, did_index].reshape(n_reps, len(effects))
+        rejections[:, column] = (p_value < state['alpha']).sum(axis=0)
+        coef_sum[:, column] = coef.sum(axis=0)
+        coef_sq_sum[:, column] = (coef ** 2).sum(axis=0)
+    return rejections, coef_sum, coef_sq_sum, n_reps
+
+
+class PowerSimulation:
+    """
+    Potencia y tamaño (tasa de rechazo sin efecto) del modelo DiD por efecto y ventana.
+
+    Attributes:
+        residual_sd (float): Desviación estándar de los residuos remuestreados; la grilla
+                             de efectos por defecto se expresa en múltiplos de ella.
+    """
+    def __init__(self, cells, treated_units, treatment_year, baseline='did', resampling='unit'):
+        """
+        Args:
+            cells (PanelCells): Sumas suficientes del panel real.
+            treated_units (list): Unidades tratadas.
+            treatment_year (int): Año de la intervención.
+            baseline (str): Modelo cuyos residuos se remuestrean: 'did' o 'event_study'.
+            resampling (str): 'unit' (series completas de residuos por unidad) o 'iid'
+                              (cada celda recibe un residuo al azar).
+        """
+        if resampling not in RESAMPLING:
+            raise ValueError(f"Remuestreo desconocido: '{resampling}'. Usa {list(RESAMPLING)}.")
+        treated = cells.unit_mask(treated_units)
+        if not treated.any():
+            raise ValueError(f"Ninguna de las unidades tratadas {list(treated_units)} está en el panel.")
+        self.cells = cells
+        self.treated = treated
+        self.treatment_year = treatment_year
+        self.baseline = baseline
+        self.resampling = resampling
+        self.mean, residuals, pool_units = null_model(cells, treated, treatment_year, baseline)
+        self.pool = residuals[pool_units]
+        self.residual_sd = float(np.nanstd(self.pool))
+
+    def _window_groups(self, windows):
+        """Celda DiD de cada (unidad, período) para cada ventana, y sus límites."""
+        periods = self.cells.periods
+        post = periods >= self.treatment_year
+        cell = self.treated[:, None].astype(int) + 2 * post[None, :].astype(int)
+        groups, bounds = [], []
+        for window in windows:
+            start, end = window_bounds(self.treatment_year, window, periods.min(), periods.max())
+            inside = (periods >= start) & (periods <= end)
+            groups.append(np.where(inside[None, :], cell, -1))
+            bounds.append((int(start), int(end)))
+        return groups, bounds
+
+    def run(self, effects=None, windows=(3, 5, 10, FULL_WINDOW), n_reps=2000, alpha=0.05, seed=None,
+            n_jobs=None, chunk_size=250):
+        """
+        Simula los paneles y estima el DiD en cada réplica, efecto y ventana.
+
+        Args:
+            effects (list, optional): Efectos inyectados (miles de ha por año); por defecto,
+                                      múltiplos de la desviación estándar de los residuos.
+            windows (list): Años desde la intervención incluidos (enteros) o 'full'; la
+                            ventana incluye siempre todo el período previo.
+            n_reps (int): Réplicas de Monte Carlo.
+            alpha (float): Nivel de la prueba t del coeficiente 'did'.
+            seed (int, optional): Semilla; los bloques usan semillas derivadas, así que el
+                                  resultado no depende del número de procesos.
+            n_jobs (int, optional): Procesos del pool; None usa todos los núcleos.
+            chunk_size (int): Réplicas por bloque enviado al pool.
+
+        Returns:
+            pd.DataFrame: Una fila por (efecto, ventana) con 'rejection_rate' (tamaño con
+                          efecto 0, potencia en otro caso), su error de Monte Carlo, la
+                          estimación promedio, el sesgo y el RMSE.
+        """
+        if effects is None:
+            effects = [round(m * self.residual_sd, 4) for m in DEFAULT_EFFECT_MULTIPLES]
+        effects = np.asarray(effects, dtype=float)
+        windows = list(windows)
+        groups, bounds = self._window_groups(windows)
+
+        sizes = [min(chunk_size, n_reps - start) for start in range(0, n_reps, chunk_size)]
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        state = {'mean': self.mean, 'pool': self.pool, 'observed': self.cells.n > 0, 'groups': groups,
+                 'effects': effects, 'alpha': alpha, 'resampling': self.resampling}
+        results = map_in_pool(_simulate, list(zip(sizes, seeds)), n_jobs=n_jobs, state=state)
+        rejections = sum(result[0] for result in results)
+        coef_sum = sum(result[1] for result in results)
+        coef_sq_sum = sum(result[2] for result in results)
+
+        rate = rejections / n_reps
+        mean_coef = coef_sum / n_reps
+        table = pd.DataFrame({
+            'effect': np.repeat(effects, len(windows)),
+            'window': [str(window) for window in windows] * len(effects),
+            'start_year': [start for start, _ in bounds] * len(effects),
+            'end_year': [end for _, end in bounds] * len(effects),
+            'n_reps': n_reps,
+            'rejection_rate': rate.ravel(),
+            'mc_std_err': np.sqrt(rate * (1 - rate) / n_reps).ravel(),
+            'mean_estimate': mean_coef.ravel(),
+            'bias': (mean_coef - effects[:, None]).ravel(),
+            'rmse': np.sqrt(np.maximum(coef_sq_sum / n_reps - 2 * effects[:, None] * mean_coef
+                                       + effects[:, None] ** 2, 0.0)).ravel(),
+        })
+        return table
+
+
+def detectable_effects(table, power=0.8):
+    """
+    Menor efecto con la potencia indicada en cada ventana, interpolando la curva de potencia.
+
+    Returns:
+        pd.DataFrame: 'window', 'size' (tasa de rechazo con efecto 0) y 'detectable_effect'
+                      (NaN si la potencia no se alcanza en la grilla).
+    """
+    rows = []
+    for window, curve in table.groupby('window', sort=False):
+        curve = curve.sort_values('effect')
+        size = curve.loc[curve['effect'] == 0, 'rejection_rate']
+        rates, effects = curve['rejection_rate'].to_numpy(), curve['effect'].to_numpy()
+        reached = np.flatnonzero(rates >= power)
+        if not len(reached):
+            detectable = np.nan
+        elif reached[0] == 0:
+            detectable = effects[0]
+        else:
+            i = reached[0]
+            detectable = np.interp(power, rates[i - 1:i + 1], effects[i - 1:i + 1])
+        rows.append({'window': window, 'size': size.iloc[0] if len(size) else np.nan,
+                     'detectable_effect': detectable})
+    return pd.DataFrame(rows)
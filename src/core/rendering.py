@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Servicio de renderizado de figuras en un pool de procesos.
+
+Cada figura se describe como datos (`FigureJob`): la función que la dibuja (como
+'paquete.modulo:funcion'), los datos ya calculados, la plantilla de estilo y la ruta
+de salida. Los trabajos se reparten en un pool de procesos con el backend Agg; cada
+proceso construye una sola vez las plantillas pre-estilizadas (ejes, rejilla,
+etiquetas fijas) y las reutiliza entre figuras, limpiando sólo lo que dibujó cada
+trabajo.
+
+Por defecto las figuras se guardan en resolución de borrador (PREVIEW_DPI); la
+resolución de publicación (FINAL_DPI) se pide explícitamente con `final=True`.
+"""
+import importlib
+import os
+from dataclasses import dataclass, field
+
+from .instrumentation import span
+from .lazy_imports import lazy_import
+from .parallel import map_in_pool
+from .visualization_utils import TEMPLATE_STYLES
+
+matplotlib = lazy_import('matplotlib')
+plt = lazy_import('matplotlib.pyplot')
+ticker = lazy_import('matplotlib.ticker')
+
+PREVIEW_DPI = 100
+FINAL_DPI = 300
+
+
+def figure_dpi(final=False):
+    """Resolución de guardado: FINAL_DPI si se pide la versión final, PREVIEW_DPI si no."""
+    return FINAL_DPI if final else PREVIEW_DPI
+
+
+@dataclass
+class FigureJob:
+    """
+    Descripción de una figura a renderizar.
+
+    Attributes:
+        renderer (str): Función de dibujo, como 'paquete.modulo:funcion'. Recibe
+                        `(fig, ax, **data)`; `ax` es None si el trabajo no usa plantilla
+                        y la función crea sus propios ejes.
+        output_path (str): Ruta del archivo de imagen.
+        data (dict): Datos y textos de la figura (deben poder serializarse).
+        template (str, optional): Plantilla de `TEMPLATE_STYLES`; None crea una figura nueva.
+        figsize (tuple): Tamaño de la figura en pulgadas.
+        tight (bool): Recorta los márgenes al guardar (bbox_inches='tight').
+    """
+    renderer: str
+    output_path: str
+    data: dict = field(default_factory=dict)
+    template: str = 'base'
+    figsize: tuple = (12, 7)
+    tight: bool = True
+
+
+class FigureTemplate:
+    """
+    Figura con el estilo fijo de una plantilla ya aplicado, reutilizable entre trabajos.
+
+    Tras cada trabajo, `reset` elimina los elementos que éste añadió y restaura
+    títulos, etiquetas, marcas y límites al estado de la plantilla.
+    """
+    def __init__(self, name, figsize):
+        self.name = name
+        self.fig, self.ax = plt.subplots(figsize=figsize)
+        TEMPLATE_STYLES[name](self.ax, self.fig)
+        self._children = set(self.ax.get_children())
+        self._fig_texts = list(self.fig.texts)
+        self._labels = (self.ax.get_xlabel(), self.ax.get_ylabel())
+        self._limits = (self.ax.get_xlim(), self.ax.get_ylim())
+        params = self.fig.subplotpars
+        self._subplot_params = dict(left=params.left, right=params.right, bottom=params.bottom,
+                                    top=params.top, wspace=params.wspace, hspace=params.hspace)
+
+    @property
+    def reusable(self):
+        """Los ejes categóricos (unidades de texto) no se pueden restaurar; la plantilla se descarta."""
+        return self.ax.xaxis.get_units() is None and self.ax.yaxis.get_units() is None
+
+    def reset(self):
+        """Devuelve la figura al estado de la plantilla."""
+        ax, fig = self.ax, self.fig
+        for container in list(ax.containers):
+            container.remove()
+        legend = ax.get_legend()
+        if legend is not None:
+            legend.remove()
+        for artist in ax.get_children():
+            if artist not in self._children and artist.axes is not None:
+                artist.remove()
+        for text in list(fig.texts):
+            if text not in self._fig_texts:
+                text.remove()
+        fig.suptitle('')
+        for loc in ('left', 'center', 'right'):
+            ax.set_title('', loc=loc)
+        ax.set_xlabel(self._labels[0])
+        ax.set_ylabel(self._labels[1])
+        for axis in (ax.xaxis, ax.yaxis):
+            axis.set_major_locator(ticker.AutoLocator())
+            axis.set_major_formatter(ticker.ScalarFormatter())
+        ax.relim()
+        ax.ignore_existing_data_limits = True
+        ax.set_xlim(self._limits[0])
+        ax.set_ylim(self._limits[1])
+        ax.set_autoscale_on(True)
+        fig.subplots_adjust(**self._subplot_params)
+
+    def close(self):
+        plt.close(self.fig)
+
+
+# Estado de cada proceso del pool (ver `_init_worker`).
+_WORKER_STATE = None
+
+
+def _release_templates():
+    """Cierra las plantillas del proceso actual."""
+    global _WORKER_STATE
+    if _WORKER_STATE is not None:
+        for template in _WORKER_STATE['templates'].values():
+            template.close()
+    _WORKER_STATE = None
+
+
+def _init_worker(dpi):
+    """Prepara el proceso del pool: backend Agg, resolución y caché de plantillas vacía."""
+    global _WORKER_STATE
+    matplotlib.use('Agg')
+    plt.switch_backend('Agg')
+    _release_templates()
+    _WORKER_STATE = {'dpi': dpi, 'templates': {}}
+
+
+def _resolve_renderer(renderer):
+    module_name, function_name = renderer.split(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def _render(job):
+    """Dibuja y guarda un trabajo en el proceso actual."""
+    draw = _resolve_renderer(job.renderer)
+    templates = _WORKER_STATE['templates']
+    template = None
+    if job.template is not None:
+        key = (job.template, tuple(job.figsize))
+        template = templates.get(key)
+        if template is None:
+            template = templates[key] = FigureTemplate(job.template, job.figsize)
+        fig, ax = template.fig, template.ax
+    else:
+        fig, ax = plt.figure(figsize=job.figsize), None
+
+    try:
+        draw(fig, ax, **job.data)
+        os.makedirs(os.path.dirname(job.output_path) or '.', exist_ok=True)
+        fig.savefig(job.output_path, dpi=_WORKER_STATE['dpi'], bbox_inches='tight' if job.tight else None)
+    finally:
+        if template is None:
+            plt.close(fig)
+        elif template.reusable:
+            template.reset()
+        else:
+            template.close()
+            del templates[(job.template, tuple(job.figsize))]
+    return job.output_path
+
+
+@span('render')
+def render_figures(jobs, n_jobs=None, final=False):
+    """
+    Renderiza una lista de figuras, en paralelo si hay más de una.
+
+    Args:
+        jobs (list): Trabajos (`FigureJob`).
+        n_jobs (int, optional): Procesos del pool; None usa todos los núcleos.
+        final (bool): Guarda a FINAL_DPI (publicación) en lugar de PREVIEW_DPI (borrador).
+
+    Returns:
+        list: Rutas de las figuras guardadas, en el orden de `jobs`.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    try:
+        return map_in_pool(_render, jobs, n_jobs=n_jobs, initializer=_init_worker, initargs=(figure_dpi(final),))
+    finally:
+        # En modo serie las plantillas viven en el proceso actual.
+        _release_templates()
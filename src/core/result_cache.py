@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Caché persistente de resultados, direccionada por contenido.
+
+Cada entrada se identifica con el hash SHA-256 de tres componentes:
+- la huella del dataset procesado (contenido de sus archivos),
+- la especificación del modelo o del script (fórmula, ventana, unidad y año de
+  tratamiento, opciones del estimador), serializada como JSON canónico,
+- la versión del código (contenido de todos los módulos de `src`).
+
+Una entrada puede guardar un objeto serializado (p. ej. una tabla de coeficientes o
+un resultado de statsmodels) y/o artefactos (reportes y gráficos de una corrida). El
+tamaño total en disco está acotado: al superarlo se eliminan las entradas usadas
+menos recientemente (LRU).
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import time
+
+from .data_manager import PROCESSED_DATA_PATH, resolve_processed_path
+from .instrumentation import METRICS_FILENAME, PROFILE_FILENAME, PROFILE_SUMMARY_FILENAME
+
+CACHE_DIR = os.path.join('.cache', 'results')
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+# Variable de entorno que desactiva la caché (p. ej. RESULT_CACHE=off).
+CACHE_ENV_VAR = 'RESULT_CACHE'
+
+_SRC_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+_RESULT_FILE = 'result.pkl'
+_ARTIFACTS_DIR = 'artifacts'
+# Archivos de una corrida que no se guardan como artefactos (describen la corrida, no sus productos).
+_SKIPPED_ARTIFACTS = ('run.log', METRICS_FILENAME, f"{METRICS_FILENAME}.tmp", PROFILE_FILENAME,
+                      PROFILE_SUMMARY_FILENAME)
+
+_file_digests = {}
+_code_version = None
+
+
+def _file_digest(path):
+    """Hash del contenido de un archivo, memorizado por (ruta, tamaño, fecha de modificación)."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_digests:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _file_digests[memo_key] = digest.hexdigest()
+    return _file_digests[memo_key]
+
+
+def path_fingerprint(root, suffix=None):
+    """Hash de todos los archivos bajo `root` (o del propio archivo), en orden determinista."""
+    if os.path.isfile(root):
+        return _file_digest(root)
+    digest = hashlib.sha256()
+    for directory, subdirs, files in os.walk(root):
+        subdirs[:] = sorted(d for d in subdirs if d != '__pycache__')
+        for name in sorted(files):
+            if suffix is None or name.endswith(suffix):
+                path = os.path.join(directory, name)
+                digest.update(os.path.relpath(path, root).replace(os.sep, '/').encode('utf-8'))
+                digest.update(_file_digest(path).encode('ascii'))
+    return digest.hexdigest()
+
+
+def dataset_fingerprint(path=PROCESSED_DATA_PATH):
+    """
+    Huella del dataset procesado que cargaría `load_processed_data`.
+
+    Args:
+        path (str): Ruta base del dataset (con o sin extensión).
+
+    Returns:
+        str: Hash hexadecimal del contenido del dataset.
+
+    Raises:
+        FileNotFoundError: Si el dataset no existe en ningún formato.
+    """
+    return path_fingerprint(resolve_processed_path(path))
+
+
+def code_version():
+    """Hash del contenido de los módulos de `src` (se calcula una vez por proceso)."""
+    global _code_version
+    if _code_version is None:
+        _code_version = path_fingerprint(_SRC_ROOT, suffix='.py')
+    return _code_version
+
+
+def cache_enabled():
+    """Indica si la caché está activa (se desactiva con RESULT_CACHE=off)."""
+    return os.environ.get(CACHE_ENV_VAR, 'on').lower() not in ('0', 'off', 'false', 'no')
+
+
+class ResultCache:
+    """
+    Caché en disco de resultados y artefactos, con desalojo LRU por tamaño.
+
+    La fecha de modificación del directorio de cada entrada registra su último uso.
+    """
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, enabled=None):
+        """
+        Args:
+            cache_dir (str): Directorio raíz de la caché.
+            max_bytes (int): Tamaño máximo total de la caché en disco.
+            enabled (bool, optional): Activa o desactiva la caché; por defecto, según la
+                                      variable de entorno RESULT_CACHE.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = cache_enabled() if enabled is None else enabled
+
+    def key(self, spec, data_path=PROCESSED_DATA_PATH):
+        """
+        Calcula la clave de una especificación para el dataset y el código actuales.
+
+        Args:
+            spec (dict): Especificación serializable en JSON (los valores no estándar
+                         se convierten a texto).
+            data_path (str): Ruta base del dataset procesado.
+
+        Returns:
+            str: Clave hexadecimal SHA-256.
+        """
+        payload = json.dumps({
+            'dataset': dataset_fingerprint(data_path),
+            'spec': spec,
+            'code': code_version(),
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _touch(self, entry):
+        now = time.time()
+        os.utime(entry, (now, now))
+
+    def get(self, key, default=None):
+        """Devuelve el objeto guardado bajo `key`, o `default` si no existe."""
+        path = os.path.join(self._entry_dir(key), _RESULT_FILE)
+        if not self.enabled or not os.path.exists(path):
+            return default
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except Exception as e:
+            logging.warning(f"Entrada de caché ilegible ({key[:12]}); se descarta. Error: {e}")
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            return default
+        self._touch(self._entry_dir(key))
+        return value
+
+    def put(self, key, value):
+        """Guarda `value` bajo `key` y aplica el límite de tamaño."""
+        if not self.enabled:
+            return
+        entry = self._entry_dir(key)
+        os.makedirs(entry, exist_ok=True)
+        temporary = os.path.join(entry, f"{_RESULT_FILE}.{os.getpid()}.tmp")
+        with open(temporary, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, os.path.join(entry, _RESULT_FILE))
+        self._touch(entry)
+        self.evict()
+
+    def get_or_compute(self, spec, compute, data_path=PROCESSED_DATA_PATH):
+        """
+        Devuelve el resultado guardado para `spec` o lo calcula y lo guarda.
+
+        Args:
+            spec (dict): Especificación del cálculo.
+            compute (callable): Función sin argumentos que produce el resultado.
+            data_path (str): Ruta base del dataset procesado.
+
+        Returns:
+            object: Resultado recuperado o recién calculado.
+        """
+        if not self.enabled:
+            return compute()
+        key = self.key(spec, data_path)
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def restore_artifacts(self, key, run_dir):
+        """
+        Copia en `run_dir` los artefactos guardados bajo `key`.
+
+        Returns:
+            list: Rutas de los archivos restaurados, o None si no hay artefactos guardados.
+        """
+        source = os.path.join(self._entry_dir(key), _ARTIFACTS_DIR)
+        if not self.enabled or not os.path.isdir(source):
+            return None
+        restored = []
+        for directory, _, files in os.walk(source):
+            for name in sorted(files):
+                relative = os.path.relpath(os.path.join(directory, name), source)
+                target = os.path.join(run_dir, relative)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copy2(os.path.join(directory, name), target)
+                restored.append(target)
+        self._touch(self._entry_dir(key))
+        return restored
+
+    def store_artifacts(self, key, run_dir):
+        """Guarda bajo `key` los archivos producidos en `run_dir` (salvo el log y las métricas de la corrida)."""
+        if not self.enabled:
+            return
+        target = os.path.join(self._entry_dir(key), _ARTIFACTS_DIR)
+        temporary = f"{target}.{os.getpid()}.tmp"
+        shutil.rmtree(temporary, ignore_errors=True)
+        shutil.copytree(run_dir, temporary, ignore=shutil.ignore_patterns(*_SKIPPED_ARTIFACTS))
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(temporary, target)
+        self._touch(self._entry_dir(key))
+        self.evict()
+
+    def evict(self):
+        """Elimina las entradas menos usadas hasta que la caché quepa en `max_bytes`."""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry = os.path.join(prefix_dir, key)
+                size = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(entry) for f in files)
+                entries.append((os.path.getmtime(entry), size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """Vacía la caché."""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Barrido de sensibilidad del modelo DiD y de la prueba de tendencias paralelas sobre
+una grilla de años de intervención y ventanas de estimación.
+
+El panel se carga y se resume una sola vez: los procesos del pool reciben, como estado
+compartido de `map_in_pool`, las sumas por (departamento, período) y las celdas
+comprimidas por (grupo, período); cada tarea sólo transporta un bloque de años de la grilla.
+"""
+import re
+
+from .batched_ols import PanelCells, batched_did
+from .lazy_imports import lazy_import
+from .parallel import map_in_pool, resolve_jobs, split_chunks, worker_state
+from .sufficient_stats import cell_ols, compress_panel
+from .treatment import TreatmentAssignment
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+FULL_WINDOW = 'full'
+PRE_TREND_FORMULA = 'deforestacion_anual ~ tratado + año_norm + tratado:año_norm'
+PRE_TREND_TERM = 'tratado:año_norm'
+
+
+def parse_years(text):
+    """
+    Interpreta una lista de años como '1999-2015', '2005,2012' o una combinación.
+
+    Returns:
+        list: Años ordenados y sin repetir.
+
+    Raises:
+        ValueError: Si algún elemento no es un año ni un rango válido.
+    """
+    years = set()
+    for part in str(text).split(','):
+        part = part.strip()
+        match = re.fullmatch(r'(\d{4})\s*-\s*(\d{4})', part)
+        if match:
+            first, last = int(match.group(1)), int(match.group(2))
+            if first > last:
+                raise ValueError(f"Rango de años inválido: '{part}'.")
+            years.update(range(first, last + 1))
+        elif re.fullmatch(r'\d{4}', part):
+            years.add(int(part))
+        else:
+            raise ValueError(f"Año o rango inválido: '{part}'. Usa p. ej. '1999-2015' o '2005,2012'.")
+    return sorted(years)
+
+
+def parse_windows(text):
+    """
+    Interpreta una lista de ventanas como '3,4,5,full'.
+
+    Una ventana entera w estima el modelo entre el año de intervención y w - 1 años
+    después; 'full' usa el período completo.
+
+    Returns:
+        list: Ventanas (enteros positivos y/o 'full') en el orden indicado.
+
+    Raises:
+        ValueError: Si alguna ventana no es un entero positivo ni 'full'.
+    """
+    windows = []
+    for part in str(text).split(','):
+        part = part.strip().lower()
+        if part == FULL_WINDOW:
+            windows.append(FULL_WINDOW)
+        elif part.isdigit() and int(part) > 0:
+            windows.append(int(part))
+        else:
+            raise ValueError(f"Ventana inválida: '{part}'. Usa enteros positivos o 'full'.")
+    return list(dict.fromkeys(windows))
+
+
+def window_bounds(year, window):
+    """Devuelve (start_year, end_year) de una ventana; None indica el período completo."""
+    if window == FULL_WINDOW:
+        return None, None
+    return year, year + int(window) - 1
+
+
+def _pre_trend_test(group_cells, year):
+    """Prueba de tendencias paralelas para un año de intervención, sobre celdas comprimidas."""
+    cells = group_cells[group_cells['Periodo'] < year].copy()
+    if cells['Periodo'].nunique() < 2 or cells['tratado'].nunique() < 2:
+        return np.nan, np.nan
+    cells['año_norm'] = cells['Periodo'] - cells['Periodo'].min()
+    result = cell_ols(PRE_TREND_FORMULA, cells)
+    return result.params[PRE_TREND_TERM], result.pvalues[PRE_TREND_TERM]
+
+
+def _fit_years(task):
+    """Estima la grilla completa de ventanas para un bloque de años."""
+    years, windows = task
+    state = worker_state()
+    specs, labels = [], []
+    for year in years:
+        for window in windows:
+            specs.append((year,) + window_bounds(year, window))
+            labels.append(str(window))
+
+    table = batched_did(state['cells'], state['treated'], specs)
+    table.insert(1, 'window', labels)
+    pre_trends = {year: _pre_trend_test(state['group_cells'], year) for year in years}
+    table['pre_trend_coef'] = [pre_trends[year][0] for year in table['treatment_year']]
+    table['pre_trend_p_value'] = [pre_trends[year][1] for year in table['treatment_year']]
+    return table
+
+
+class SensitivitySweep:
+    """
+    Estima el efecto DiD y la prueba de tendencias paralelas para cada combinación
+    (año de intervención, ventana) de la grilla.
+    """
+    def __init__(self, df, treated_units, years, windows, n_jobs=None):
+        """
+        Args:
+            df (pd.DataFrame): Panel procesado (se resume una sola vez).
+            treated_units (str or list): Departamento(s) tratado(s).
+            years (list): Años de intervención candidatos.
+            windows (list): Ventanas: enteros (años desde la intervención) y/o 'full'.
+            n_jobs (int, optional): Procesos del pool; None usa todos los núcleos.
+        """
+        self.treated_units = [treated_units] if isinstance(treated_units, str) else list(treated_units)
+        self.years = [int(year) for year in years]
+        self.windows = list(windows)
+        self.n_jobs = n_jobs
+
+        cells = PanelCells(df)
+        panel = df[['departamento', 'Periodo', 'deforestacion_anual']].copy()
+        treatment = TreatmentAssignment.from_units(self.treated_units, self.years[0])
+        panel['tratado'] = treatment.codes(panel['departamento'])[0].astype(int)
+        self._state = {
+            'cells': cells,
+            'treated': treatment.unit_mask(cells.units),
+            'group_cells': compress_panel(panel, ['tratado', 'Periodo']),
+        }
+        self.periods = cells.periods
+
+    def run(self):
+        """
+        Ejecuta el barrido en el pool de procesos.
+
+        Returns:
+            pd.DataFrame: Una fila por (año, ventana) con el efecto DiD (coeficiente,
+                          error estándar, p-valor, intervalo), la ventana efectiva y la
+                          prueba de tendencias paralelas del año.
+        """
+        chunks = split_chunks(len(self.years), resolve_jobs(self.n_jobs))
+        tasks = [([self.years[i] for i in chunk], self.windows) for chunk in chunks]
+        results = map_in_pool(_fit_years, tasks, n_jobs=self.n_jobs, state=self._state)
+        table = pd.concat(results, ignore_index=True)
+
+        # Ventana efectiva: el panel puede terminar antes que la ventana solicitada.
+        first, last = self.periods.min(), self.periods.max()
+        table['start_year'] = table['start_year'].fillna(first).clip(lower=first)
+        table['end_year'] = table['end_year'].fillna(last).clip(upper=last)
+        table['truncated'] = [
+            window != FULL_WINDOW and year + int(window) - 1 > last
+            for year, window in zip(table['treatment_year'], table['window'])
+        ]
+        return table.rename(columns={'treatment_year': 'year'})
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Diferencias en diferencias con adopción escalonada: efectos por cohorte y período
+(ATT(g,t), al estilo de Callaway y Sant'Anna, 2021) y sus agregaciones.
+
+Cada ATT(g,t) es una comparación 2x2: el cambio medio de la cohorte g entre el
+período base y t, menos el mismo cambio en el grupo de control (unidades nunca
+tratadas o aún no tratadas en t). En un panel balanceado esas diferencias sólo
+dependen de la tabla de medias por (cohorte, período), que se calcula una sola vez;
+todas las comparaciones se arman a partir de ella con operaciones vectorizadas.
+
+La inferencia usa la función de influencia de cada ATT(g,t) por unidad (conglomerado)
+y un bootstrap multiplicador: cada réplica es un producto matricial entre pesos
+aleatorios por unidad y esa matriz, repartido en bloques en un pool de procesos. Las
+agregaciones son combinaciones lineales de los ATT(g,t), de modo que sus réplicas se
+obtienen de las mismas; sus pesos (tamaños de cohorte) se tratan como fijos.
+"""
+from .lazy_imports import lazy_import
+from .parallel import map_in_pool, resolve_jobs, split_chunks, worker_state
+from .wild_bootstrap import RADEMACHER_WEIGHTS, WEBB_WEIGHTS
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+stats = lazy_import('scipy.stats')
+
+CONTROL_GROUPS = ('never_treated', 'not_yet_treated')
+BASE_PERIODS = ('varying', 'universal')
+AGGREGATIONS = ('event_time', 'calendar', 'group', 'overall')
+_MULTIPLIER_WEIGHTS = {'rademacher': RADEMACHER_WEIGHTS, 'webb': WEBB_WEIGHTS}
+
+
+class CohortPanel:
+    """
+    Panel balanceado agrupado por cohorte de adopción.
+
+    Los períodos en que falta alguna unidad se descartan (`dropped_periods`).
+
+    Attributes:
+        units (np.ndarray): Unidades ordenadas.
+        periods (np.ndarray): Períodos ordenados.
+        Y (np.ndarray): Variable de resultado (unidades x períodos).
+        cohorts (np.ndarray): Año de adopción de cada cohorte, ordenado; np.inf identifica
+                              a las unidades nunca tratadas.
+        unit_cohort (np.ndarray): Índice de la cohorte de cada unidad.
+        sizes (np.ndarray): Unidades por cohorte.
+        means (np.ndarray): Media de la variable de resultado por (cohorte, período).
+    """
+    def __init__(self, df, first_treatment, outcome='deforestacion_anual', unit_col='departamento',
+                 period_col='Periodo', keep_always_treated=False):
+        """
+        Args:
+            df (pd.DataFrame): Panel en formato largo.
+            first_treatment (dict): Año de adopción por unidad; las unidades ausentes (o
+                                    con None, 0 o NaN) se consideran nunca tratadas.
+            outcome, unit_col, period_col (str): Columnas del panel.
+            keep_always_treated (bool): Conserva las unidades tratadas desde el primer
+                                        período (cohorte igual al primer período); el
+                                        ATT(g,t) las excluye porque no tienen período base.
+
+        Raises:
+            ValueError: Si menos de dos períodos están completos o no hay cohortes tratadas
+                        con al menos un período previo a la adopción.
+        """
+        Y = df.pivot_table(index=unit_col, columns=period_col, values=outcome, observed=True)
+        # Las comparaciones suponen un panel balanceado: se descartan los períodos con
+        # alguna unidad sin observación.
+        incomplete = Y.isna().any(axis=0)
+        self.dropped_periods = Y.columns[incomplete].tolist()
+        Y = Y.loc[:, ~incomplete]
+        if Y.shape[1] < 2:
+            raise ValueError("El panel no tiene al menos dos períodos observados para todas las unidades.")
+        self.units = np.asarray(Y.index, dtype=object)
+        self.periods = Y.columns.to_numpy()
+        self.Y = Y.to_numpy(dtype=float)
+
+        first = np.array([first_treatment.get(unit) for unit in self.units], dtype=float)
+        first = np.where(np.isnan(first) | (first <= 0), np.inf, first)
+        # Las unidades tratadas desde el primer período no tienen un período base.
+        first = np.maximum(first, self.periods.min())
+        always_treated = (first <= self.periods.min()) & (not keep_always_treated)
+        if always_treated.any():
+            self.units, self.Y, first = self.units[~always_treated], self.Y[~always_treated], first[~always_treated]
+        self.excluded_units = list(Y.index[always_treated])
+
+        self.cohorts, self.unit_cohort = np.unique(first, return_inverse=True)
+        if not np.isfinite(self.cohorts).any():
+            raise ValueError("No hay cohortes tratadas con al menos un período previo a la adopción.")
+        self.sizes = np.bincount(self.unit_cohort, minlength=len(self.cohorts)).astype(float)
+        sums = np.zeros((len(self.cohorts), len(self.periods)))
+        np.add.at(sums, self.unit_cohort, self.Y)
+        self.means = sums / self.sizes[:, None]
+
+
+def _bootstrap_chunk(task):
+    """Desviaciones bootstrap (réplicas x ATT(g,t)) para un bloque de réplicas."""
+    seed, n_reps = task
+    rng = np.random.default_rng(seed)
+    state = worker_state()
+    influence = state['influence']
+    support = np.asarray(_MULTIPLIER_WEIGHTS[state['weight_type']])
+    weights = rng.choice(support, size=(n_reps, influence.shape[0]))
+    return weights @ influence / influence.shape[0]
+
+
+class StaggeredDiD:
+    """
+    Estimador de efectos por cohorte y período con adopción escalonada.
+    """
+    def __init__(self, panel, control_group='not_yet_treated', base_period='varying', anticipation=0):
+        """
+        Args:
+            panel (CohortPanel): Panel agrupado por cohorte.
+            control_group (str): 'never_treated' (sólo unidades nunca tratadas) o
+                                 'not_yet_treated' (también las cohortes aún no tratadas).
+            base_period (str): 'varying' compara cada período pre-adopción con el anterior;
+                               'universal' compara todos los períodos con g - 1 - anticipation.
+            anticipation (int): Períodos de anticipación del tratamiento.
+        """
+        if control_group not in CONTROL_GROUPS:
+            raise ValueError(f"Grupo de control no soportado: '{control_group}'. Usa {list(CONTROL_GROUPS)}.")
+        if base_period not in BASE_PERIODS:
+            raise ValueError(f"Período base no soportado: '{base_period}'. Usa {list(BASE_PERIODS)}.")
+        self.panel = panel
+        self.control_group = control_group
+        self.base_period = base_period
+        self.anticipation = int(anticipation)
+        self._pairs = self._build_pairs()
+
+    def _build_pairs(self):
+        """Índices (cohorte, período, período base) de todas las comparaciones 2x2 estimables."""
+        panel = self.panel
+        periods = panel.periods
+        treated_cohorts = np.flatnonzero(np.isfinite(panel.cohorts))
+        g_idx, t_idx = [a.ravel() for a in np.meshgrid(treated_cohorts, np.arange(len(periods)), indexing='ij')]
+        g_year, t_year = panel.cohorts[g_idx], periods[t_idx]
+
+        # Período base: g - 1 - anticipación para los períodos post (y todos, con 'universal');
+        # el período anterior para los períodos pre-adopción con 'varying'.
+        universal_base = np.searchsorted(periods, g_year - 1 - self.anticipation, side='right') - 1
+        pre = t_year < g_year - self.anticipation
+        b_idx = np.where(pre & (self.base_period == 'varying'), t_idx - 1, universal_base)
+        valid = (b_idx >= 0) & (b_idx != t_idx) & (universal_base >= 0)
+        g_idx, t_idx, b_idx = g_idx[valid], t_idx[valid], b_idx[valid]
+
+        # Cohortes de control de cada comparación (cohortes x comparaciones).
+        cohort_year = panel.cohorts[:, None]
+        if self.control_group == 'never_treated':
+            control = np.repeat(~np.isfinite(cohort_year), len(g_idx), axis=1)
+        else:
+            latest = np.maximum(periods[t_idx], periods[b_idx])[None, :]
+            control = cohort_year > latest + self.anticipation
+        control &= np.arange(len(panel.cohorts))[:, None] != g_idx[None, :]
+        return {'g': g_idx, 't': t_idx, 'b': b_idx, 'control': control}
+
+    def group_time_att(self):
+        """
+        Calcula todos los ATT(g,t) a partir de la tabla de medias por (cohorte, período).
+
+        Returns:
+            pd.DataFrame: Una fila por comparación con la cohorte, el período, el tiempo
+                          relativo, el período base, el ATT y el número de unidades
+                          tratadas y de control (NaN si no hay controles).
+        """
+        panel, pairs = self.panel, self._pairs
+        g, t, b, control = pairs['g'], pairs['t'], pairs['b'], pairs['control']
+        treated_change = panel.means[g, t] - panel.means[g, b]
+        # Cambio medio del grupo de control: promedio de las cohortes ponderado por su tamaño.
+        control_weights = control * panel.sizes[:, None]
+        n_control = control_weights.sum(axis=0)
+        cohort_changes = panel.means[:, t] - panel.means[:, b]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            control_change = (control_weights * cohort_changes).sum(axis=0) / n_control
+        return pd.DataFrame({
+            'cohort': panel.cohorts[g].astype(int),
+            'period': panel.periods[t],
+            'event_time': (panel.periods[t] - panel.cohorts[g]).astype(int),
+            'base_period': panel.periods[b],
+            'att': np.where(n_control > 0, treated_change - control_change, np.nan),
+            'n_treated': panel.sizes[g].astype(int),
+            'n_control': n_control.astype(int),
+        })
+
+    def influence_functions(self):
+        """
+        Función de influencia de cada ATT(g,t) por unidad, escalada por el número de
+        unidades N (ATT = N^-1 * suma de contribuciones).
+
+        Returns:
+            np.ndarray: Matriz (unidades x comparaciones).
+        """
+        panel, pairs = self.panel, self._pairs
+        g, t, b, control = pairs['g'], pairs['t'], pairs['b'], pairs['control']
+        n_units = len(panel.units)
+        change = panel.Y[:, t] - panel.Y[:, b]
+        is_treated = panel.unit_cohort[:, None] == g[None, :]
+        is_control = control[panel.unit_cohort]
+        n_treated, n_control = is_treated.sum(axis=0), is_control.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            treated_mean = (change * is_treated).sum(axis=0) / n_treated
+            control_mean = (change * is_control).sum(axis=0) / n_control
+            influence = n_units * (is_treated * (change - treated_mean) / n_treated
+                                   - is_control * (change - control_mean) / n_control)
+        influence[:, n_control == 0] = 0.0
+        return influence
+
+    def aggregation_weights(self, att_gt):
+        """
+        Pesos de cada agregación sobre los ATT(g,t) válidos.
+
+        - 'event_time': por tiempo relativo e, promedio de ATT(g, g+e) ponderado por el tamaño de cohorte.
+        - 'calendar': por período t, promedio de los ATT(g,t) post-adopción de las cohortes ya tratadas.
+        - 'group': por cohorte, promedio simple de sus ATT(g,t) post-adopción.
+        - 'overall': promedio de los efectos por cohorte ponderado por el tamaño de cohorte.
+
+        Returns:
+            dict: Nombre de la agregación -> (etiquetas, matriz de pesos comparaciones x etiquetas).
+        """
+        valid = att_gt['att'].notna().to_numpy()
+        size = np.where(valid, att_gt['n_treated'].to_numpy(dtype=float), 0.0)
+        post = valid & (att_gt['event_time'].to_numpy() >= 0)
+
+        def normalized(keys, mask, weight):
+            labels = np.unique(keys[mask])
+            matrix = (keys[:, None] == labels[None, :]) * (mask * weight)[:, None]
+            return labels, matrix / matrix.sum(axis=0, keepdims=True)
+
+        event_labels, event_w = normalized(att_gt['event_time'].to_numpy(), valid, size)
+        calendar_labels, calendar_w = normalized(att_gt['period'].to_numpy(), post, size)
+        group_labels, group_w = normalized(att_gt['cohort'].to_numpy(), post, np.ones(len(att_gt)))
+        cohort_sizes = att_gt.drop_duplicates('cohort').set_index('cohort')['n_treated'].reindex(group_labels)
+        shares = cohort_sizes.to_numpy(dtype=float) / cohort_sizes.sum()
+        return {
+            'event_time': (event_labels, event_w),
+            'calendar': (calendar_labels, calendar_w),
+            'group': (group_labels, group_w),
+            'overall': (np.array(['overall']), group_w @ shares[:, None]),
+        }
+
+    def fit(self, n_reps=999, alpha=0.05, seed=None, n_jobs=None, weight_type='rademacher', chunk_size=250):
+        """
+        Estima los ATT(g,t), sus agregaciones y su inferencia.
+
+        Args:
+            n_reps (int): Réplicas del bootstrap multiplicador; con 0 se usan errores
+                          estándar analíticos (a partir de la función de influencia).
+            alpha (float): Nivel de significancia de los intervalos.
+            seed (int, optional): Semilla del bootstrap.
+            n_jobs (int, optional): Procesos del pool; None usa todos los núcleos.
+            weight_type (str): Pesos del bootstrap: 'rademacher' o 'webb'.
+            chunk_size (int): Réplicas por tarea del pool.
+
+        Returns:
+            dict: Tablas 'att_gt', 'event_time', 'calendar', 'group' y 'overall' con el
+                  efecto, su error estándar e intervalos puntuales ('ci_*'); 'att_gt' y
+                  'event_time' incluyen además bandas uniformes ('cb_*', con el valor
+                  crítico sup-t del bootstrap). También 'n_reps' y 'n_units'.
+        """
+        if weight_type not in _MULTIPLIER_WEIGHTS:
+            raise ValueError(f"Tipo de pesos no soportado: '{weight_type}'. Usa 'rademacher' o 'webb'.")
+        att_gt = self.group_time_att()
+        influence = self.influence_functions()
+        valid = att_gt['att'].notna().to_numpy()
+        n_units = influence.shape[0]
+        aggregations = self.aggregation_weights(att_gt)
+
+        if n_reps > 0:
+            chunks = split_chunks(n_reps, max(resolve_jobs(n_jobs), -(-n_reps // chunk_size)))
+            seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+            state = {'influence': influence[:, valid], 'weight_type': weight_type}
+            deviations = np.concatenate(map_in_pool(_bootstrap_chunk, [(s, len(c)) for s, c in zip(seeds, chunks)],
+                                                    n_jobs=n_jobs, state=state))
+        else:
+            deviations = None
+
+        def summarize(estimates, weights, uniform):
+            """Errores estándar e intervalos de combinaciones lineales de los ATT(g,t) (None: los propios ATT)."""
+            if deviations is not None:
+                draws = deviations if weights is None else deviations @ weights
+                std_err = draws.std(axis=0, ddof=1)
+            else:
+                draws = None
+                contributions = influence[:, valid] if weights is None else influence[:, valid] @ weights
+                std_err = np.sqrt((contributions ** 2).sum(axis=0)) / n_units
+            z = stats.norm.ppf(1 - alpha / 2)
+            table = {'att': estimates, 'std_err': std_err,
+                     'ci_lower': estimates - z * std_err, 'ci_upper': estimates + z * std_err}
+            if uniform:
+                if draws is not None and len(estimates) > 0:
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        sup_t = np.nanmax(np.abs(draws) / std_err, axis=1)
+                    critical = np.quantile(sup_t, 1 - alpha)
+                else:
+                    critical = z
+                table.update(cb_lower=estimates - critical * std_err, cb_upper=estimates + critical * std_err)
+            return table
+
+        gt_summary = summarize(att_gt.loc[valid, 'att'].to_numpy(), None, uniform=True)
+        for column, values in gt_summary.items():
+            if column != 'att':
+                att_gt.loc[valid, column] = values
+
+        results = {'att_gt': att_gt, 'n_reps': int(n_reps), 'n_units': n_units}
+        att_values = att_gt.loc[valid, 'att'].to_numpy()
+        for name, (labels, weights) in aggregations.items():
+            weights = weights[valid]
+            summary = summarize(att_values @ weights, weights, uniform=name == 'event_time')
+            key = {'event_time': 'event_time', 'calendar': 'period', 'group': 'cohort', 'overall': 'aggregation'}[name]
+            results[name] = pd.DataFrame(dict({key: labels}, **summary))
+        return results
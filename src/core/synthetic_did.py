@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""
+Diferencias en diferencias sintéticas (SDID, Arkhangelsky et al. 2021).
+
+El estimador pondera las unidades de control (pesos ω, como en el control sintético)
+y los años pre-intervención (pesos λ) antes de comparar, de modo que queda entre el
+DiD clásico (pesos iguales) y el SCM (sólo pesos de unidades). Ambos conjuntos de
+pesos resuelven mínimos cuadrados regularizados sobre el simplex con intercepto, y se
+obtienen con Frank-Wolfe sobre la matriz unidad x año, como en la implementación de
+referencia (`synthdid`): una primera pasada corta, una poda de pesos pequeños y una
+segunda pasada hasta que la pérdida deja de disminuir.
+
+El solucionador trabaja por lotes: K problemas que comparten la matriz de datos y
+difieren en las filas y columnas admitidas (p. ej. cada réplica placebo excluye a sus
+pseudo-tratadas). La varianza placebo resuelve así todas las réplicas de un bloque a
+la vez, partiendo de los pesos del ajuste principal; la varianza jackknife reutiliza
+los pesos del ajuste principal sin volver a resolver.
+"""
+import itertools
+import math
+
+from .lazy_imports import lazy_import
+from .parallel import map_in_pool, resolve_jobs, split_chunks, worker_state
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+stats = lazy_import('scipy.stats')
+
+VARIANCE_METHODS = ('placebo', 'jackknife')
+
+
+def frank_wolfe_simplex(A, b, zeta, x0=None, row_mask=None, col_mask=None, min_decrease=1e-5, max_iter=10000):
+    """
+    Resuelve por lotes  min_{x0, x}  ||x0 + A x - b||² / R + ζ² ||x||²  con x en el simplex.
+
+    El intercepto x0 se elimina centrando las columnas de A y b en las filas de cada
+    problema. Se usan pasos de Frank-Wolfe por pares (del peso activo con mayor gradiente
+    al vértice con menor gradiente) con el paso óptimo exacto de la cuadrática: a
+    diferencia del paso clásico, convergen linealmente con la regularización ζ > 0. Un
+    problema se detiene cuando su pérdida disminuye menos que `min_decrease`² entre
+    iteraciones.
+
+    Args:
+        A (np.ndarray): Matriz (R, C) compartida, o (K, R, C).
+        b (np.ndarray): Objetivos (K, R).
+        zeta (np.ndarray): Regularización ζ de cada problema (K,).
+        x0 (np.ndarray, optional): Puntos de partida (K, C); por defecto, pesos uniformes.
+        row_mask (np.ndarray, optional): Filas usadas por cada problema (K, R).
+        col_mask (np.ndarray, optional): Columnas (pesos) admitidas en cada problema (K, C).
+        min_decrease (float or np.ndarray): Tolerancia de cada problema.
+        max_iter (int): Máximo de iteraciones.
+
+    Returns:
+        tuple: (pesos (K, C), iteraciones realizadas).
+    """
+    b = np.atleast_2d(np.asarray(b, dtype=float))
+    n_problems, n_rows = b.shape
+    A = np.broadcast_to(np.asarray(A, dtype=float), (n_problems, n_rows, np.shape(A)[-1]))
+    rows = np.ones(b.shape) if row_mask is None else np.asarray(row_mask, dtype=float)
+    cols = np.ones((n_problems, A.shape[2]), dtype=bool) if col_mask is None else np.asarray(col_mask, dtype=bool)
+    n_used = rows.sum(axis=1)
+
+    # Centrado en las filas de cada problema (intercepto) y filas excluidas en cero.
+    A = (A - np.einsum('kr,krc->kc', rows, A)[:, None, :] / n_used[:, None, None]) * rows[:, :, None]
+    b = (b - (rows * b).sum(axis=1, keepdims=True) / n_used[:, None]) * rows
+    zeta = np.broadcast_to(np.asarray(zeta, dtype=float), (n_problems,))
+    eta = n_used * zeta ** 2
+    tolerance = np.broadcast_to(np.asarray(min_decrease, dtype=float), (n_problems,)) ** 2
+
+    x = cols / cols.sum(axis=1, keepdims=True) if x0 is None else np.where(cols, x0, 0.0).astype(float)
+    weights = x
+    Ax = np.einsum('krc,kc->kr', A, x)
+    live = np.arange(n_problems)
+    active = np.ones(n_problems, dtype=bool)
+    previous = np.full(n_problems, np.inf)
+    for iteration in range(1, max_iter + 1):
+        if active.sum() <= len(live) // 2:
+            # Los problemas que ya convergieron salen del lote para no seguir iterándolos.
+            weights[live] = x
+            A, b, cols, x, Ax, eta, zeta, n_used, tolerance, previous, live = (
+                array[active] for array in (A, b, cols, x, Ax, eta, zeta, n_used, tolerance, previous, live))
+            active = active[active]
+        index = np.arange(len(live))
+        residual = Ax - b
+        half_gradient = np.einsum('krc,kr->kc', A, residual) + eta[:, None] * x
+        toward = np.argmin(np.where(cols, half_gradient, np.inf), axis=1)
+        away = np.argmax(np.where(x > 0, half_gradient, -np.inf), axis=1)
+        # Paso por pares: traslada peso del vértice activo con mayor gradiente al de menor
+        # gradiente; A·d = A[:, hacia] - A[:, desde], así que el paso exacto usa dos columnas.
+        direction_error = A[index, :, toward] - A[index, :, away]
+        numerator = -((direction_error * residual).sum(axis=1) + eta * (x[index, toward] - x[index, away]))
+        denominator = (direction_error ** 2).sum(axis=1) + 2 * eta * (toward != away)
+        step = np.where(denominator > 0, numerator / np.where(denominator > 0, denominator, 1.0), 0.0)
+        step = np.clip(step, 0.0, x[index, away]) * active
+        x[index, toward] += step
+        x[index, away] -= step
+        Ax = Ax + step[:, None] * direction_error
+
+        value = zeta ** 2 * (x ** 2).sum(axis=1) + ((Ax - b) ** 2).sum(axis=1) / n_used
+        if iteration > 1:
+            active &= previous - value > tolerance
+        previous = value
+        if not active.any():
+            break
+    weights[live] = x
+    return weights, iteration
+
+
+def _sparsify(x):
+    """Anula los pesos menores que la cuarta parte del máximo y renormaliza (como `synthdid`)."""
+    x = np.where(x <= x.max(axis=1, keepdims=True) / 4, 0.0, x)
+    return x / x.sum(axis=1, keepdims=True)
+
+
+def _noise_level(Y_pre, control_rows):
+    """Desviación estándar de las primeras diferencias pre-intervención de los controles de cada problema."""
+    diffs = np.diff(Y_pre, axis=1)
+    counts = control_rows.sum(axis=1) * diffs.shape[1]
+    sums = control_rows @ diffs.sum(axis=1)
+    squares = control_rows @ (diffs ** 2).sum(axis=1)
+    return np.sqrt(np.maximum(squares - sums ** 2 / counts, 0.0) / (counts - 1))
+
+
+def solve_weights(Y, n_pre, treated_rows, control_rows, n_post_treated, omega0=None, lambda0=None,
+                  max_iter_pre_sparsify=100, max_iter=10000):
+    """
+    Pesos de unidades y de años del SDID para K problemas sobre una misma matriz.
+
+    Args:
+        Y (np.ndarray): Resultados (unidades, períodos), con los pre-intervención primero.
+        n_pre (int): Períodos pre-intervención.
+        treated_rows (np.ndarray): Unidades tratadas de cada problema (K, unidades).
+        control_rows (np.ndarray): Unidades de control de cada problema (K, unidades).
+        n_post_treated (np.ndarray): N1 * T1 de cada problema, para la regularización (K,).
+        omega0, lambda0 (np.ndarray, optional): Puntos de partida (K, unidades) y (K, n_pre).
+        max_iter_pre_sparsify, max_iter (int): Iteraciones antes y después de la poda.
+
+    Returns:
+        tuple: (ω (K, unidades), λ (K, n_pre)).
+    """
+    Y_pre, Y_post = Y[:, :n_pre], Y[:, n_pre:]
+    treated_rows = np.asarray(treated_rows, dtype=float)
+    control_rows = np.asarray(control_rows, dtype=bool)
+    noise = _noise_level(Y_pre, control_rows.astype(float))
+    min_decrease = 1e-5 * noise
+
+    # Pesos de unidades: filas = años pre, columnas = unidades de control.
+    treated_pre = treated_rows @ Y_pre / treated_rows.sum(axis=1, keepdims=True)
+    zeta_omega = n_post_treated ** 0.25 * noise
+    omega = frank_wolfe_simplex(Y_pre.T, treated_pre, zeta_omega, x0=omega0, col_mask=control_rows,
+                                min_decrease=min_decrease, max_iter=max_iter_pre_sparsify)[0]
+    omega = frank_wolfe_simplex(Y_pre.T, treated_pre, zeta_omega, x0=_sparsify(omega), col_mask=control_rows,
+                                min_decrease=min_decrease, max_iter=max_iter)[0]
+
+    # Pesos de años: filas = unidades de control, columnas = años pre.
+    control_post = np.broadcast_to(Y_post.mean(axis=1), (len(control_rows), len(Y)))
+    zeta_lambda = 1e-6 * noise
+    lambda_ = frank_wolfe_simplex(Y_pre, control_post, zeta_lambda, x0=lambda0, row_mask=control_rows,
+                                  min_decrease=min_decrease, max_iter=max_iter_pre_sparsify)[0]
+    lambda_ = frank_wolfe_simplex(Y_pre, control_post, zeta_lambda, x0=_sparsify(lambda_), row_mask=control_rows,
+                                  min_decrease=min_decrease, max_iter=max_iter)[0]
+    return omega, lambda_
+
+
+def sdid_estimates(Y, n_pre, treated_rows, omega, lambda_):
+    """
+    Efecto SDID de cada problema dados sus pesos.
+
+    τ = (ȳ_tr,post - λ'ȳ_tr,pre) - (ω'ȳ_co,post - ω'Y_co,pre λ)
+
+    Returns:
+        np.ndarray: Estimaciones (K,).
+    """
+    Y_pre, Y_post = Y[:, :n_pre], Y[:, n_pre:]
+    treated_rows = np.asarray(treated_rows, dtype=float)
+    treated_rows = treated_rows / treated_rows.sum(axis=1, keepdims=True)
+    treated_gap = treated_rows @ Y_post.mean(axis=1) - np.einsum('ku,ut,kt->k', treated_rows, Y_pre, lambda_)
+    control_gap = omega @ Y_post.mean(axis=1) - np.einsum('ku,ut,kt->k', omega, Y_pre, lambda_)
+    return treated_gap - control_gap
+
+
+def _placebo_task(assignments):
+    """Resuelve en un lote las réplicas placebo de un bloque (pseudo-tratadas por fila)."""
+    state = worker_state()
+    Y, n_pre, controls = state['Y'], state['n_pre'], state['controls']
+    pseudo_treated = np.zeros((len(assignments), len(Y)), dtype=bool)
+    np.put_along_axis(pseudo_treated, assignments, True, axis=1)
+    control_rows = controls[None, :] & ~pseudo_treated
+    # Punto de partida: pesos del ajuste principal restringidos a los controles de la réplica.
+    omega0 = np.where(control_rows, state['omega'], 0.0)
+    totals = omega0.sum(axis=1, keepdims=True)
+    omega0 = np.where(totals > 0, omega0 / np.where(totals > 0, totals, 1.0),
+                      control_rows / control_rows.sum(axis=1, keepdims=True))
+    lambda0 = np.broadcast_to(state['lambda'], (len(assignments), n_pre))
+    n_post_treated = np.full(len(assignments), assignments.shape[1] * (Y.shape[1] - n_pre), dtype=float)
+    omega, lambda_ = solve_weights(Y, n_pre, pseudo_treated, control_rows, n_post_treated,
+                                   omega0=omega0, lambda0=lambda0)
+    return sdid_estimates(Y, n_pre, pseudo_treated, omega, lambda_)
+
+
+class SyntheticDiD:
+    """
+    Estimador de diferencias en diferencias sintéticas sobre un panel balanceado.
+
+    Attributes:
+        units (np.ndarray): Unidades (controles primero, luego las tratadas).
+        periods (np.ndarray): Períodos usados (pre-intervención primero).
+        dropped_periods (list): Períodos descartados por tener alguna unidad sin dato.
+    """
+    def __init__(self, df, treated_units, treatment_year, outcome='deforestacion_anual',
+                 unit_col='departamento', period_col='Periodo'):
+        """
+        Args:
+            df (pd.DataFrame): Panel en formato largo.
+            treated_units (list): Unidades tratadas (todas desde `treatment_year`).
+            treatment_year (int): Año de la intervención.
+            outcome, unit_col, period_col (str): Columnas del panel.
+        """
+        table = df.pivot_table(index=unit_col, columns=period_col, values=outcome, observed=True)
+        complete = table.notna().all(axis=0)
+        self.dropped_periods = [int(p) for p in table.columns[~complete]]
+        table = table.loc[:, complete]
+        treated = table.index.isin(list(treated_units))
+        if not treated.any():
+            raise ValueError(f"Ninguna de las unidades tratadas {list(treated_units)} está en el panel.")
+        if treated.all():
+            raise ValueError("No hay unidades de control.")
+        periods = table.columns.to_numpy()
+        pre = periods < treatment_year
+        if pre.sum() < 2 or (~pre).sum() < 1:
+            raise ValueError(f"El SDID requiere al menos dos períodos antes de {treatment_year} y uno después.")
+
+        table = table.iloc[np.argsort(treated, kind='stable')]
+        self.units = np.asarray(table.index, dtype=object)
+        self.periods = periods
+        self.treatment_year = treatment_year
+        self.n_pre = int(pre.sum())
+        self.n_treated = int(treated.sum())
+        self.Y = table.to_numpy(dtype=float)
+        self.treated = np.zeros(len(self.units), dtype=bool)
+        self.treated[-self.n_treated:] = True
+        self.omega = self.lambda_ = None
+
+    def fit(self):
+        """
+        Estima los pesos y el efecto SDID.
+
+        Returns:
+            dict: 'estimate' (SDID), 'did_estimate' (pesos iguales), 'unit_weights' y
+                  'time_weights' (pd.Series) y 'trajectories' (tratadas y controles
+                  ponderados por período).
+        """
+        treated_rows = self.treated[None, :]
+        n_post_treated = np.array([self.n_treated * (len(self.periods) - self.n_pre)], dtype=float)
+        omega, lambda_ = solve_weights(self.Y, self.n_pre, treated_rows, ~treated_rows, n_post_treated)
+        self.omega, self.lambda_ = omega[0], lambda_[0]
+        estimate = sdid_estimates(self.Y, self.n_pre, treated_rows, omega, lambda_)[0]
+
+        controls = ~self.treated
+        uniform_omega = (controls / controls.sum())[None, :]
+        uniform_lambda = np.full((1, self.n_pre), 1.0 / self.n_pre)
+        did_estimate = sdid_estimates(self.Y, self.n_pre, treated_rows, uniform_omega, uniform_lambda)[0]
+        # Trayectoria de los controles ponderados, desplazada para coincidir con la tratada
+        # en el promedio ponderado por λ del período previo (como en los gráficos de `synthdid`).
+        treated_path = self.Y[self.treated].mean(axis=0)
+        control_path = self.omega @ self.Y
+        offset = self.lambda_ @ (treated_path - control_path)[:self.n_pre]
+        return {
+            'estimate': float(estimate),
+            'did_estimate': float(did_estimate),
+            'unit_weights': pd.Series(self.omega[controls], index=self.units[controls], name='omega'),
+            'time_weights': pd.Series(self.lambda_, index=self.periods[:self.n_pre], name='lambda'),
+            'trajectories': pd.DataFrame({'treated': treated_path, 'synthetic': control_path + offset},
+                                         index=pd.Index(self.periods, name='Periodo')),
+        }
+
+    def placebo_variance(self, n_reps=200, seed=None, n_jobs=None, chunk_size=50):
+        """
+        Varianza placebo: cada réplica asigna el tratamiento a tantos controles como
+        unidades tratadas hay y re-estima el SDID sólo con los controles.
+
+        Si las asignaciones distintas no superan `n_reps` se evalúan todas; si no, se
+        muestrean. Requiere haber llamado a `fit` (sus pesos son el punto de partida).
+
+        Returns:
+            tuple: (varianza, estimaciones placebo).
+        """
+        controls = np.flatnonzero(~self.treated)
+        if len(controls) <= self.n_treated:
+            raise ValueError("La varianza placebo requiere más controles que unidades tratadas.")
+        rng = np.random.default_rng(seed)
+        if math.comb(len(controls), self.n_treated) <= n_reps:
+            assignments = np.array(list(itertools.combinations(controls, self.n_treated)))
+        else:
+            assignments = np.array([np.sort(rng.choice(controls, self.n_treated, replace=False))
+                                    for _ in range(n_reps)])
+
+        n_chunks = max(resolve_jobs(n_jobs), int(np.ceil(len(assignments) / chunk_size)))
+        state = {'Y': self.Y, 'n_pre': self.n_pre, 'controls': ~self.treated, 'omega': self.omega,
+                 'lambda': self.lambda_}
+        results = map_in_pool(_placebo_task, [assignments[chunk] for chunk in split_chunks(len(assignments), n_chunks)],
+                              n_jobs=n_jobs, state=state)
+        estimates = np.concatenate(results)
+        return float(np.var(estimates)), estimates
+
+    def jackknife_variance(self):
+        """
+        Varianza jackknife por exclusión de unidades con los pesos del ajuste principal
+        (renormalizados), como en Arkhangelsky et al. (2021). Requiere al menos dos
+        unidades tratadas y haber llamado a `fit`.
+
+        Returns:
+            float: Varianza, o NaN si hay una sola unidad tratada.
+        """
+        if self.n_treated < 2:
+            return np.nan
+        n_units = len(self.units)
+        keep = ~np.eye(n_units, dtype=bool)
+        omega = np.where(keep & ~self.treated[None, :], self.omega[None, :], 0.0)
+        totals = omega.sum(axis=1, keepdims=True)
+        valid = totals[:, 0] > 0
+        omega = omega[valid] / totals[valid]
+        treated_rows = (keep & self.treated[None, :])[valid]
+        lambda_ = np.broadcast_to(self.lambda_, (int(valid.sum()), self.n_pre))
+        estimates = sdid_estimates(self.Y, self.n_pre, treated_rows, omega, lambda_)
+        n = len(estimates)
+        return float((n - 1) / n * np.sum((estimates - estimates.mean()) ** 2))
+
+
+def synthetic_did(df, treated_units, treatment_year, variance='placebo', n_reps=200, alpha=0.05, seed=None,
+                  n_jobs=None, **columns):
+    """
+    Estima el SDID con su error estándar e intervalo de confianza.
+
+    Args:
+        df (pd.DataFrame): Panel en formato largo.
+        treated_units (list): Unidades tratadas.
+        treatment_year (int): Año de la intervención.
+        variance (str): 'placebo' o 'jackknife' (éste requiere varias unidades tratadas).
+        n_reps (int): Réplicas placebo.
+        alpha (float): Nivel del intervalo de confianza.
+        seed (int, optional): Semilla de las réplicas placebo.
+        n_jobs (int, optional): Procesos del pool; None usa todos los núcleos.
+        **columns: 'outcome', 'unit_col' y 'period_col', como en `SyntheticDiD`.
+
+    Returns:
+        dict: Resultados de `SyntheticDiD.fit` más 'std_err', 'ci_lower', 'ci_upper',
+              'p_value', 'variance_method', 'placebo_estimates' y 'dropped_periods'.
+    """
+    if variance not in VARIANCE_METHODS:
+        raise ValueError(f"Método de varianza desconocido: '{variance}'. Usa {list(VARIANCE_METHODS)}.")
+    estimator = SyntheticDiD(df, treated_units, treatment_year, **columns)
+    result = estimator.fit()
+    placebo_estimates = None
+    if variance == 'placebo':
+        var, placebo_estimates = estimator.placebo_variance(n_reps=n_reps, seed=seed, n_jobs=n_jobs)
+    else:
+        var = estimator.jackknife_variance()
+    std_err = float(np.sqrt(var))
+    critical = stats.norm.ppf(1 - alpha / 2)
+    result.update({
+        'std_err': std_err,
+        'ci_lower': result['estimate'] - critical * std_err,
+        'ci_upper': result['estimate'] + critical * std_err,
+        'p_value': float(2 * stats.norm.sf(abs(result['estimate']) / std_err)) if std_err > 0 else np.nan,
+        'variance_method': variance,
+        'placebo_estimates': placebo_estimates,
+        'dropped_periods': estimator.dropped_periods,
+        'pre_periods': [int(p) for p in estimator.periods[:estimator.n_pre]],
+    })
+    return result
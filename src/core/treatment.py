@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Asignación del tratamiento: qué unidades son tratadas y desde qué año.
+
+La asignación es un mapeo unidad -> año de adopción (las unidades sin año son
+controles), que puede leerse de un archivo CSV (una fila por unidad, columnas
+`departamento`, `tratado` y `anio_adopcion`) o escribirse en línea como
+'San Martin=2005,Loreto=2010'. Se aplica al panel sobre los códigos de la columna
+categórica de unidades: el mapeo se evalúa una vez por categoría y se indexa con los
+códigos de cada fila, sin comparar cadenas fila por fila, así que cientos de distritos
+tratados cuestan lo mismo que uno.
+"""
+import os
+
+from .lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+UNIT_COLUMN = 'departamento'
+TREATED_COLUMN = 'tratado'
+YEAR_COLUMNS = ('anio_adopcion', 'año_adopcion')
+
+
+def _adoption_year(value):
+    """Convierte un año de adopción (entero, texto o faltante) en int o None."""
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NA:
+        return None
+    text = str(value).strip()
+    if not text or text.lower() in ('nan', 'none'):
+        return None
+    try:
+        return int(float(text))
+    except ValueError:
+        raise ValueError(f"Año de adopción inválido: '{value}'.")
+
+
+class TreatmentAssignment:
+    """
+    Mapeo unidad -> año de adopción del tratamiento.
+
+    Attributes:
+        adoption (dict): Año de adopción de cada unidad tratada.
+        controls (list): Unidades declaradas como no tratadas (informativo; las unidades
+                         ausentes del mapeo también son controles).
+    """
+    def __init__(self, adoption, controls=()):
+        """
+        Args:
+            adoption (dict): Unidad -> año de adopción, o -> (tratado, año). Las unidades
+                             con tratado falso son controles.
+            controls (iterable): Unidades no tratadas adicionales.
+
+        Raises:
+            ValueError: Si no hay unidades tratadas o una unidad tratada no tiene año
+                        (`parse` completa los años faltantes con un año por defecto).
+        """
+        self.adoption = {}
+        self.controls = list(controls)
+        for unit, value in dict(adoption).items():
+            treated, year = value if isinstance(value, tuple) else (True, value)
+            year = _adoption_year(year)
+            if not treated:
+                self.controls.append(unit)
+            elif year is None:
+                raise ValueError(f"La unidad tratada '{unit}' no tiene año de adopción.")
+            else:
+                self.adoption[str(unit)] = year
+        if not self.adoption:
+            raise ValueError("La asignación no tiene unidades tratadas.")
+        self.adoption = dict(sorted(self.adoption.items()))
+
+    @classmethod
+    def from_units(cls, units, year):
+        """Asignación con una o varias unidades tratadas desde un mismo año."""
+        units = [units] if isinstance(units, str) else list(units)
+        return cls({unit: year for unit in units})
+
+    @classmethod
+    def from_file(cls, path, default_year=None):
+        """
+        Lee la asignación de un archivo CSV con una fila por unidad.
+
+        Columnas: `departamento` (o la primera columna), `tratado` (0/1, opcional: por
+        defecto, tratada si tiene año) y `anio_adopcion` (vacío para los controles).
+
+        Args:
+            path (str): Ruta del archivo.
+            default_year (int, optional): Año de las unidades tratadas sin año.
+
+        Raises:
+            ValueError: Si faltan columnas o valores necesarios.
+        """
+        table = pd.read_csv(path, dtype=str, keep_default_na=False)
+        unit_column = UNIT_COLUMN if UNIT_COLUMN in table.columns else table.columns[0]
+        year_column = next((column for column in YEAR_COLUMNS if column in table.columns), None)
+        if year_column is None and (TREATED_COLUMN not in table.columns or default_year is None):
+            raise ValueError(f"El archivo de asignación '{path}' necesita la columna '{YEAR_COLUMNS[0]}' "
+                             f"(o '{TREATED_COLUMN}' y un año por defecto).")
+        years = table[year_column] if year_column else pd.Series([''] * len(table))
+        if TREATED_COLUMN in table.columns:
+            treated = table[TREATED_COLUMN].str.strip().str.lower().isin(['1', 'true', 'si', 'sí', 'yes'])
+        else:
+            treated = years.str.strip() != ''
+        adoption = {}
+        for unit, is_treated, year in zip(table[unit_column].str.strip(), treated, years):
+            year = _adoption_year(year)
+            adoption[unit] = (bool(is_treated), year if year is not None or not is_treated else default_year)
+        return cls(adoption)
+
+    @classmethod
+    def parse(cls, spec, default_year=None):
+        """
+        Construye la asignación a partir de cualquiera de sus formas.
+
+        Args:
+            spec: `TreatmentAssignment`; dict unidad -> año; ruta a un archivo CSV;
+                  texto 'San Martin=2005,Loreto=2010' (las unidades sin '=AÑO' usan
+                  `default_year`); o una unidad o lista de unidades tratadas desde
+                  `default_year`.
+            default_year (int, optional): Año de las unidades sin año explícito.
+
+        Raises:
+            ValueError: Si la especificación no es válida.
+        """
+        if isinstance(spec, cls):
+            return spec
+        if isinstance(spec, dict):
+            # Igual que en las otras formas, una unidad sin año es tratada desde
+            # `default_year`; sólo (False, ...) la declara control.
+            adoption = {}
+            for unit, value in spec.items():
+                treated, year = value if isinstance(value, tuple) else (True, value)
+                year = _adoption_year(year)
+                year = default_year if year is None and treated else year
+                adoption[unit] = (treated, year) if isinstance(value, tuple) else year
+            spec = adoption
+        elif isinstance(spec, str) and os.path.isfile(spec):
+            return cls.from_file(spec, default_year=default_year)
+        elif isinstance(spec, str):
+            adoption = {}
+            for part in spec.split(','):
+                unit, separator, year = part.partition('=')
+                if not unit.strip() or (separator and not year.strip().isdigit()):
+                    raise ValueError(f"Asignación inválida: '{part}'. Usa UNIDAD=AÑO, p. ej. 'San Martin=2005', "
+                                     f"o la ruta de un archivo CSV.")
+                adoption[unit.strip()] = int(year) if separator else default_year
+            spec = adoption
+        else:
+            spec = {unit: default_year for unit in spec}
+        missing = [unit for unit, value in spec.items()
+                   if (value[1] if isinstance(value, tuple) and value[0] else value) is None]
+        if missing:
+            raise ValueError(f"Unidades tratadas sin año de adopción: {missing}.")
+        return cls(spec)
+
+    @property
+    def treated_units(self):
+        """Unidades tratadas, ordenadas."""
+        return list(self.adoption)
+
+    @property
+    def reference_year(self):
+        """Primer año de adopción (el año común si todas adoptan a la vez)."""
+        return min(self.adoption.values())
+
+    @property
+    def is_staggered(self):
+        """True si las unidades tratadas adoptan en años distintos."""
+        return len(set(self.adoption.values())) > 1
+
+    @property
+    def label(self):
+        """Descripción corta para reportes y gráficos."""
+        units = self.treated_units
+        if len(units) <= 3:
+            return ', '.join(units)
+        return f"{len(units)} unidades tratadas"
+
+    def key(self):
+        """Representación estable para las claves de la caché."""
+        return [[unit, year] for unit, year in self.adoption.items()]
+
+    def unit_mask(self, units):
+        """Vector booleano que marca las unidades tratadas entre `units`."""
+        return np.isin(np.asarray(units, dtype=object), self.treated_units)
+
+    def lookup(self, units):
+        """
+        Evalúa el mapeo sobre un conjunto de unidades (p. ej. las categorías del panel).
+
+        Returns:
+            tuple: (vector booleano de tratadas, años de adopción como float con NaN
+                    para los controles).
+        """
+        treated = self.unit_mask(units)
+        years = pd.Series(self.adoption, dtype=float).reindex(pd.Index(units, dtype=object)).to_numpy()
+        return treated, years
+
+    def codes(self, units):
+        """
+        Tratamiento y año de adopción de cada fila, vía códigos categóricos.
+
+        Args:
+            units (pd.Series): Columna de unidades (categórica o no).
+
+        Returns:
+            tuple: (tratada por fila, año de adopción por fila; NaN en los controles).
+        """
+        if not isinstance(units.dtype, pd.CategoricalDtype):
+            units = units.astype('category')
+        treated, years = self.lookup(units.cat.categories)
+        # El código -1 (unidad faltante) apunta al centinela final: no tratada y sin año.
+        codes = units.cat.codes.to_numpy()
+        return np.append(treated, False)[codes], np.append(years, np.nan)[codes]
+
+    def apply(self, df, treatment_year=None, unit_col=UNIT_COLUMN, period_col='Periodo'):
+        """
+        Agrega al panel los regresores del DiD clásico.
+
+        'tratado' marca las unidades tratadas y 'did' las filas de cada unidad tratada
+        desde su propio año de adopción. 'post_treatment' marca los períodos desde
+        `treatment_year` (por defecto, el primer año de adopción), el corte calendario
+        común a tratadas y controles; sin adopción escalonada, 'did' es su producto con
+        'tratado'. Con adopción escalonada conviene usar los estimadores que reciben el
+        año de cada unidad (`StaggeredDiD`, la descomposición de Goodman-Bacon).
+
+        Args:
+            df (pd.DataFrame): Panel en formato largo (se modifica en el lugar).
+            treatment_year (int, optional): Año del corte 'post_treatment'.
+
+        Returns:
+            pd.DataFrame: El mismo panel.
+        """
+        treatment_year = self.reference_year if treatment_year is None else treatment_year
+        treated, years = self.codes(df[unit_col])
+        periods = df[period_col].to_numpy()
+        df['tratado'] = treated.astype(int)
+        df['post_treatment'] = (periods >= treatment_year).astype(int)
+        # Los controles tienen año NaN: la comparación es falsa y su 'did' queda en cero.
+        with np.errstate(invalid='ignore'):
+            df['did'] = (treated & (periods >= years)).astype(int)
+        return df
+
+    def to_frame(self):
+        """Asignación como tabla, con el formato de `from_file`."""
+        rows = [{UNIT_COLUMN: unit, TREATED_COLUMN: 1, YEAR_COLUMNS[0]: year} for unit, year in self.adoption.items()]
+        rows += [{UNIT_COLUMN: unit, TREATED_COLUMN: 0, YEAR_COLUMNS[0]: None} for unit in self.controls]
+        return pd.DataFrame(rows).astype({YEAR_COLUMNS[0]: 'Int64'})
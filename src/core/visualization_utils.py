@@ -3,16 +3,18 @@
 Módulo centralizado para la creación y estilización de visualizaciones
 bajo la filosofía de "Investigación Anfibia".
 """
-import matplotlib.pyplot as plt
-import pandas as pd
+from .lazy_imports import lazy_import
 
-def style_plot(ax, fig, title, subtitle, source_note):
-    """
-    Aplica un estilo base y profesional a un gráfico de Matplotlib.
-    Función genérica para gráficos exploratorios y descriptivos.
-    """
-    fig.suptitle(title, fontsize=18, fontweight='bold', ha='center')
-    ax.set_title(subtitle, fontsize=12, fontstyle='italic', pad=20, loc='center')
+plt = lazy_import('matplotlib.pyplot')
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# --- Estilos fijos (plantillas) ---
+# Cada función aplica sólo la parte del estilo que no depende de los datos, de modo que
+# el servicio de renderizado (`src.core.rendering`) la construya una vez por proceso.
+
+def apply_base_style(ax, fig=None):
+    """Estilo fijo de los gráficos exploratorios y descriptivos."""
     ax.spines['top'].set_visible(False)
     ax.spines['right'].set_visible(False)
     ax.spines['bottom'].set_color('gray')
@@ -21,9 +23,67 @@ def style_plot(ax, fig, title, subtitle, source_note):
     ax.set_axisbelow(True)
     ax.tick_params(axis='x', colors='gray', rotation=45)
     ax.tick_params(axis='y', length=0, colors='gray')
+
+def apply_event_study_style(ax, fig=None):
+    """Estilo fijo de los gráficos de Estudio de Eventos."""
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.yaxis.grid(True, color='#EEEEEE', linestyle='--', linewidth=0.8)
+    ax.set_axisbelow(True)
+    ax.set_xlabel('Años Relativos a la Intervención', fontsize=12, labelpad=15, color='gray')
+    ax.set_ylabel('Coeficiente Estimado del Impacto (β)', fontsize=12, labelpad=15, color='gray')
+    ax.tick_params(axis='x', colors='gray')
+    ax.tick_params(axis='y', colors='gray')
+
+def apply_scm_style(ax, fig=None):
+    """Estilo fijo de los gráficos de Control Sintético (SCM)."""
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.yaxis.grid(True, color='#EEEEEE', linestyle='--', linewidth=0.8)
+    ax.set_axisbelow(True)
+    ax.set_xlabel('Año', fontsize=12, labelpad=15, color='gray')
+    ax.set_ylabel('Deforestación Anual (miles de hectáreas)', fontsize=12, labelpad=15, color='gray')
+    ax.tick_params(axis='x', colors='gray')
+    ax.tick_params(axis='y', colors='gray')
+
+TEMPLATE_STYLES = {
+    'base': apply_base_style,
+    'event_study': apply_event_study_style,
+    'scm': apply_scm_style,
+}
+
+def annotate_plot(ax, fig, title, subtitle, source_note):
+    """Añade título, subtítulo y nota de fuente, y ajusta el diseño de la figura."""
+    fig.suptitle(title, fontsize=18, fontweight='bold', ha='center')
+    ax.set_title(subtitle, fontsize=12, fontstyle='italic', pad=20, loc='center')
     fig.tight_layout(rect=[0, 0.05, 1, 0.9])
     fig.text(0.05, 0.01, source_note, ha='left', fontsize=9, color='gray')
 
+def style_plot(ax, fig, title, subtitle, source_note):
+    """
+    Aplica un estilo base y profesional a un gráfico de Matplotlib.
+    Función genérica para gráficos exploratorios y descriptivos.
+    """
+    apply_base_style(ax, fig)
+    annotate_plot(ax, fig, title, subtitle, source_note)
+
+def draw_did_summary(fig, ax, pre_means, post_means, treatment_year, title, subtitle, treated_label='San Martín'):
+    """
+    Gráfico de barras de las medias pre/post por grupo del análisis DiD (trabajo de
+    renderizado sobre la plantilla 'base').
+    """
+    labels = ['Grupo de Control', f'Grupo de Tratamiento ({treated_label})']
+    x = np.arange(len(labels))
+    width = 0.35
+    ax.bar(x - width/2, pre_means, width, label=f'Pre-{treatment_year}', color='#457B9D', alpha=0.7)
+    ax.bar(x + width/2, post_means, width, label=f'Post-{treatment_year}', color='#A8DADC')
+
+    ax.set_ylabel('Deforestación Anual Promedio (miles de ha)')
+    ax.set_xticks(x)
+    ax.set_xticklabels(labels)
+    ax.legend(frameon=False, loc='upper left')
+    annotate_plot(ax, fig, title, subtitle, 'Fuente: Elaboración propia con datos de MapBiomas Perú.')
+
 def plot_did_results(results_data, title, subtitle, output_path):
     """
     Crea y guarda un gráfico de barras estilizado para los resultados del DiD.
@@ -64,7 +124,7 @@ def plot_did_results(results_data, title, subtitle, output_path):
         plt.savefig(period_output_path, dpi=300, bbox_inches='tight')
         plt.close(fig)
 
-def style_event_study_plot(ax, fig, title, subtitle, source_note):
+def style_event_study_plot(ax, fig, title, subtitle, source_note, treatment_year=2005):
     """
     Aplica un estilo específico para gráficos de Estudio de Eventos.
     """
@@ -74,17 +134,10 @@ def style_event_study_plot(ax, fig, title, subtitle, source_note):
 
     # Líneas de referencia clave
     ax.axhline(0, color='black', linestyle='--', linewidth=1.0, alpha=0.8)
-    ax.axvline(-0.5, color='#E63946', linestyle=':', linewidth=2, label='Intervención (Año 2005)')
+    ax.axvline(-0.5, color='#E63946', linestyle=':', linewidth=2, label=f'Intervención (Año {treatment_year})')
 
     # Estilo de ejes y rejilla
-    ax.spines['top'].set_visible(False)
-    ax.spines['right'].set_visible(False)
-    ax.yaxis.grid(True, color='#EEEEEE', linestyle='--', linewidth=0.8)
-    ax.set_axisbelow(True)
-    ax.set_xlabel('Años Relativos a la Intervención', fontsize=12, labelpad=15, color='gray')
-    ax.set_ylabel('Coeficiente Estimado del Impacto (β)', fontsize=12, labelpad=15, color='gray')
-    ax.tick_params(axis='x', colors='gray')
-    ax.tick_params(axis='y', colors='gray')
+    apply_event_study_style(ax, fig)
 
     # Leyenda y notas
     ax.legend(loc='upper left', frameon=False)
@@ -92,7 +145,7 @@ def style_event_study_plot(ax, fig, title, subtitle, source_note):
     
     fig.tight_layout(rect=[0, 0.05, 1, 0.9])
 
-def style_scm_plot(ax, fig, title, subtitle, source_note):
+def style_scm_plot(ax, fig, title, subtitle, source_note, treatment_year=2005):
     """
     Aplica un estilo específico para los gráficos de Control Sintético (SCM).
     """
@@ -101,17 +154,14 @@ def style_scm_plot(ax, fig, title, subtitle, source_note):
     ax.set_title(subtitle, fontsize=12, fontstyle='italic', pad=20, loc='center')
 
     # Línea de intervención
-    ax.axvline(x=2005, ymin=0.05, ymax=0.95, color='#E63946', linestyle=':', linewidth=2, label='Intervención (2005)')
+    ax.axvline(x=treatment_year, ymin=0.05, ymax=0.95, color='#E63946', linestyle=':', linewidth=2,
+               label=f'Intervención ({treatment_year})')
     
     # Estilo de ejes y rejilla
-    ax.spines['top'].set_visible(False)
-    ax.spines['right'].set_visible(False)
-    ax.yaxis.grid(True, color='#EEEEEE', linestyle='--', linewidth=0.8)
-    ax.set_axisbelow(True)
-    ax.set_xlabel('Año', fontsize=12, labelpad=15, color='gray')
-    ax.set_ylabel('Deforestación Anual (miles de hectáreas)', fontsize=12, labelpad=15, color='gray')
-    ax.tick_params(axis='x', colors='gray')
-    ax.tick_params(axis='y', colors='gray')
+    ylabel = ax.get_ylabel()
+    apply_scm_style(ax, fig)
+    if ylabel:
+        ax.set_ylabel(ylabel, fontsize=12, labelpad=15, color='gray')
     
     # Para el gráfico de "gaps", añadir una línea de base en cero
     if "Diferencia" in ax.get_ylabel():
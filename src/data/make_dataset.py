@@ -4,24 +4,206 @@ Script dedicado a leer los datos crudos, limpiarlos, procesarlos y guardar
 una versión única y validada que servirá como fuente para todos los análisis.
 """
 
-import pandas as pd
 import os
 import logging
 import sys
+import argparse
 
-def main():
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.core.data_manager import (PROCESSED_DATA_PATH, ProcessedDataWriter, append_processed_data,
+                                   load_processed_data, save_processed_data)
+from src.core.incremental import MomentStore
+from src.core.result_cache import dataset_fingerprint
+from src.core.lazy_imports import lazy_import
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+RAW_DATA_PATH = 'data/01_raw/mapbiomas_cobertura_1996_2023.csv'
+FIRST_YEAR = 1998
+# Filas por bloque al recorrer el archivo crudo en el modo de anexado.
+APPEND_CHUNKSIZE = 100_000
+_RAW_DTYPES = {'Periodo': 'int32', 'departamento': 'str', 'cobertura_boscosa': 'float64'}
+
+def annual_deforestation_chunk(chunk, last_seen):
+    """
+    Calcula 'deforestacion_anual' para un bloque de filas crudas, continuando la serie
+    de cada unidad desde el bloque anterior.
+
+    Las filas de cada unidad deben llegar en orden estrictamente creciente de período
+    (las unidades pueden intercalarse); así el resultado coincide con ordenar el archivo
+    y aplicar `groupby('departamento').diff() * -1`. Un archivo desordenado no se puede
+    procesar con un solo estado por unidad, así que se rechaza en lugar de escribir
+    diferencias entre años no consecutivos.
+
+    Args:
+        chunk (pd.DataFrame): Bloque con 'Periodo', 'departamento' y 'cobertura_boscosa'.
+        last_seen (dict): Último (período, cobertura) visto por unidad; se actualiza en el lugar.
+
+    Returns:
+        pd.DataFrame: El bloque con la columna 'deforestacion_anual'.
+
+    Raises:
+        ValueError: Si el período de una fila no supera al último visto de su unidad.
+    """
+    # El estado sólo se consulta para las unidades presentes en el bloque.
+    codes, units = pd.factorize(chunk['departamento'])
+    carried = np.array([last_seen.get(unit, (np.nan, np.nan)) for unit in units], dtype=float).reshape(-1, 2)
+    periods = chunk['Periodo'].to_numpy()
+    prior_max = pd.Series(periods).groupby(codes).cummax().groupby(codes).shift().to_numpy()
+    in_order = periods > np.nan_to_num(np.fmax(prior_max, carried[codes, 0]), nan=-np.inf)
+    if not in_order.all():
+        first = np.flatnonzero(~in_order)[0]
+        raise ValueError(f"El archivo crudo no está ordenado por período dentro de cada unidad: "
+                         f"'{units[codes[first]]}' tiene el período {periods[first]} después de uno "
+                         f"igual o posterior ({(~in_order).sum()} filas fuera de orden en el bloque). "
+                         f"Ordena el archivo por departamento y período o procésalo sin --chunksize.")
+    chunk = chunk.copy()
+
+    # La primera fila de cada unidad en el bloque continúa desde el estado acumulado.
+    coverage = chunk['cobertura_boscosa'].to_numpy()
+    previous = pd.Series(coverage).groupby(codes).shift().to_numpy(copy=True)
+    first = ~pd.Series(codes).duplicated().to_numpy()
+    previous[first] = carried[codes[first], 1]
+
+    last = ~pd.Series(codes).duplicated(keep='last').to_numpy()
+    last_seen.update(zip(units[codes[last]], zip(chunk['Periodo'].to_numpy()[last], coverage[last])))
+
+    chunk['deforestacion_anual'] = (coverage - previous) * -1
+    return chunk
+
+def stream_dataset(raw_path, output_path, chunksize):
+    """
+    Procesa el archivo crudo por bloques, sin cargarlo completo en memoria.
+
+    El único estado entre bloques es la última cobertura vista de cada unidad, de modo
+    que la memoria depende del tamaño del bloque y del número de unidades, no del
+    número de filas. Requiere que las filas de cada unidad lleguen en orden creciente
+    de período (ver `annual_deforestation_chunk`); si no, se descarta lo escrito y el
+    dataset previo se conserva.
+
+    Args:
+        raw_path (str): Archivo CSV crudo.
+        output_path (str): Ruta base del dataset procesado.
+        chunksize (int): Filas por bloque.
+
+    Returns:
+        tuple: (ruta del dataset escrito, filas escritas).
+
+    Raises:
+        ValueError: Si algún período llega fuera de orden dentro de su unidad.
+    """
+    last_seen = {}
+    reader = pd.read_csv(raw_path, chunksize=chunksize, dtype=_RAW_DTYPES)
+    with reader, ProcessedDataWriter(output_path) as writer:
+        for chunk in reader:
+            processed = annual_deforestation_chunk(chunk, last_seen)
+            writer.write(processed[processed['Periodo'] >= FIRST_YEAR])
+    return writer.target, writer.rows
+
+def append_new_periods(raw_path, output_path, chunksize=APPEND_CHUNKSIZE):
+    """
+    Anexa al dataset procesado sólo los períodos nuevos del archivo crudo.
+
+    Para cada unidad se toman las filas crudas posteriores a su último período ya
+    procesado; 'deforestacion_anual' se calcula sólo para ellas, continuando desde la
+    última cobertura guardada (la misma lógica que la ingesta por bloques). Luego se
+    actualizan los momentos guardados de los modelos (ver `src.core.incremental`).
+
+    Las colecciones de MapBiomas pueden revisar años anteriores: si alguna cobertura
+    ya procesada cambió, se advierte que conviene reconstruir el dataset completo.
+
+    Args:
+        raw_path (str): Archivo CSV crudo con la serie completa.
+        output_path (str): Ruta base del dataset procesado existente.
+        chunksize (int): Filas por bloque al recorrer el archivo crudo.
+
+    Returns:
+        pd.DataFrame: Filas anexadas.
+    """
+    existing = load_processed_data(output_path, columns=['Periodo', 'departamento', 'cobertura_boscosa'])
+    existing['departamento'] = existing['departamento'].astype(str)
+    latest = existing.sort_values('Periodo').groupby('departamento').last()
+    cutoff = latest['Periodo'].to_dict()
+    last_seen = {unit: (row.Periodo, row.cobertura_boscosa) for unit, row in latest.iterrows()}
+    stored = existing.set_index(['departamento', 'Periodo'])['cobertura_boscosa']
+
+    new_rows, revised = [], 0
+    for chunk in pd.read_csv(raw_path, chunksize=chunksize, dtype=_RAW_DTYPES):
+        is_new = chunk['Periodo'].to_numpy() > chunk['departamento'].map(cutoff).fillna(-np.inf).to_numpy()
+        previous = chunk[~is_new]
+        matched = stored.reindex(pd.MultiIndex.from_frame(previous[['departamento', 'Periodo']]))
+        revised += int((~np.isclose(matched.to_numpy(), previous['cobertura_boscosa'].to_numpy())
+                        & matched.notna().to_numpy()).sum())
+        processed = annual_deforestation_chunk(chunk[is_new], last_seen)
+        new_rows.append(processed[processed['Periodo'] >= FIRST_YEAR])
+    if revised:
+        logging.warning(f"El archivo crudo modifica {revised} coberturas ya procesadas; el modo de anexado sólo "
+                        f"agrega períodos nuevos. Reconstruye el dataset completo para incorporar la revisión.")
+
+    new_rows = pd.concat(new_rows, ignore_index=True)
+    if new_rows.empty:
+        return new_rows
+    previous_fingerprint = dataset_fingerprint(output_path)
+    append_processed_data(new_rows, output_path, logging.getLogger())
+    refreshed = MomentStore(output_path).refresh(new_rows, previous_fingerprint)
+    logging.info(f"Momentos de {refreshed} modelos actualizados con los períodos anexados.")
+    return new_rows
+
+def main(partition_by=None, chunksize=None, append=False, raw_path=RAW_DATA_PATH):
     """
     Orquesta la creación del dataset procesado.
+
+    Args:
+        partition_by (str, optional): Columna por la que particionar el dataset columnar
+                                      (p. ej. 'departamento').
+        chunksize (int, optional): Si se indica, el archivo crudo se procesa por bloques
+                                   de ese número de filas (exportaciones grandes).
+        append (bool): Sólo anexa los períodos nuevos del archivo crudo al dataset
+                       existente (p. ej. al publicarse un año más de MapBiomas).
+        raw_path (str): Archivo CSV crudo.
     """
     logging.info("Iniciando la creación del dataset procesado...")
 
+    if append:
+        try:
+            new_rows = append_new_periods(raw_path, PROCESSED_DATA_PATH, chunksize or APPEND_CHUNKSIZE)
+        except (FileNotFoundError, ValueError) as e:
+            logging.error(f"Error en el modo de anexado: {e}")
+            return False
+        if new_rows.empty:
+            logging.info("No hay períodos nuevos en el archivo crudo; el dataset no cambió.")
+        else:
+            periods = sorted(new_rows['Periodo'].unique().tolist())
+            logging.info(f"Anexados {len(new_rows)} registros de los períodos {periods}.")
+        logging.info("Creación del dataset completada.")
+        return
+
+    if chunksize:
+        if partition_by:
+            logging.warning("La ingesta por bloques escribe un único dataset; se ignora 'partition_by'.")
+        try:
+            target, rows = stream_dataset(raw_path, PROCESSED_DATA_PATH, chunksize)
+        except FileNotFoundError:
+            logging.error(f"Error: No se encontró el archivo de datos crudos '{raw_path}'.")
+            return False
+        except ValueError as e:
+            logging.error(f"Error en la ingesta por bloques: {e}")
+            return False
+        logging.info(f"Ingesta por bloques de {chunksize} filas completada: {rows} filas guardadas en '{target}'.")
+        logging.info("Creación del dataset completada.")
+        return
+
     # --- PASO 1: Cargar datos crudos ---
     try:
-        df = pd.read_csv('data/01_raw/mapbiomas_cobertura_1996_2023.csv')
+        df = pd.read_csv(raw_path)
         logging.info("Datos crudos cargados exitosamente.")
     except FileNotFoundError:
-        logging.error("Error: No se encontró el archivo de datos crudos 'data/01_raw/mapbiomas_cobertura_1996_2023.csv'.")
-        return
+        logging.error(f"Error: No se encontró el archivo de datos crudos '{raw_path}'.")
+        return False
 
     # --- PASO 2: Procesamiento y limpieza ---
     logging.info("Procesando datos...")
@@ -29,22 +211,23 @@ def main():
     df = df.sort_values(by=['departamento', 'Periodo'])
     df['deforestacion_anual'] = df.groupby('departamento')['cobertura_boscosa'].diff() * -1
     
-    df_processed = df[df['Periodo'] >= 1998].copy()
+    df_processed = df[df['Periodo'] >= FIRST_YEAR].copy()
     logging.info("Filtro aplicado: El dataset ahora abarca desde 1998 hasta 2023.")
 
-    # --- PASO 3: Guardar dataset procesado ---
-    output_dir = 'data/02_processed'
-    output_path = os.path.join(output_dir, 'deforestation_analysis_data.csv')
-
-    os.makedirs(output_dir, exist_ok=True)
-    
-    try:
-        df_processed.to_csv(output_path, index=False)
-        logging.info(f"Dataset procesado y guardado exitosamente en: {output_path}")
-    except Exception as e:
-        logging.error(f"Error al guardar el archivo procesado: {e}")
+    # --- PASO 3: Guardar dataset procesado (formato columnar tipado) ---
+    if not save_processed_data(df_processed, PROCESSED_DATA_PATH, logging.getLogger(), partition_by=partition_by):
+        return False
 
     logging.info("Creación del dataset completada.")
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--partition-by", default=None,
+                        help="Columna por la que particionar el dataset procesado (p. ej. 'departamento').")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Procesa el archivo crudo por bloques de N filas (exportaciones grandes).")
+    parser.add_argument("--append", action="store_true",
+                        help="Anexa sólo los períodos nuevos del archivo crudo al dataset existente.")
+    parser.add_argument("--raw", default=RAW_DATA_PATH, help="Archivo CSV crudo.")
+    args = parser.parse_args()
+    main(partition_by=args.partition_by, chunksize=args.chunksize, append=args.append, raw_path=args.raw)
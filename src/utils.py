@@ -3,13 +3,20 @@ import logging
 import sys
 from datetime import datetime
 
-def setup_run_environment(base_dir):
+from src.core.instrumentation import start_run
+
+def setup_run_environment(base_dir, join_run=False):
     """
     Crea un directorio único para una corrida de análisis con marca de tiempo
     y configura un logger para registrar en un archivo dentro de ese directorio.
 
+    La corrida queda instrumentada: las etapas medidas con `span` se registran en
+    'metrics.json', junto a 'run.log' (ver `src.core.instrumentation`).
+
     Args:
         base_dir (str): El directorio base donde se creará la carpeta de la corrida.
+        join_run (bool): Suma el directorio a la corrida ya abierta en este proceso, que
+                         escribe las mismas métricas en todos sus directorios.
 
     Returns:
         tuple: Una tupla conteniendo la ruta al directorio de la corrida y el logger configurado.
@@ -40,5 +47,6 @@ def setup_run_environment(base_dir):
     stream_handler.setFormatter(formatter)
     logger.addHandler(stream_handler)
     
+    start_run(run_dir, join=join_run)
     logger.info(f"Directorio de ejecución creado: {run_dir}")
     return run_dir, logger